@@ -0,0 +1,88 @@
+"""Benchmark records/sec of per-record vs batched news-classifier scoring on a synthetic pool.
+
+Uses a tokenizer fitted on a synthetic vocabulary and a small Keras model with the same input
+shape as the news classifier, so it runs without the S3 tokenizer or a trained model:
+
+    python benchmark_batch_scoring.py --records 20000 --batch-sizes 32 256 1024
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.python.keras.preprocessing.sequence import pad_sequences
+from tensorflow.python.keras.preprocessing.text import Tokenizer
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "news-classifier")
+)
+
+from batch_scoring import score_texts, stream_jsonlines  # noqa: E402
+
+MAX_LEN = 100
+NUM_CLASSES = 4
+
+
+def make_pool(records, vocab_size, rng):
+    words = np.array(["w{}".format(i) for i in range(vocab_size)])
+    lengths = rng.randint(5, 15, size=records)
+    return [" ".join(rng.choice(words, size=length)) for length in lengths]
+
+
+def make_model(vocab_size):
+    model = tf.keras.Sequential(
+        [
+            tf.keras.layers.Embedding(vocab_size + 1, 32, input_length=MAX_LEN),
+            tf.keras.layers.GlobalAveragePooling1D(),
+            tf.keras.layers.Dense(NUM_CLASSES, activation="softmax"),
+        ]
+    )
+    model.compile(loss="categorical_crossentropy", optimizer="adam")
+    return model
+
+
+def score_one_by_one(model, tokenizer, texts):
+    """The previous per-record path: tokenize, pad and predict every headline separately."""
+    for text in texts:
+        seq = tokenizer.texts_to_sequences([text])
+        d = pad_sequences(seq, maxlen=MAX_LEN)
+        probs = np.array(model.predict(np.array(d))).flatten()
+        order = (-probs).argsort()
+        yield {"label": ["__label__{}".format(i) for i in order], "prob": list(probs[order])}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--baseline-records", type=int, default=500)
+    parser.add_argument("--vocab-size", type=int, default=20000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 128, 256, 1024])
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    texts = make_pool(args.records, args.vocab_size, rng)
+    tokenizer = Tokenizer(num_words=args.vocab_size)
+    tokenizer.fit_on_texts(texts)
+    model = make_model(args.vocab_size)
+
+    baseline = texts[: args.baseline_records]
+    start = time.perf_counter()
+    for _ in score_one_by_one(model, tokenizer, baseline):
+        pass
+    elapsed = time.perf_counter() - start
+    print("per-record          {:>10.1f} records/sec".format(len(baseline) / elapsed))
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        predictions = score_texts(model, tokenizer, texts, MAX_LEN, batch_size)
+        for _ in stream_jsonlines(predictions, batch_size):
+            pass
+        elapsed = time.perf_counter() - start
+        print("batch_size={:<8} {:>10.1f} records/sec".format(batch_size, len(texts) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
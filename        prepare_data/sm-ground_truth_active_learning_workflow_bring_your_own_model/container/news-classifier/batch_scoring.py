@@ -0,0 +1,90 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License").
+#   You may not use this file except in compliance with the License.
+#   A copy of the License is located at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   or in the "license" file accompanying this file. This file is distributed
+#   on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+#   express or implied. See the License for the specific language governing
+#   permissions and limitations under the License.
+#
+# Batched scoring helpers for the news classifier. Active learning runs batch transform over
+# large unlabeled pools, so records are read lazily from the JSON Lines payload, tokenized
+# and padded a batch at a time, and predictions are streamed back line by line.
+
+import json
+from io import BytesIO
+from itertools import islice
+
+import numpy as np
+from tensorflow.python.keras.preprocessing.sequence import pad_sequences
+
+
+def iter_sources(payload):
+    """Yield the "source" text of every JSON Lines record in the payload, skipping bad records."""
+    for line in BytesIO(payload):
+        if not line.strip():
+            continue
+        instance = json.loads(line)
+        source = instance.get("source")
+        if source is None:
+            print(
+                "Instance does not have source. Unexpected input to batch transform {}".format(
+                    instance
+                )
+            )
+            continue
+        yield source
+
+
+def iter_batches(iterable, batch_size):
+    """Split an iterable into lists of at most batch_size items without materializing it."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def predict_proba(model, tokenizer, texts, max_len, batch_size):
+    """Tokenize, pad and score one batch of texts.
+
+    The padded matrix always has batch_size rows so the model sees a fixed input shape,
+    the rows past len(texts) are dropped from the returned probabilities.
+    """
+    sequences = tokenizer.texts_to_sequences(texts)
+    padded = np.zeros((batch_size, max_len), dtype=np.int32)
+    padded[: len(texts)] = pad_sequences(sequences, maxlen=max_len)
+    return np.asarray(model.predict_on_batch(padded))[: len(texts)]
+
+
+def format_predictions(probs):
+    """Turn a (records, classes) probability matrix into the predictor's response records."""
+    order = np.argsort(-probs, axis=1, kind="stable")
+    sorted_probs = np.take_along_axis(probs, order, axis=1).astype(float)
+    for indices, row_probs in zip(order.tolist(), sorted_probs.tolist()):
+        yield {
+            "label": ["__label__{}".format(index) for index in indices],
+            "prob": row_probs,
+        }
+
+
+def score_texts(model, tokenizer, texts, max_len, batch_size):
+    """Yield one prediction per text, scoring the texts in fixed-size batches."""
+    for batch in iter_batches(texts, batch_size):
+        probs = predict_proba(model, tokenizer, batch, max_len, batch_size)
+        for prediction in format_predictions(probs):
+            yield prediction
+
+
+def stream_jsonlines(predictions, batch_size):
+    """Encode predictions as JSON Lines, yielding one chunk of lines per batch."""
+    for batch in iter_batches(predictions, batch_size):
+        yield "".join(
+            json.dumps(prediction, ensure_ascii=False, sort_keys=True) + "\n"
+            for prediction in batch
+        ).encode("utf-8")
@@ -16,24 +16,24 @@
 
 from __future__ import print_function
 
-import json
 import logging
 import os
 import pickle
 import signal
 import sys
 import traceback
-from io import BytesIO, StringIO
+from itertools import chain
 
 import boto3
 import flask
-import numpy as np
 import pandas as pd
 import tensorflow as tf
-from tensorflow.python.keras.preprocessing.sequence import pad_sequences
+from batch_scoring import iter_sources, score_texts, stream_jsonlines
 from tensorflow.python.keras.preprocessing.text import Tokenizer
 
 MAX_LEN = 100
+# Number of records tokenized and scored together during batch transform
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 256))
 prefix = "/opt/ml/"
 model_path = os.environ.get("SM_MODEL_DIR", "/opt/ml/model")
 
@@ -71,18 +71,17 @@ class ScoringService(object):
 
         Args:
             input (a single news headline): The data on which to do the predictions."""
-        model = self.get_model()
-        seq = self.tokenizer.texts_to_sequences([input])
-        d = pad_sequences(seq, maxlen=MAX_LEN)
-        prediction = model.predict(np.array(d))
+        prediction = next(self.predict_batch([input], batch_size=1))
         print("prediction received {}".format(prediction))
+        return prediction
 
-        probs = np.array(prediction).flatten()
-        descending_sorted_index = (-probs).argsort()
-        return {
-            "label": ["__label__{}".format(index) for index in descending_sorted_index],
-            "prob": list(probs[descending_sorted_index].astype(float)),
-        }
+    def predict_batch(self, texts, batch_size=BATCH_SIZE):
+        """Lazily predict an iterable of news headlines, batch_size headlines at a time.
+
+        Args:
+            texts (iterable of news headlines): The data on which to do the predictions.
+            batch_size (int): Number of headlines tokenized, padded and scored together."""
+        return score_texts(self.get_model(), self.tokenizer, texts, MAX_LEN, batch_size)
 
 
 # The flask app for serving predictions
@@ -101,41 +100,26 @@ def ping():
     return flask.Response(response="\n", status=status, mimetype="application/json")
 
 
-def _load_json_instance(instance):
-    source = instance.get("source")
-    if source is None:
-        print(
-            "Instance does not have source. Unexpected input to batch transform {}".format(instance)
-        )
-        return None
-    return source.encode("utf-8").decode("utf-8")
-
-
-def _dump_jsonlines_entry(prediction):
-    return (json.dumps(prediction, ensure_ascii=False, sort_keys=True) + "\n").encode("utf-8")
-
-
 @app.route("/invocations", methods=["POST"])
 def transformation():
-    """Do an inference on a single news headline."""
-    data = None
-
+    """Do inference on a batch of news headlines sent as JSON Lines, one record per line."""
     if flask.request.content_type == "application/jsonlines":
         payload = flask.request.data
         if len(payload) == 0:
             return flask.Response(response="", status=204)
 
-        print("prediction input size in bytes:{} content:{}".format(len(payload), payload))
-
-        fr = StringIO(payload.decode("utf-8"))
-        texts = [_load_json_instance(json.loads(line)) for line in iter(lambda: fr.readline(), "")]
+        print("prediction input size in bytes:{}".format(len(payload)))
 
-        predictions = [scoring_service.predict(text[0]) for text in texts if text is not None]
-
-        bio = BytesIO()
-        for line in predictions:
-            bio.write(_dump_jsonlines_entry(line))
-        return flask.Response(response=bio.getvalue(), status=200, mimetype="application/jsonlines")
+        # Records are parsed, scored and serialized one batch at a time. The first batch is
+        # scored before the response starts, so that a bad payload or a model that fails still
+        # returns an error status. A failure in a later batch ends the stream.
+        chunks = stream_jsonlines(scoring_service.predict_batch(iter_sources(payload)), BATCH_SIZE)
+        first_chunk = next(chunks, b"")
+        return flask.Response(
+            chain([first_chunk], chunks),
+            status=200,
+            mimetype="application/jsonlines",
+        )
     else:
         return flask.Response(
             response="This predictor only supports application/jsonlines format",
@@ -0,0 +1,79 @@
+"""
+Benchmark auto-annotation and selection of SimpleActiveLearning on a synthetic pool.
+
+    python -m ActiveLearning.benchmark_selection --records 1000000 --labels 4
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ActiveLearning.helper import SimpleActiveLearning, predictions_to_matrix
+
+
+def make_predictions(records, labels, embedding_size, rng):
+    """
+    synthetic inference outputs in the batch transform format, labels sorted by probability.
+    """
+    probs = rng.dirichlet(np.full(labels, 0.5), size=records)
+    order = np.argsort(-probs, axis=1)
+    sorted_probs = np.take_along_axis(probs, order, axis=1)
+    embeddings = rng.standard_normal((records, embedding_size)) if embedding_size else None
+    predictions = []
+    for i in range(records):
+        prediction = {
+            "id": i,
+            "prob": sorted_probs[i].tolist(),
+            "label": ["__label__{}".format(j) for j in order[i]],
+        }
+        if embeddings is not None:
+            prediction["embedding"] = embeddings[i].tolist()
+        predictions.append(prediction)
+    return predictions
+
+
+def timed(name, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print("{:<40} {:>8.3f} s".format(name, time.perf_counter() - start))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--labels", type=int, default=4)
+    parser.add_argument("--embedding-size", type=int, default=0)
+    parser.add_argument("--diversity-pool-factor", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    predictions = make_predictions(args.records, args.labels, args.embedding_size, rng)
+    sources = [{"id": i, "source": "record {}".format(i)} for i in range(args.records)]
+    label_names = ["label {}".format(j) for j in range(args.labels)]
+    max_selections = args.records // 10
+
+    timed("predictions_to_matrix", predictions_to_matrix, predictions)
+    simple_al = SimpleActiveLearning("benchmark", "category", label_names, max_selections)
+    autoannotations = timed("autoannotate", simple_al.autoannotate, predictions, sources)
+    for strategy in ["margin", "entropy", "least_confidence", "random"]:
+        simple_al = SimpleActiveLearning(
+            "benchmark",
+            "category",
+            label_names,
+            max_selections,
+            strategy=strategy,
+            diversity_pool_factor=args.diversity_pool_factor,
+            seed=0,
+        )
+        timed(
+            "select_for_labeling [{}]".format(strategy),
+            simple_al.select_for_labeling,
+            predictions,
+            autoannotations,
+        )
+
+
+if __name__ == "__main__":
+    main()
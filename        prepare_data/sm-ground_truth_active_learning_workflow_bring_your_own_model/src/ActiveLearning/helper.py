@@ -1,27 +1,142 @@
-import random
 from datetime import datetime
 
+import numpy as np
+
 AUTOANNOTATION_THRESHOLD = 0.50
 JOB_TYPE = "groundtruth/text-classification"
+UNCERTAINTY_STRATEGIES = ("margin", "entropy", "least_confidence", "random")
+
+
+def predictions_to_matrix(predictions):
+    """
+    Load inference outputs into arrays.
+     - ids : record id of every prediction.
+     - probabilities : (records, labels) matrix where column j holds the probability of "__label__j".
+    Every prediction lists its labels in its own order, so the probabilities are scattered into
+    their label columns in a single vectorized assignment.
+    """
+    ids = np.array([prediction["id"] for prediction in predictions])
+    label_counts = np.fromiter(
+        (len(prediction["label"]) for prediction in predictions), dtype=np.int64, count=len(ids)
+    )
+    label_columns = np.array(
+        [int(label.split("_")[-1]) for prediction in predictions for label in prediction["label"]],
+        dtype=np.int64,
+    )
+    flat_probs = np.array(
+        [prob for prediction in predictions for prob in prediction["prob"]], dtype=np.float64
+    )
+    n_labels = int(label_columns.max()) + 1 if len(label_columns) else 0
+    probabilities = np.zeros((len(ids), n_labels))
+    probabilities[np.repeat(np.arange(len(ids)), label_counts), label_columns] = flat_probs
+    return ids, probabilities
+
+
+def margin_scores(probabilities):
+    """
+    difference between the best and second best probability of every record.
+    """
+    if probabilities.shape[1] < 2:
+        return probabilities.max(axis=1, initial=0.0)
+    top_two = -np.partition(-probabilities, 1, axis=1)[:, :2]
+    return top_two[:, 0] - top_two[:, 1]
+
+
+def entropy_scores(probabilities):
+    """
+    entropy of the predicted distribution of every record.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.where(probabilities > 0, np.log(probabilities), 0.0)
+    return -(probabilities * logs).sum(axis=1)
+
+
+def least_confidence_scores(probabilities):
+    """
+    one minus the best probability of every record.
+    """
+    return 1.0 - probabilities.max(axis=1, initial=0.0)
+
+
+def uncertainty_scores(probabilities, strategy):
+    """
+    uncertainty of every record, higher is more uncertain.
+    """
+    if strategy == "margin":
+        return -margin_scores(probabilities)
+    if strategy == "entropy":
+        return entropy_scores(probabilities)
+    if strategy == "least_confidence":
+        return least_confidence_scores(probabilities)
+    raise ValueError("Unknown uncertainty strategy {}".format(strategy))
+
+
+def top_k(scores, k):
+    """
+    indices of the k highest scores, highest first, found with argpartition.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def k_center_greedy(embeddings, k, first=0):
+    """
+    Pick k rows of embeddings that cover the embedding space (k-center greedy).
+    Each step adds the point furthest from everything selected so far.
+    """
+    k = min(k, len(embeddings))
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    selected = np.empty(k, dtype=np.int64)
+    selected[0] = first
+    min_distances = ((embeddings - embeddings[first]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        selected[i] = np.argmax(min_distances)
+        distances = ((embeddings - embeddings[selected[i]]) ** 2).sum(axis=1)
+        np.minimum(min_distances, distances, out=min_distances)
+    return selected
 
 
 class SimpleActiveLearning:
-    def __init__(self, job_name, label_category_name, label_names, max_selections):
+    def __init__(
+        self,
+        job_name,
+        label_category_name,
+        label_names,
+        max_selections,
+        strategy="margin",
+        diversity_pool_factor=None,
+        seed=None,
+    ):
+        """
+        - strategy : uncertainty score used to pick records for labeling, one of
+            "margin", "entropy", "least_confidence" or "random".
+        - diversity_pool_factor : when set and the predictions carry an "embedding", the
+            max_selections * diversity_pool_factor most uncertain records are reduced to
+            max_selections diverse records with k-center greedy over their embeddings.
+        """
+        if strategy not in UNCERTAINTY_STRATEGIES:
+            raise ValueError("Unknown uncertainty strategy {}".format(strategy))
         self.job_name = job_name
         self.label_category_name = label_category_name
         self.label_names = label_names
         self.max_selections = max_selections
+        self.strategy = strategy
+        self.diversity_pool_factor = diversity_pool_factor
+        self.rng = np.random.default_rng(seed)
 
     def compute_margin(self, probabilities, labels):
         """
         compute the confidence and the best label given the probability distribution.
         """
-        max_probability = max(probabilities)
-        max_prob_index = probabilities.index(max_probability)
-        best_label = labels[max_prob_index]
-        remaining_probs = [prob for i, prob in enumerate(probabilities) if i != max_prob_index]
-        second_probability = max(remaining_probs, default=0.0)
-        return max_probability - second_probability, best_label
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        max_prob_index = int(np.argmax(probabilities))
+        margin = margin_scores(probabilities[np.newaxis, :])[0]
+        return float(margin), labels[max_prob_index]
 
     def get_label_index(self, inference_label_output):
         """
@@ -59,27 +174,51 @@ class SimpleActiveLearning:
         """
         auto annotate all unlabeled data with confidence above AUTOANNOTATION_THRESHOLD.
         """
+        _, probabilities = predictions_to_matrix(predictions)
+        margins = margin_scores(probabilities)
+        confident = np.flatnonzero(margins > AUTOANNOTATION_THRESHOLD)
+        if len(confident) == 0:
+            return []
+
+        best_labels = probabilities[confident].argmax(axis=1)
         sources_by_id = {source["id"]: source for source in sources}
         autoannotations = []
-        for prediction in predictions:
-            probabilities = prediction["prob"]
-            labels = prediction["label"]
-            margin, best_label = self.compute_margin(probabilities, labels)
-            if margin > AUTOANNOTATION_THRESHOLD:
-                autoannotations.append(
-                    self.make_autoannotation(
-                        prediction, sources_by_id[prediction["id"]], margin, best_label
-                    )
+        for index, margin, best_label in zip(
+            confident.tolist(), margins[confident].tolist(), best_labels.tolist()
+        ):
+            prediction = predictions[index]
+            autoannotations.append(
+                self.make_autoannotation(
+                    prediction,
+                    sources_by_id[prediction["id"]],
+                    margin,
+                    "__label__{}".format(best_label),
                 )
+            )
 
         return autoannotations
 
     def select_for_labeling(self, predictions, autoannotations):
         """
         Select the next set of records to be labeled by humans.
+         - records that were auto annotated are skipped.
+         - the most uncertain remaining records are picked according to self.strategy.
         """
-        initial_ids = {prediction["id"] for prediction in predictions}
-        autoannotation_ids = {autoannotation["id"] for autoannotation in autoannotations}
-        remaining_ids = initial_ids - autoannotation_ids
-        selections = random.sample(remaining_ids, min(self.max_selections, len(remaining_ids)))
-        return selections
+        ids, probabilities = predictions_to_matrix(predictions)
+        autoannotation_ids = np.array([autoannotation["id"] for autoannotation in autoannotations])
+        remaining = np.flatnonzero(~np.isin(ids, autoannotation_ids))
+        k = min(self.max_selections, len(remaining))
+
+        if self.strategy == "random":
+            chosen = self.rng.choice(remaining, size=k, replace=False)
+            return ids[chosen].tolist()
+
+        scores = uncertainty_scores(probabilities[remaining], self.strategy)
+        has_embeddings = len(predictions) > 0 and "embedding" in predictions[0]
+        if self.diversity_pool_factor and has_embeddings:
+            pool = top_k(scores, k * self.diversity_pool_factor)
+            embeddings = np.array([predictions[i]["embedding"] for i in remaining[pool]])
+            chosen = pool[k_center_greedy(embeddings, k)]
+        else:
+            chosen = top_k(scores, k)
+        return ids[remaining[chosen]].tolist()
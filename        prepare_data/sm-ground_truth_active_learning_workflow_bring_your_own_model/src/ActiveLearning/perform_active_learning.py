@@ -1,9 +1,14 @@
 import json
 import logging
-from io import StringIO
 
 from ActiveLearning.helper import SimpleActiveLearning
-from s3_helper import S3Ref, create_ref_at_parent_key, download, download_with_query, upload
+from s3_helper import (
+    S3Ref,
+    StreamingUpload,
+    create_ref_at_parent_key,
+    download_with_query,
+    stream_lines,
+)
 from string_helper import generate_job_id_and_s3_path
 
 logger = logging.getLogger()
@@ -26,14 +31,9 @@ def get_label_names_from_s3(labels_s3_uri):
 
 def get_sources(inference_input):
     """
-    Load inference input as a python list
+    Load inference input as a python list, parsing every line exactly once.
     """
-    sources = []
-    for line in inference_input:
-        data = json.loads(line)
-        sources.append(data)
-    inference_input.seek(0)
-    return sources
+    return [json.loads(line) for line in inference_input]
 
 
 def get_predictions(inference_output):
@@ -60,10 +60,9 @@ def collect_inference_inputs(s3_input_uri):
     collect information related to input to inference.
     """
     inference_input_s3_ref = S3Ref.from_uri(s3_input_uri)
-    inference_input = download(inference_input_s3_ref)
-    sources = get_sources(inference_input)
+    sources = get_sources(stream_lines(inference_input_s3_ref))
     logger.info("Collected {} inference inputs.".format(len(sources)))
-    return inference_input_s3_ref, inference_input, sources
+    return inference_input_s3_ref, sources
 
 
 def collect_inference_outputs(inference_output_uri):
@@ -73,8 +72,7 @@ def collect_inference_outputs(inference_output_uri):
     sagemaker_output_file = "unlabeled.manifest.out"
     prediction_output_uri = inference_output_uri + sagemaker_output_file
     prediction_output_s3 = S3Ref.from_uri(prediction_output_uri)
-    prediction_output = download(prediction_output_s3)
-    predictions = get_predictions(prediction_output)
+    predictions = get_predictions(stream_lines(prediction_output_s3))
     logger.info("Collected {} inference outputs.".format(len(predictions)))
     return predictions
 
@@ -84,35 +82,29 @@ def write_auto_annotations(simple_al, sources, predictions, inference_input_s3_r
     write auto annotations to s3
     """
     logger.info("Generating auto annotations where confidence is high.")
-    auto_annotation_stream = StringIO()
     auto_annotations = simple_al.autoannotate(predictions, sources)
-    for auto_annotation in auto_annotations:
-        auto_annotation_stream.write(json.dumps(auto_annotation) + "\n")
 
     # Auto annotation.
     auto_dest = create_ref_at_parent_key(inference_input_s3_ref, "autoannotated.manifest")
-    upload(auto_annotation_stream, auto_dest)
+    with StreamingUpload(auto_dest) as auto_annotation_stream:
+        for auto_annotation in auto_annotations:
+            auto_annotation_stream.write(json.dumps(auto_annotation) + "\n")
     logger.info("Uploaded autoannotations to {}.".format(auto_dest.get_uri()))
     return auto_dest.get_uri(), auto_annotations
 
 
-def write_selector_file(
-    simple_al, sources, predictions, inference_input_s3_ref, inference_input, auto_annotations
-):
+def write_selector_file(simple_al, sources, predictions, inference_input_s3_ref, auto_annotations):
     """
     write selector file to s3. This file is used to decide which records should be labeled by humans next.
     """
     logger.info("Selecting input for next manual annotation")
-    selection_data = StringIO()
     selections = simple_al.select_for_labeling(predictions, auto_annotations)
     selections_set = set(selections)
-    for line in inference_input:
-        data = json.loads(line)
-        if data["id"] in selections_set:
-            selection_data.write(json.dumps(data) + "\n")
-    inference_input.seek(0)
     selection_dest = create_ref_at_parent_key(inference_input_s3_ref, "selection.manifest")
-    upload(selection_data, selection_dest)
+    with StreamingUpload(selection_dest) as selection_data:
+        for data in sources:
+            if data["id"] in selections_set:
+                selection_data.write(json.dumps(data) + "\n")
     logger.info("Uploaded selections to {}.".format(selection_dest.get_uri()))
     return selection_dest.get_uri(), selections
 
@@ -136,9 +128,7 @@ def lambda_handler(event, context):
     if max_selections == 0:
         max_selections = input_total
 
-    inference_input_s3_ref, inference_input, sources = collect_inference_inputs(
-        meta_data["UnlabeledS3Uri"]
-    )
+    inference_input_s3_ref, sources = collect_inference_inputs(meta_data["UnlabeledS3Uri"])
     predictions = collect_inference_outputs(meta_data["transform_config"]["S3OutputPath"])
     label_names = get_label_names_from_s3(labels_s3_uri)
     logger.info("Collected {} label names.".format(len(label_names)))
@@ -148,7 +138,7 @@ def lambda_handler(event, context):
         simple_al, sources, predictions, inference_input_s3_ref
     )
     meta_data["selections_s3_uri"], selections = write_selector_file(
-        simple_al, sources, predictions, inference_input_s3_ref, inference_input, auto_annotations
+        simple_al, sources, predictions, inference_input_s3_ref, auto_annotations
     )
     (
         meta_data["selected_job_name"],
@@ -1,12 +1,34 @@
+import json
 import logging
-from functools import partial
 
-from s3_helper import S3Ref, get_count_with_query
+from s3_helper import S3Ref, stream_lines
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def count_labels(lines, label_attribute_name):
+    """
+    Count the total, human labeled and auto labeled records in a single pass over the
+    manifest lines. Lines that do not mention the label metadata are unlabeled and are
+    counted without being parsed.
+    """
+    metadata_key = "{}-metadata".format(label_attribute_name)
+    quoted_key = json.dumps(metadata_key)
+    total = human_labeled = auto_labeled = 0
+    for line in lines:
+        total += 1
+        if quoted_key not in line:
+            continue
+        metadata = json.loads(line).get(metadata_key) or {}
+        human_annotated = metadata.get("human-annotated")
+        if human_annotated == "yes":
+            human_labeled += 1
+        elif human_annotated == "no":
+            auto_labeled += 1
+    return total, human_labeled, auto_labeled
+
+
 def lambda_handler(event, context):
     """
     This function returns the counts of the labeling job records
@@ -21,19 +43,10 @@ def lambda_handler(event, context):
     s3_input_uri = meta_data["IntermediateManifestS3Uri"]
 
     source = S3Ref.from_uri(s3_input_uri)
-    manifest_count = partial(get_count_with_query, source)
     logger.info("Getting counts from {}".format(s3_input_uri))
-    total_query = "select count(*) from s3object s"
-    human_labeled_query = """select count(*) from s3object[*] s where s."{}-metadata"."human-annotated" IN ('yes')""".format(
-        label_attribute_name
-    )
-    auto_labeled_query = """select count(*) from s3object[*] s where s."{}-metadata"."human-annotated" IN ('no')""".format(
-        label_attribute_name
+    manifest_size, human_labeled_count, auto_labeled_count = count_labels(
+        stream_lines(source), label_attribute_name
     )
-
-    manifest_size = manifest_count(total_query)
-    human_labeled_count = manifest_count(human_labeled_query)
-    auto_labeled_count = manifest_count(auto_labeled_query)
     unlabeled_count = manifest_size - (auto_labeled_count + human_labeled_count)
     human_label_percentage = int(human_labeled_count * 100.0 / manifest_size)
     counts = {
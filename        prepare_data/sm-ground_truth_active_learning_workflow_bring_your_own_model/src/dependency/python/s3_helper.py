@@ -2,7 +2,7 @@
 Utility file to help with s3 operations.
 """
 from io import BytesIO, StringIO, TextIOWrapper
-from typing import Callable, NamedTuple
+from typing import Callable, Iterator, NamedTuple
 from urllib.parse import urlparse
 
 import boto3
@@ -10,6 +10,10 @@ import boto3
 s3r = boto3.resource("s3")
 s3 = boto3.client("s3")
 
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one.
+MIN_PART_SIZE = 5 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+
 
 class S3Ref(NamedTuple):
     """
@@ -71,6 +75,87 @@ def upload(memoryfile: StringIO, dest: S3Ref) -> None:
     s3.upload_fileobj(BytesIO(memoryfile.getvalue().encode()), dest.bucket, dest.key)
 
 
+def stream_lines(source: S3Ref, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Stream the lines of a S3 file without loading the whole file in memory.
+     - Empty lines are skipped.
+    """
+    body = s3.get_object(Bucket=source.bucket, Key=source.key)["Body"]
+    pending = b""
+    for chunk in body.iter_chunks(chunk_size):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8")
+    if pending.strip():
+        yield pending.decode("utf-8")
+
+
+class StreamingUpload:
+    """
+    Write lines to a S3 file as a stream through a multipart upload.
+     - Lines are buffered until a part of at least part_size bytes is ready.
+     - Files smaller than a single part are uploaded with a plain put_object.
+     - The multipart upload is aborted if the writer exits with an exception.
+
+    Usage:
+        with StreamingUpload(dest) as writer:
+            writer.write(json.dumps(record) + "\n")
+    """
+
+    def __init__(self, dest: S3Ref, part_size: int = MIN_PART_SIZE):
+        self.dest = dest
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.buffer = BytesIO()
+        self.upload_id = None
+        self.parts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.upload_id is not None:
+            s3.abort_multipart_upload(
+                Bucket=self.dest.bucket, Key=self.dest.key, UploadId=self.upload_id
+            )
+
+    def write(self, data: str) -> None:
+        self.buffer.write(data.encode("utf-8"))
+        if self.buffer.tell() >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self) -> None:
+        if self.upload_id is None:
+            response = s3.create_multipart_upload(Bucket=self.dest.bucket, Key=self.dest.key)
+            self.upload_id = response["UploadId"]
+        part_number = len(self.parts) + 1
+        response = s3.upload_part(
+            Bucket=self.dest.bucket,
+            Key=self.dest.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=self.buffer.getvalue(),
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = BytesIO()
+
+    def close(self) -> None:
+        if self.upload_id is None:
+            s3.put_object(Bucket=self.dest.bucket, Key=self.dest.key, Body=self.buffer.getvalue())
+            return
+        if self.buffer.tell():
+            self._upload_part()
+        s3.complete_multipart_upload(
+            Bucket=self.dest.bucket,
+            Key=self.dest.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+
 def get_count_with_query(source: S3Ref, query: str) -> int:
     """
     Run a s3_select query and return the resulting count.
@@ -1,30 +1,35 @@
+import json
+import os
+
 import boto3
-from MetaData.get_counts import lambda_handler
+from MetaData.get_counts import count_labels, lambda_handler
 from moto import mock_s3
 
+# Size of the synthetic manifest used by test_get_counts_large_manifest.
+# Set MANIFEST_TEST_SIZE_MB=4096 to validate a multi-GB manifest.
+MANIFEST_TEST_SIZE_MB = int(os.environ.get("MANIFEST_TEST_SIZE_MB", "12"))
+
+
+def labeled_record(record_id, human_annotated):
+    return {
+        "source": "Fed revises guidelines sending stocks up.",
+        "id": record_id,
+        "category": 1,
+        "category-metadata": {
+            "confidence": 1.0,
+            "human-annotated": human_annotated,
+            "type": "groundtruth/text-classification",
+        },
+    }
+
 
 @mock_s3
-def test_get_counts_nothing_labeled(monkeypatch):
-    """
-    This test requires monkeypatching because select_object_content is not implemented by moto.
-    https://github.com/spulec/moto/blob/master/IMPLEMENTATION_COVERAGE.md
-    """
+def test_get_counts_nothing_labeled():
     manifest_content = b'{"source": "Fed revises guidelines sending stocks up.", "id": 0}\n{"source": "Review Guardians of the Galaxy", "id": 1}\n'
     s3r = boto3.resource("s3", region_name="us-east-1")
     s3r.create_bucket(Bucket="source_bucket")
     s3r.Object("source_bucket", "input.manifest").put(Body=manifest_content)
 
-    def mock_count(*args, **kwargs):
-        key = args[0].key
-        query = args[1]
-        if "input.manifest" == key and "select count(*) from s3object s" == query:
-            return 2
-        return 0
-
-    from MetaData import get_counts
-
-    monkeypatch.setattr(get_counts, "get_count_with_query", mock_count)
-
     event = {
         "LabelAttributeName": "category",
         "meta_data": {"IntermediateManifestS3Uri": "s3://source_bucket/input.manifest"},
@@ -44,27 +49,13 @@ def test_get_counts_nothing_labeled(monkeypatch):
 
 
 @mock_s3
-def test_get_counts_everything_labeled(monkeypatch):
-    manifest_content = b'{"source": "Fed revises guidelines sending stocks up.", "id": 0}\n{"source": "Review Guardians of the Galaxy", "id": 1}\n'
+def test_get_counts_everything_labeled():
+    records = [labeled_record(i, "yes" if i % 2 else "no") for i in range(2000)]
+    manifest_content = "".join(json.dumps(record) + "\n" for record in records).encode()
     s3r = boto3.resource("s3", region_name="us-east-1")
     s3r.create_bucket(Bucket="source_bucket")
     s3r.Object("source_bucket", "input.manifest").put(Body=manifest_content)
 
-    def mock_count(*args, **kwargs):
-        key = args[0].key
-        query = args[1]
-        if "input.manifest" == key and "select count(*) from s3object s" == query:
-            return 2000
-        if "input.manifest" == key and "\"human-annotated\" IN ('yes')" in query:
-            return 1000
-        if "input.manifest" == key and "\"human-annotated\" IN ('no')" in query:
-            return 1000
-        return 0
-
-    from MetaData import get_counts
-
-    monkeypatch.setattr(get_counts, "get_count_with_query", mock_count)
-
     event = {
         "LabelAttributeName": "category",
         "meta_data": {
@@ -84,3 +75,57 @@ def test_get_counts_everything_labeled(monkeypatch):
     output = lambda_handler(event, {})
 
     assert output == expected_counts
+
+
+def test_count_labels_ignores_other_label_attributes():
+    lines = [
+        json.dumps(labeled_record(0, "yes")),
+        json.dumps({"source": "category-metadata in the text", "id": 1}),
+        json.dumps({"source": "other", "id": 2, "animal-metadata": {"human-annotated": "no"}}),
+    ]
+
+    assert count_labels(lines, "category") == (3, 1, 0)
+
+
+@mock_s3
+def test_get_counts_large_manifest():
+    line_templates = [
+        json.dumps(labeled_record(0, "yes")) + "\n",
+        json.dumps(labeled_record(0, "no")) + "\n",
+        json.dumps({"source": "Review Guardians of the Galaxy", "id": 0}) + "\n",
+    ]
+    block = "".join(line_templates * 1000).encode()
+    n_blocks = max(1, MANIFEST_TEST_SIZE_MB * 1024 * 1024 // len(block))
+
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="source_bucket")
+    upload = s3.create_multipart_upload(Bucket="source_bucket", Key="input.manifest")
+    parts = []
+    blocks_per_part = max(1, 8 * 1024 * 1024 // len(block))
+    for part_number, start in enumerate(range(0, n_blocks, blocks_per_part), start=1):
+        body = block * min(blocks_per_part, n_blocks - start)
+        response = s3.upload_part(
+            Bucket="source_bucket",
+            Key="input.manifest",
+            UploadId=upload["UploadId"],
+            PartNumber=part_number,
+            Body=body,
+        )
+        parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+    s3.complete_multipart_upload(
+        Bucket="source_bucket",
+        Key="input.manifest",
+        UploadId=upload["UploadId"],
+        MultipartUpload={"Parts": parts},
+    )
+
+    event = {
+        "LabelAttributeName": "category",
+        "meta_data": {"IntermediateManifestS3Uri": "s3://source_bucket/input.manifest"},
+    }
+    output = lambda_handler(event, {})
+
+    assert output["input_total"] == n_blocks * 3000
+    assert output["human_label"] == n_blocks * 1000
+    assert output["auto_label"] == n_blocks * 1000
+    assert output["unlabeled"] == n_blocks * 1000
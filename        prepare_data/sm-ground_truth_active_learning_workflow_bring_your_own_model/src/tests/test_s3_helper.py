@@ -0,0 +1,63 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_s3
+from s3_helper import MIN_PART_SIZE, S3Ref, StreamingUpload, stream_lines
+
+
+@mock_s3
+def test_stream_lines_across_chunks():
+    s3r = boto3.resource("s3", region_name="us-east-1")
+    s3r.create_bucket(Bucket="source_bucket")
+    lines = [json.dumps({"source": "héadline {}".format(i), "id": i}) for i in range(1000)]
+    s3r.Object("source_bucket", "input.manifest").put(Body=("\n".join(lines) + "\n\n").encode())
+
+    streamed = list(stream_lines(S3Ref("source_bucket", "input.manifest"), chunk_size=7))
+
+    assert streamed == lines
+
+
+@mock_s3
+def test_streaming_upload_small_file():
+    s3r = boto3.resource("s3", region_name="us-east-1")
+    s3r.create_bucket(Bucket="output_bucket")
+
+    with StreamingUpload(S3Ref("output_bucket", "small.manifest")) as writer:
+        writer.write('{"id": 0}\n')
+        writer.write('{"id": 1}\n')
+
+    body = s3r.Object("output_bucket", "small.manifest").get()["Body"].read()
+    assert body == b'{"id": 0}\n{"id": 1}\n'
+
+
+@mock_s3
+def test_streaming_upload_multipart():
+    s3r = boto3.resource("s3", region_name="us-east-1")
+    s3r.create_bucket(Bucket="output_bucket")
+    line = json.dumps({"source": "x" * 1000, "id": 0}) + "\n"
+    n_lines = 2 * MIN_PART_SIZE // len(line) + 10
+
+    dest = S3Ref("output_bucket", "large.manifest")
+    with StreamingUpload(dest) as writer:
+        for _ in range(n_lines):
+            writer.write(line)
+
+    assert len(writer.parts) == 3
+    assert sum(1 for _ in stream_lines(dest)) == n_lines
+
+
+@mock_s3
+def test_streaming_upload_aborted_on_error():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="output_bucket")
+    line = "x" * 1024 + "\n"
+
+    with pytest.raises(RuntimeError):
+        with StreamingUpload(S3Ref("output_bucket", "failed.manifest")) as writer:
+            for _ in range(MIN_PART_SIZE // len(line) + 1):
+                writer.write(line)
+            raise RuntimeError("failure while writing")
+
+    assert "Contents" not in s3.list_objects_v2(Bucket="output_bucket")
+    assert "Uploads" not in s3.list_multipart_uploads(Bucket="output_bucket")
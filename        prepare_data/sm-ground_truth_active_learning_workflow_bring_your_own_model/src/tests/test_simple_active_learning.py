@@ -1,5 +1,14 @@
+import numpy as np
 import pytest
-from ActiveLearning.helper import SimpleActiveLearning
+from ActiveLearning.helper import (
+    SimpleActiveLearning,
+    entropy_scores,
+    k_center_greedy,
+    least_confidence_scores,
+    margin_scores,
+    predictions_to_matrix,
+    top_k,
+)
 
 
 def test_compute_margin_high_confidence():
@@ -58,3 +67,92 @@ def test_select_for_labeling():
     selected = al.select_for_labeling(predictions, autoannotations)
     assert len(selected) == 1
     assert selected[0] == 1
+
+
+def test_compute_margin_single_label():
+    al = SimpleActiveLearning("test", "animal", ["dog"], 1000)
+    confidence, chosen = al.compute_margin([0.7], ["dog"])
+
+    assert chosen == "dog"
+    assert confidence == pytest.approx(0.7)
+
+
+def test_predictions_to_matrix_orders_columns_by_label():
+    predictions = [
+        {"id": 7, "prob": [0.6, 0.3, 0.1], "label": ["__label__2", "__label__0", "__label__1"]},
+        {"id": 3, "prob": [0.5, 0.5, 0.0], "label": ["__label__0", "__label__1", "__label__2"]},
+    ]
+
+    ids, probabilities = predictions_to_matrix(predictions)
+
+    assert ids.tolist() == [7, 3]
+    assert probabilities.tolist() == [[0.3, 0.1, 0.6], [0.5, 0.5, 0.0]]
+
+
+def test_uncertainty_scores():
+    probabilities = np.array([[0.9, 0.05, 0.05], [0.4, 0.35, 0.25], [1.0, 0.0, 0.0]])
+
+    assert margin_scores(probabilities) == pytest.approx([0.85, 0.05, 1.0])
+    assert least_confidence_scores(probabilities) == pytest.approx([0.1, 0.6, 0.0])
+    assert entropy_scores(probabilities)[2] == pytest.approx(0.0)
+    assert np.argmax(entropy_scores(probabilities)) == 1
+
+
+def test_top_k():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+
+    assert top_k(scores, 3).tolist() == [1, 3, 2]
+    assert top_k(scores, 10).tolist() == [1, 3, 2, 4, 0]
+    assert top_k(scores, 0).tolist() == []
+
+
+def test_k_center_greedy_picks_distinct_clusters():
+    embeddings = np.array([[0.0, 0.0], [0.1, 0.0], [10.0, 0.0], [9.9, 0.0], [0.0, 10.0]])
+
+    selected = k_center_greedy(embeddings, 3)
+
+    assert selected.tolist() == [0, 2, 4]
+
+
+@pytest.mark.parametrize("strategy", ["margin", "entropy", "least_confidence"])
+def test_select_for_labeling_most_uncertain(strategy):
+    al = SimpleActiveLearning("test", "animal", ["dog", "cat"], 2, strategy=strategy)
+    predictions = [
+        {"id": i, "prob": [p, 1.0 - p], "label": ["__label__0", "__label__1"]}
+        for i, p in enumerate([0.95, 0.55, 0.8, 0.5, 0.7])
+    ]
+
+    selected = al.select_for_labeling(predictions, [])
+
+    assert selected == [3, 1]
+
+
+def test_select_for_labeling_random():
+    al = SimpleActiveLearning("test", "animal", ["dog", "cat"], 2, strategy="random", seed=0)
+    predictions = [
+        {"id": i, "prob": [0.5, 0.5], "label": ["__label__0", "__label__1"]} for i in range(5)
+    ]
+
+    selected = al.select_for_labeling(predictions, [{"id": 0}, {"id": 1}])
+
+    assert len(selected) == 2
+    assert set(selected) <= {2, 3, 4}
+
+
+def test_select_for_labeling_diverse():
+    al = SimpleActiveLearning("test", "animal", ["dog", "cat"], 2, diversity_pool_factor=2)
+    predictions = [
+        {"id": 0, "prob": [0.5, 0.5], "label": ["__label__0", "__label__1"], "embedding": [0, 0]},
+        {"id": 1, "prob": [0.51, 0.49], "label": ["__label__0", "__label__1"], "embedding": [0, 0]},
+        {"id": 2, "prob": [0.6, 0.4], "label": ["__label__0", "__label__1"], "embedding": [5, 5]},
+        {"id": 3, "prob": [0.99, 0.01], "label": ["__label__0", "__label__1"], "embedding": [1, 1]},
+    ]
+
+    selected = al.select_for_labeling(predictions, [])
+
+    assert selected == [0, 2]
+
+
+def test_invalid_strategy():
+    with pytest.raises(ValueError):
+        SimpleActiveLearning("test", "animal", ["dog", "cat"], 2, strategy="unknown")
@@ -0,0 +1,253 @@
+"""
+Checks and benchmarks the array based quality metrics of quality_metrics.py.
+
+The problem frames are checked against the previous frame by frame get_problem_frames on
+SeqLabel.json and on synthetic videos with jittering boxes, label gaps and size jumps.
+Then the frames/sec of both are compared for a long video, and the frames/sec of
+analyzing a whole labeling job is measured for several numbers of worker processes.
+
+    python benchmark_quality_metrics.py --frames 2000 --objects 20 --videos 32 --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import distance
+
+from quality_metrics import (
+    embedding_distances,
+    get_problem_frames,
+    load_tracks,
+    outlier_frames,
+    tracks_from_frame,
+)
+
+
+def bb_int_over_union(boxA, boxB):
+    """plotting_funcs.bb_int_over_union"""
+    xA = max(boxA[0], boxB[0])
+    yA = max(boxA[1], boxB[1])
+    xB = min(boxA[2], boxB[2])
+    yB = min(boxA[3], boxB[3])
+    interArea = max(0, xB - xA + 1) * max(0, yB - yA + 1)
+    boxAArea = (boxA[2] - boxA[0] + 1) * (boxA[3] - boxA[1] + 1)
+    boxBArea = (boxB[2] - boxB[0] + 1) * (boxB[3] - boxB[1] + 1)
+    return interArea / float(boxAArea + boxBArea - interArea)
+
+
+def create_annot_frame(annots):
+    """plotting_funcs.create_annot_frame"""
+    rows = [
+        (i, ann["frame"], label["object-name"], label["left"], label["top"])
+        + (label["width"], label["height"])
+        for i, ann in enumerate(annots)
+        for label in ann["annotations"]
+    ]
+    return pd.DataFrame(rows, columns=["frameid", "file", "obj", "left", "top", "width", "height"])
+
+
+def calc_frame_int_over_union(annot_frame, obj, i):
+    """plotting_funcs.calc_frame_int_over_union"""
+    lframe_len = max(annot_frame["frameid"])
+    annot_frame = annot_frame[annot_frame.obj == obj]
+    annot_frame.index = list(np.arange(len(annot_frame)))
+    coord_vec = np.zeros((lframe_len + 1, 4))
+    coord_vec[annot_frame["frameid"].values, 0] = annot_frame["left"]
+    coord_vec[annot_frame["frameid"].values, 1] = annot_frame["top"]
+    coord_vec[annot_frame["frameid"].values, 2] = annot_frame["width"]
+    coord_vec[annot_frame["frameid"].values, 3] = annot_frame["height"]
+    boxA = [
+        coord_vec[i, 0],
+        coord_vec[i, 1],
+        coord_vec[i, 0] + coord_vec[i, 2],
+        coord_vec[i, 1] + coord_vec[i, 3],
+    ]
+    boxB = [
+        coord_vec[i + 1, 0],
+        coord_vec[i + 1, 1],
+        coord_vec[i + 1, 0] + coord_vec[i + 1, 2],
+        coord_vec[i + 1, 1] + coord_vec[i + 1, 3],
+    ]
+    return bb_int_over_union(boxA, boxB)
+
+
+def get_problem_frames_by_frame(lab_frame, size_thresh=0.25, iou_thresh=0.4):
+    """The previous get_problem_frames of quality_metrics_cli.py, without embeddings."""
+    frame_res = {}
+    for obj in list(np.unique(lab_frame.obj)):
+        frame_res[obj] = {}
+        lframe_len = max(lab_frame["frameid"])
+        ann_subframe = lab_frame[lab_frame.obj == obj]
+        size_vec = np.zeros(lframe_len + 1)
+        size_vec[ann_subframe["frameid"].values] = ann_subframe["height"] * ann_subframe["width"]
+        size_diff = np.array(size_vec[:-1]) - np.array(size_vec[1:])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            norm_size_diff = size_diff / np.array(size_vec[:-1])
+        norm_size_diff[np.where(np.isnan(norm_size_diff))[0]] = 0
+        norm_size_diff[np.where(np.isinf(norm_size_diff))[0]] = 0
+        frame_res[obj]["size_diff"] = [int(x) for x in size_diff]
+        frame_res[obj]["norm_size_diff"] = [int(x) for x in norm_size_diff]
+        problem_frames = [int(x) for x in np.where(np.abs(norm_size_diff) > size_thresh)[0]]
+        frame_res[obj]["size_problem_frames"] = problem_frames
+
+        iou_vec = np.ones(len(np.unique(lab_frame.frameid)))
+        for i in lab_frame[lab_frame.obj == obj].frameid[:-1]:
+            iou = calc_frame_int_over_union(lab_frame, obj, i)
+            iou_vec[i] = iou
+
+        frame_res[obj]["iou"] = iou_vec.tolist()
+        inds = [int(x) for x in np.where(iou_vec < iou_thresh)[0]]
+        frame_res[obj]["iou_problem_frames"] = inds
+    return frame_res
+
+
+def compute_dist_by_frame(img_embeds, dist_func=distance.euclidean, obj="Vehicle:1"):
+    """The previous compute_dist of quality_metrics_cli.py."""
+    dists = []
+    inds = []
+    for i in img_embeds:
+        if (i > 0) & (obj in list(img_embeds[i].keys())):
+            if obj in list(img_embeds[i - 1].keys()):
+                dists.append(dist_func(img_embeds[i - 1][obj], img_embeds[i][obj]))
+                inds.append(i)
+    return dists, inds
+
+
+def synthetic_annotations(num_frames, num_objects, seed=0):
+    """tracking-annotations of a video where every object is labeled in one range of frames"""
+    rng = np.random.RandomState(seed)
+    starts = rng.randint(0, num_frames // 2, size=num_objects)
+    starts[0] = 0
+    ends = rng.randint(num_frames // 2, num_frames + 1, size=num_objects)
+    ends[0] = num_frames
+    annots = [
+        {"annotations": [], "frame-no": str(i), "frame": f"{i + 1:06d}.jpg"}
+        for i in range(num_frames)
+    ]
+    for obj in range(num_objects):
+        length = ends[obj] - starts[obj]
+        left = np.cumsum(rng.randint(-3, 4, size=length)) + rng.randint(100, 1500)
+        top = np.cumsum(rng.randint(-3, 4, size=length)) + rng.randint(100, 800)
+        width = np.full(length, rng.randint(20, 200))
+        height = np.full(length, rng.randint(20, 200))
+        # mislabeled frames: boxes that jump or change size
+        jumps = rng.random_sample(length) < 0.02
+        left[jumps] += rng.randint(50, 200, size=jumps.sum())
+        resized = rng.random_sample(length) < 0.02
+        width[resized] = width[resized] * 2
+        # the previous get_problem_frames fails on frames without labels, the first object is
+        # labeled in every frame
+        labeled = (rng.random_sample(length) > 0.01) | (obj == 0)
+        for i in np.flatnonzero(labeled):
+            annots[starts[obj] + i]["annotations"].append(
+                {
+                    "height": int(height[i]),
+                    "width": int(width[i]),
+                    "top": int(top[i]),
+                    "left": int(left[i]),
+                    "class-id": "0",
+                    "object-name": f"Vehicle:{obj + 1}",
+                }
+            )
+    return annots
+
+
+def check_equivalence():
+    with open("SeqLabel.json") as f:
+        videos = [json.load(f)["tracking-annotations"]]
+    videos += [synthetic_annotations(300, n, seed=n) for n in [1, 5, 12]]
+    for annots in videos:
+        lab_frame = create_annot_frame(annots)
+        expected = get_problem_frames_by_frame(lab_frame, iou_thresh=0.5)
+        assert get_problem_frames(tracks_from_frame(lab_frame), iou_thresh=0.5) == expected
+        assert get_problem_frames(load_tracks(annots), iou_thresh=0.5) == expected
+
+    # embedding distances, with frames where the object is missing
+    tracks = load_tracks(videos[-1])
+    rng = np.random.RandomState(0)
+    embeddings = rng.normal(size=tracks.present.shape + (512,))
+    img_embeds = {
+        j: {obj: embeddings[o, j] for o, obj in enumerate(tracks.objs) if tracks.present[o, j]}
+        for j in range(tracks.present.shape[1])
+    }
+    dists = embedding_distances(embeddings, tracks.present)
+    problems = outlier_frames(dists)
+    for o, obj in enumerate(tracks.objs):
+        expected_dists, inds = compute_dist_by_frame(img_embeds, obj=obj)
+        assert np.array_equal(np.flatnonzero(~np.isnan(dists[o])) + 1, inds)
+        assert np.allclose(dists[o][np.array(inds) - 1], expected_dists)
+        prob = np.where(expected_dists > (np.mean(expected_dists) + np.std(expected_dists) * 2))[0]
+        assert np.array_equal(np.flatnonzero(problems[o]) + 1, np.array(inds)[prob])
+
+
+def analyze_file(path):
+    with open(path) as f:
+        annots = json.load(f)["tracking-annotations"]
+    return get_problem_frames(load_tracks(annots))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--objects", type=int, default=20)
+    parser.add_argument("--videos", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print("problem frames and embedding distances match the previous functions")
+
+    annots = synthetic_annotations(args.frames, args.objects)
+    lab_frame = create_annot_frame(annots)
+    print(f"one video, {args.frames} frames, {args.objects} objects, {len(lab_frame)} boxes")
+    print("{:<34} {:>10} {:>12}".format("", "seconds", "frames/sec"))
+    expected, elapsed = timed(get_problem_frames_by_frame, lab_frame)
+    print("{:<34} {:>10.2f} {:>12.0f}".format("frame by frame", elapsed, args.frames / elapsed))
+    result, elapsed = timed(lambda: get_problem_frames(tracks_from_frame(lab_frame)))
+    assert result == expected
+    print("{:<34} {:>10.3f} {:>12.0f}".format("arrays", elapsed, args.frames / elapsed))
+    result, elapsed = timed(lambda: get_problem_frames(load_tracks(annots)))
+    assert result == expected
+    print(
+        "{:<34} {:>10.3f} {:>12.0f}".format(
+            "arrays from the json labels", elapsed, args.frames / elapsed
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(args.videos):
+            paths.append(os.path.join(tmp_dir, f"{i}", "SeqLabel.json"))
+            os.makedirs(os.path.dirname(paths[-1]))
+            with open(paths[-1], "w") as f:
+                json.dump(
+                    {"tracking-annotations": synthetic_annotations(args.frames, args.objects, i)},
+                    f,
+                )
+        print(f"labeling job, {args.videos} videos of {args.frames} frames")
+        for workers in args.workers:
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(analyze_file, paths))
+            elapsed = time.perf_counter() - start
+            assert len(results) == args.videos
+            print(
+                "{:<34} {:>10.2f} {:>12.0f}".format(
+                    f"{workers} workers", elapsed, args.videos * args.frames / elapsed
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Array based quality metrics of Ground Truth video object tracking labels.
+
+The boxes of all objects of a video are loaded once into an (objects, frames, 4) array,
+and the frame to frame IoU, size changes and embedding distances of all objects are
+computed with NumPy operations over the whole array instead of frame by frame.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# Boxes are left, top, width, height. Frames where an object is not labeled have zero boxes.
+Tracks = namedtuple("Tracks", ["objs", "boxes", "present"])
+
+
+def _build_tracks(frameids, objs, boxes):
+    frameids = np.asarray(frameids, dtype=int)
+    names, obj_index = np.unique(np.asarray(objs, dtype=object), return_inverse=True)
+    num_frames = frameids.max() + 1 if len(frameids) else 0
+    track_boxes = np.zeros((len(names), num_frames, 4))
+    present = np.zeros((len(names), num_frames), dtype=bool)
+    track_boxes[obj_index, frameids] = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    present[obj_index, frameids] = True
+    return Tracks(objs=list(names), boxes=track_boxes, present=present)
+
+
+def load_tracks(annots):
+    """
+    Tracks of the "tracking-annotations" of a SeqLabel.json file
+    """
+    frameids, objs, boxes = [], [], []
+    for i, ann in enumerate(annots):
+        for label in ann["annotations"]:
+            frameids.append(i)
+            objs.append(label["object-name"])
+            boxes.append((label["left"], label["top"], label["width"], label["height"]))
+    return _build_tracks(frameids, objs, boxes)
+
+
+def tracks_from_frame(annot_frame):
+    """
+    Tracks of an annotation frame of plotting_funcs.create_annot_frame
+    """
+    return _build_tracks(
+        annot_frame["frameid"].values,
+        annot_frame["obj"].values,
+        annot_frame[["left", "top", "width", "height"]].values,
+    )
+
+
+def int_over_union(boxes_a, boxes_b):
+    """
+    IoU of boxes given as (x1, y1, x2, y2) along their last axis, with the pixel
+    convention of plotting_funcs.bb_int_over_union
+    """
+    x_a = np.maximum(boxes_a[..., 0], boxes_b[..., 0])
+    y_a = np.maximum(boxes_a[..., 1], boxes_b[..., 1])
+    x_b = np.minimum(boxes_a[..., 2], boxes_b[..., 2])
+    y_b = np.minimum(boxes_a[..., 3], boxes_b[..., 3])
+    inter_area = np.maximum(0, x_b - x_a + 1) * np.maximum(0, y_b - y_a + 1)
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0] + 1) * (boxes_a[..., 3] - boxes_a[..., 1] + 1)
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0] + 1) * (boxes_b[..., 3] - boxes_b[..., 1] + 1)
+    return inter_area / (area_a + area_b - inter_area)
+
+
+def frame_int_over_union(tracks):
+    """
+    (objects, frames - 1) IoU of the box of every object in a frame with its box in the next frame
+    """
+    corners = np.concatenate(
+        [tracks.boxes[..., :2], tracks.boxes[..., :2] + tracks.boxes[..., 2:]], axis=-1
+    )
+    return int_over_union(corners[:, :-1], corners[:, 1:])
+
+
+def rolling_int_over_union(tracks):
+    """
+    (objects, frames) IoU of every object with the next frame, for the frames where
+    the object is labeled except its last one, and 1 for all other frames
+    """
+    num_objs, num_frames = tracks.present.shape
+    rolling = np.ones((num_objs, num_frames))
+    if num_frames < 2:
+        return rolling
+    last = num_frames - 1 - np.argmax(tracks.present[:, ::-1], axis=1)
+    compared = tracks.present.copy()
+    compared[np.arange(num_objs), last] = False
+    compared = compared[:, :-1]
+    rolling[:, :-1][compared] = frame_int_over_union(tracks)[compared]
+    return rolling
+
+
+def size_changes(tracks):
+    """
+    (objects, frames - 1) decrease of the box area of every object from a frame to the
+    next one, and that decrease relative to the area in the first frame, which is 0 where
+    the object is not labeled in the first frame
+    """
+    sizes = tracks.boxes[..., 2] * tracks.boxes[..., 3]
+    size_diff = sizes[:, :-1] - sizes[:, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        norm_size_diff = size_diff / sizes[:, :-1]
+    norm_size_diff[~np.isfinite(norm_size_diff)] = 0
+    return size_diff, norm_size_diff
+
+
+def embedding_distances(embeddings, present):
+    """
+    (objects, frames - 1) Euclidean distance of the embedding of every object in a frame to
+    its embedding in the previous frame, NaN where it is not labeled in both frames.
+    :param embeddings: (objects, frames, embedding size) array
+    :param present: (objects, frames) indicator if an embedding exists
+    """
+    dists = np.linalg.norm(embeddings[:, 1:] - embeddings[:, :-1], axis=-1)
+    dists[~(present[:, 1:] & present[:, :-1])] = np.nan
+    return dists
+
+
+def outlier_frames(dists, num_std=2):
+    """
+    (objects, frames - 1) indicator of the distances more than num_std standard deviations
+    above the mean distance of their object
+    """
+    with np.errstate(invalid="ignore"):
+        mean = np.nanmean(dists, axis=1, keepdims=True)
+        std = np.nanstd(dists, axis=1, keepdims=True)
+        return dists > mean + std * num_std
+
+
+def embed_tracks(model, imgs, tracks, batch_size=64, crop_size=224):
+    """
+    (objects, frames, embedding size) embeddings of the box crops of all objects in all images,
+    computed by the model in batches, and the indicator of the crops that could be embedded
+    """
+    import torch
+    from PIL import Image
+
+    crops, index = [], []
+    for frame, img in enumerate(imgs[: tracks.present.shape[1]]):
+        img_arr = np.array(img)
+        for obj in np.flatnonzero(tracks.present[:, frame]):
+            left, top, width, height = tracks.boxes[obj, frame].astype(int)
+            crop = img_arr[top : top + height, left : left + width, :]
+            if crop.size == 0:
+                continue
+            crop = np.array(Image.fromarray(crop).resize((crop_size, crop_size)))
+            crops.append(crop.transpose(2, 0, 1))
+            index.append((obj, frame))
+
+    embedded = np.zeros(tracks.present.shape, dtype=bool)
+    embeddings = None
+    for start in range(0, len(crops), batch_size):
+        batch = torch.tensor(np.stack(crops[start : start + batch_size]), dtype=torch.float)
+        with torch.no_grad():
+            emb = model(batch).reshape(len(batch), -1).numpy()
+        if embeddings is None:
+            embeddings = np.zeros(tracks.present.shape + (emb.shape[1],), dtype=emb.dtype)
+        objs, frames = np.array(index[start : start + batch_size]).T
+        embeddings[objs, frames] = emb
+        embedded[objs, frames] = True
+    if embeddings is None:
+        embeddings = np.zeros(tracks.present.shape + (0,))
+    return embeddings, embedded
+
+
+def get_problem_frames(
+    tracks, size_thresh=0.25, iou_thresh=0.4, embeddings=None, embed_std=2, verbose=False
+):
+    """
+    Potentially problematic frames of every object by bounding box size change, rolling IoU,
+    and optionally by the distance of the embeddings of its crops, as returned by embed_tracks.
+    """
+    size_diff, norm_size_diff = size_changes(tracks)
+    size_problems = np.abs(norm_size_diff) > size_thresh
+    rolling_iou = rolling_int_over_union(tracks)
+    iou_problems = rolling_iou < iou_thresh
+    if embeddings is not None:
+        embed_problems = outlier_frames(embedding_distances(*embeddings), embed_std)
+
+    frame_res = {}
+    for i, obj in enumerate(tracks.objs):
+        frame_res[obj] = {
+            "size_diff": size_diff[i].astype(int).tolist(),
+            "norm_size_diff": norm_size_diff[i].astype(int).tolist(),
+            "size_problem_frames": np.flatnonzero(size_problems[i]).tolist(),
+            "iou": rolling_iou[i].tolist(),
+            "iou_problem_frames": np.flatnonzero(iou_problems[i]).tolist(),
+        }
+        if verbose and len(norm_size_diff[i]):
+            print("Worst frame for", obj, "is: ", np.argmax(np.abs(norm_size_diff[i])))
+        if embeddings is not None:
+            # distances are to the previous frame
+            frame_res[obj]["embed_prob_frames"] = (np.flatnonzero(embed_problems[i]) + 1).tolist()
+    return frame_res
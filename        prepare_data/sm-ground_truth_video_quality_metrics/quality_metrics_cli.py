@@ -1,11 +1,15 @@
 import json
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 import argh
 import boto3
 import numpy as np
+import quality_metrics
 from argh import arg
 from plotting_funcs import *
+from quality_metrics import embed_tracks, load_tracks, tracks_from_frame
 from scipy.spatial import distance
 from tqdm import tqdm
 
@@ -13,17 +17,26 @@ s3 = boto3.client("s3")
 
 
 def compute_dist(img_embeds, dist_func=distance.euclidean, obj="Vehicle:1"):
-    dists = []
-    inds = []
-    for i in img_embeds:
-        if (i > 0) & (obj in list(img_embeds[i].keys())):
-            if obj in list(img_embeds[i - 1].keys()):
-                dist = dist_func(
-                    img_embeds[i - 1][obj], img_embeds[i][obj]
-                )  # distance  between frame at t0 and t1
-                dists.append(dist)
-                inds.append(i)
-    return dists, inds
+    inds = [i for i in img_embeds if i > 0 and obj in img_embeds[i] and obj in img_embeds[i - 1]]
+    if dist_func is not distance.euclidean:
+        dists = [dist_func(img_embeds[i - 1][obj], img_embeds[i][obj]) for i in inds]
+        return dists, inds
+    if len(inds) == 0:
+        return [], inds
+    # distances between frames at t0 and t1, all at once
+    previous = np.stack([np.asarray(img_embeds[i - 1][obj]).ravel() for i in inds])
+    current = np.stack([np.asarray(img_embeds[i][obj]).ravel() for i in inds])
+    return np.linalg.norm(current - previous, axis=1).tolist(), inds
+
+
+def load_embedding_model():
+    import torch
+    import torch.nn as nn
+
+    model = torch.hub.load("pytorch/vision:v0.6.0", "resnet18", pretrained=True)
+    model.eval()
+    modules = list(model.children())[:-1]
+    return nn.Sequential(*modules)
 
 
 def get_problem_frames(
@@ -39,76 +52,62 @@ def get_problem_frames(
     """
     Function for identifying potentially problematic frames using bounding box size, rolling IoU, and optionally embedding comparison.
     """
+    tracks = tracks_from_frame(lab_frame)
+    embeddings = None
     if embed:
-        model = torch.hub.load("pytorch/vision:v0.6.0", "resnet18", pretrained=True)
-        model.eval()
-        modules = list(model.children())[:-1]
-        model = nn.Sequential(*modules)
-
-    frame_res = {}
-    for obj in list(np.unique(lab_frame.obj)):
-        frame_res[obj] = {}
-        lframe_len = max(lab_frame["frameid"])
-        ann_subframe = lab_frame[lab_frame.obj == obj]
-        size_vec = np.zeros(lframe_len + 1)
-        size_vec[ann_subframe["frameid"].values] = ann_subframe["height"] * ann_subframe["width"]
-        size_diff = np.array(size_vec[:-1]) - np.array(size_vec[1:])
-        norm_size_diff = size_diff / np.array(size_vec[:-1])
-        norm_size_diff[np.where(np.isnan(norm_size_diff))[0]] = 0
-        norm_size_diff[np.where(np.isinf(norm_size_diff))[0]] = 0
-        frame_res[obj]["size_diff"] = [int(x) for x in size_diff]
-        frame_res[obj]["norm_size_diff"] = [int(x) for x in norm_size_diff]
-        try:
-            problem_frames = [int(x) for x in np.where(np.abs(norm_size_diff) > size_thresh)[0]]
-            if verbose:
-                worst_frame = np.argmax(np.abs(norm_size_diff))
-                print("Worst frame for", obj, "in", frame, "is: ", worst_frame)
-        except:
-            problem_frames = []
-        frame_res[obj]["size_problem_frames"] = problem_frames
-
-        iou_vec = np.ones(len(np.unique(lab_frame.frameid)))
-        for i in lab_frame[lab_frame.obj == obj].frameid[:-1]:
-            iou = calc_frame_int_over_union(lab_frame, obj, i)
-            iou_vec[i] = iou
-
-        frame_res[obj]["iou"] = iou_vec.tolist()
-        inds = [int(x) for x in np.where(iou_vec < iou_thresh)[0]]
-        frame_res[obj]["iou_problem_frames"] = inds
-
-        if embed:
-            img_crops = {}
-            img_embeds = {}
-
-            for j, img in tqdm(enumerate(imgs)):
-                img_arr = np.array(img)
-                img_embeds[j] = {}
-                img_crops[j] = {}
-                for i, annot in enumerate(flawed_labels["tracking-annotations"][j]["annotations"]):
-                    try:
-                        crop = img_arr[
-                            annot["top"] : (annot["top"] + annot["height"]),
-                            annot["left"] : (annot["left"] + annot["width"]),
-                            :,
-                        ]
-                        new_crop = np.array(Image.fromarray(crop).resize((224, 224)))
-                        img_crops[j][annot["object-name"]] = new_crop
-                        new_crop = np.reshape(new_crop, (1, 224, 224, 3))
-                        new_crop = np.reshape(new_crop, (1, 3, 224, 224))
-                        torch_arr = torch.tensor(new_crop, dtype=torch.float)
-                        with torch.no_grad():
-                            emb = model(torch_arr)
-                        img_embeds[j][annot["object-name"]] = emb.squeeze()
-                    except:
-                        pass
-
-            dists = compute_dist(img_embeds, obj=obj)
-
-            # look for distances that are 2+ standard deviations greater than the mean distance
-            prob_frames = np.where(dists > (np.mean(dists) + np.std(dists) * embed_std))[0]
-            frame_res[obj]["embed_prob_frames"] = prob_frames.tolist()
-
-    return frame_res
+        embeddings = embed_tracks(load_embedding_model(), imgs, tracks)
+
+    return quality_metrics.get_problem_frames(
+        tracks,
+        size_thresh=size_thresh,
+        iou_thresh=iou_thresh,
+        embeddings=embeddings,
+        embed_std=embed_std,
+        verbose=verbose,
+    )
+
+
+def check_label_file(path, size_thresh=0.25, iou_thresh=0.4):
+    """
+    Size and rolling IoU problem frames of every object of a SeqLabel.json file
+    """
+    with open(path, "r") as f:
+        tlabels = json.load(f)
+    return quality_metrics.get_problem_frames(
+        load_tracks(tlabels["tracking-annotations"]),
+        size_thresh=size_thresh,
+        iou_thresh=iou_thresh,
+    )
+
+
+def check_s3_label_file(bucket, key, size_thresh=0.25, iou_thresh=0.4):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "SeqLabel.json")
+        boto3.client("s3").download_file(Bucket=bucket, Key=key, Filename=path)
+        return check_label_file(path, size_thresh=size_thresh, iou_thresh=iou_thresh)
+
+
+def check_labeling_job(bucket, keys, size_thresh=0.25, iou_thresh=0.4, workers=None):
+    """
+    Problem frames of all videos of a labeling job, the SeqLabel.json files are downloaded and
+    analyzed by a pool of worker processes
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            key: executor.submit(check_s3_label_file, bucket, key, size_thresh, iou_thresh)
+            for key in keys
+        }
+        return {key: future.result() for key, future in tqdm(futures.items())}
+
+
+def list_label_files(bucket, prefix):
+    paginator = s3.get_paginator("list_objects_v2")
+    return [
+        obj["Key"]
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith("SeqLabel.json")
+    ]
 
 
 # for frame in tqdm(frame_dict):
@@ -178,9 +177,60 @@ def run_quality_check(
 #     os.system(f'aws s3 cp quality_results.json s3://{bucket}/{save_path}')
 
 
+@arg("--bucket", help="s3 bucket to retrieve labels from and save result to", default=None)
+@arg(
+    "--job_prefix",
+    help="s3 prefix of the labels of a labeling job, all SeqLabel.json files below it are analyzed, an example would look like mot_track_job_results/annotations/consolidated-annotation/output/",
+    default=None,
+)
+@arg(
+    "--size_thresh",
+    help="Threshold for identifying allowable percentage size change for a given object between frames",
+    default=0.25,
+)
+@arg(
+    "--iou_thresh",
+    help="Threshold for identifying the bounding boxes of objects that fall below this IoU metric between frames",
+    default=0.4,
+)
+@arg(
+    "--workers",
+    help="Number of videos analyzed in parallel, defaults to the number of CPUs",
+    default=None,
+)
+@arg("--save_path", help="s3 key to save quality analysis results to", default=None)
+def run_job_quality_check(
+    bucket=None,
+    job_prefix=None,
+    size_thresh=0.25,
+    iou_thresh=0.4,
+    workers=None,
+    save_path=None,
+):
+    """
+    Data quality check of all videos of a Ground Truth Video job.
+    The results are saved as a single json file, with the results of every SeqLabel.json file under its s3 key.
+    """
+    keys = list_label_files(bucket, job_prefix)
+    print(f"Running analysis of {len(keys)} videos...")
+    job_res = check_labeling_job(
+        bucket,
+        keys,
+        size_thresh=float(size_thresh),
+        iou_thresh=float(iou_thresh),
+        workers=int(workers) if workers else None,
+    )
+
+    with open("quality_results.json", "w") as f:
+        json.dump(job_res, f)
+
+    print(f"Output saved to s3 path s3://{bucket}/{save_path}")
+    s3.upload_file(Bucket=bucket, Key=save_path, Filename="quality_results.json")
+
+
 def main():
     parser = argh.ArghParser()
-    parser.add_commands([run_quality_check])
+    parser.add_commands([run_quality_check, run_job_quality_check])
     parser.dispatch()
 
 
@@ -0,0 +1,143 @@
+"""
+Runs program/bootstrap.py as local processes standing in for the hosts of a processing job.
+
+Every host gets its own resourceconfig.json, with the loopback addresses 127.0.0.1,
+127.0.0.2, ... as host names, and the dask-scheduler and dask-worker of this Python
+environment. The last host starts --slow-host-delay seconds late. The script checks that
+the driver only starts once every host has a registered worker, that all hosts shut down
+after the driver, and that the job fails after the startup timeout when a host never
+joins. It prints the startup phase timings of every host, to compare with the fixed
+10 second wait of the previous bootstrap.
+
+Requires dask and distributed, as installed in the container.
+
+    python benchmark_bootstrap.py --hosts 3 --slow-host-delay 5
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BOOTSTRAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "program", "bootstrap.py")
+
+DRIVER = """
+import json
+import os
+import sys
+
+from distributed import Client
+
+client = Client("tcp://{}:{}".format(sys.argv[-1], os.environ["DASK_SCHEDULER_PORT"]))
+workers = client.scheduler_info()["workers"]
+assert client.submit(sum, [1, 2, 3]).result() == 6
+with open(sys.argv[1], "w") as f:
+    json.dump(sorted(worker["name"] for worker in workers.values()), f)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_host(tmp_dir, hosts, current_host, port, timeout):
+    name = current_host.replace(".", "_")
+    config_path = os.path.join(tmp_dir, "resourceconfig_{}.json".format(name))
+    with open(config_path, "w") as f:
+        json.dump({"current_host": current_host, "hosts": hosts}, f)
+    env = dict(
+        os.environ,
+        DASK_PATH=os.path.dirname(sys.executable),
+        RESOURCE_CONFIG_PATH=config_path,
+        DASK_SCHEDULER_PORT=str(port),
+        DASK_SCHEDULER_FILE=os.path.join(tmp_dir, "scheduler.json"),
+        DASK_STARTUP_TIMEOUT=str(timeout),
+        BOOTSTRAP_TIMINGS_PATH=os.path.join(tmp_dir, "timings_{}.json".format(name)),
+    )
+    driver = os.path.join(tmp_dir, "driver.py")
+    result = os.path.join(tmp_dir, "workers.json")
+    return subprocess.Popen(
+        [sys.executable, BOOTSTRAP, driver, result],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+
+def run_cluster(tmp_dir, n_hosts, slow_host_delay, timeout):
+    with open(os.path.join(tmp_dir, "driver.py"), "w") as f:
+        f.write(DRIVER)
+    hosts = ["127.0.0.{}".format(i + 1) for i in range(n_hosts)]
+    port = free_port()
+
+    start = time.monotonic()
+    processes = [start_host(tmp_dir, hosts, host, port, timeout) for host in hosts[:-1]]
+    if n_hosts > 1:
+        time.sleep(slow_host_delay)
+        processes.append(start_host(tmp_dir, hosts, hosts[-1], port, timeout))
+    exit_codes = []
+    for process in processes:
+        try:
+            process.wait(timeout=timeout + 30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        exit_codes.append(process.returncode)
+    elapsed = time.monotonic() - start
+    return hosts, exit_codes, elapsed, [p.stderr.read().decode() for p in processes]
+
+
+def check_cluster(n_hosts, slow_host_delay, timeout):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        hosts, exit_codes, elapsed, errors = run_cluster(tmp_dir, n_hosts, slow_host_delay, timeout)
+        assert exit_codes == [0] * n_hosts, "exit codes {}\n{}".format(exit_codes, errors[0])
+        with open(os.path.join(tmp_dir, "workers.json")) as f:
+            assert json.load(f) == sorted(hosts), "the driver started before all workers joined"
+
+        print(
+            "{} hosts, the last one {}s late, done in {:.1f}s".format(
+                n_hosts, slow_host_delay, elapsed
+            )
+        )
+        for host in hosts:
+            with open(os.path.join(tmp_dir, "timings_{}.json".format(host.replace(".", "_")))) as f:
+                record = json.load(f)
+            phases = ", ".join("{} {:.2f}s".format(k, v) for k, v in record["phases"].items())
+            print("  {:<10} {}".format(host, phases))
+
+
+def check_missing_host(timeout):
+    """The first host of a two host cluster alone fails after the startup timeout."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, "driver.py"), "w") as f:
+            f.write(DRIVER)
+        start = time.monotonic()
+        process = start_host(tmp_dir, ["127.0.0.1", "127.0.0.2"], "127.0.0.1", free_port(), timeout)
+        _, stderr = process.communicate(timeout=timeout + 30)
+        elapsed = time.monotonic() - start
+        assert process.returncode != 0 and b"2 workers to register" in stderr, stderr.decode()
+        assert not os.path.exists(os.path.join(tmp_dir, "workers.json"))
+        print(
+            "a missing host fails the job after {:.1f}s with a {}s timeout".format(elapsed, timeout)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hosts", type=int, default=3)
+    parser.add_argument("--slow-host-delay", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    check_cluster(args.hosts, 0.0, args.timeout)
+    check_cluster(args.hosts, args.slow_host_delay, args.timeout)
+    check_missing_host(5.0)
+
+
+if __name__ == "__main__":
+    main()
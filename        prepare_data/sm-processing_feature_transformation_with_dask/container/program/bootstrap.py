@@ -1,88 +1,194 @@
 #!/usr/bin/env python3
 import json
 import os
+import random
 import socket
 import subprocess
 import sys
 import time
-from shutil import copyfile
-from subprocess import PIPE, Popen
+from collections import OrderedDict
+from contextlib import contextmanager
+from subprocess import Popen
 
-DASK_PATH = "/opt/conda/bin"
+DASK_PATH = os.environ.get("DASK_PATH", "/opt/conda/bin")
+RESOURCE_CONFIG_PATH = os.environ.get("RESOURCE_CONFIG_PATH", "/opt/ml/config/resourceconfig.json")
+SCHEDULER_PORT = int(os.environ.get("DASK_SCHEDULER_PORT", "8786"))
+# Written by the scheduler once it accepts connections, this is its readiness marker
+SCHEDULER_FILE = os.environ.get("DASK_SCHEDULER_FILE", "/tmp/dask-scheduler.json")
+# Bound on every startup phase, after which the job fails instead of waiting forever
+STARTUP_TIMEOUT = float(os.environ.get("DASK_STARTUP_TIMEOUT", "300"))
+# Where to write the startup phase timings of this host, they are always printed to the logs
+TIMINGS_PATH = os.environ.get("BOOTSTRAP_TIMINGS_PATH")
 
 
 def get_resource_config():
-    resource_config_path = "/opt/ml/config/resourceconfig.json"
-    with open(resource_config_path, "r") as f:
+    with open(RESOURCE_CONFIG_PATH, "r") as f:
         return json.load(f)
 
 
-def start_daemons(master_ip):
-    resource_config = get_resource_config()
-    current_host = resource_config["current_host"]
-    scheduler_host = resource_config["hosts"][0]
-
-    cmd_start_scheduler = os.path.join(DASK_PATH, "dask-scheduler")
-    cmd_start_worker = os.path.join(DASK_PATH, "dask-worker")
-    schedule_conn_string = "tcp://{ip}:8786".format(ip=master_ip)
-    if current_host == scheduler_host:
-        Popen([cmd_start_scheduler])
-        Popen([cmd_start_worker, schedule_conn_string])
-    else:
-        worker_process = Popen([cmd_start_worker, schedule_conn_string])
+def wait_until(condition, description, timeout=STARTUP_TIMEOUT, initial_delay=0.05, max_delay=2.0):
+    """
+    Call condition with exponential backoff until it returns a truthy value and return that value.
+    Raises TimeoutError once timeout seconds have passed.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        result = condition()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Exceeded max wait time of {}s for {}".format(timeout, description))
+        # jitter, so that the hosts do not retry in lockstep
+        time.sleep(min(delay * random.uniform(0.5, 1.0), remaining))
+        delay = min(delay * 2, max_delay)
+
+
+@contextmanager
+def phase(timings, name):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.monotonic() - start, 3)
+
+
+def report_timings(current_host, timings):
+    record = {"host": current_host, "phases": timings, "total": round(sum(timings.values()), 3)}
+    print("Bootstrap timings: {}".format(json.dumps(record)), flush=True)
+    if TIMINGS_PATH:
+        with open(TIMINGS_PATH, "w") as f:
+            json.dump(record, f)
+
+
+def resolve_host(host_name):
+    try:
+        return socket.gethostbyname(host_name)
+    except socket.gaierror:
+        return None
 
 
 def get_ip_from_host(host_name):
-    ip_wait_time = 200
-    counter = 0
-    ip = ""
+    return wait_until(lambda: resolve_host(host_name), "hostname resolution of " + host_name)
 
-    while counter < ip_wait_time and ip == "":
-        try:
-            ip = socket.gethostbyname(host_name)
-            break
-        except:
-            counter += 1
-            time.sleep(1)
 
-    if counter == ip_wait_time and ip == "":
-        raise Exception(
-            "Exceeded max wait time of {}s for hostname resolution".format(ip_wait_time)
-        )
+def port_open(ip, port):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as alive_socket:
+        alive_socket.settimeout(2)
+        return alive_socket.connect_ex((ip, port)) == 0
+
+
+def check_running(process, name):
+    if process.poll() is not None:
+        raise RuntimeError("{} exited with code {}".format(name, process.returncode))
+
+
+def start_scheduler():
+    """
+    Start the scheduler and wait until it has written its readiness marker
+    """
+    if os.path.exists(SCHEDULER_FILE):
+        os.remove(SCHEDULER_FILE)
+    scheduler = Popen(
+        [
+            os.path.join(DASK_PATH, "dask-scheduler"),
+            "--port",
+            str(SCHEDULER_PORT),
+            "--scheduler-file",
+            SCHEDULER_FILE,
+        ]
+    )
+
+    def ready():
+        check_running(scheduler, "dask-scheduler")
+        return os.path.exists(SCHEDULER_FILE) and os.path.getsize(SCHEDULER_FILE) > 0
+
+    try:
+        wait_until(ready, "the scheduler readiness marker " + SCHEDULER_FILE)
+    except BaseException:
+        scheduler.terminate()
+        raise
+    return scheduler
+
 
-    return ip
+def start_worker(scheduler_address, current_host):
+    return Popen(
+        [os.path.join(DASK_PATH, "dask-worker"), scheduler_address, "--name", current_host]
+    )
+
+
+def wait_for_workers(scheduler_address, n_workers, processes):
+    """
+    Wait until n_workers workers have registered with the scheduler
+    """
+    from distributed import Client
+
+    with Client(scheduler_address, timeout=STARTUP_TIMEOUT) as client:
+
+        def registered():
+            for name, process in processes.items():
+                check_running(process, name)
+            return len(client.scheduler_info()["workers"]) >= n_workers
+
+        wait_until(registered, "{} workers to register".format(n_workers))
+
+
+def run_driver(scheduler_ip):
+    cmd_string = [os.path.join(DASK_PATH, "python"), str(sys.argv[1])]
+    cmd_string.extend(sys.argv[2:])
+    cmd_string.append(scheduler_ip)
+    result = subprocess.Popen(cmd_string)
+    result.communicate()
+    return result.returncode
 
 
 if __name__ == "__main__":
-    ips = []
+    timings = OrderedDict()
     resource_config = get_resource_config()
-    master_host = resource_config["hosts"][0]
-    scheduler_ip = get_ip_from_host(master_host)
+    hosts = resource_config["hosts"]
+    master_host = hosts[0]
     current_host = resource_config["current_host"]
 
-    # Start Dask cluster in all nodes
-    start_daemons(scheduler_ip)
-
-    # wait for a few seconds until the cluster is up and running
-    time.sleep(10)
+    with phase(timings, "resolve_scheduler_host"):
+        scheduler_ip = get_ip_from_host(master_host)
+    scheduler_address = "tcp://{ip}:{port}".format(ip=scheduler_ip, port=SCHEDULER_PORT)
 
-    # Submit the preprocessing job on the cluster from the first instance. You only need to submit the job once from one node.
+    # Submit the preprocessing job on the cluster from the first instance, once all instances have joined the cluster.
     if current_host == master_host:
-        cmd_string = ["/opt/conda/bin/python", str(sys.argv[1])]
-        cmd_string.extend(sys.argv[2:])
-        cmd_string.append(scheduler_ip)
-        result = subprocess.Popen(cmd_string)
-        _ = result.communicate()[0]
-        exit_code = result.returncode
+        daemons = {}
+        try:
+            with phase(timings, "start_scheduler"):
+                daemons["dask-scheduler"] = start_scheduler()
+            with phase(timings, "start_worker"):
+                daemons["dask-worker"] = start_worker(scheduler_address, current_host)
+            with phase(timings, "wait_for_workers"):
+                wait_for_workers(scheduler_address, len(hosts), daemons)
+            report_timings(current_host, timings)
+
+            with phase(timings, "driver"):
+                exit_code = run_driver(scheduler_ip)
+            report_timings(current_host, timings)
+        finally:
+            # the other hosts shut down once the scheduler is gone
+            for process in daemons.values():
+                process.terminate()
+        sys.exit(exit_code)
     else:
-        while True:
-            scheduler = (scheduler_ip, 8786)
-            alive_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            alive_check = alive_socket.connect_ex(scheduler)
-            if alive_check == 0:
-                pass
-            else:
-                print("Received a shutdown signal from Dask cluster")
-                sys.exit(0)
-            alive_socket.close()
-            time.sleep(2)
+        with phase(timings, "wait_for_scheduler"):
+            wait_until(
+                lambda: port_open(scheduler_ip, SCHEDULER_PORT),
+                "the scheduler at " + scheduler_address,
+            )
+        with phase(timings, "start_worker"):
+            worker = start_worker(scheduler_address, current_host)
+        report_timings(current_host, timings)
+
+        try:
+            while port_open(scheduler_ip, SCHEDULER_PORT):
+                check_running(worker, "dask-worker")
+                time.sleep(2)
+            print("Received a shutdown signal from Dask cluster")
+        finally:
+            worker.terminate()
+        sys.exit(0)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "program"))
+import bootstrap  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_wait_until_times_out():
+    calls = []
+    with pytest.raises(TimeoutError, match="never"):
+        bootstrap.wait_until(lambda: calls.append(1), "never", timeout=0.2)
+    assert len(calls) > 1
+    assert bootstrap.wait_until(lambda: len(calls) > 3 and "ready", "calls", timeout=5) == "ready"
+
+
+def test_cluster_starts_on_readiness_probes(tmp_path, monkeypatch):
+    """
+    Start a real dask-scheduler and two dask-workers standing in for two hosts, the way
+    bootstrap.py does on the first host and the others
+    """
+    distributed = pytest.importorskip("distributed")
+    dask_path = os.path.dirname(sys.executable)
+    if shutil.which("dask-scheduler", path=dask_path) is None:
+        pytest.skip("dask-scheduler is not installed next to the Python interpreter")
+    port = free_port()
+    monkeypatch.setattr(bootstrap, "DASK_PATH", dask_path)
+    monkeypatch.setattr(bootstrap, "SCHEDULER_PORT", port)
+    monkeypatch.setattr(bootstrap, "SCHEDULER_FILE", str(tmp_path / "scheduler.json"))
+    address = "tcp://127.0.0.1:{}".format(port)
+
+    daemons = {}
+    try:
+        daemons["dask-scheduler"] = bootstrap.start_scheduler()
+        assert os.path.getsize(bootstrap.SCHEDULER_FILE) > 0
+        # the probe of the other hosts
+        bootstrap.wait_until(lambda: bootstrap.port_open("127.0.0.1", port), address, timeout=30)
+        for host in ["algo-1", "algo-2"]:
+            daemons[host] = bootstrap.start_worker(address, host)
+        bootstrap.wait_for_workers(address, 2, daemons)
+
+        with distributed.Client(address) as client:
+            workers = client.scheduler_info()["workers"].values()
+            assert sorted(worker["name"] for worker in workers) == ["algo-1", "algo-2"]
+            assert client.submit(sum, [1, 2, 3]).result() == 6
+
+        # a worker that exits fails the wait instead of hanging it
+        daemons["algo-2"].terminate()
+        daemons["algo-2"].wait()
+        with pytest.raises(RuntimeError, match="algo-2 exited"):
+            bootstrap.wait_for_workers(address, 3, daemons)
+    finally:
+        for process in daemons.values():
+            process.terminate()
+            process.wait()
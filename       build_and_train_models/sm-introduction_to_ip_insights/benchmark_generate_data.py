@@ -0,0 +1,187 @@
+# Copyright 2017 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use this
+# file except in compliance with the License. A copy of the License is located at
+#
+#    http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and limitations under the License.
+
+"""Compare the events/sec of generate_dataset and generate_dataset_batched.
+
+The generator loads ip2asn-v4-u32.tsv.gz when it is imported, so this script
+writes a synthetic ASN table with the same layout to a temporary directory
+and runs from there. Usage:
+
+    python benchmark_generate_data.py [--users 1000] [--batched-users 20000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import filecmp
+import gzip as gz
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NUM_ASNS = 400000
+LOG_COLUMNS = [
+    "ip_address",
+    "rcf_id",
+    "user",
+    "timestamp",
+    "time_zone",
+    "request",
+    "status",
+    "size",
+    "referer",
+    "user_agent",
+]
+
+
+def write_asn_file(file_name, num_asns=NUM_ASNS, seed=0):
+    """Split the IPv4 space into num_asns contiguous ranges, like ip2asn-v4-u32.tsv."""
+    rng = np.random.default_rng(seed)
+    bounds = np.sort(rng.choice(2**32 - 1, size=num_asns - 1, replace=False) + 1)
+    begins = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds - 1, [2**32 - 1]])
+    with gz.open(file_name, "wt") as f:
+        for i, (begin, end) in enumerate(zip(begins.tolist(), ends.tolist())):
+            f.write("{}\t{}\t{}\tUS\tAS-{}\n".format(begin, end, 1000 + i, i))
+
+
+def read_log(file_name):
+    """Read an access log like the notebook does."""
+    df = pd.read_csv(file_name, sep=" ", na_values="-", header=None, names=LOG_COLUMNS)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="[%d/%b/%Y:%H:%M:%S")
+    return df
+
+
+def summarize(df, generate_data):
+    """Return statistics of the generative model that both generators should match."""
+    ips = df["ip_address"].map(generate_data.ip2int).to_numpy()
+    df = df.assign(asn=np.searchsorted(generate_data.asn_begin, ips, side="right") - 1)
+    per_user = df.groupby("user")["asn"]
+    return {
+        "events/user": per_user.size().mean(),
+        "median events/user": per_user.size().median(),
+        "ASNs/user": per_user.nunique().mean(),
+    }
+
+
+def check_timestamps(df, generate_data):
+    """Check that all timestamps fall in the DATE_WINDOW_DAYS before END_DATE."""
+    end = pd.Timestamp(generate_data.END_DATE)
+    start = end - pd.Timedelta(days=generate_data.DATE_WINDOW_DAYS)
+    assert ((df["timestamp"] > start) & (df["timestamp"] <= end)).all()
+
+
+def timed(label, func, results):
+    start = time.time()
+    num_events = func()
+    elapsed = time.time() - start
+    results.append((label, elapsed, num_events))
+    return num_events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000, help="users for the per-event script")
+    parser.add_argument("--batched-users", type=int, default=20000)
+    parser.add_argument("--processes", type=int, default=2)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    try:
+        run(args)
+    finally:
+        os.chdir(SCRIPT_DIR)
+        shutil.rmtree(work_dir)
+
+
+def run(args):
+    write_asn_file("ip2asn-v4-u32.tsv.gz")
+    sys.path.insert(0, SCRIPT_DIR)
+    import generate_data
+
+    results = []
+
+    def run_previous():
+        generate_data.generate_dataset(args.users, "previous.log", num_processes=args.processes)
+        return sum(1 for _ in open("previous.log"))
+
+    timed("generate_dataset", run_previous, results)
+    previous_log = read_log("previous.log")
+    check_timestamps(previous_log, generate_data)
+    previous = summarize(previous_log, generate_data)
+
+    # Same number of users as the per-event script, to compare the generated data
+    generate_data.generate_dataset_batched(args.users, "batched_small.log", seed=0)
+    batched_log = read_log("batched_small.log")
+    check_timestamps(batched_log, generate_data)
+    batched = summarize(batched_log, generate_data)
+
+    print("{:<20}{:>22}{:>22}".format("", "generate_dataset", "batched"))
+    for key in previous:
+        print("{:<20}{:>22.1f}{:>22.1f}".format(key, previous[key], batched[key]))
+
+    for output_format in generate_data.OUTPUT_FORMATS:
+        timed(
+            "batched {}".format(output_format),
+            lambda: generate_data.generate_dataset_batched(
+                args.batched_users,
+                "batched." + output_format,
+                output_format=output_format,
+                seed=1,
+                anomaly_rate=0.01,
+            ),
+            results,
+        )
+    timed(
+        "batched log, {} processes".format(args.processes),
+        lambda: generate_data.generate_dataset_batched(
+            args.batched_users,
+            "batched_processes.log",
+            seed=1,
+            anomaly_rate=0.01,
+            num_processes=args.processes,
+        ),
+        results,
+    )
+
+    # The output only depends on the seed, not on the number of processes
+    assert filecmp.cmp("batched.log", "batched_processes.log", shallow=False)
+
+    table = pd.read_parquet("batched.parquet")
+    csv_table = pd.read_csv("batched.csv", parse_dates=["timestamp"])
+    log_table = read_log("batched.log")
+    check_timestamps(log_table, generate_data)
+    for column in generate_data.OUTPUT_COLUMNS:
+        assert (table[column].to_numpy() == csv_table[column].to_numpy()).all(), column
+    assert table["ip_address"].equals(log_table["ip_address"])
+    assert (table["timestamp"].to_numpy() == log_table["timestamp"].to_numpy()).all()
+    print("log, csv and parquet outputs hold the same events for the same seed")
+    print("anomaly rate: {:.4f} (requested 0.01)".format(table["is_anomaly"].mean()))
+
+    print()
+    print("{:<32}{:>10}{:>12}{:>14}".format("", "seconds", "events", "events/sec"))
+    for label, elapsed, num_events in results:
+        print(
+            "{:<32}{:>10.1f}{:>12}{:>14.0f}".format(
+                label, elapsed, num_events, num_events / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
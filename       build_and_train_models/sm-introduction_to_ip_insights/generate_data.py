@@ -16,6 +16,7 @@ import gzip as gz
 import multiprocessing as mp
 import socket
 import struct
+from collections import deque
 from functools import partial
 
 import numpy as np
@@ -53,6 +54,12 @@ LOG_FORMAT = '{} - {} [{}] "GET /login_success HTTP/1.1" 200 476 "-" \
 "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_6) AppleWebKit/555.33 \
 (KHTML, like Gecko) Chrome/1.1.1111.100 Safari/555.355"\n'
 END_DATE = datetime.datetime(2018, 11, 14)
+DATE_WINDOW_DAYS = 10
+
+# Batched generation
+USERS_PER_BATCH = 1000
+OUTPUT_FORMATS = ("log", "csv", "parquet")
+OUTPUT_COLUMNS = ["user", "ip_address", "timestamp", "is_anomaly"]
 
 
 def ip2int(ip):
@@ -78,6 +85,10 @@ global asn_list
 asn_list = load_asn_list()
 print("Loaded ASN List: {} ASNs.".format(len(asn_list)))
 
+# The same IP ranges as arrays, for drawing many IP addresses at once
+asn_begin = np.fromiter((asn["begin"] for asn in asn_list), dtype=np.int64, count=len(asn_list))
+asn_end = np.fromiter((asn["end"] for asn in asn_list), dtype=np.int64, count=len(asn_list))
+
 
 def int2ip(n):
     """Convert an long to IP string."""
@@ -309,3 +320,380 @@ def generate_dataset(
     pool.close()
     pool.join()
     print("Finished simulating web activity for {} users.".format(num_users))
+
+
+# Lookup tables for formatting IP addresses and timestamps without per-event Python calls
+OCTET_STRINGS = np.array([str(i).encode() for i in range(256)])
+TWO_DIGIT_STRINGS = np.array(["{:02d}".format(i).encode() for i in range(60)])
+
+CSV_HEADER = ",".join(OUTPUT_COLUMNS) + "\n"
+CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def int2ip_array(ip_ints):
+    """Convert an array of longs to an array of IP byte strings."""
+    ip_ints = np.asarray(ip_ints, dtype=np.int64)
+    ip_strings = OCTET_STRINGS[(ip_ints >> 24) & 255]
+    for shift in (16, 8, 0):
+        ip_strings = np.char.add(
+            np.char.add(ip_strings, b"."), OCTET_STRINGS[(ip_ints >> shift) & 255]
+        )
+    return ip_strings
+
+
+def draw_ips_from_asns(rng, asns):
+    """Draw an IP address uniform at random from each of the given ASN idx."""
+    return rng.integers(asn_begin[asns], asn_end[asns] + 1)
+
+
+def generate_users(rng, num_users, max_num_of_events=MAX_NUM_OF_EVENTS):
+    """Draw the home and work ASN ids, activity and probabilities for a batch of users.
+
+    This follows the same generative model as `generate_user_asns` and
+    `generate_user_login_events`, for all users of the batch at once.
+
+    :param rng: (numpy.random.Generator) the random generator of the batch
+    :param num_users: (int) the number of users to draw
+    :param max_num_of_events: (int) the max number of events of a user
+    :return (dict[str, numpy.ndarray]) the home, work, num_events, p_travel
+        and p_home of every user
+    """
+    num_asn = len(asn_list)
+    window = HOME_WORK_DISTANCE_UNIFORM_WINDOW
+
+    home = rng.integers(num_asn, size=num_users)
+
+    # Work is drawn around home like in generate_user_asns, skipping the zero offset
+    work = home.copy()
+    redraw = np.ones(num_users, dtype=bool)
+    while redraw.any():
+        offset = rng.integers(-window, window - 1, size=redraw.sum())
+        offset[offset >= 0] += 1
+        work[redraw] = (home[redraw] + offset) % num_asn
+        redraw = work == home
+
+    num_events = NUM_EVENTS_PARETO_SCALE * (
+        rng.pareto(NUM_EVENTS_PARETO_A, size=num_users) + NUM_EVENTS_PARETO_LOC
+    )
+    num_events = np.minimum(num_events.astype(np.int64), max_num_of_events)
+
+    return {
+        "home": home,
+        "work": work,
+        "num_events": num_events,
+        "p_travel": rng.beta(P_TRAVEL_ALPHA, P_TRAVEL_BETA, size=num_users),
+        "p_home": rng.beta(P_HOME_ALPHA, P_HOME_BETA, size=num_users),
+    }
+
+
+def generate_events(
+    rng, first_user_id, num_users, max_num_of_events=MAX_NUM_OF_EVENTS, anomaly_rate=0.0
+):
+    """Generate the login events of a batch of consecutive users.
+
+    The IP address of every event is drawn like in `draw_user_ip`. With
+    probability anomaly_rate, an event is replaced by a login from a random
+    IP address, like the malicious traffic that is injected in the notebook.
+
+    :param rng: (numpy.random.Generator) the random generator of the batch
+    :param first_user_id: (int) the id of the first user of the batch
+    :param num_users: (int) the number of users in the batch
+    :param max_num_of_events: (int) the max number of events of a user
+    :param anomaly_rate: (float) the probability that an event is anomalous
+    :return (dict[str, numpy.ndarray]) the user_id, ip (long), timestamp
+        (seconds before END_DATE) and is_anomaly of every event
+    """
+    num_asn = len(asn_list)
+    users = generate_users(rng, num_users, max_num_of_events)
+
+    event_user = np.repeat(np.arange(num_users), users["num_events"])
+    num_events = len(event_user)
+
+    # Users are at home or at work, and travel locally around them
+    at_home = rng.random(num_events) < users["p_home"][event_user]
+    home_or_work = np.where(at_home, users["home"][event_user], users["work"][event_user])
+    local_asn = (
+        np.trunc(rng.normal(loc=home_or_work, scale=HOME_WORK_LOCALITY_WINDOW_SIGMA)).astype(
+            np.int64
+        )
+        % num_asn
+    )
+
+    # Unless they are traveling, then they pick a random ASN
+    traveling = rng.random(num_events) < users["p_travel"][event_user]
+    asn = np.where(traveling, rng.integers(num_asn, size=num_events), local_asn)
+
+    ip = draw_ips_from_asns(rng, asn)
+
+    is_anomaly = rng.random(num_events) < anomaly_rate
+    num_anomalies = is_anomaly.sum()
+    if num_anomalies:
+        ip[is_anomaly] = draw_ips_from_asns(rng, rng.integers(num_asn, size=num_anomalies))
+
+    date_window_sec = int(datetime.timedelta(days=DATE_WINDOW_DAYS).total_seconds())
+
+    return {
+        "user_id": first_user_id + event_user,
+        "ip": ip,
+        "timestamp": rng.integers(0, date_window_sec, size=num_events),
+        "is_anomaly": is_anomaly,
+    }
+
+
+def format_timestamps(seconds_before_end, date_format=LOG_DATE_FORMAT, end=END_DATE):
+    """Format an array of seconds before end as byte strings.
+
+    date_format must hold "%H:%M:%S" after the date, like LOG_DATE_FORMAT and CSV_DATE_FORMAT.
+    Only the dates are formatted with strftime, once per day.
+    """
+    seconds_before_end = np.asarray(seconds_before_end, dtype=np.int64)
+    day_format, time_suffix = date_format.split("%H:%M:%S")
+
+    # Count the seconds from the midnight before the earliest timestamp
+    first_day = (end - datetime.timedelta(seconds=int(seconds_before_end.max(initial=0)))).date()
+    first_midnight = datetime.datetime.combine(first_day, datetime.time())
+    seconds = int((end - first_midnight).total_seconds()) - seconds_before_end
+
+    day, seconds = np.divmod(seconds, 24 * 60 * 60)
+    hour, seconds = np.divmod(seconds, 60 * 60)
+    minute, second = np.divmod(seconds, 60)
+
+    day_strings = np.array(
+        [
+            (first_day + datetime.timedelta(days=i)).strftime(day_format).encode()
+            for i in range(day.max(initial=0) + 1)
+        ]
+    )
+
+    timestamp_strings = np.char.add(day_strings[day], TWO_DIGIT_STRINGS[hour])
+    for part in (minute, second):
+        timestamp_strings = np.char.add(
+            np.char.add(timestamp_strings, b":"), TWO_DIGIT_STRINGS[part]
+        )
+    return np.char.add(timestamp_strings, time_suffix.encode())
+
+
+def format_user_names(user_ids):
+    """Format an array of user ids as "user_<id>" byte strings, once per user."""
+    first_user_id = user_ids.min(initial=0)
+    user_names = np.char.add(
+        b"user_", np.arange(first_user_id, user_ids.max(initial=0) + 1).astype(bytes)
+    )
+    return user_names[user_ids - first_user_id]
+
+
+def join_fields(fields, separators):
+    """Join arrays of byte strings into one line per element, with separators around the fields.
+
+    separators holds one more string than fields: the text before the first field,
+    between every two fields and after the last field. The constant text at the
+    start and end of the lines is joined with bytes.join, which is faster than
+    appending it to every element.
+    """
+    lines = fields[0]
+    for separator, field in zip(separators[1:], fields[1:]):
+        lines = np.char.add(np.char.add(lines, separator.encode()), field)
+
+    if not len(lines):
+        return b""
+    prefix, suffix = separators[0].encode(), separators[-1].encode()
+    return prefix + (suffix + prefix).join(lines.tolist()) + suffix
+
+
+def format_events_as_log(events):
+    """Format a batch of events as the lines of an access log, like `format_event_as_log`."""
+    return join_fields(
+        [
+            int2ip_array(events["ip"]),
+            format_user_names(events["user_id"]),
+            format_timestamps(events["timestamp"]),
+        ],
+        LOG_FORMAT.split("{}"),
+    )
+
+
+def format_events_as_csv(events):
+    """Format a batch of events as CSV lines with OUTPUT_COLUMNS."""
+    return join_fields(
+        [
+            format_user_names(events["user_id"]),
+            int2ip_array(events["ip"]),
+            format_timestamps(events["timestamp"], CSV_DATE_FORMAT),
+            events["is_anomaly"].astype(np.int8).astype(bytes),
+        ],
+        ["", ",", ",", ",", "\n"],
+    )
+
+
+def events_to_table(events, end=END_DATE):
+    """Return a batch of events as a pyarrow Table with OUTPUT_COLUMNS."""
+    import pyarrow as pa
+
+    return pa.table(
+        {
+            "user": pa.array(format_user_names(events["user_id"])).cast(pa.string()),
+            "ip_address": pa.array(int2ip_array(events["ip"])).cast(pa.string()),
+            "timestamp": np.datetime64(end, "s") - events["timestamp"].astype("timedelta64[s]"),
+            "is_anomaly": events["is_anomaly"],
+        }
+    )
+
+
+def generate_batch(
+    seed, users_per_batch, num_users, max_num_of_events, anomaly_rate, output_format, batch
+):
+    """Generate and format the events of one batch of users.
+
+    Every batch has its own random generator derived from the seed and the
+    batch index, so the output only depends on the seed and users_per_batch.
+    """
+    rng = np.random.default_rng([seed, batch])
+    first_user_id = batch * users_per_batch
+    num_batch_users = min(users_per_batch, num_users - first_user_id)
+    events = generate_events(rng, first_user_id, num_batch_users, max_num_of_events, anomaly_rate)
+
+    if output_format == "log":
+        return format_events_as_log(events)
+    if output_format == "csv":
+        return format_events_as_csv(events)
+    return events_to_table(events)
+
+
+class EventWriter(object):
+    """Write formatted batches of events to a log, CSV or Parquet file."""
+
+    def __init__(self, file_name, output_format):
+        self.output_format = output_format
+        self.parquet_writer = None
+        self.num_events = 0
+
+        if file_name.startswith("s3://"):
+            import s3fs
+
+            self.fp = s3fs.S3FileSystem().open(file_name, "wb")
+        else:
+            self.fp = open(file_name, "wb")
+
+        if output_format == "csv":
+            self.fp.write(CSV_HEADER.encode())
+
+    def write(self, batch):
+        if self.output_format == "parquet":
+            import pyarrow.parquet as pq
+
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.fp, batch.schema)
+            self.parquet_writer.write_table(batch)
+            self.num_events += batch.num_rows
+        else:
+            self.fp.write(batch)
+            self.num_events += batch.count(b"\n")
+
+    def close(self):
+        if self.output_format == "parquet" and self.parquet_writer is None:
+            # No user was generated, write an empty table so that the file is still valid Parquet
+            no_events = {
+                "user_id": np.empty(0, dtype=np.int64),
+                "ip": np.empty(0, dtype=np.int64),
+                "timestamp": np.empty(0, dtype=np.int64),
+                "is_anomaly": np.empty(0, dtype=bool),
+            }
+            self.write(events_to_table(no_events))
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        self.fp.close()
+
+
+def bounded_imap(pool, func, iterable, max_pending):
+    """Like pool.imap, but with at most max_pending results waiting to be consumed."""
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def generate_dataset_batched(
+    num_users,
+    file_name,
+    output_format="log",
+    seed=None,
+    anomaly_rate=0.0,
+    max_num_of_events=MAX_NUM_OF_EVENTS,
+    users_per_batch=USERS_PER_BATCH,
+    num_processes=1,
+):
+    """Generate user traffic for specified number of users, a batch of users at a time.
+
+    This simulates the same scenario as `generate_dataset`, but draws the
+    events of a whole batch of users with NumPy and formats them with array
+    operations, instead of drawing and formatting every event in Python.
+    The batches are written to file_name in order as they are generated.
+
+    :param num_users: (int) the number of users to simulate
+    :param file_name: (str) the local or s3:// path of the output file
+    :param output_format: (str) "log" for access log lines like `generate_dataset`,
+        "csv" or "parquet" for a table with OUTPUT_COLUMNS
+    :param seed: (int) the seed to reproduce a dataset, a random one is drawn and printed if None
+    :param anomaly_rate: (float) the probability that an event is a login from a
+        random IP address. Only the csv and parquet outputs label them in is_anomaly.
+    :param max_num_of_events: (int) the max number of events of a user
+    :param users_per_batch: (int) the number of users generated at a time
+    :param num_processes: (int) the number of processes generating batches
+    :return (int) the number of events written
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("output_format must be one of {}".format(OUTPUT_FORMATS))
+    if not 0.0 <= anomaly_rate <= 1.0:
+        raise ValueError("anomaly_rate must be between 0 and 1")
+
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**63)
+    print("Starting User Activity Simulation with seed {}".format(seed))
+
+    num_batches = -(-num_users // users_per_batch)
+    generate_func = partial(
+        generate_batch,
+        seed,
+        users_per_batch,
+        num_users,
+        max_num_of_events,
+        anomaly_rate,
+        output_format,
+    )
+
+    try:
+        from tqdm import tqdm
+
+        pbar = tqdm(total=num_users, unit="users")
+    except ImportError:
+        pbar = None
+
+    writer = EventWriter(file_name, output_format)
+    pool = mp.Pool(num_processes) if num_processes > 1 else None
+    try:
+        if pool:
+            batches = bounded_imap(pool, generate_func, range(num_batches), 2 * num_processes)
+        else:
+            batches = map(generate_func, range(num_batches))
+
+        for batch in batches:
+            writer.write(batch)
+            if pbar:
+                pbar.update(min(users_per_batch, num_users - pbar.n))
+    finally:
+        writer.close()
+        if pool:
+            pool.close()
+            pool.join()
+        if pbar:
+            pbar.close()
+
+    print(
+        "Finished simulating web activity for {} users: {} events.".format(
+            num_users, writer.num_events
+        )
+    )
+    return writer.num_events
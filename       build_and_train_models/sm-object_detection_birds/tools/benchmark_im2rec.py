@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare the images/sec of the im2rec packing against the number of workers.
+
+Writes synthetic JPEGs and a .lst file with packed labels like the birds
+notebook, then packs them with the previous pipeline (read workers sending
+the encoded images through a queue to one writer process) and with the
+sharded workers of im2rec.py. Every run must produce the same .rec/.idx
+bytes. Usage:
+
+    python tools/benchmark_im2rec.py [--images 2000] [--workers 1 2 4]
+"""
+
+from __future__ import print_function
+
+import argparse
+import filecmp
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import mxnet as mx
+import numpy as np
+
+curr_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, curr_path)
+import im2rec
+
+
+def write_images(root, num_images, seed=0):
+    """Write num_images smooth random JPEGs and a .lst file with one box per image."""
+    rng = np.random.RandomState(seed)
+    os.makedirs(os.path.join(root, "images"))
+    with open(os.path.join(root, "bench.lst"), "w") as fout:
+        for i in range(num_images):
+            height, width = rng.randint(300, 500), rng.randint(300, 500)
+            small = rng.randint(0, 256, size=(height // 16, width // 16, 3)).astype(np.uint8)
+            img = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+            img = cv2.add(img, rng.randint(0, 16, size=img.shape).astype(np.uint8))
+            fname = "img_%06d.jpg" % i
+            cv2.imwrite(os.path.join(root, "images", fname), img)
+            xmin, ymin = rng.uniform(0, 0.5, size=2)
+            label = [2, 5, rng.randint(10), xmin, ymin, xmin + 0.4, ymin + 0.4]
+            fout.write("%d\t%s\t%s\n" % (i, "\t".join("%f" % x for x in label), fname))
+
+
+def previous_encode(args, i, item, q_out):
+    q_out.put((i, im2rec.image_encode(args, item), item))
+
+
+def previous_read_worker(args, q_in, q_out):
+    while True:
+        deq = q_in.get()
+        if deq is None:
+            break
+        i, item = deq
+        previous_encode(args, i, item, q_out)
+
+
+def previous_write_worker(q_out, fname, working_dir):
+    count = 0
+    fname = os.path.basename(fname)
+    fname_rec = os.path.splitext(fname)[0] + ".rec"
+    fname_idx = os.path.splitext(fname)[0] + ".idx"
+    record = mx.recordio.MXIndexedRecordIO(
+        os.path.join(working_dir, fname_idx), os.path.join(working_dir, fname_rec), "w"
+    )
+    buf = {}
+    more = True
+    while more:
+        deq = q_out.get()
+        if deq is not None:
+            i, s, item = deq
+            buf[i] = (s, item)
+        else:
+            more = False
+        while count in buf:
+            s, item = buf[count]
+            del buf[count]
+            if s is not None:
+                record.write_idx(item[0], s)
+            count += 1
+
+
+def previous_write_record(args, fname, working_dir):
+    """The packing of im2rec.py before the sharded workers."""
+    image_list = im2rec.read_list(fname)
+    if args.num_thread == 1:
+        fname = os.path.splitext(os.path.basename(fname))[0]
+        record = mx.recordio.MXIndexedRecordIO(
+            os.path.join(working_dir, fname + ".idx"),
+            os.path.join(working_dir, fname + ".rec"),
+            "w",
+        )
+        for item in image_list:
+            s = im2rec.image_encode(args, item)
+            if s is not None:
+                record.write_idx(item[0], s)
+        record.close()
+        return
+
+    q_in = [multiprocessing.Queue(1024) for i in range(args.num_thread)]
+    q_out = multiprocessing.Queue(1024)
+    read_process = [
+        multiprocessing.Process(target=previous_read_worker, args=(args, q_in[i], q_out))
+        for i in range(args.num_thread)
+    ]
+    for p in read_process:
+        p.start()
+    write_process = multiprocessing.Process(
+        target=previous_write_worker, args=(q_out, fname, working_dir)
+    )
+    write_process.start()
+
+    for i, item in enumerate(image_list):
+        q_in[i % len(q_in)].put((i, item))
+    for q in q_in:
+        q.put(None)
+    for p in read_process:
+        p.join()
+
+    q_out.put(None)
+    write_process.join()
+
+
+def peak_rss_mib():
+    """Return the peak RSS of this process and of its largest child, in MiB."""
+    with open("/proc/self/status") as f:
+        own = [int(line.split()[1]) for line in f if line.startswith("VmHWM")][0]
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024.0, children / 1024.0
+
+
+def run(mode, root, out_dir, workers):
+    """Pack root/bench.lst into out_dir and print the elapsed time as JSON."""
+    os.makedirs(out_dir)
+    fname = os.path.join(out_dir, "bench.lst")
+    shutil.copy(os.path.join(root, "bench.lst"), fname)
+    args = im2rec.parse_args(
+        [
+            "--resize",
+            "256",
+            "--pack-label",
+            "--num-thread",
+            str(workers),
+            "--shard-size",
+            "250",
+            fname,
+            os.path.join(root, "images"),
+        ]
+    )
+    start = time.time()
+    if mode == "previous":
+        previous_write_record(args, fname, out_dir)
+    else:
+        im2rec.write_record(args, fname, out_dir)
+    elapsed = time.time() - start
+    own, child = peak_rss_mib()
+    print(json.dumps({"seconds": elapsed, "own_mib": own, "child_mib": child}))
+
+
+def run_in_subprocess(mode, root, out_dir, workers):
+    output = subprocess.check_output(
+        [sys.executable, __file__, "--run", mode, "--root", root, "--out", out_dir]
+        + ["--workers", str(workers)],
+        stderr=subprocess.DEVNULL,
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def check_resume(root, expected_dir):
+    """Write half of the shards and a partial one, then check that packing resumes from them.
+
+    This runs with one worker, in this process, to count the images that are encoded.
+    """
+    out_dir = os.path.join(root, "resume")
+    os.makedirs(out_dir)
+    fname = os.path.join(out_dir, "bench.lst")
+    shutil.copy(os.path.join(root, "bench.lst"), fname)
+    args = im2rec.parse_args(
+        ["--resize", "256", "--pack-label", "--num-thread", "1", "--shard-size", "250"]
+        + [fname, os.path.join(root, "images")]
+    )
+    image_list = list(im2rec.read_list(fname))
+    shards = []
+    for start in range(0, len(image_list), args.shard_size):
+        items = image_list[start : start + args.shard_size]
+        shards.append(im2rec.shard_paths(args, out_dir, fname, start, items) + (items,))
+    written = shards[: len(shards) // 2]
+    for shard in written:
+        im2rec.write_shard(args, shard)
+    with open(shards[-1][1] + ".tmp", "wb") as f:
+        f.write(b"interrupted")
+    # A shard of a run with another shard size, which is removed after the merge
+    with open(os.path.join(out_dir, "bench.part-0-100-00000000.rec"), "wb") as f:
+        f.write(b"stale")
+
+    # Count the images encoded by the resumed run
+    encoded = []
+    image_encode = im2rec.image_encode
+    im2rec.image_encode = lambda args, item: encoded.append(item) or image_encode(args, item)
+    try:
+        im2rec.write_record(args, fname, out_dir)
+    finally:
+        im2rec.image_encode = image_encode
+
+    assert len(encoded) == sum(len(items) for _, _, items in shards[len(written) :])
+    assert filecmp.cmp(
+        os.path.join(out_dir, "bench.rec"), os.path.join(expected_dir, "bench.rec"), shallow=False
+    )
+    assert filecmp.cmp(
+        os.path.join(out_dir, "bench.idx"), os.path.join(expected_dir, "bench.idx"), shallow=False
+    )
+    assert not [f for f in os.listdir(out_dir) if ".part-" in f]
+    print(
+        "a resumed run reuses %d of %d shards and writes the same files"
+        % (len(written), len(shards))
+    )
+
+    # Shards written with other encoding settings are not reused
+    for shard in written:
+        im2rec.write_shard(args, shard)
+    args.resize = 128
+    del encoded[:]
+    im2rec.image_encode = lambda args, item: encoded.append(item) or image_encode(args, item)
+    try:
+        im2rec.write_record(args, fname, out_dir)
+    finally:
+        im2rec.image_encode = image_encode
+    assert len(encoded) == len(image_list)
+    assert not [f for f in os.listdir(out_dir) if ".part-" in f]
+    print("a run with another --resize encodes all the images again")
+
+
+def check_records(out_dir, num_images):
+    """Check that the merged .idx points at the records of the right images."""
+    record = mx.recordio.MXIndexedRecordIO(
+        os.path.join(out_dir, "bench.idx"), os.path.join(out_dir, "bench.rec"), "r"
+    )
+    assert sorted(record.keys) == list(range(num_images))
+    for key in [0, num_images // 2, num_images - 1]:
+        header, img = mx.recordio.unpack_img(record.read_idx(key))
+        assert header.id == key and min(img.shape[:2]) == 256
+    record.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--run", choices=["previous", "sharded"], help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.root, args.out, args.workers[0])
+        return
+
+    root = tempfile.mkdtemp()
+    try:
+        write_images(root, args.images)
+        results = []
+        expected_dir = None
+        for workers in args.workers:
+            for mode in ["previous", "sharded"]:
+                out_dir = os.path.join(root, "%s_%d" % (mode, workers))
+                result = run_in_subprocess(mode, root, out_dir, workers)
+                results.append((mode, workers, result))
+                if expected_dir is None:
+                    expected_dir = out_dir
+                    check_records(out_dir, args.images)
+                for ext in [".rec", ".idx"]:
+                    assert filecmp.cmp(
+                        os.path.join(out_dir, "bench" + ext),
+                        os.path.join(expected_dir, "bench" + ext),
+                        shallow=False,
+                    ), (mode, workers, ext)
+        print("all runs wrote the same .rec/.idx files")
+        check_resume(root, expected_dir)
+
+        print()
+        print(
+            "%-10s %8s %10s %12s %16s %16s"
+            % ("", "workers", "seconds", "images/sec", "parent MiB", "max child MiB")
+        )
+        for mode, workers, result in results:
+            print(
+                "%-10s %8d %10.1f %12.0f %16.0f %16.0f"
+                % (
+                    mode,
+                    workers,
+                    result["seconds"],
+                    args.images / result["seconds"],
+                    result["own_mib"],
+                    result["child_mib"],
+                )
+            )
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark the request path of sklearn_abalone_featurizer.py (input_fn -> predict_fn ->
+output_fn) for payloads of 1 to 100k rows, comparing the original row-by-row JSON encoding
+and np.insert with the vectorized encoders and the binary (.npy / Arrow IPC) formats.
+
+Run it in an environment with the SageMaker scikit-learn container dependencies installed:
+
+    python benchmark_featurizer_io.py --sizes 1 100 10000 100000
+"""
+import argparse
+import json
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sklearn.compose import ColumnTransformer, make_column_selector
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+import sklearn_abalone_featurizer as featurizer
+
+
+def make_data(rows, rng):
+    data = {name: rng.uniform(0.0, 1.0, size=rows) for name in featurizer.feature_columns_names[1:]}
+    df = pd.DataFrame(data)
+    df.insert(0, "sex", rng.choice(["M", "F", "I"], size=rows))
+    df[featurizer.label_column] = rng.randint(1, 30, size=rows).astype(np.float64)
+    return df
+
+
+def fit_preprocessor(df):
+    preprocessor = ColumnTransformer(
+        transformers=[
+            (
+                "num",
+                make_pipeline(SimpleImputer(strategy="median"), StandardScaler()),
+                make_column_selector(dtype_exclude="category"),
+            ),
+            (
+                "cat",
+                make_pipeline(
+                    SimpleImputer(strategy="constant", fill_value="missing"),
+                    OneHotEncoder(handle_unknown="ignore"),
+                ),
+                make_column_selector(dtype_include="category"),
+            ),
+        ]
+    )
+    features = df.drop(featurizer.label_column, axis=1).astype({"sex": "category"})
+    return preprocessor.fit(features)
+
+
+def legacy_request(payload, model):
+    """The original CSV -> np.insert -> row-by-row JSON path"""
+    df = featurizer.input_fn(payload, "text/csv")
+    features = model.transform(df)
+    prediction = np.insert(features, 0, df[featurizer.label_column], axis=1)
+    instances = []
+    for row in prediction.tolist():
+        instances.append({"features": row})
+    return json.dumps({"instances": instances})
+
+
+def fast_request(payload, model, content_type, accept):
+    df = featurizer.input_fn(payload, content_type)
+    prediction = featurizer.predict_fn(df, model)
+    return featurizer.output_fn(prediction, accept)
+
+
+def encode_payloads(df):
+    csv = df.to_csv(header=False, index=False)
+    npy = BytesIO()
+    np.save(npy, df.to_records(index=False, column_dtypes={"sex": "U1"}))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return csv, npy.getvalue(), sink.getvalue().to_pybytes()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    model = fit_preprocessor(make_data(10000, rng))
+
+    paths = [
+        ("csv -> json (original)", None, None),
+        ("csv -> json", "text/csv", "application/json"),
+        ("csv -> csv", "text/csv", "text/csv"),
+        ("npy -> npy", featurizer.NPY_CONTENT_TYPE, featurizer.NPY_CONTENT_TYPE),
+        ("arrow -> arrow", featurizer.ARROW_CONTENT_TYPE, featurizer.ARROW_CONTENT_TYPE),
+    ]
+    print("{:>8} {:<24} {:>12} {:>14}".format("rows", "path", "ms", "rows/s"))
+    for rows in args.sizes:
+        csv, npy, arrow = encode_payloads(make_data(rows, rng))
+        payloads = {
+            "text/csv": csv,
+            featurizer.NPY_CONTENT_TYPE: npy,
+            featurizer.ARROW_CONTENT_TYPE: arrow,
+        }
+        for name, content_type, accept in paths:
+            if content_type is None:
+                fn = lambda: legacy_request(csv, model)
+            else:
+                fn = lambda: fast_request(payloads[content_type], model, content_type, accept)
+            elapsed = best_of(fn, args.repeat)
+            print(
+                "{:>8} {:<24} {:>12.2f} {:>14.0f}".format(
+                    rows, name, elapsed * 1000, rows / elapsed
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
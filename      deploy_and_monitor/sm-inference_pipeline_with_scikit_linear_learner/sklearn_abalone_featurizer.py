@@ -7,14 +7,13 @@ import os
 import shutil
 import sys
 import time
-from io import StringIO
+from io import BytesIO, StringIO
 
 import joblib
 import numpy as np
 import pandas as pd
 from sagemaker_containers.beta.framework import (
     content_types,
-    encoders,
     env,
     modules,
     transformer,
@@ -52,6 +51,10 @@ feature_columns_dtype = {
 
 label_column_dtype = {"rings": "float64"}  # +1.5 gives the age in years
 
+# Binary payload types for large batches, in addition to CSV and JSON
+NPY_CONTENT_TYPE = "application/x-npy"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
 
 def merge_two_dicts(x, y):
     z = x.copy()  # start with x's keys and values
@@ -132,25 +135,55 @@ if __name__ == "__main__":
     print("saved model!")
 
 
+def _name_columns(df):
+    """Name the columns of a headerless frame depending on whether the label is present"""
+    if len(df.columns) == len(feature_columns_names) + 1:
+        # This is a labelled example, includes the ring label
+        df.columns = feature_columns_names + [label_column]
+    elif len(df.columns) == len(feature_columns_names):
+        # This is an unlabelled example.
+        df.columns = feature_columns_names
+    return df
+
+
+def _encode_matrix(prediction, separators):
+    """Encode the whole 2-D prediction array with a single call to the C JSON encoder
+
+    Returns the rows as "[v, v], [v, v]" without the enclosing brackets. Because every
+    cell is a number, the only brackets in the text are the row delimiters, so callers
+    can reshape rows with plain string replacement instead of a Python loop per row.
+    """
+    return json.dumps(np.asarray(prediction).tolist(), separators=separators)[1:-1]
+
+
 def input_fn(input_data, content_type):
     """Parse input data payload
 
-    We currently only take csv input. Since we need to process both labelled
-    and unlabelled data we first determine whether the label column is present
-    by looking at how many columns were provided.
+    We take csv input, and for large batches also NumPy (.npy) and Arrow IPC stream
+    payloads. Since we need to process both labelled and unlabelled data we first
+    determine whether the label column is present by looking at how many columns
+    were provided.
     """
     if content_type == "text/csv":
         # Read the raw input data as CSV.
         df = pd.read_csv(StringIO(input_data), header=None)
-
-        if len(df.columns) == len(feature_columns_names) + 1:
-            # This is a labelled example, includes the ring label
-            df.columns = feature_columns_names + [label_column]
-        elif len(df.columns) == len(feature_columns_names):
-            # This is an unlabelled example.
-            df.columns = feature_columns_names
-
-        return df
+        return _name_columns(df)
+    elif content_type == NPY_CONTENT_TYPE:
+        # Mixed-type rows should be sent as a structured array, e.g. with a "U1" sex field
+        array = np.load(BytesIO(input_data), allow_pickle=False)
+        if array.dtype.names is not None:
+            # Structured arrays carry their own column names
+            return pd.DataFrame(array)
+        df = _name_columns(pd.DataFrame(np.atleast_2d(array)))
+        return df.astype({column: "float64" for column in df.columns if column != "sex"})
+    elif content_type == ARROW_CONTENT_TYPE:
+        import pyarrow as pa
+
+        df = pa.ipc.open_stream(BytesIO(input_data)).read_pandas()
+        if set(feature_columns_names).issubset(df.columns):
+            return df
+        df.columns = range(len(df.columns))
+        return _name_columns(df)
     else:
         raise ValueError("{} not supported by script!".format(content_type))
 
@@ -163,15 +196,30 @@ def output_fn(prediction, accept):
     container can read the response payload correctly.
     """
     if accept == "application/json":
-        instances = []
-        for row in prediction.tolist():
-            instances.append({"features": row})
-
-        json_output = {"instances": instances}
-
-        return worker.Response(json.dumps(json_output), mimetype=accept)
+        rows = _encode_matrix(prediction, (", ", ": "))
+        rows = rows.replace("[", '{"features": [').replace("]", "]}")
+        return worker.Response('{"instances": [' + rows + "]}", mimetype=accept)
     elif accept == "text/csv":
-        return worker.Response(encoders.encode(prediction, accept), mimetype=accept)
+        rows = _encode_matrix(prediction, (",", ":"))[1:-1].replace("],[", "\n")
+        if rows and not np.isfinite(prediction).all():
+            # Match numpy's spelling of non-finite values
+            rows = rows.replace("NaN", "nan").replace("Infinity", "inf")
+        return worker.Response(rows + "\n" if rows else rows, mimetype=accept)
+    elif accept == NPY_CONTENT_TYPE:
+        buffer = BytesIO()
+        np.save(buffer, prediction)
+        return worker.Response(buffer.getvalue(), mimetype=accept)
+    elif accept == ARROW_CONTENT_TYPE:
+        import pyarrow as pa
+
+        table = pa.Table.from_arrays(
+            [pa.array(column) for column in prediction.T],
+            names=[str(i) for i in range(prediction.shape[1])],
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return worker.Response(sink.getvalue().to_pybytes(), mimetype=accept)
     else:
         raise RuntimeException("{} accept type is not supported by this script.".format(accept))
 
@@ -189,8 +237,12 @@ def predict_fn(input_data, model):
     features = model.transform(input_data)
 
     if label_column in input_data:
-        # Return the label (as the first column) and the set of features.
-        return np.insert(features, 0, input_data[label_column], axis=1)
+        # Return the label (as the first column) and the set of features, written into
+        # one preallocated array instead of copying the features again with np.insert.
+        output = np.empty((features.shape[0], features.shape[1] + 1), dtype=np.float64)
+        output[:, 0] = input_data[label_column].to_numpy(dtype=np.float64)
+        output[:, 1:] = features
+        return output
     else:
         # Return only the set of features
         return features
@@ -0,0 +1,71 @@
+"""
+Synthetic benchmark for ModelCache: requests pick target models from a Zipf distribution,
+as they would on a multi-model endpoint hosting thousands of models, and every cold model
+pays a simulated load time. Reports the cache hit rate and latency percentiles.
+
+This measures ModelCache alone. The MMS handler never sees this workload: MMS runs one model
+per worker process, so the cache of model_handler.py holds a single model.
+
+Example:
+    python benchmark_model_cache.py --models 2000 --requests 20000 --cache-mb 512
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from model_cache import ModelCache
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--zipf-a", type=float, default=1.2)
+    parser.add_argument("--model-mb", type=int, default=45, help="size of each model in MB")
+    parser.add_argument("--cache-mb", type=int, default=2048)
+    parser.add_argument("--load-ms", type=float, default=20.0, help="cold model load time")
+    parser.add_argument("--infer-ms", type=float, default=1.0, help="warm inference time")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(args.seed)
+    # Zipf ranks are unbounded, fold them onto the available models
+    model_ids = (rng.zipf(args.zipf_a, size=args.requests) - 1) % args.models
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        time.sleep(args.load_ms / 1000.0)
+        return args.model_mb * 1024 * 1024
+
+    cache = ModelCache(args.cache_mb * 1024 * 1024, sizeof=lambda nbytes: nbytes)
+
+    def invoke(model_id):
+        start = time.perf_counter()
+        cache.get(model_id, load)
+        time.sleep(args.infer_ms / 1000.0)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        latencies = np.array(list(executor.map(invoke, model_ids))) * 1000.0
+    elapsed = time.perf_counter() - start
+
+    print("requests:         {}".format(args.requests))
+    print("distinct models:  {}".format(len(np.unique(model_ids))))
+    print("model loads:      {}".format(len(loads)))
+    print("evictions:        {}".format(cache.evictions))
+    print("cache hit rate:   {:.2%}".format(cache.hit_rate))
+    print("throughput:       {:.1f} req/s".format(args.requests / elapsed))
+    for q in (50, 90, 99):
+        print("p{} latency:      {:.2f} ms".format(q, np.percentile(latencies, q)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+ModelCache keeps loaded models in memory across invocations with an LRU eviction policy
+bounded by a memory budget, and makes sure each model is loaded at most once even when
+several requests for the same cold model arrive in parallel.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+
+class _PendingLoad(object):
+    """
+    Placeholder for a model that is currently being loaded by another thread.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ModelCache(object):
+    """
+    Thread-safe LRU cache of loaded models with a memory budget.
+
+    Every entry is stored together with its size in bytes, as reported by the ``sizeof``
+    callable. Once the total size exceeds ``max_bytes``, least recently used models are
+    evicted until the cache fits again. The most recently loaded model is never evicted,
+    so a single model larger than the budget can still be served.
+    """
+
+    def __init__(self, max_bytes, sizeof, on_evict=None):
+        """
+        :param max_bytes: memory budget for all cached models, in bytes
+        :param sizeof: callable returning the size in bytes of a loaded model
+        :param on_evict: optional callable invoked with ``(key, model)`` on eviction
+        """
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (model, nbytes), oldest first
+        self._pending = {}  # key -> _PendingLoad
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def get(self, key, loader):
+        """
+        Return the cached model for ``key``, loading it with ``loader(key)`` on a miss.
+
+        Concurrent callers asking for the same missing key wait for a single load instead
+        of each loading their own copy. If the load fails, the exception is raised in
+        every waiting caller and nothing is cached.
+
+        :param key: model identifier, e.g. the model directory
+        :param loader: callable that loads and returns the model for ``key``
+        :return: loaded model
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses += 1
+                pending = self._pending[key] = _PendingLoad()
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+
+        if not owner:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            model = loader(key)
+            nbytes = self.sizeof(model)
+        except BaseException as err:
+            with self._lock:
+                del self._pending[key]
+            pending.error = err
+            pending.event.set()
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            self._entries[key] = (model, nbytes)
+            self._nbytes += nbytes
+            evicted = self._evict()
+        pending.value = model
+        pending.event.set()
+
+        for evicted_key, evicted_model in evicted:
+            logging.info("Evicted model {} from cache".format(evicted_key))
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted_model)
+        return model
+
+    def evict(self, key):
+        """
+        Drop ``key`` from the cache, e.g. when the model server unloads the model.
+
+        :param key: model identifier
+        :return: True if the model was cached
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self._nbytes -= entry[1]
+        if self.on_evict is not None:
+            self.on_evict(key, entry[0])
+        return True
+
+    def _evict(self):
+        # Must be called with the lock held
+        evicted = []
+        while self._nbytes > self.max_bytes and len(self._entries) > 1:
+            key, (model, nbytes) = self._entries.popitem(last=False)
+            self._nbytes -= nbytes
+            self.evictions += 1
+            evicted.append((key, model))
+        return evicted
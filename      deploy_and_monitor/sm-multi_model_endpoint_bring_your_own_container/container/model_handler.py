@@ -7,10 +7,22 @@ import logging
 import os
 import re
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import mxnet as mx
 import numpy as np
 
+from model_cache import ModelCache
+
+# Memory budget for models kept loaded by this handler, in MB. MMS runs one model per worker
+# process, in that model's directory, so the cache of a handler only ever holds the model of
+# initialize and loads it once; models are not shared or evicted across the endpoint's models.
+MODEL_CACHE_SIZE_MB = int(os.environ.get("MODEL_CACHE_SIZE_MB", "2048"))
+# Threads used to decode and resize the images of a request batch
+PREPROCESS_THREADS = int(os.environ.get("PREPROCESS_THREADS", "4"))
+
+LoadedModel = namedtuple("LoadedModel", ["module", "labels", "data_shapes", "nbytes"])
+
 
 class ModelHandler(object):
     """
@@ -19,8 +31,10 @@ class ModelHandler(object):
 
     def __init__(self):
         self.initialized = False
-        self.mx_model = None
         self.shapes = None
+        self.model_dir = None
+        self.model_cache = ModelCache(MODEL_CACHE_SIZE_MB * 1024 * 1024, lambda m: m.nbytes)
+        self.executor = ThreadPoolExecutor(max_workers=PREPROCESS_THREADS)
 
     def get_model_files_prefix(self, model_dir):
         """
@@ -77,9 +91,24 @@ class ModelHandler(object):
         self.initialized = True
         properties = context.system_properties
         # Contains the url parameter passed to the load request
-        model_dir = properties.get("model_dir")
-        gpu_id = properties.get("gpu_id")
+        self.model_dir = properties.get("model_dir")
+        self.use_model(self.model_dir)
 
+    def use_model(self, model_dir):
+        """
+        Get the model in model_dir, loading it unless it is already cached.
+        Parallel requests for the same cold model share a single load.
+        :param model_dir: Path to the directory with model artifacts
+        :return: LoadedModel of model_dir
+        """
+        return self.model_cache.get(model_dir, self.load_model)
+
+    def load_model(self, model_dir):
+        """
+        Load the MXNet model from model_dir and bind it for inference
+        :param model_dir: Path to the directory with model artifacts
+        :return: LoadedModel with the bound module, its labels and size in bytes
+        """
         checkpoint_prefix = self.get_model_files_prefix(model_dir)
 
         # Read the model input data shapes
@@ -89,71 +118,95 @@ class ModelHandler(object):
         try:
             ctx = mx.cpu()  # Set the context on CPU
             sym, arg_params, aux_params = mx.model.load_checkpoint(
-                checkpoint_prefix, 0
+                os.path.join(model_dir, checkpoint_prefix), 0
             )  # epoch set to 0
-            self.mx_model = mx.mod.Module(symbol=sym, context=ctx, label_names=None)
-            self.mx_model.bind(
+            mx_model = mx.mod.Module(symbol=sym, context=ctx, label_names=None)
+            mx_model.bind(
                 for_training=False,
                 data_shapes=data_shapes,
-                label_shapes=self.mx_model._label_shapes,
+                label_shapes=mx_model._label_shapes,
             )
-            self.mx_model.set_params(arg_params, aux_params, allow_missing=True)
-            with open("synset.txt", "r") as f:
-                self.labels = [l.rstrip() for l in f]
+            mx_model.set_params(arg_params, aux_params, allow_missing=True)
+            with open(os.path.join(model_dir, "synset.txt"), "r") as f:
+                labels = [l.rstrip() for l in f]
         except (mx.base.MXNetError, RuntimeError) as memerr:
             if re.search("Failed to allocate (.*) Memory", str(memerr), re.IGNORECASE):
                 logging.error("Memory allocation exception: {}".format(memerr))
                 raise MemoryError
             raise
 
-    def preprocess(self, request):
+        nbytes = sum(
+            p.size * np.dtype(p.dtype).itemsize
+            for params in (arg_params, aux_params)
+            for p in params.values()
+        )
+        return LoadedModel(mx_model, labels, data_shapes, nbytes)
+
+    def decode_image(self, img_arr, out):
+        """
+        Decode and resize a single image into its slot of the batch array
+        :param img_arr: bytearray of the encoded image
+        :param out: preallocated (RGB, height, width) slot to write into
+        :return: False if the image could not be decoded
+        """
+        # Input image is in bytearray, convert it to MXNet NDArray
+        img = mx.img.imdecode(img_arr)
+        if img is None:
+            return False
+
+        height, width = out.shape[1:]
+        img = mx.image.imresize(img, width, height)  # resize
+        out[...] = img.asnumpy().transpose((2, 0, 1))  # Channel first
+        return True
+
+    def preprocess(self, model, request):
         """
         Transform raw input into model input data.
+        :param model: LoadedModel the input is prepared for
         :param request: list of raw requests
-        :return: list of preprocessed model input data
+        :return: preprocessed batch of shape (batch, RGB, height, width)
         """
         # Take the input data and pre-process it make it inference ready
+        height, width = 224, 224
+        if model.data_shapes and len(model.data_shapes[0][1]) == 4:
+            height, width = model.data_shapes[0][1][2:]
 
-        img_list = []
-        for idx, data in enumerate(request):
-            # Read the bytearray of the image from the input
-            img_arr = data.get("body")
-
-            # Input image is in bytearray, convert it to MXNet NDArray
-            img = mx.img.imdecode(img_arr)
-            if img is None:
-                return None
+        # Decode the whole batch in parallel straight into one array
+        batch = np.empty((len(request), 3, height, width), dtype=np.float32)
+        decoded = self.executor.map(
+            self.decode_image, [data.get("body") for data in request], batch
+        )
+        if not all(decoded):
+            return None
 
-            # convert into format (batch, RGB, width, height)
-            img = mx.image.imresize(img, 224, 224)  # resize
-            img = img.transpose((2, 0, 1))  # Channel first
-            img = img.expand_dims(axis=0)  # batchify
-            img_list.append(img)
+        return batch
 
-        return img_list
-
-    def inference(self, model_input):
+    def inference(self, model, model_input):
         """
         Internal inference methods
-        :param model_input: transformed model input data list
-        :return: list of inference output in NDArray
+        :param model: LoadedModel to run
+        :param model_input: preprocessed batch of images
+        :return: inference output in NDArray
         """
         # Do some inference call to engine here and return output
-        Batch = namedtuple("Batch", ["data"])
-        self.mx_model.forward(Batch(model_input))
-        prob = self.mx_model.get_outputs()[0].asnumpy()
+        model.module.forward(mx.io.DataBatch([mx.nd.array(model_input)]), is_train=False)
+        prob = model.module.get_outputs()[0].asnumpy()
         return prob
 
-    def postprocess(self, inference_output):
+    def postprocess(self, model, inference_output):
         """
         Return predict result in as list.
-        :param inference_output: list of inference output
-        :return: list of predict results
+        :param model: LoadedModel with the labels of the output
+        :param inference_output: batch of inference output
+        :return: list of predict results, one per request
         """
         # Take output from network and post-process to desired format
-        prob = np.squeeze(inference_output)
-        a = np.argsort(prob)[::-1]
-        return [["probability=%f, class=%s" % (prob[i], self.labels[i]) for i in a[0:5]]]
+        prob = inference_output.reshape(len(inference_output), -1)
+        top5 = np.argsort(prob, axis=1)[:, ::-1][:, :5]
+        return [
+            ["probability=%f, class=%s" % (p[i], model.labels[i]) for i in a]
+            for p, a in zip(prob, top5)
+        ]
 
     def handle(self, data, context):
         """
@@ -161,10 +214,14 @@ class ModelHandler(object):
         :param data: input data
         :param context: mms context
         """
-
-        model_input = self.preprocess(data)
-        model_out = self.inference(model_input)
-        return self.postprocess(model_out)
+        model_dir = context.system_properties.get("model_dir", self.model_dir)
+        model = self.use_model(model_dir)
+
+        model_input = self.preprocess(model, data)
+        if model_input is None:
+            return None
+        model_out = self.inference(model, model_input)
+        return self.postprocess(model, model_out)
 
 
 _service = ModelHandler()
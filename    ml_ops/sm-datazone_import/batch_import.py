@@ -0,0 +1,684 @@
+"""
+Bulk, non-interactive import of a SageMaker Domain into DataZone from a mapping file.
+
+All list calls are paginated. The changes for all projects and user profiles are
+planned up front against the current tags and linked types and printed as a diff.
+They are then applied concurrently with a shared rate limit, and throttled or failed
+calls are retried. Applying a plan is idempotent. A second run with the same
+mapping file finds the tags and linked types in place.
+
+Example mapping file:
+
+{
+    "sageMakerDomainId": "d-xxxxxxxxxxxx",
+    "dataZoneDomainId": "dzd_xxxxxxxxxxxxxx",
+    "projects": [
+        {
+            "projectId": "xxxxxxxxxxxxxx",
+            "environmentId": "xxxxxxxxxxxxxx",
+            "federationRoleArn": "arn:aws:iam::111122223333:role/byod-fed-role",
+            "users": {
+                "alice": ["alice@example.com"],
+                "bob": ["arn:aws:iam::111122223333:role/bob", "xxxxxxxxxxxxxx"]
+            },
+            "matchUserNames": false
+        }
+    ]
+}
+
+"users" maps SageMaker user profile names to DataZone users. Each DataZone user is
+given by its user id, its SSO user name or its IAM principal arn. With
+"matchUserNames", every SageMaker user profile is also mapped to the DataZone users
+whose SSO user name (up to the @) or IAM principal name equals the profile name.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+USER_TYPES = [
+    "SSO_USER",
+    # remove DATAZONE_USER as these are redundant with others.
+    "DATAZONE_SSO_USER",
+    "DATAZONE_IAM_USER",
+]
+
+# Error codes of calls that can succeed when they are retried
+RETRYABLE_ERRORS = {
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "InternalServerException",
+    "InternalFailure",
+    "ServiceUnavailable",
+}
+
+# Limits of BatchPutLinkedTypes, see resources/datazone-linkedtypes-2018-05-10.normal.json
+MAX_LINKED_TYPE_ITEMS = 10
+MAX_AUTHORIZED_PRINCIPALS = 10
+
+# A planned change. Changes of a stage only run after all changes of earlier stages.
+Change = namedtuple("Change", ["stage", "resource", "action", "description", "kind", "args"])
+
+TAG_STAGE, DOMAIN_LINK_STAGE, USER_LINK_STAGE = 0, 1, 2
+
+
+def paginate(call, items_key, token_param="nextToken", **kwargs):
+    """
+    Yield the items of all pages of a list call. The token of the next page is read
+    from the response field with the name of the request parameter token_param.
+    """
+    while True:
+        response = call(**kwargs)
+        yield from response.get(items_key, [])
+        token = response.get(token_param)
+        if not token:
+            return
+        kwargs[token_param] = token
+
+
+class RateLimiter:
+    """
+    Spaces out the calls of all threads to at most calls_per_second calls per second.
+    """
+
+    def __init__(self, calls_per_second):
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0.0
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def is_sagemaker_action(action):
+    """
+    If the environment action links to SageMaker Studio. The datazone model of botocore does not
+    know the sageMaker parameters, so botocore returns them as an unknown member.
+    """
+    parameters = action["parameters"]
+    unknown = parameters.get("SDK_UNKNOWN_MEMBER", {})
+    return "sageMaker" in parameters or unknown.get("name") == "sageMaker"
+
+
+def error_code(error):
+    return error.response.get("Error", {}).get("Code")
+
+
+def load_mapping(mapping_file):
+    with open(mapping_file) as f:
+        mapping = json.load(f)
+
+    missing = [
+        key for key in ["sageMakerDomainId", "dataZoneDomainId", "projects"] if key not in mapping
+    ]
+    for i, project in enumerate(mapping.get("projects", [])):
+        missing += [
+            f"projects[{i}].{key}"
+            for key in ["projectId", "environmentId", "federationRoleArn"]
+            if key not in project
+        ]
+    if missing:
+        raise ValueError(f"Mapping file {mapping_file} is missing {missing}")
+    return mapping
+
+
+class SageMakerDomainBatchImporter:
+    def __init__(
+        self,
+        region,
+        stage,
+        account_id,
+        sm_client,
+        dz_client,
+        byod_client,
+        iam_client,
+        link_client=None,
+        max_workers=8,
+        calls_per_second=20.0,
+        max_attempts=6,
+        retry_delay=0.2,
+    ) -> None:
+        """
+        link_client is the DataZone BYOD client for the linked types, in the Cross-Account
+        scenario the client of the parent account. It defaults to byod_client.
+        """
+        self.region = region
+        self.stage = stage
+        self.account_id = account_id
+        self.sm_client = sm_client
+        self.dz_client = dz_client
+        self.byod_client = byod_client
+        self.iam_client = iam_client
+        self.link_client = link_client or byod_client
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(calls_per_second)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def _backoff(self, attempt):
+        time.sleep(self.retry_delay * 2**attempt * random.uniform(0.5, 1.0))
+
+    def _call(self, method, **kwargs):
+        """
+        Call method under the rate limit, and retry it with exponential backoff when
+        it is throttled or fails with a server error.
+        """
+        for attempt in range(self.max_attempts):
+            self.rate_limiter.acquire()
+            try:
+                return method(**kwargs)
+            except ClientError as e:
+                if error_code(e) not in RETRYABLE_ERRORS or attempt == self.max_attempts - 1:
+                    raise
+            self._backoff(attempt)
+
+    def _list(self, method, items_key, token_param="nextToken", **kwargs):
+        return list(
+            paginate(
+                lambda **page_kwargs: self._call(method, **page_kwargs),
+                items_key,
+                token_param,
+                **kwargs,
+            )
+        )
+
+    def _map(self, fn, items):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(fn, items))
+
+    def _domain_arn(self, sm_domain_id):
+        return f"arn:aws:sagemaker:{self.region}:{self.account_id}:domain/{sm_domain_id}"
+
+    def _user_profile_arn(self, sm_domain_id, user_name):
+        return (
+            f"arn:aws:sagemaker:{self.region}:{self.account_id}"
+            f":user-profile/{sm_domain_id}/{user_name}"
+        )
+
+    def _index_dz_users(self, dz_users):
+        """
+        Map of the user ids, SSO user names and IAM principal arns of the DataZone users
+        to their user ids, and of their names for matchUserNames to their user ids.
+        """
+        users, names = {}, {}
+        for dz_user_list in dz_users:
+            for dz_user in dz_user_list:
+                user_id = dz_user["id"]
+                users[user_id] = user_id
+                details = dz_user.get("details", {})
+                if "sso" in details:
+                    users[details["sso"]["username"]] = user_id
+                    name = details["sso"]["username"].split("@")[0]
+                    names.setdefault(name, set()).add(user_id)
+                if "iam" in details:
+                    users[details["iam"]["arn"]] = user_id
+                    name = details["iam"]["arn"].rsplit("/", 1)[-1]
+                    names.setdefault(name, set()).add(user_id)
+        return users, names
+
+    def _resolve_users(self, project, sm_users, dz_users, dz_names, errors):
+        """
+        Map of SageMaker user profile names to the sorted DataZone user ids of a project
+        """
+        resolved = {}
+        if project.get("matchUserNames", False):
+            for user_name in sm_users:
+                if user_name in dz_names:
+                    resolved[user_name] = set(dz_names[user_name])
+        for user_name, references in project.get("users", {}).items():
+            if user_name not in sm_users:
+                errors.append(f"SageMaker user profile {user_name} does not exist")
+                continue
+            for reference in references:
+                if reference not in dz_users:
+                    errors.append(f"DataZone user {reference} does not exist")
+                    continue
+                resolved.setdefault(user_name, set()).add(dz_users[reference])
+        for user_name, user_ids in resolved.items():
+            if len(user_ids) > MAX_AUTHORIZED_PRINCIPALS:
+                errors.append(
+                    f"SageMaker user profile {user_name} is mapped to {len(user_ids)} "
+                    f"DataZone users, at most {MAX_AUTHORIZED_PRINCIPALS} are allowed"
+                )
+        return {user_name: sorted(user_ids) for user_name, user_ids in resolved.items()}
+
+    def _plan_tags(self, stage, resource, current, desired, kind, args):
+        changes = []
+        unchanged = 0
+        for key, value in desired.items():
+            if current.get(key) == value:
+                unchanged += 1
+                continue
+            if key in current:
+                action, description = "~", f"tag {key}: {current[key]} -> {value}"
+            else:
+                action, description = "+", f"tag {key}={value}"
+            changes.append(Change(stage, resource, action, description, kind, args))
+        return changes, unchanged
+
+    def plan(self, mapping):
+        """
+        Changes to import the SageMaker Domain of the mapping into its DataZone projects,
+        and the number of tags and linked types that are already in place.
+        """
+        sm_domain_id = mapping["sageMakerDomainId"]
+        dz_domain_id = mapping["dataZoneDomainId"]
+        sm_domain = self._call(self.sm_client.describe_domain, DomainId=sm_domain_id)
+        auth_mode = sm_domain["AuthMode"]
+        default_execution_role = sm_domain["DefaultUserSettings"]["ExecutionRole"]
+
+        # Each listing is a chain of pages, the listings run concurrently.
+        listings = [
+            lambda: self._list(
+                self.sm_client.list_user_profiles,
+                "UserProfiles",
+                "NextToken",
+                DomainIdEquals=sm_domain_id,
+            )
+        ]
+        for user_type in USER_TYPES:
+            listings.append(
+                lambda user_type=user_type: self._list(
+                    self.dz_client.search_user_profiles,
+                    "items",
+                    domainIdentifier=dz_domain_id,
+                    userType=user_type,
+                )
+            )
+        sm_profiles, *dz_user_lists = self._map(lambda listing: listing(), listings)
+        sm_users = {user["UserProfileName"] for user in sm_profiles}
+        dz_users, dz_names = self._index_dz_users(dz_user_lists)
+
+        errors = []
+        projects = [
+            (
+                project,
+                self._resolve_users(project, sm_users, dz_users, dz_names, errors),
+            )
+            for project in mapping["projects"]
+        ]
+        user_projects = {}
+        for project, users in projects:
+            for user_name in users:
+                user_projects.setdefault(user_name, []).append(project["projectId"])
+        errors += [
+            f"SageMaker user profile {user_name} is mapped in projects {project_ids}"
+            for user_name, project_ids in user_projects.items()
+            if len(project_ids) > 1
+        ]
+
+        def get_execution_role(user_name):
+            user_profile = self._call(
+                self.sm_client.describe_user_profile,
+                DomainId=sm_domain_id,
+                UserProfileName=user_name,
+            )
+            exec_role = user_profile.get("UserSettings", {}).get("ExecutionRole")
+            return exec_role or default_execution_role
+
+        user_names = sorted(user_projects)
+        exec_roles = dict(zip(user_names, self._map(get_execution_role, user_names)))
+
+        # The tags of an execution role select the project in the DataZone UI.
+        role_tags = OrderedDict()
+        for project, users in projects:
+            tags = OrderedDict(
+                [
+                    ("AmazonDataZoneDomain", dz_domain_id),
+                    ("AmazonDataZoneProject", project["projectId"]),
+                    ("AmazonDataZoneEnvironment", project["environmentId"]),
+                ]
+            )
+            for user_name in users:
+                role_name = exec_roles[user_name][exec_roles[user_name].rfind("/") + 1 :]
+                if role_tags.setdefault(role_name, tags) != tags:
+                    errors.append(
+                        f"Execution role {role_name} of {user_name} is used in projects "
+                        f"{role_tags[role_name]['AmazonDataZoneProject']} and "
+                        f"{project['projectId']}"
+                    )
+        if errors:
+            raise ValueError("Invalid mapping:\n" + "\n".join(errors))
+
+        changes = []
+        unchanged = 0
+
+        sm_domain_arn = self._domain_arn(sm_domain_id)
+        current = {
+            tag["Key"]: tag["Value"]
+            for tag in self._list(
+                self.sm_client.list_tags, "Tags", "NextToken", ResourceArn=sm_domain_arn
+            )
+        }
+        desired = OrderedDict(
+            [
+                ("AmazonDataZoneDomain", dz_domain_id),
+                ("AmazonDataZoneDomainAccount", self.account_id),
+                ("AmazonDataZoneStage", self.stage),
+            ]
+        )
+        domain_changes, domain_unchanged = self._plan_tags(
+            TAG_STAGE,
+            f"SageMaker Domain {sm_domain_id}",
+            current,
+            desired,
+            "tag_domain",
+            (sm_domain_arn, list(desired.items())),
+        )
+        changes += domain_changes
+        unchanged += domain_unchanged
+
+        def get_role_tags(role_name):
+            return {
+                tag["Key"]: tag["Value"]
+                for tag in self._list(
+                    self.iam_client.list_role_tags, "Tags", "Marker", RoleName=role_name
+                )
+            }
+
+        for (role_name, desired), current in zip(
+            role_tags.items(), self._map(get_role_tags, list(role_tags))
+        ):
+            role_changes, role_unchanged = self._plan_tags(
+                TAG_STAGE,
+                f"Execution role {role_name}",
+                current,
+                desired,
+                "tag_role",
+                (role_name, list(desired.items())),
+            )
+            changes += role_changes
+            unchanged += role_unchanged
+
+        def get_environment(project):
+            actions = self._list(
+                self.dz_client.list_environment_actions,
+                "items",
+                domainIdentifier=dz_domain_id,
+                environmentIdentifier=project["environmentId"],
+            )
+            linked = {
+                item["itemIdentifier"]: item
+                for item in self._list(
+                    self.link_client.list_linked_types,
+                    "items",
+                    domainIdentifier=dz_domain_id,
+                    projectIdentifier=project["projectId"],
+                    environmentIdentifier=project["environmentId"],
+                )
+            }
+            return actions, linked
+
+        environments = self._map(get_environment, [project for project, _ in projects])
+        for (project, users), (actions, linked) in zip(projects, environments):
+            env_id = project["environmentId"]
+            project_id = project["projectId"]
+            resource = f"Environment {env_id} of project {project_id}"
+
+            changes.append(
+                Change(
+                    TAG_STAGE,
+                    resource,
+                    "+",
+                    f"associate federation role {project['federationRoleArn']} "
+                    "(kept if the environment has a role)",
+                    "associate_role",
+                    (dz_domain_id, env_id, project["federationRoleArn"]),
+                )
+            )
+
+            if any(is_sagemaker_action(action) for action in actions):
+                unchanged += 1
+            else:
+                changes.append(
+                    Change(
+                        TAG_STAGE,
+                        resource,
+                        "+",
+                        "create SageMaker environment action",
+                        "create_action",
+                        (dz_domain_id, env_id),
+                    )
+                )
+
+            domain_item = {
+                "itemIdentifier": sm_domain_arn,
+                "itemType": "SAGEMAKER_DOMAIN",
+                "configuration": {"AuthMode": auth_mode},
+                "connectedEntities": [
+                    {
+                        "connectedEntityIdentifier": env_id,
+                        "connectedEntityType": "ENVIRONMENT",
+                        "connectedEntityConnectionType": "CONSUMED_BY",
+                    }
+                ],
+            }
+            if sm_domain_arn in linked:
+                unchanged += 1
+            else:
+                changes.append(
+                    Change(
+                        DOMAIN_LINK_STAGE,
+                        resource,
+                        "+",
+                        f"link SAGEMAKER_DOMAIN {sm_domain_arn}",
+                        "link",
+                        (dz_domain_id, project_id, env_id, domain_item),
+                    )
+                )
+
+            for user_name, user_ids in sorted(users.items()):
+                user_arn = self._user_profile_arn(sm_domain_id, user_name)
+                user_item = {
+                    "itemIdentifier": user_arn,
+                    "itemType": "SAGEMAKER_USER_PROFILE",
+                    "name": user_name,
+                    "authorizedPrincipals": [
+                        {
+                            "principalIdentifier": user_id,
+                            "principalType": "DATAZONE_USER_PROFILE",
+                        }
+                        for user_id in user_ids
+                    ],
+                    "connectedEntities": [
+                        {
+                            "connectedEntityConnectionType": "BELONGS_TO",
+                            "connectedEntityIdentifier": sm_domain_arn,
+                            "connectedEntityType": "SAGEMAKER_DOMAIN",
+                        }
+                    ],
+                }
+                current_ids = sorted(
+                    principal["principalIdentifier"]
+                    for principal in linked.get(user_arn, {}).get("authorizedPrincipals", [])
+                )
+                if user_arn not in linked:
+                    action, description = "+", f"link {user_name} to {user_ids}"
+                elif current_ids != user_ids:
+                    action = "~"
+                    description = f"link {user_name} to {current_ids} -> {user_ids}"
+                else:
+                    unchanged += 1
+                    continue
+                changes.append(
+                    Change(
+                        USER_LINK_STAGE,
+                        resource,
+                        action,
+                        description,
+                        "link",
+                        (dz_domain_id, project_id, env_id, user_item),
+                    )
+                )
+
+        return changes, unchanged
+
+    def _tag_domain(self, sm_domain_arn, tags):
+        self._call(
+            self.sm_client.add_tags,
+            ResourceArn=sm_domain_arn,
+            Tags=[{"Key": key, "Value": value} for key, value in tags],
+        )
+
+    def _tag_role(self, role_name, tags):
+        self._call(
+            self.iam_client.tag_role,
+            RoleName=role_name,
+            Tags=[{"Key": key, "Value": value} for key, value in tags],
+        )
+
+    def _associate_role(self, dz_domain_id, env_id, federation_role):
+        try:
+            self._call(
+                self.dz_client.associate_environment_role,
+                domainIdentifier=dz_domain_id,
+                environmentIdentifier=env_id,
+                environmentRoleArn=federation_role,
+            )
+        except ClientError as e:
+            if error_code(e) != "ConflictException" and (
+                "Environment has a role configured already" not in str(e)
+            ):
+                raise
+
+    def _create_action(self, dz_domain_id, env_id):
+        # Look for the action before every attempt, a create that timed out may
+        # have created it.
+        for attempt in range(self.max_attempts):
+            actions = self._list(
+                self.dz_client.list_environment_actions,
+                "items",
+                domainIdentifier=dz_domain_id,
+                environmentIdentifier=env_id,
+            )
+            if any(is_sagemaker_action(action) for action in actions):
+                return
+            self.rate_limiter.acquire()
+            try:
+                self.byod_client.create_environment_action(
+                    domainIdentifier=dz_domain_id,
+                    environmentIdentifier=env_id,
+                    name="SageMaker Environment Action Link",
+                    description="Link from DataZone Data Portal to SageMaker Studio",
+                    parameters={"sageMaker": {}},
+                )
+                return
+            except ClientError as e:
+                if error_code(e) not in RETRYABLE_ERRORS or attempt == self.max_attempts - 1:
+                    raise
+            self._backoff(attempt)
+
+    def _link(self, dz_domain_id, project_id, env_id, items):
+        """
+        Put the linked type items, and retry the items that failed with a retryable
+        error. Returns the errors of the items that could not be put.
+        """
+        for attempt in range(self.max_attempts):
+            response = self._call(
+                self.link_client.batch_put_linked_types,
+                domainIdentifier=dz_domain_id,
+                projectIdentifier=project_id,
+                environmentIdentifier=env_id,
+                items=items,
+            )
+            errors = response.get("errors", [])
+            retry = {
+                error["itemIdentifier"]
+                for error in errors
+                if error["code"] == 429 or error["code"] >= 500
+            }
+            if not retry or attempt == self.max_attempts - 1:
+                return errors
+            items = [item for item in items if item["itemIdentifier"] in retry]
+            self._backoff(attempt)
+
+    def _tasks(self, changes):
+        """
+        Calls that apply the changes of one stage, with the linked type items of an
+        environment put in batches of at most MAX_LINKED_TYPE_ITEMS items
+        """
+        tasks = []
+        links = OrderedDict()
+        for change in changes:
+            if change.kind == "link":
+                dz_domain_id, project_id, env_id, item = change.args
+                links.setdefault((dz_domain_id, project_id, env_id), []).append(item)
+            else:
+                method = getattr(self, "_" + change.kind)
+                tasks.append((change.description, method, change.args))
+        for args, items in links.items():
+            for start in range(0, len(items), MAX_LINKED_TYPE_ITEMS):
+                batch = items[start : start + MAX_LINKED_TYPE_ITEMS]
+                tasks.append((f"link {len(batch)} items", self._link, args + (batch,)))
+        return tasks
+
+    def apply(self, changes):
+        """
+        Apply the changes stage by stage, concurrently within a stage. Returns the
+        number of calls made and the failures as (description, error) pairs.
+        """
+        calls = 0
+        failures = []
+
+        def run(task):
+            description, method, args = task
+            try:
+                errors = method(*args)
+            except ClientError as e:
+                return [(description, str(e))]
+            return [(error["itemIdentifier"], error["errorMessage"]) for error in errors or []]
+
+        for stage in sorted({change.stage for change in changes}):
+            tasks = self._tasks([change for change in changes if change.stage == stage])
+            calls += len(tasks)
+            for task_failures in self._map(run, tasks):
+                failures += task_failures
+            if failures:
+                # later stages link items to the resources of this one
+                break
+        return calls, failures
+
+    def import_batch(self, mapping, dry_run=False):
+        print("Planning the import of SageMaker Domain", mapping["sageMakerDomainId"])
+        start = time.monotonic()
+        changes, unchanged = self.plan(mapping)
+        print_plan(changes, unchanged)
+        print(f"Planned in {time.monotonic() - start:.1f}s")
+        if dry_run or not changes:
+            return []
+
+        print("--------------------------------------------------------------------")
+        start = time.monotonic()
+        calls, failures = self.apply(changes)
+        print(
+            f"Applied {len(changes)} changes with {calls} calls in "
+            f"{time.monotonic() - start:.1f}s"
+        )
+        for description, error in failures:
+            print(f"FAILED {description}: {error}")
+        return failures
+
+
+def print_plan(changes, unchanged):
+    resource = None
+    for change in changes:
+        if change.resource != resource:
+            resource = change.resource
+            print(resource)
+        print(f"  {change.action} {change.description}")
+    added = sum(change.action == "+" for change in changes)
+    print(f"Plan: {added} to add, {len(changes) - added} to change, " f"{unchanged} unchanged.")
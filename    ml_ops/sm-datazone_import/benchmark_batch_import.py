@@ -0,0 +1,439 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from batch_import import SageMakerDomainBatchImporter, load_mapping
+
+"""
+Checks and benchmarks batch_import.py against stubbed SageMaker, DataZone and IAM clients.
+
+The stubs hold an account with thousands of synthetic user profiles in memory. They
+paginate like the services and add a latency to every call. They throttle calls above
+a server side rate, fail a fraction of calls and linked type items with server errors,
+and reject requests over the limits of BatchPutLinkedTypes. The script checks that:
+    - a dry run makes no changes,
+    - the import links every mapped user profile despite the injected errors,
+    - a second import plans no further tag or link changes.
+It compares the time of the import with the calls of the previous interactive
+script, one user profile at a time, and how many profiles an unpaginated
+list_user_profiles returns.
+
+    python benchmark_batch_import.py --profiles 3000 --projects 3 --latency 0.02
+"""
+
+WRITE_METHODS = {
+    "add_tags",
+    "tag_role",
+    "associate_environment_role",
+    "create_environment_action",
+    "batch_put_linked_types",
+}
+
+
+def sso_user(i, num_projects):
+    # only the odd profiles of the first project are named like their SSO users
+    if i % 2 and i % num_projects == 0:
+        return f"user-{i:05d}@example.com"
+    return f"user-{i:05d}.sso@example.com"
+
+
+def iam_user(i):
+    return f"arn:aws:iam::111122223333:role/user-{i:05d}-role"
+
+
+def client_error(code, operation):
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+class StubAccount:
+    """
+    In-memory state of an account, with one method per API call used by the import.
+    """
+
+    def __init__(self, num_profiles, num_projects, latency, server_rate, error_rate, seed=0):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.server_rate = server_rate
+        self.error_rate = error_rate
+        self.calls = {}
+        self.window = []
+
+        self.sm_domain_id = "d-stub"
+        self.dz_domain_id = "dzd_stub"
+        self.profiles = {}
+        self.dz_users = {
+            "SSO_USER": [],
+            "DATAZONE_SSO_USER": [],
+            "DATAZONE_IAM_USER": [],
+        }
+        for i in range(num_profiles):
+            name = f"user-{i:05d}"
+            # users of a project share 20 execution roles, some use the default role
+            role = f"AmazonSageMaker-ExecutionRole-{i % num_projects}-{i % 20}"
+            settings = {"ExecutionRole": f"arn:aws:iam::111122223333:role/{role}"}
+            if i % num_projects == 0 and i % 20 == 0:
+                settings = {}
+            self.profiles[name] = {
+                "UserProfileName": name,
+                "UserProfileArn": f"arn:aws:sagemaker:us-east-2:111122223333:{name}",
+                "HomeEfsFileSystemUid": str(200000 + i),
+                "UserSettings": settings,
+            }
+            self.dz_users["SSO_USER"].append(
+                {
+                    "id": f"sso-{i:05d}",
+                    "details": {"sso": {"username": sso_user(i, num_projects)}},
+                }
+            )
+            if i % 10 == 0:
+                self.dz_users["DATAZONE_IAM_USER"].append(
+                    {"id": f"iam-{i:05d}", "details": {"iam": {"arn": iam_user(i)}}}
+                )
+        self.domain_tags = {}
+        self.role_tags = {}
+        self.env_roles = {}
+        self.env_actions = {}
+        self.linked = {}
+
+    def call(self, method, fn):
+        def wrapper(**kwargs):
+            time.sleep(self.latency)
+            with self.lock:
+                self.calls[method] = self.calls.get(method, 0) + 1
+                now = time.monotonic()
+                self.window = [t for t in self.window if t > now - 1.0]
+                throttled = len(self.window) >= self.server_rate
+                self.window.append(now)
+                failed = self.rng.random() < self.error_rate
+            if throttled:
+                raise client_error("ThrottlingException", method)
+            if failed:
+                raise client_error("InternalServerException", method)
+            return fn(**kwargs)
+
+        return wrapper
+
+    @staticmethod
+    def page(items, token, page_size, items_key, token_key):
+        start = int(token or 0)
+        response = {items_key: items[start : start + page_size]}
+        if start + page_size < len(items):
+            response[token_key] = str(start + page_size)
+        return response
+
+    # SageMaker
+    def describe_domain(self, DomainId):
+        return {
+            "DomainId": DomainId,
+            "AuthMode": "IAM",
+            "DefaultUserSettings": {
+                "ExecutionRole": "arn:aws:iam::111122223333:role/service-role/Default"
+            },
+        }
+
+    def list_user_profiles(self, DomainIdEquals, NextToken=None):
+        profiles = [{"UserProfileName": name} for name in sorted(self.profiles)]
+        return self.page(profiles, NextToken, 10, "UserProfiles", "NextToken")
+
+    def describe_user_profile(self, DomainId, UserProfileName):
+        return self.profiles[UserProfileName]
+
+    def list_tags(self, ResourceArn, NextToken=None):
+        tags = [{"Key": k, "Value": v} for k, v in self.domain_tags.items()]
+        return self.page(tags, NextToken, 50, "Tags", "NextToken")
+
+    def add_tags(self, ResourceArn, Tags):
+        with self.lock:
+            self.domain_tags.update({tag["Key"]: tag["Value"] for tag in Tags})
+
+    # IAM
+    def list_role_tags(self, RoleName, Marker=None):
+        tags = [{"Key": k, "Value": v} for k, v in self.role_tags.get(RoleName, {}).items()]
+        response = self.page(tags, Marker, 100, "Tags", "Marker")
+        response["IsTruncated"] = "Marker" in response
+        return response
+
+    def tag_role(self, RoleName, Tags):
+        with self.lock:
+            self.role_tags.setdefault(RoleName, {}).update(
+                {tag["Key"]: tag["Value"] for tag in Tags}
+            )
+
+    # DataZone
+    def search_user_profiles(self, domainIdentifier, userType, nextToken=None):
+        return self.page(self.dz_users[userType], nextToken, 50, "items", "nextToken")
+
+    def associate_environment_role(
+        self, domainIdentifier, environmentIdentifier, environmentRoleArn
+    ):
+        with self.lock:
+            if environmentIdentifier in self.env_roles:
+                raise client_error("ConflictException", "AssociateEnvironmentRole")
+            self.env_roles[environmentIdentifier] = environmentRoleArn
+
+    def list_environment_actions(self, domainIdentifier, environmentIdentifier, nextToken=None):
+        actions = self.env_actions.get(environmentIdentifier, [])
+        return self.page(actions, nextToken, 50, "items", "nextToken")
+
+    def create_environment_action(
+        self, domainIdentifier, environmentIdentifier, name, description, parameters
+    ):
+        with self.lock:
+            self.env_actions.setdefault(environmentIdentifier, []).append(
+                {"name": name, "parameters": parameters}
+            )
+
+    def list_linked_types(
+        self, domainIdentifier, projectIdentifier, environmentIdentifier, nextToken=None
+    ):
+        items = list(self.linked.get((projectIdentifier, environmentIdentifier), {}).values())
+        return self.page(items, nextToken, 50, "items", "nextToken")
+
+    def batch_put_linked_types(
+        self, domainIdentifier, projectIdentifier, environmentIdentifier, items
+    ):
+        if not 1 <= len(items) <= 10 or any(
+            not 1 <= len(item.get("authorizedPrincipals", [None])) <= 10 for item in items
+        ):
+            raise client_error("ValidationException", "BatchPutLinkedTypes")
+        errors = []
+        with self.lock:
+            linked = self.linked.setdefault((projectIdentifier, environmentIdentifier), {})
+            for item in items:
+                if self.rng.random() < self.error_rate:
+                    errors.append(
+                        {
+                            "itemIdentifier": item["itemIdentifier"],
+                            "code": 500,
+                            "errorMessage": "Internal error",
+                        }
+                    )
+                else:
+                    linked[item["itemIdentifier"]] = dict(item)
+        return {"errors": errors}
+
+    def client(self):
+        """A client with the stubbed methods of all services"""
+        stub = type("StubClient", (), {})()
+        for method in [
+            "describe_domain",
+            "list_user_profiles",
+            "describe_user_profile",
+            "list_tags",
+            "add_tags",
+            "list_role_tags",
+            "tag_role",
+            "search_user_profiles",
+            "associate_environment_role",
+            "list_environment_actions",
+            "create_environment_action",
+            "list_linked_types",
+            "batch_put_linked_types",
+        ]:
+            setattr(stub, method, self.call(method, getattr(self, method)))
+        return stub
+
+    def writes(self):
+        return sum(self.calls.get(method, 0) for method in WRITE_METHODS)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+
+def write_mapping(path, account, num_projects):
+    """
+    Every project gets the profiles with its index. The even ones are mapped by SSO
+    user name and IAM arn. The odd ones of the first project are mapped by matching
+    names. Returns the names of the mapped profiles.
+    """
+    names = sorted(account.profiles)
+    projects = []
+    for p in range(num_projects):
+        users = {}
+        for i, name in enumerate(names):
+            if i % num_projects == p and i % 2 == 0:
+                users[name] = [sso_user(i, num_projects)]
+                if i % 10 == 0:
+                    users[name].append(iam_user(i))
+        projects.append(
+            {
+                "projectId": f"project-{p}",
+                "environmentId": f"env-{p}",
+                "federationRoleArn": f"arn:aws:iam::111122223333:role/fed-{p}",
+                "users": users,
+                "matchUserNames": p == 0,
+            }
+        )
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "sageMakerDomainId": account.sm_domain_id,
+                "dataZoneDomainId": account.dz_domain_id,
+                "projects": projects,
+            },
+            f,
+            indent=2,
+        )
+    return {name for i, name in enumerate(names) if i % 2 == 0 or i % num_projects == 0}
+
+
+def check_linked(account, expected_names, num_projects):
+    linked = set()
+    for p in range(num_projects):
+        items = account.linked.get((f"project-{p}", f"env-{p}"), {})
+        for item in items.values():
+            if item["itemType"] == "SAGEMAKER_USER_PROFILE":
+                linked.add(item["name"])
+                principals = {x["principalIdentifier"] for x in item["authorizedPrincipals"]}
+                index = int(item["name"].split("-")[1])
+                assert f"sso-{index:05d}" in principals
+                assert (f"iam-{index:05d}" in principals) == (index % 10 == 0)
+                assert index % num_projects == p
+        assert account.env_actions.get(f"env-{p}")
+        assert account.env_roles.get(f"env-{p}")
+    assert linked == expected_names, (len(linked), len(expected_names))
+
+
+def one_at_a_time(account, mapping, num_users):
+    """
+    The calls of the previous interactive script for every user profile, without
+    prompts. They cover the mapping, tagging and linking of one profile at a time.
+    """
+    client = account.client()
+    project = mapping["projects"][0]
+    users = sorted(project["users"])[:num_users]
+    for name in users:
+        profile = client.describe_user_profile(DomainId=account.sm_domain_id, UserProfileName=name)
+        role = profile.get("UserSettings", {}).get("ExecutionRole", "x/Default")
+        client.tag_role(RoleName=role.rsplit("/", 1)[-1], Tags=[])
+        for user_type in ["SSO_USER", "DATAZONE_SSO_USER", "DATAZONE_IAM_USER"]:
+            client.search_user_profiles(domainIdentifier=account.dz_domain_id, userType=user_type)
+        client.list_environment_actions(
+            domainIdentifier=account.dz_domain_id,
+            environmentIdentifier=project["environmentId"],
+        )
+        for identifier in [account.sm_domain_id, name]:
+            client.batch_put_linked_types(
+                domainIdentifier=account.dz_domain_id,
+                projectIdentifier=project["projectId"],
+                environmentIdentifier=project["environmentId"],
+                items=[
+                    {
+                        "itemIdentifier": identifier,
+                        "itemType": "SAGEMAKER_USER_PROFILE",
+                        "name": identifier,
+                        "authorizedPrincipals": [{"principalIdentifier": "x"}],
+                    }
+                ],
+            )
+
+
+def importer(account, max_workers, calls_per_second):
+    client = account.client()
+    return SageMakerDomainBatchImporter(
+        "us-east-2",
+        "prod",
+        "111122223333",
+        sm_client=client,
+        dz_client=client,
+        byod_client=client,
+        iam_client=client,
+        max_workers=max_workers,
+        calls_per_second=calls_per_second,
+        retry_delay=0.05,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=3000)
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--server-rate", type=float, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--calls-per-second", type=float, default=300)
+    args = parser.parse_args()
+
+    def new_account(error_rate=args.error_rate):
+        return StubAccount(args.profiles, args.projects, args.latency, args.server_rate, error_rate)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        account = new_account()
+        mapping_file = os.path.join(tmp_dir, "mapping.json")
+        expected_names = write_mapping(mapping_file, account, args.projects)
+        mapping = load_mapping(mapping_file)
+
+        # unpaginated, as in the previous script
+        first_page = account.client().list_user_profiles(DomainIdEquals="d-stub")
+        print(
+            f"{args.profiles} user profiles, {len(expected_names)} mapped to "
+            f"{args.projects} projects, an unpaginated list_user_profiles returns "
+            f"{len(first_page['UserProfiles'])}"
+        )
+
+        sample = 50
+        start = time.monotonic()
+        one_at_a_time(new_account(error_rate=0), mapping, sample)
+        per_user = (time.monotonic() - start) / sample
+        print(
+            f"one profile at a time: {per_user:.2f}s per profile, "
+            f"{per_user * len(expected_names):.0f}s for all mapped profiles (extrapolated)"
+        )
+
+        print("{:<34} {:>10} {:>8} {:>8}".format("", "seconds", "calls", "writes"))
+        dry_run = importer(account, 8, args.calls_per_second)
+        start = time.monotonic()
+        changes, unchanged = dry_run.plan(mapping)
+        print(
+            "{:<34} {:>10.1f} {:>8} {:>8}".format(
+                "dry run plan",
+                time.monotonic() - start,
+                account.total_calls(),
+                account.writes(),
+            )
+        )
+        assert account.writes() == 0 and unchanged == 0
+        print(f"  {len(changes)} changes planned, for example:")
+        for change in changes[:3] + changes[-2:]:
+            print(f"    {change.resource}: {change.action} {change.description}")
+
+        for workers in args.workers:
+            account = new_account()
+            start = time.monotonic()
+            calls, failures = importer(account, workers, args.calls_per_second).apply(
+                importer(account, workers, args.calls_per_second).plan(mapping)[0]
+            )
+            elapsed = time.monotonic() - start
+            assert not failures, failures[:5]
+            check_linked(account, expected_names, args.projects)
+            print(
+                "{:<34} {:>10.1f} {:>8} {:>8}".format(
+                    f"plan and apply, {workers} workers",
+                    elapsed,
+                    account.total_calls(),
+                    account.writes(),
+                )
+            )
+
+        # a second import of the same mapping file
+        rerun = importer(account, 8, args.calls_per_second)
+        changes, unchanged = rerun.plan(mapping)
+        assert [change.kind for change in changes] == ["associate_role"] * args.projects
+        calls, failures = rerun.apply(changes)
+        assert not failures
+        print(
+            f"second import: {len(changes)} federation role checks, {unchanged} "
+            "tags and linked types unchanged"
+        )
+
+
+if __name__ == "__main__":
+    main()
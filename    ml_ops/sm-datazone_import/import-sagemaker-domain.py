@@ -5,6 +5,8 @@ import datetime
 from dateutil.tz import tzlocal
 from botocore.exceptions import ClientError
 
+from batch_import import SageMakerDomainBatchImporter, is_sagemaker_action, load_mapping, paginate
+
 """
 The purpose of this script is run the SageMaker Hulk - Bring Your Own Domain
 feature end to end. This will walk the user through the SageMaker Domains/Users
@@ -101,7 +103,7 @@ class SageMakerDomainImporter:
         )
         print("--------------------------------------------------------------------")
         sm_domain_map = {}  # save name->id map.
-        for domain in self.sm_client.list_domains()["Domains"]:
+        for domain in paginate(self.sm_client.list_domains, "Domains", "NextToken"):
             print(f'Name: {domain["DomainName"]}')
             sm_domain_map[domain["DomainName"]] = domain["DomainId"]
 
@@ -131,7 +133,7 @@ class SageMakerDomainImporter:
         print("--------------------------------------------------------------------")
         dz_domain_map = {}
         self.__get_parent_dz_clients() # Toggle to parent clients for list domains/projects.
-        for domain in self.dz_client.list_domains()["items"]:
+        for domain in paginate(self.dz_client.list_domains, "items"):
             print(f'Name: {domain["name"]}')
             dz_domain_map[domain["name"]] = domain["id"]
 
@@ -151,9 +153,9 @@ class SageMakerDomainImporter:
         )
         print("--------------------------------------------------------------------")
         dz_project_map = {}
-        for project in self.dz_client.list_projects(domainIdentifier=self.dz_domain_id)[
-            "items"
-        ]:
+        for project in paginate(
+            self.dz_client.list_projects, "items", domainIdentifier=self.dz_domain_id
+        ):
             print(f'Name: {project["name"]}')
             dz_project_map[project["name"]] = project["id"]
 
@@ -201,9 +203,12 @@ class SageMakerDomainImporter:
         """
 
         sm_users = []
-        for user in self.sm_client.list_user_profiles(DomainIdEquals=self.sm_domain_id)[
-            "UserProfiles"
-        ]:
+        for user in paginate(
+            self.sm_client.list_user_profiles,
+            "UserProfiles",
+            "NextToken",
+            DomainIdEquals=self.sm_domain_id,
+        ):
             sm_users.append(user["UserProfileName"])
 
         print("--------------------------------------------------------------------")
@@ -269,9 +274,14 @@ class SageMakerDomainImporter:
         ]
         all_dz_users = []  # [( payload, type ), ... ]
         for user_type in user_types:
-            search_response = self.dz_client.search_user_profiles(
-                domainIdentifier=self.dz_domain_id, userType=user_type
-            )["items"]
+            search_response = list(
+                paginate(
+                    self.dz_client.search_user_profiles,
+                    "items",
+                    domainIdentifier=self.dz_domain_id,
+                    userType=user_type,
+                )
+            )
             dz_user_map = {"Items": search_response, "Type": user_type}
             all_dz_users.append(dz_user_map)
 
@@ -326,13 +336,16 @@ class SageMakerDomainImporter:
         print("Listing Blueprints in Customer Account")
         # Toggle to Child Account here - Make the call from original child account.
         self.__get_child_dz_clients()
-        blueprints = self.dz_client.list_environment_blueprints(
-            domainIdentifier=self.dz_domain_id, managed=True
+        blueprints = paginate(
+            self.dz_client.list_environment_blueprints,
+            "items",
+            domainIdentifier=self.dz_domain_id,
+            managed=True,
         )
 
         managed_key = "CustomAwsService"
         self.managed_blueprint_id = None
-        for bp in blueprints["items"]:
+        for bp in blueprints:
             print("Id: ", bp["id"], " Name: ", bp["name"])
             if bp["name"] == managed_key:
                 self.managed_blueprint_id = bp["id"]
@@ -381,10 +394,12 @@ class SageMakerDomainImporter:
                 )
             except ClientError as e:
                 if "already exists within this project" in str(e):
-                    envs = self.dz_client.list_environments(
+                    envs = paginate(
+                        self.dz_client.list_environments,
+                        "items",
                         domainIdentifier=self.dz_domain_id,
                         projectIdentifier=self.dz_project_id,
-                    )["items"]
+                    )
                     for e in envs:
                         if e["name"] == self.env_name:
                             self.env_id = e["id"]
@@ -402,9 +417,12 @@ class SageMakerDomainImporter:
                 "--------------------------------------------------------------------"
             )
             dz_env_map = {}
-            for env in self.dz_client.list_environments(
-                domainIdentifier=self.dz_domain_id, projectIdentifier=self.dz_project_id
-            )["items"]:
+            for env in paginate(
+                self.dz_client.list_environments,
+                "items",
+                domainIdentifier=self.dz_domain_id,
+                projectIdentifier=self.dz_project_id,
+            ):
                 print(f'Name: {env["name"]}')
                 dz_env_map[env["name"]] = env["id"]
             self.env_name = input("Please provide the name of DataZone environment: ")
@@ -413,12 +431,15 @@ class SageMakerDomainImporter:
         return self.env_id
 
     def _add_environment_action(self):
-        items = self.dz_client.list_environment_actions(
-            domainIdentifier=self.dz_domain_id, environmentIdentifier=self.env_id
-        )["items"]
+        items = paginate(
+            self.dz_client.list_environment_actions,
+            "items",
+            domainIdentifier=self.dz_domain_id,
+            environmentIdentifier=self.env_id,
+        )
         sm_env_action = None
         for item in items:
-            if "sageMaker" in item["parameters"]:
+            if is_sagemaker_action(item):
                 sm_env_action = item
 
         if sm_env_action is None:
@@ -557,13 +578,17 @@ class SageMakerDomainImporter:
         print(
             f"Listing linked items for domain {self.dz_domain_id}, project {self.dz_project_id}, and environment {self.env_id}."
         )
-        list_result = self.byod_client.list_linked_types(
-            domainIdentifier=self.dz_domain_id,
-            projectIdentifier=self.dz_project_id,
-            environmentIdentifier=self.env_id,
+        items = list(
+            paginate(
+                self.byod_client.list_linked_types,
+                "items",
+                domainIdentifier=self.dz_domain_id,
+                projectIdentifier=self.dz_project_id,
+                environmentIdentifier=self.env_id,
+            )
         )
-        print(f"Found {len(list_result)} linked items.")
-        for item in list_result["items"]:
+        print(f"Found {len(items)} linked items.")
+        for item in items:
             print(item)
 
     def _get_env_link(self):
@@ -604,6 +629,38 @@ class SageMakerDomainImporter:
         self._get_env_link()
         self._link_multiple_users_and_projects()
 
+    def import_batch(
+        self, mapping_file, dry_run=False, max_workers=8, calls_per_second=20.0
+    ):
+        """
+        Import the SageMaker Domain without prompts, as declared by a mapping file.
+        See batch_import.py for the format of the mapping file.
+        """
+        mapping = load_mapping(mapping_file)
+        cross_account = mapping.get("crossAccount")
+        if cross_account:
+            self.parent_account_id = cross_account["accountId"]
+            self.parent_assume_role_name = cross_account["roleName"]
+            self.cross_account_enabled = True
+        # Linked types are put from the parent account, all else from the child account.
+        self.__get_parent_dz_clients()
+        link_client = self.byod_client
+        self.__get_child_dz_clients()
+
+        batch_importer = SageMakerDomainBatchImporter(
+            self.region,
+            self.stage,
+            self.child_account_id,
+            sm_client=self.sm_client,
+            dz_client=self.dz_client,
+            byod_client=self.byod_client,
+            iam_client=self.iam_client,
+            link_client=link_client,
+            max_workers=max_workers,
+            calls_per_second=calls_per_second,
+        )
+        return batch_importer.import_batch(mapping, dry_run=dry_run)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -628,6 +685,33 @@ if __name__ == "__main__":
         help="Account to create new DataZone environment in. Ensure the current session"
         + "has the correct permissions for SageMaker and DataZone actions.",
     )
+    parser.add_argument(
+        "--mapping-file",
+        type=str,
+        required=False,
+        default=None,
+        help="JSON file mapping SageMaker user profiles to DataZone users and projects. "
+        + "Imports without prompts, see batch_import.py for the format.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print the changes planned for the mapping file.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        required=False,
+        default=8,
+        help="Number of concurrent calls when importing from a mapping file.",
+    )
+    parser.add_argument(
+        "--max-calls-per-second",
+        type=float,
+        required=False,
+        default=20.0,
+        help="Rate limit of the calls when importing from a mapping file.",
+    )
     args = parser.parse_args()
 
     region = args.region
@@ -636,5 +720,15 @@ if __name__ == "__main__":
 
     print("--------------------------------------------------------------------")
     importer = SageMakerDomainImporter(region, stage, account_id)
-    importer.import_interactive()
+    if args.mapping_file:
+        failures = importer.import_batch(
+            args.mapping_file,
+            dry_run=args.dry_run,
+            max_workers=args.max_workers,
+            calls_per_second=args.max_calls_per_second,
+        )
+        if failures:
+            raise SystemExit(1)
+    else:
+        importer.import_interactive()
     print("--------------------------------------------------------------------")
@@ -0,0 +1,236 @@
+import json
+import os
+import shutil
+
+import botocore.session
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+
+from batch_import import SageMakerDomainBatchImporter
+
+REGION = "us-east-1"
+ACCOUNT_ID = "111122223333"
+SM_DOMAIN_ID = "d-xxxxxxxxxxxx"
+DZ_DOMAIN_ID = "dzd_xxxxxxxxxxxxxx"
+PROJECT_ID = "prj1234567890a"
+ENV_ID = "env1234567890a"
+FED_ROLE_ARN = f"arn:aws:iam::{ACCOUNT_ID}:role/byod-fed-role"
+EXEC_ROLE_ARN = f"arn:aws:iam::{ACCOUNT_ID}:role/service-role/exec-role"
+SM_DOMAIN_ARN = f"arn:aws:sagemaker:{REGION}:{ACCOUNT_ID}:domain/{SM_DOMAIN_ID}"
+USERS = {"alice": "usr1234567890a", "bob": "usr1234567890b"}
+
+MAPPING = {
+    "sageMakerDomainId": SM_DOMAIN_ID,
+    "dataZoneDomainId": DZ_DOMAIN_ID,
+    "projects": [
+        {
+            "projectId": PROJECT_ID,
+            "environmentId": ENV_ID,
+            "federationRoleArn": FED_ROLE_ARN,
+            "users": {"alice": [USERS["alice"]]},
+            "matchUserNames": True,
+        }
+    ],
+}
+
+
+class RawBody:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class DataZoneResponses:
+    """
+    Canned HTTP responses of the datazone client. Unlike the responses of a Stubber, they go
+    through the parser of botocore, which does not know the sageMaker environment action.
+    """
+
+    def __init__(self, client):
+        self.responses = []
+        client.meta.events.register("before-send.datazone", self.send)
+
+    def add_response(self, operation_name, body, status=200):
+        self.responses.append((operation_name, status, json.dumps(body).encode()))
+
+    def send(self, request, event_name, **kwargs):
+        assert self.responses, f"unexpected call {event_name}"
+        operation_name, status, body = self.responses.pop(0)
+        assert event_name.endswith("." + operation_name), event_name
+        return AWSResponse(request.url, status, {}, RawBody(body))
+
+    def assert_no_pending_responses(self):
+        assert not self.responses
+
+
+@pytest.fixture
+def clients(tmp_path):
+    """
+    Clients that fail on any call without a response, datazone-byod is loaded from the model
+    in resources like in the README
+    """
+    model_dir = tmp_path / "datazone-byod" / "2018-05-10"
+    model_dir.mkdir(parents=True)
+    shutil.copy(
+        os.path.join(
+            os.path.dirname(__file__), "resources", "datazone-linkedtypes-2018-05-10.normal.json"
+        ),
+        model_dir / "service-2.json",
+    )
+    session = botocore.session.get_session()
+    session.get_component("data_loader").search_paths.append(str(tmp_path))
+    credentials = dict(aws_access_key_id="testing", aws_secret_access_key="testing")
+    names = {"sm": "sagemaker", "dz": "datazone", "byod": "datazone-byod", "iam": "iam"}
+    clients = {
+        key: session.create_client(name, region_name=REGION, **credentials)
+        for key, name in names.items()
+    }
+    stubbers = {key: Stubber(clients[key]) for key in ["sm", "byod", "iam"]}
+    for stubber in stubbers.values():
+        stubber.activate()
+    stubbers["dz"] = DataZoneResponses(clients["dz"])
+    yield clients, stubbers
+    for key in ["sm", "byod", "iam"]:
+        stubbers[key].deactivate()
+
+
+def add_imported_state(stubbers):
+    """Responses of the calls of plan once the mapping has been imported"""
+    sm, dz, byod, iam = (stubbers[key] for key in ["sm", "dz", "byod", "iam"])
+    sm.add_response(
+        "describe_domain",
+        {"AuthMode": "IAM", "DefaultUserSettings": {"ExecutionRole": EXEC_ROLE_ARN}},
+        {"DomainId": SM_DOMAIN_ID},
+    )
+    sm.add_response(
+        "list_user_profiles",
+        {"UserProfiles": [{"UserProfileName": "alice"}], "NextToken": "page2"},
+        {"DomainIdEquals": SM_DOMAIN_ID},
+    )
+    sm.add_response(
+        "list_user_profiles",
+        {"UserProfiles": [{"UserProfileName": "bob"}]},
+        {"DomainIdEquals": SM_DOMAIN_ID, "NextToken": "page2"},
+    )
+    dz.add_response("SearchUserProfiles", {"items": []})
+    dz.add_response(
+        "SearchUserProfiles",
+        {"items": [{"id": USERS["bob"], "details": {"sso": {"username": "bob@example.com"}}}]},
+    )
+    dz.add_response(
+        "SearchUserProfiles",
+        {
+            "items": [
+                {
+                    "id": USERS["alice"],
+                    "details": {"iam": {"arn": f"arn:aws:iam::{ACCOUNT_ID}:role/alice"}},
+                }
+            ]
+        },
+    )
+    for user_name in ["alice", "bob"]:
+        sm.add_response(
+            "describe_user_profile",
+            {"UserSettings": {}},
+            {"DomainId": SM_DOMAIN_ID, "UserProfileName": user_name},
+        )
+    sm.add_response(
+        "list_tags",
+        {
+            "Tags": [
+                {"Key": "AmazonDataZoneDomain", "Value": DZ_DOMAIN_ID},
+                {"Key": "AmazonDataZoneDomainAccount", "Value": ACCOUNT_ID},
+                {"Key": "AmazonDataZoneStage", "Value": "prod"},
+            ]
+        },
+        {"ResourceArn": SM_DOMAIN_ARN},
+    )
+    iam.add_response(
+        "list_role_tags",
+        {
+            "Tags": [
+                {"Key": "AmazonDataZoneDomain", "Value": DZ_DOMAIN_ID},
+                {"Key": "AmazonDataZoneProject", "Value": PROJECT_ID},
+                {"Key": "AmazonDataZoneEnvironment", "Value": ENV_ID},
+            ]
+        },
+        {"RoleName": "exec-role"},
+    )
+    dz.add_response(
+        "ListEnvironmentActions",
+        {
+            "items": [
+                {
+                    "domainId": DZ_DOMAIN_ID,
+                    "environmentId": ENV_ID,
+                    "id": "act1234567890a",
+                    "name": "SageMaker Environment Action Link",
+                    "parameters": {"sageMaker": {}},
+                }
+            ]
+        },
+    )
+    linked = [{"itemIdentifier": SM_DOMAIN_ARN, "itemType": "SAGEMAKER_DOMAIN"}]
+    for user_name, user_id in USERS.items():
+        linked.append(
+            {
+                "itemIdentifier": (
+                    f"arn:aws:sagemaker:{REGION}:{ACCOUNT_ID}"
+                    f":user-profile/{SM_DOMAIN_ID}/{user_name}"
+                ),
+                "itemType": "SAGEMAKER_USER_PROFILE",
+                "authorizedPrincipals": [
+                    {"principalIdentifier": user_id, "principalType": "DATAZONE_USER_PROFILE"}
+                ],
+            }
+        )
+    byod.add_response(
+        "list_linked_types",
+        {"items": linked},
+        {
+            "domainIdentifier": DZ_DOMAIN_ID,
+            "projectIdentifier": PROJECT_ID,
+            "environmentIdentifier": ENV_ID,
+        },
+    )
+
+
+def test_second_import_changes_nothing(clients):
+    clients, stubbers = clients
+    # one worker, so that the calls of every client come in a fixed order
+    importer = SageMakerDomainBatchImporter(
+        REGION,
+        "prod",
+        ACCOUNT_ID,
+        clients["sm"],
+        clients["dz"],
+        clients["byod"],
+        clients["iam"],
+        max_workers=1,
+        calls_per_second=0,
+    )
+
+    add_imported_state(stubbers)
+    changes, unchanged = importer.plan(MAPPING)
+    # 3 domain tags, 3 role tags, the environment action and 3 linked types
+    assert unchanged == 10
+    # the federation role is always associated, DataZone keeps the role of the environment
+    assert [change.kind for change in changes] == ["associate_role"]
+
+    stubbers["dz"].add_response(
+        "AssociateEnvironmentRole",
+        {"__type": "ConflictException", "message": "Environment has a role configured already"},
+        status=409,
+    )
+    # any other call, like a tag or a linked type, fails as it has no response
+    assert importer.apply(changes) == (1, [])
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
+
+    add_imported_state(stubbers)
+    assert importer.import_batch(MAPPING, dry_run=True) == []
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
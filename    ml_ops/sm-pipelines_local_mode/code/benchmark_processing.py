@@ -0,0 +1,302 @@
+"""
+Checks and benchmarks the chunked transforms of processing/processing.py.
+
+A synthetic transactions dataset with the columns of the credit card transactions CSV is
+written as CSV and as Parquet. The transformed rows are checked against the previous
+extract_data and transform_data on a sample. Then the previous processing step and the
+chunked one on CSV and Parquet input each run in their own process over the whole dataset.
+The script checks that train and test contain the same rows and reports the runtime and
+peak memory of every run.
+
+    python benchmark_processing.py --rows 10000000 --chunk-rows 1000000
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from os import listdir
+from os.path import isfile, join
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.model_selection import train_test_split
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing"))
+
+from processing import extract_data, process_data, transform_data  # noqa: E402
+
+COLUMNS = [
+    "User",
+    "Card",
+    "Year",
+    "Month",
+    "Day",
+    "Time",
+    "Amount",
+    "Use Chip",
+    "Merchant Name",
+    "Merchant City",
+    "Merchant State",
+    "Zip",
+    "MCC",
+    "Errors?",
+    "Is Fraud?",
+]
+
+ERRORS = [
+    "Insufficient Balance",
+    "Technical Glitch",
+    "Bad PIN",
+    "Bad Expiration",
+    "Bad Card Number",
+    "Bad CVV",
+    "Bad PIN,Insufficient Balance",
+    "Bad PIN,Technical Glitch",
+    "Bad Zipcode",
+    " Bad CVV ",
+]
+USE_CHIP = ["Swipe Transaction", "Chip Transaction", "Online Transaction", "Chip Transaction "]
+IS_FRAUD = ["No", "Yes", "'Yes'", " No", "Maybe"]
+
+
+def old_extract_data(file_path, percentage=100):
+    """The previous extract_data, with on_bad_lines instead of the removed error_bad_lines."""
+    files = [f for f in listdir(file_path) if isfile(join(file_path, f)) and f.endswith(".csv")]
+    frames = []
+    for file in files:
+        df = pd.read_csv(
+            os.path.join(file_path, file),
+            sep=",",
+            quotechar='"',
+            quoting=csv.QUOTE_ALL,
+            escapechar="\\",
+            encoding="utf-8",
+            on_bad_lines="skip",
+        )
+        df = df.head(int(len(df) * (percentage / 100)))
+        frames.append(df)
+    return pd.concat(frames)
+
+
+def old_transform_data(df):
+    """The previous transform_data, with fillna assigned back, as inplace has no effect on
+    a column under copy on write."""
+    df = df[df["Is Fraud?"].notna()]
+    df.insert(0, "ID", range(1, len(df) + 1))
+    df["Errors?"] = df["Errors?"].fillna("")
+    df["Errors?"] = df["Errors?"].map(lambda x: x.strip())
+    df["Errors?"] = df["Errors?"].map(
+        {
+            "Insufficient Balance": 0,
+            "Technical Glitch": 1,
+            "Bad PIN": 2,
+            "Bad Expiration": 3,
+            "Bad Card Number": 4,
+            "Bad CVV": 5,
+            "Bad PIN,Insufficient Balance": 6,
+            "Bad PIN,Technical Glitch": 7,
+            "": 8,
+        }
+    )
+    df["Use Chip"] = df["Use Chip"].fillna("")
+    df["Use Chip"] = df["Use Chip"].map(lambda x: x.strip())
+    df["Use Chip"] = df["Use Chip"].map(
+        {
+            "Swipe Transaction": 0,
+            "Chip Transaction": 1,
+            "Online Transaction": 2,
+        }
+    )
+    df["Is Fraud?"] = df["Is Fraud?"].map(lambda x: x.replace("'", ""))
+    df["Is Fraud?"] = df["Is Fraud?"].map(lambda x: x.strip())
+    df["Is Fraud?"] = df["Is Fraud?"].replace("", np.nan)
+    df["Is Fraud?"] = df["Is Fraud?"].replace(" ", np.nan)
+    df["Is Fraud?"] = df["Is Fraud?"].map({"No": 0, "Yes": 1})
+    df = df.rename(
+        columns={
+            "Card": "card",
+            "MCC": "mcc",
+            "Errors?": "errors",
+            "Use Chip": "use_chip",
+            "Is Fraud?": "labels",
+        }
+    )
+    return df[["card", "mcc", "errors", "use_chip", "labels"]]
+
+
+def old_process_data(input_path, output_path):
+    df = old_transform_data(old_extract_data(input_path))
+    data_train, data_test = train_test_split(df, test_size=0.2, shuffle=True)
+    for name, data in [("train", data_train), ("test", data_test)]:
+        os.makedirs(os.path.join(output_path, name))
+        data.to_csv(
+            os.path.join(output_path, name, name + ".csv"),
+            index=False,
+            header=True,
+            quoting=csv.QUOTE_ALL,
+            encoding="utf-8",
+            escapechar="\\",
+            sep=",",
+        )
+
+
+def synthetic_transactions(rows, seed):
+    rng = np.random.RandomState(seed)
+
+    def pick(values, p_missing, p_values=None):
+        column = np.array(values, dtype=object)[rng.choice(len(values), rows, p=p_values)]
+        column[rng.random_sample(rows) < p_missing] = None
+        return column
+
+    return pd.DataFrame(
+        {
+            "User": rng.randint(0, 2000, rows),
+            "Card": rng.randint(0, 9, rows),
+            "Year": rng.randint(1991, 2020, rows),
+            "Month": rng.randint(1, 13, rows),
+            "Day": rng.randint(1, 29, rows),
+            "Time": pick(["06:21", "12:42", "18:03", "23:59"], 0),
+            "Amount": np.char.add("$", np.round(rng.exponential(50, rows), 2).astype(str)),
+            "Use Chip": pick(USE_CHIP, 0.001, [0.45, 0.4, 0.14, 0.01]),
+            "Merchant Name": rng.randint(-9 * 10**18, 9 * 10**18, rows, dtype=np.int64),
+            "Merchant City": pick(["La Verne", "Monterey Park", "ONLINE", "Mira Loma"], 0),
+            "Merchant State": pick(["CA", "NY", "TX", None], 0),
+            "Zip": rng.randint(10000, 99999, rows).astype(float),
+            "MCC": rng.choice([5300, 5411, 5499, 5651, 5912, 5942], rows),
+            "Errors?": pick(ERRORS, 0.98),
+            "Is Fraud?": pick(IS_FRAUD, 0.001, [0.95, 0.02, 0.01, 0.015, 0.005]),
+        },
+        columns=COLUMNS,
+    )
+
+
+def write_dataset(data_dir, rows, chunk_rows):
+    csv_dir, parquet_dir = os.path.join(data_dir, "csv"), os.path.join(data_dir, "parquet")
+    os.makedirs(csv_dir)
+    os.makedirs(parquet_dir)
+    csv_path = os.path.join(csv_dir, "creditcard_csv.csv")
+    writer = None
+    for i, start in enumerate(range(0, rows, chunk_rows)):
+        df = synthetic_transactions(min(chunk_rows, rows - start), seed=i)
+        df.to_csv(csv_path, mode="a" if i else "w", header=i == 0, index=False)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(os.path.join(parquet_dir, "creditcard.parquet"), table.schema)
+        writer.write_table(table)
+    writer.close()
+    return csv_dir, parquet_dir
+
+
+def check_equivalence(csv_dir, parquet_dir, chunk_rows):
+    """The chunked transform gives the rows of the previous one, in order."""
+    expected = old_transform_data(old_extract_data(csv_dir))
+    for path in [csv_dir, parquet_dir]:
+        result = pd.concat(transform_data(df) for df in extract_data(path, chunk_rows=chunk_rows))
+        # the index is not written, and starts at 0 in every Parquet batch
+        assert len(result) == len(expected)
+        assert list(result.columns) == list(expected.columns)
+        for column in expected.columns:
+            np.testing.assert_array_equal(
+                result[column].astype("float64").to_numpy(),
+                expected[column].astype("float64").to_numpy(),
+            )
+
+
+def read_output(output_path):
+    frames = []
+    for name in ["train", "test"]:
+        for f in sorted(listdir(os.path.join(output_path, name))):
+            path = os.path.join(output_path, name, f)
+            frames.append(pd.read_parquet(path) if f.endswith(".parquet") else pd.read_csv(path))
+    df = pd.concat(frames).astype("float64")
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def peak_memory():
+    """Peak resident memory of this process in MiB. Unlike ru_maxrss, it does not
+    start from the resident memory of the parent process at fork."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def run(mode, input_path, output_path, chunk_rows):
+    start = time.perf_counter()
+    if mode == "previous":
+        old_process_data(input_path, output_path)
+    else:
+        output_format = "parquet" if mode.endswith("parquet") else "csv"
+        process_data(input_path, output_path, chunk_rows=chunk_rows, output_format=output_format)
+    print(json.dumps({"seconds": time.perf_counter() - start, "peak": peak_memory()}))
+
+
+def measure(mode, input_path, output_path, chunk_rows):
+    """Runtime and peak resident memory of mode in a new process"""
+    process = subprocess.run(
+        [sys.executable, __file__, "--run", mode, input_path, output_path, str(chunk_rows)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    result = json.loads(process.stdout.decode().splitlines()[-1])
+    return result["seconds"], result["peak"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--chunk-rows", type=int, default=1000000)
+    parser.add_argument("--check-rows", type=int, default=200000)
+    parser.add_argument("--run", nargs=4, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        mode, input_path, output_path, chunk_rows = args.run
+        return run(mode, input_path, output_path, int(chunk_rows))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_dir, parquet_dir = write_dataset(os.path.join(tmp_dir, "check"), args.check_rows, 30000)
+        check_equivalence(csv_dir, parquet_dir, chunk_rows=30000)
+    print("the chunked transforms match the previous transform_data on CSV and Parquet input")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        csv_dir, parquet_dir = write_dataset(
+            os.path.join(tmp_dir, "data"), args.rows, args.chunk_rows
+        )
+        print("wrote {} rows in {:.0f}s".format(args.rows, time.perf_counter() - start))
+
+        runs = [
+            ("previous", csv_dir),
+            ("chunked csv", csv_dir),
+            ("chunked parquet", parquet_dir),
+            ("chunked parquet to parquet", parquet_dir),
+        ]
+        print("{:<28} {:>10} {:>12} {:>14}".format("", "seconds", "rows/sec", "peak MiB"))
+        expected = None
+        for i, (mode, input_path) in enumerate(runs):
+            output_path = os.path.join(tmp_dir, "output{}".format(i))
+            seconds, peak = measure(mode, input_path, output_path, args.chunk_rows)
+            print(
+                "{:<28} {:>10.1f} {:>12.0f} {:>14.0f}".format(
+                    mode, seconds, args.rows / seconds, peak
+                )
+            )
+
+            output = read_output(output_path)
+            if expected is None:
+                expected = output
+            else:
+                pd.testing.assert_frame_equal(output, expected)
+        print("train and test contain the same rows for all runs")
+
+
+if __name__ == "__main__":
+    main()
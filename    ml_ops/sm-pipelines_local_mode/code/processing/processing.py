@@ -6,7 +6,8 @@ import os
 from os import listdir
 from os.path import isfile, join
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import pyarrow as pa
+import pyarrow.parquet as pq
 import traceback
 
 logging.basicConfig(level=logging.INFO)
@@ -17,121 +18,240 @@ PROCESSING_PATH = os.path.join(BASE_PATH, "processing")
 PROCESSING_PATH_INPUT = os.path.join(PROCESSING_PATH, "input")
 PROCESSING_PATH_OUTPUT = os.path.join(PROCESSING_PATH, "output")
 
-def extract_data(file_path, percentage=100):
-    try:
-        files = [f for f in listdir(file_path) if isfile(join(file_path, f)) and f.endswith(".csv")]
-        LOGGER.info("{}".format(files))
-
-        frames = []
+# Only these columns of the transactions are read from the input files
+INPUT_COLUMNS = ["Card", "MCC", "Errors?", "Use Chip", "Is Fraud?"]
+OUTPUT_COLUMNS = ["card", "mcc", "errors", "use_chip", "labels"]
+
+ERRORS_MAPPING = {
+    "Insufficient Balance": 0,
+    "Technical Glitch": 1,
+    "Bad PIN": 2,
+    "Bad Expiration": 3,
+    "Bad Card Number": 4,
+    "Bad CVV": 5,
+    "Bad PIN,Insufficient Balance": 6,
+    "Bad PIN,Technical Glitch": 7,
+    "": 8
+}
+
+USE_CHIP_MAPPING = {
+    "Swipe Transaction": 0,
+    "Chip Transaction": 1,
+    "Online Transaction": 2
+}
+
+LABELS_MAPPING = {"No": 0, "Yes": 1}
+
+CSV_OPTIONS = dict(
+    sep=",",
+    quotechar='"',
+    quoting=csv.QUOTE_ALL,
+    escapechar='\\',
+    encoding='utf-8'
+)
+
+# on_bad_lines replaces error_bad_lines from pandas 1.3, the SKLearn 0.23-1 image ships pandas 1.1
+if tuple(int(v) for v in pd.__version__.split(".")[:2]) >= (1, 3):
+    BAD_LINES_OPTIONS = dict(on_bad_lines="skip")
+else:
+    BAD_LINES_OPTIONS = dict(error_bad_lines=False, warn_bad_lines=False)
+
+def list_input_files(file_path):
+    files = sorted(
+        f for f in listdir(file_path)
+        if isfile(join(file_path, f)) and (f.endswith(".csv") or f.endswith(".parquet"))
+    )
+    LOGGER.info("{}".format(files))
+
+    return [os.path.join(file_path, f) for f in files]
+
+def read_chunks(path, chunk_rows):
+    """
+    Read the input columns of a CSV or Parquet file in chunks of at most chunk_rows rows
+    """
+    if path.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(path)
+
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=INPUT_COLUMNS):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(
+            path,
+            usecols=INPUT_COLUMNS,
+            chunksize=chunk_rows,
+            **BAD_LINES_OPTIONS,
+            **CSV_OPTIONS
+        )
 
-        for file in files:
-            df = pd.read_csv(
-                os.path.join(file_path, file),
-                sep=",",
-                quotechar='"',
-                quoting=csv.QUOTE_ALL,
-                escapechar='\\',
-                encoding='utf-8',
-                error_bad_lines=False
-            )
+def count_rows(path, chunk_rows):
+    if path.endswith(".parquet"):
+        return pq.ParquetFile(path).metadata.num_rows
+
+    return sum(len(chunk) for chunk in pd.read_csv(
+        path,
+        usecols=INPUT_COLUMNS[:1],
+        chunksize=chunk_rows,
+        **BAD_LINES_OPTIONS,
+        **CSV_OPTIONS
+    ))
+
+def extract_data(file_path, percentage=100, chunk_rows=1000000):
+    """
+    Read the first percentage % of the rows of every CSV and Parquet file in file_path,
+    as DataFrames of at most chunk_rows rows with the input columns only
+    """
+    try:
+        for path in list_input_files(file_path):
+            rows = None
 
-            df = df.head(int(len(df) * (percentage / 100)))
+            if percentage < 100:
+                rows = int(count_rows(path, chunk_rows) * (percentage / 100))
 
-            frames.append(df)
+            for df in read_chunks(path, chunk_rows):
+                if rows is not None:
+                    if rows <= 0:
+                        break
 
-        df = pd.concat(frames)
+                    df = df.head(rows)
+                    rows -= len(df)
 
-        return df
+                yield df
     except Exception as e:
         stacktrace = traceback.format_exc()
         LOGGER.error("{}".format(stacktrace))
 
         raise e
 
-def load_data(df, file_path, file_name):
+def encode_column(values, mapping, clean=str.strip, fill_value=None):
+    """
+    Map every value of a string column with mapping after clean, to a nullable integer column.
+
+    The distinct values are cleaned and mapped once and the result is gathered by their codes,
+    instead of calling clean for every row. Missing values are replaced by fill_value, and values
+    without a mapping are missing in the result.
+    """
+    codes, uniques = pd.factorize(values)
+
+    lookup = [mapping.get(clean(value)) for value in uniques]
+    # the code of missing values is -1, which selects the last entry
+    lookup.append(mapping.get(clean(fill_value)) if fill_value is not None else None)
+
+    return pd.Series(pd.array(lookup, dtype="Int64")[codes], index=values.index)
+
+def clean_label(value):
+    return value.replace("'", "").strip()
+
+def transform_data(df):
     try:
-        if not os.path.exists(file_path):
-            os.makedirs(file_path)
+        df = df[df['Is Fraud?'].notna()]
 
-        path = os.path.join(file_path, file_name + ".csv")
+        df = pd.DataFrame({
+            "card": df["Card"],
+            "mcc": df["MCC"],
+            "errors": encode_column(df["Errors?"], ERRORS_MAPPING, fill_value=''),
+            "use_chip": encode_column(df["Use Chip"], USE_CHIP_MAPPING, fill_value=''),
+            "labels": encode_column(df["Is Fraud?"], LABELS_MAPPING, clean=clean_label)
+        })
 
-        LOGGER.info("Saving file in {}".format(path))
+        return df
 
-        df.to_csv(
-            path,
-            index=False,
-            header=True,
-            quoting=csv.QUOTE_ALL,
-            encoding="utf-8",
-            escapechar="\\",
-            sep=","
-        )
     except Exception as e:
         stacktrace = traceback.format_exc()
         LOGGER.error("{}".format(stacktrace))
 
         raise e
 
-def transform_data(df):
-    try:
-        df = df[df['Is Fraud?'].notna()]
+class DataWriter:
+    """
+    Append DataFrames to one CSV or Parquet file, one Parquet row group per DataFrame
+    """
+    def __init__(self, file_path, file_name, output_format="csv"):
+        if not os.path.exists(file_path):
+            os.makedirs(file_path)
 
-        df.insert(0, 'ID', range(1, len(df) + 1))
-
-        df["Errors?"].fillna('', inplace=True)
-        df['Errors?'] = df['Errors?'].map(lambda x: x.strip())
-        df["Errors?"] = df["Errors?"].map({
-            "Insufficient Balance": 0,
-            "Technical Glitch": 1,
-            "Bad PIN": 2,
-            "Bad Expiration": 3,
-            "Bad Card Number": 4,
-            "Bad CVV": 5,
-            "Bad PIN,Insufficient Balance": 6,
-            "Bad PIN,Technical Glitch": 7,
-            "": 8
-        })
+        self.path = os.path.join(file_path, file_name + "." + output_format)
+        self.output_format = output_format
+        self.parquet_writer = None
+        self.rows = 0
 
-        df["Use Chip"].fillna('', inplace=True)
-        df['Use Chip'] = df['Use Chip'].map(lambda x: x.strip())
-        df["Use Chip"] = df["Use Chip"].map({
-            "Swipe Transaction": 0,
-            "Chip Transaction": 1,
-            "Online Transaction": 2
-        })
+        LOGGER.info("Saving file in {}".format(self.path))
 
-        df['Is Fraud?'] = df['Is Fraud?'].map(lambda x: x.replace("'", ""))
-        df['Is Fraud?'] = df['Is Fraud?'].map(lambda x: x.strip())
-        df['Is Fraud?'] = df['Is Fraud?'].replace('', np.nan)
-        df['Is Fraud?'] = df['Is Fraud?'].replace(' ', np.nan)
+    def write(self, df):
+        try:
+            if self.output_format == "parquet":
+                if self.parquet_writer is None:
+                    schema = pa.Schema.from_pandas(df, preserve_index=False)
+                    self.parquet_writer = pq.ParquetWriter(self.path, schema)
 
-        df["Is Fraud?"] = df["Is Fraud?"].map({"No": 0, "Yes": 1})
+                table = pa.Table.from_pandas(df, schema=self.parquet_writer.schema, preserve_index=False)
+                self.parquet_writer.write_table(table)
+            else:
+                df.to_csv(
+                    self.path,
+                    mode="w" if self.rows == 0 else "a",
+                    index=False,
+                    header=self.rows == 0,
+                    **CSV_OPTIONS
+                )
 
-        df = df.rename(
-            columns={'Card': 'card', 'MCC': 'mcc', "Errors?": "errors", "Use Chip": "use_chip", "Is Fraud?": "labels"})
+            self.rows += len(df)
+        except Exception as e:
+            stacktrace = traceback.format_exc()
+            LOGGER.error("{}".format(stacktrace))
 
-        df = df[["card", "mcc", "errors", "use_chip", "labels"]]
+            raise e
 
-        return df
+    def close(self):
+        if self.rows == 0 and self.parquet_writer is None:
+            self.write(pd.DataFrame({column: pd.array([], dtype="Int64") for column in OUTPUT_COLUMNS}))
 
-    except Exception as e:
-        stacktrace = traceback.format_exc()
-        LOGGER.error("{}".format(stacktrace))
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
 
-        raise e
+        LOGGER.info("Saved {} rows in {}".format(self.rows, self.path))
+
+def split_data(df, test_size=0.2):
+    """
+    Shuffle the rows and put every row in the test set with probability test_size,
+    so that the split does not depend on the size of the chunks.
+
+    Unlike train_test_split, the test set is not exactly test_size of the rows:
+    its size follows a binomial distribution around it.
+    """
+    df = df.sample(frac=1)
+    test = np.random.random_sample(len(df)) < test_size
+
+    return df[~test], df[test]
+
+def process_data(input_path, output_path, percentage=100, chunk_rows=1000000, output_format="csv"):
+    """
+    Transform the input files chunk by chunk, and split every chunk into the train and test outputs
+    """
+    train_writer = DataWriter(os.path.join(output_path, "train"), "train", output_format)
+    test_writer = DataWriter(os.path.join(output_path, "test"), "test", output_format)
+
+    for df in extract_data(input_path, percentage, chunk_rows):
+        data_train, data_test = split_data(transform_data(df))
+
+        train_writer.write(data_train)
+        test_writer.write(data_test)
+
+    train_writer.close()
+    test_writer.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--dataset-percentage", type=int, required=False, default=100)
+    parser.add_argument("--chunk-rows", type=int, required=False, default=1000000)
+    parser.add_argument("--output-format", type=str, required=False, default="csv", choices=["csv", "parquet"])
     args = parser.parse_args()
 
     LOGGER.info("Arguments: {}".format(args))
 
-    df = extract_data(PROCESSING_PATH_INPUT, args.dataset_percentage)
-
-    df = transform_data(df)
-
-    data_train, data_test = train_test_split(df, test_size=0.2, shuffle=True)
-
-    load_data(data_train, os.path.join(PROCESSING_PATH_OUTPUT, "train"), "train")
-    load_data(data_test, os.path.join(PROCESSING_PATH_OUTPUT, "test"), "test")
+    process_data(
+        PROCESSING_PATH_INPUT,
+        PROCESSING_PATH_OUTPUT,
+        args.dataset_percentage,
+        args.chunk_rows,
+        args.output_format
+    )
@@ -0,0 +1,153 @@
+"""
+Checks that MovieLensBatchSimulator follows seeded MovieLens100KEnv user by user, then
+compares the users/sec of both for several batch sizes.
+
+Without --data-dir a synthetic MovieLens 100K directory (u.data, u.item) with the same
+number of users, items and ratings is written to a temporary directory.
+
+    python benchmark_movielens_env.py --data-dir ./ml-100k --batch-sizes 16 64 256
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from env import (
+    CACHE_FILE,
+    NUM_GENRES,
+    NUM_ITEMS,
+    NUM_USERS,
+    MovieLens100KEnv,
+    MovieLensBatchSimulator,
+    clicks_to_lists,
+)
+
+NUM_RATINGS = 100000
+
+
+def write_synthetic_movielens(data_dir, seed=0):
+    rng = np.random.RandomState(seed)
+    with open(os.path.join(data_dir, "u.item"), "w", encoding="latin-1") as f:
+        for item in range(1, NUM_ITEMS + 1):
+            genres = "|".join(str(g) for g in rng.randint(0, 2, size=NUM_GENRES))
+            f.write(f"{item}|Movie {item} (1995)|01-Jan-1995||http://example.com/{item}|{genres}\n")
+    users = rng.randint(1, NUM_USERS + 1, size=NUM_RATINGS)
+    items = rng.randint(1, NUM_ITEMS + 1, size=NUM_RATINGS)
+    ratings = rng.randint(1, 6, size=NUM_RATINGS)
+    timestamps = rng.randint(874724710, 893286638, size=NUM_RATINGS)
+    np.savetxt(
+        os.path.join(data_dir, "u.data"),
+        np.column_stack([users, items, ratings, timestamps]),
+        fmt="%d",
+        delimiter="\t",
+    )
+
+
+def random_actions(rng, pool_sizes, top_k):
+    """top_k distinct positions in the item pool of every user."""
+    keys = rng.random_sample((len(pool_sizes), pool_sizes.max()))
+    keys[np.arange(pool_sizes.max()) >= pool_sizes[:, None]] = np.inf
+    return np.argsort(keys, axis=1)[:, :top_k]
+
+
+def check_equivalence(data_dir, env_kwargs, batch_size, steps, seed=0):
+    env = MovieLens100KEnv(data_dir=data_dir, seed=seed, **env_kwargs)
+    simulator = MovieLensBatchSimulator(
+        data_dir=data_dir, batch_size=batch_size, seed=seed, **env_kwargs
+    )
+    action_rng = np.random.RandomState(seed)
+    env.reset()
+    simulator.reset()
+    for step in range(steps):
+        pools = simulator.current_item_pools
+        sizes = simulator.current_pool_sizes
+        embeddings = simulator.current_items_embedding
+        actions = random_actions(action_rng, sizes, env.top_k)
+        _, clicks, _, info = simulator.step(actions)
+        for i, user_clicks in enumerate(clicks_to_lists(clicks)):
+            assert np.array_equal(env.current_item_pool, pools[i, : sizes[i]]), "pools differ"
+            assert np.array_equal(env.current_items_embedding, embeddings[i, : sizes[i]])
+            regret_before = env.total_regret
+            random_regret_before = env.total_random_regret
+            _, env_clicks, _, env_info = env.step(actions[i])
+            assert np.array_equal(env_clicks, user_clicks), f"step {step}: clicks differ"
+            assert np.isclose(env_info["total_regret"] - regret_before, info["regret"][i])
+            assert np.isclose(
+                env_info["total_random_regret"] - random_regret_before, info["random_regret"][i]
+            )
+
+
+def benchmark(data_dir, env_kwargs, batch_sizes, users):
+    env = MovieLens100KEnv(data_dir=data_dir, seed=0, **env_kwargs)
+    env.reset()
+    action_rng = np.random.RandomState(0)
+    start = time.perf_counter()
+    for _ in range(users):
+        actions = action_rng.choice(len(env.current_item_pool), env.top_k, replace=False)
+        env.step(actions)
+    baseline = users / (time.perf_counter() - start)
+    print("{:<32} {:>12.0f} users/sec".format("MovieLens100KEnv", baseline))
+
+    for batch_size in batch_sizes:
+        simulator = MovieLensBatchSimulator(
+            data_dir=data_dir, batch_size=batch_size, seed=0, **env_kwargs
+        )
+        simulator.reset()
+        steps = max(1, users // batch_size)
+        start = time.perf_counter()
+        for _ in range(steps):
+            actions = random_actions(action_rng, simulator.current_pool_sizes, env.top_k)
+            simulator.step(actions)
+        rate = steps * batch_size / (time.perf_counter() - start)
+        print(
+            "{:<32} {:>12.0f} users/sec  {:>6.1f}x".format(
+                f"MovieLensBatchSimulator B={batch_size}", rate, rate / baseline
+            )
+        )
+
+
+def time_loading(data_dir):
+    cache_file = os.path.join(data_dir, CACHE_FILE)
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    start = time.perf_counter()
+    MovieLens100KEnv(data_dir=data_dir)
+    parsed = time.perf_counter() - start
+    start = time.perf_counter()
+    MovieLens100KEnv(data_dir=data_dir)
+    cached = time.perf_counter() - start
+    print(f"MovieLens100KEnv load: {parsed:.3f}s parsing the text files, {cached:.3f}s cached")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--item-pool-size", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-users", type=int, default=NUM_USERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = tmp_dir
+            write_synthetic_movielens(data_dir)
+        env_kwargs = dict(item_pool_size=args.item_pool_size, top_k=args.top_k)
+
+        time_loading(data_dir)
+        for max_users, batch_size in [(100, 7), (NUM_USERS, 64)]:
+            check_equivalence(data_dir, dict(env_kwargs, max_users=max_users), batch_size, 40)
+        check_equivalence(data_dir, dict(top_k=args.top_k, max_users=50), 16, 10)
+        print("MovieLensBatchSimulator matches MovieLens100KEnv(seed=0)")
+
+        benchmark(
+            data_dir, dict(env_kwargs, max_users=args.max_users), args.batch_sizes, args.users
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Benchmark of the VWAgent pipe protocol against a fake VW process.
+
+The fake VW reads multiline examples from stdin and answers each one with an action
+scores line and a blank line, like `vw --cb_explore_adf -p /dev/stdout`, without learning.
+The script checks that the pipelined and batched clients choose the same actions as the
+previous one-example-per-round-trip client, then reports simulated users per second:
+
+    python benchmark_vw_agent.py --users 2000 --batch-size 64 --pool-size 4
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+from vw_agent import VWAgent, VWAgentPool
+
+
+def fake_vw_scores(example):
+    """Deterministic action scores for an example, the first pair is the chosen action."""
+    num_items = example.count(b"|d")
+    best = len(example) % num_items
+    if num_items % 7 == 0:
+        # a zero probability first: the client normalizes the scores itself
+        return b",".join(b"%d:%d" % (i, 0 if i == 0 else 1 + (i == best)) for i in range(num_items))
+    others = [i for i in range(num_items) if i != best]
+    rest = 0.1 / max(1, len(others))
+    return b",".join(
+        [b"%d:%.6f" % (best, 0.9 if others else 1.0)] + [b"%d:%.6f" % (i, rest) for i in others]
+    )
+
+
+def fake_vw(read_latency):
+    """
+    Answers every complete example of each chunk read from stdin with one write.
+    read_latency seconds are spent on every read, standing in for the wake-up and
+    per-request work of a real VW process.
+    """
+    pending = b""
+    while True:
+        chunk = os.read(0, 1 << 16)
+        if not chunk:
+            return
+        if read_latency:
+            time.sleep(read_latency)
+        examples = (pending + chunk).split(b"\n\n")
+        pending = examples.pop()
+        output = b"".join(fake_vw_scores(example) + b"\n\n" for example in examples if example)
+        if output:
+            os.write(1, output)
+
+
+def fake_vw_cmd(read_latency):
+    return [sys.executable, __file__, "--fake-vw", "--read-latency", str(read_latency)]
+
+
+def start_fake_agent(read_latency, **kwargs):
+    agent = VWAgent(cli_args="--cb_explore_adf", quiet_mode=True, **kwargs)
+    agent.cmd = fake_vw_cmd(read_latency)
+    return agent
+
+
+class OneByOneClient:
+    """The previous VWAgent protocol: one write, flush and readline per example."""
+
+    def __init__(self, read_latency):
+        self.proc = subprocess.Popen(
+            fake_vw_cmd(read_latency),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def _choose_action(self, vw_prediction_str):
+        self.proc.stdin.write(vw_prediction_str.encode())
+        self.proc.stdin.flush()
+        vw_scores_string = self.proc.stdout.readline().decode()
+        self.proc.stdout.readline()
+        action, prob = vw_scores_string.strip().split(",")[0].split(":")
+        action = int(action)
+        prob = float(prob)
+        if prob == 0:
+            scores_dict = eval("{" + vw_scores_string + "}")
+            item_scores = np.array([scores_dict[i] for i in range(len(scores_dict))])
+            item_probs = item_scores / item_scores.sum()
+            action = np.argmax(item_probs)
+            prob = item_probs[action]
+        return action, prob
+
+    def choose_actions(self, shared_features, candidate_arms_features, user_id, top_k):
+        shared_vw_features = VWAgent.transform_context(shared_features) + " user_%s" % user_id
+        start_index = len(shared_features) + 1
+        item_vw_features = [
+            VWAgent.transform_context(i, start_index) for i in candidate_arms_features
+        ]
+        action_ids = list(range(len(item_vw_features)))
+        actions, probs = [], []
+        for k in range(top_k):
+            parsed_example = VWAgent.generate_prediction_string_multiline(
+                shared_vw_features, item_vw_features
+            )
+            best_action_index, action_prob = self._choose_action(parsed_example)
+            actions.append(action_ids[best_action_index])
+            probs.append(action_prob)
+            item_vw_features.pop(best_action_index)
+            action_ids.pop(best_action_index)
+        return actions, probs
+
+    def learn(
+        self,
+        shared_features,
+        candidate_arms_features,
+        action_index,
+        action_prob,
+        reward,
+        user_id,
+        cost_fn,
+    ):
+        shared_vw_features = VWAgent.transform_context(shared_features) + " user_%s" % user_id
+        start_index = len(shared_features) + 1
+        item_vw_features = [
+            VWAgent.transform_context(i, start_index) for i in candidate_arms_features
+        ]
+        parsed_example = VWAgent.generate_experience_string_multiline(
+            shared_vw_features, item_vw_features, action_index, cost_fn(reward), action_prob
+        )
+        self.proc.stdin.write(parsed_example.encode())
+        self.proc.stdin.flush()
+        self.proc.stdout.readline()
+        self.proc.stdout.readline()
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def make_users(num_users, num_items, seed=0):
+    rng = np.random.RandomState(seed)
+    users = rng.randint(0, 2, size=(num_users, 19))
+    items = rng.randint(0, 2, size=(num_users, num_items, 19))
+    # varying pool sizes exercise the zero probability path of the fake VW
+    pool_sizes = rng.randint(num_items - 3, num_items + 1, size=num_users)
+    return [(i, users[i].tolist(), items[i, : pool_sizes[i]].tolist()) for i in range(num_users)]
+
+
+def interact(client, users, top_k, learn=True):
+    """choose_actions and learn from every recommendation, as train.py does"""
+    results = []
+    for user_id, user_features, items_features in users:
+        actions, probs = client.choose_actions(
+            user_features, items_features, user_id=user_id, top_k=top_k
+        )
+        results.append((actions, probs))
+        if learn:
+            for action, prob in zip(actions, probs):
+                client.learn(
+                    user_features,
+                    items_features,
+                    action,
+                    prob,
+                    reward=1.0,
+                    user_id=user_id,
+                    cost_fn=lambda x: -x,
+                )
+    return results
+
+
+def batched(client, users, top_k, batch_size):
+    results = []
+    for start in range(0, len(users), batch_size):
+        batch = users[start : start + batch_size]
+        results.extend(
+            client.choose_actions_batch(
+                [user_features for _, user_features, _ in batch],
+                [items_features for _, _, items_features in batch],
+                user_ids=[user_id for user_id, _, _ in batch],
+                top_k=top_k,
+            )
+        )
+    return results
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--read-latency", type=float, default=0.0001)
+    parser.add_argument("--fake-vw", action="store_true")
+    args = parser.parse_args()
+
+    if args.fake_vw:
+        fake_vw(args.read_latency)
+        return
+
+    users = make_users(args.users, args.items)
+
+    def report(name, seconds, baseline=None):
+        rate = len(users) / seconds
+        speedup = "" if baseline is None else "{:>7.1f}x".format(rate / baseline)
+        print("{:<30} {:>10.0f} users/sec {}".format(name, rate, speedup))
+        return rate
+
+    old = OneByOneClient(args.read_latency)
+    expected, seconds = timed(interact, old, users, args.top_k)
+    old.close()
+    baseline = report("one example per round trip", seconds)
+
+    agent = start_fake_agent(args.read_latency)
+    agent.start()
+    results, seconds = timed(interact, agent, users, args.top_k)
+    assert results == expected, "pipelined learn and predict differ"
+    agent.close()
+    report("pipelined learn", seconds, baseline)
+
+    old = OneByOneClient(args.read_latency)
+    expected, seconds = timed(interact, old, users, args.top_k, False)
+    old.close()
+    baseline = report("predict only, one by one", seconds)
+
+    agent = start_fake_agent(args.read_latency, test_only=True)
+    agent.start()
+    results, seconds = timed(batched, agent, users, args.top_k, args.batch_size)
+    assert [tuple(r) for r in expected] == results, "batched predictions differ"
+    agent.close()
+    report(f"predict batches of {args.batch_size}", seconds, baseline)
+
+    pool = VWAgentPool(args.pool_size, cli_args="--cb_explore_adf", quiet_mode=True, test_only=True)
+    for pool_agent in pool.agents:
+        pool_agent.cmd = fake_vw_cmd(args.read_latency)
+    pool.start()
+    results, seconds = timed(batched, pool, users, args.top_k, args.batch_size * args.pool_size)
+    assert [tuple(r) for r in expected] == results, "pool predictions differ"
+    pool.close()
+    report(f"pool of {args.pool_size} processes", seconds, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,94 @@ import os
 
 import numpy as np
 
+NUM_USERS = 943
+NUM_ITEMS = 1682
+NUM_GENRES = 19
+CACHE_FILE = "movielens100k.npz"
+
+
+def _parse_movielens(data_dir):
+    metadata_file = os.path.join(data_dir, "u.item")
+    ratings_data = os.path.join(data_dir, "u.data")
+
+    item_features = np.zeros((NUM_ITEMS, NUM_GENRES))
+    item_rows = np.loadtxt(
+        metadata_file,
+        delimiter="|",
+        usecols=[0] + list(range(5, 5 + NUM_GENRES)),
+        dtype=np.int64,
+        encoding="latin-1",
+        comments=None,
+        ndmin=2,
+    )
+    item_features[item_rows[:, 0] - 1] = item_rows[:, 1:]
+
+    ratings = np.loadtxt(ratings_data, usecols=(0, 1, 2), dtype=np.int64, ndmin=2)
+    user_ids = ratings[:, 0] - 1
+    item_ids = ratings[:, 1] - 1
+    attractiveness = np.where(ratings[:, 2] >= 3, ratings[:, 2] / 5, 0.01)
+
+    # CSR rows of the attractiveness matrix, the items of every user in ascending order.
+    # When a user rated an item twice the last rating is kept, as with the dense matrix.
+    order = np.lexsort((np.arange(len(user_ids)), item_ids, user_ids))
+    user_ids, item_ids, attractiveness = user_ids[order], item_ids[order], attractiveness[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (user_ids[1:] != user_ids[:-1]) | (item_ids[1:] != item_ids[:-1])
+    user_ids, item_ids, attractiveness = user_ids[last], item_ids[last], attractiveness[last]
+    indptr = np.searchsorted(user_ids, np.arange(NUM_USERS + 1))
+    return item_features, indptr, item_ids, attractiveness
+
+
+def load_movielens(data_dir):
+    """
+    Returns the genre features of every item and the attractiveness matrix as CSR arrays:
+    the items rated by user u are indices[indptr[u]:indptr[u + 1]], with their
+    attractiveness in values.
+
+    The arrays are cached in CACHE_FILE in data_dir, and parsed again when u.data or
+    u.item change. The cache is skipped if data_dir is not writable.
+    """
+    sources = [os.path.join(data_dir, name) for name in ("u.data", "u.item")]
+    source_stats = np.array([[os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in sources])
+    cache_file = os.path.join(data_dir, CACHE_FILE)
+    try:
+        with np.load(cache_file) as cache:
+            if np.array_equal(cache["source_stats"], source_stats):
+                return tuple(cache[k] for k in ("item_features", "indptr", "indices", "values"))
+    except (OSError, KeyError, ValueError):
+        pass
+
+    item_features, indptr, indices, values = _parse_movielens(data_dir)
+    try:
+        tmp_file = cache_file + ".tmp.npz"
+        np.savez(
+            tmp_file,
+            source_stats=source_stats,
+            item_features=item_features,
+            indptr=indptr,
+            indices=indices,
+            values=values,
+        )
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print("Could not cache MovieLens data in", data_dir, e)
+    return item_features, indptr, indices, values
+
+
+def _seeded_rngs(seed):
+    # Independent streams for the item pools and the clicks, so that a batch of users can
+    # draw all its pools before the agent acts and all its clicks after.
+    pool_seed, click_seed = np.random.SeedSequence(seed).spawn(2)
+    return (
+        np.random.RandomState(np.random.MT19937(pool_seed)),
+        np.random.RandomState(np.random.MT19937(click_seed)),
+    )
+
 
 class MovieLens100KEnv:
-    def __init__(self, data_dir="./ml-100k", item_pool_size=None, top_k=5, max_users=100):
+    def __init__(
+        self, data_dir="./ml-100k", item_pool_size=None, top_k=5, max_users=100, seed=None
+    ):
         """
         Args:
             data_dir: Local dir where MovieLens 100K has been extracted.
@@ -20,7 +105,14 @@ class MovieLens100KEnv:
             all users i.e. 943 will be used for sampling. This parameter can be used to
             simplify the learning problem.
 
+            seed: If None, the environment draws from the global np.random. Otherwise item
+            pools and clicks are drawn from generators seeded with it, in the same way as
+            MovieLensBatchSimulator with the same seed.
+
         """
+        self.seed = seed
+        if seed is not None:
+            self._pool_rng, self._click_rng = _seeded_rngs(seed)
         self._preprocess_data(data_dir)
         self.total_users, self.total_items = self.attractiveness_means.shape
         self.max_users = max_users
@@ -29,35 +121,10 @@ class MovieLens100KEnv:
         self._reset()
 
     def _preprocess_data(self, data_dir):
-        metadata_file = os.path.join(data_dir, "u.item")
-        genre_file = os.path.join(data_dir, "u.genre")
-        ratings_data = os.path.join(data_dir, "u.data")
-
-        num_users = 943
-        num_items = 1682
-
-        self.attractiveness_means = np.zeros((num_users, num_items))
-        self.item_features = np.zeros((num_items, 19))
-        movie_names = {}
-
-        with open(metadata_file, encoding="latin-1") as f:
-            for line in f.readlines():
-                line = line.strip().split("|")
-                item_id = int(line[0]) - 1
-                movie_names[item_id] = line[1]
-                self.item_features[item_id][:] = list(map(int, line[5:]))
-
-        with open(ratings_data) as f:
-            for line in f.readlines():
-                line = line.strip().split()
-                user_id = int(line[0]) - 1
-                item_id = int(line[1]) - 1
-                rating = float(line[2])
-                if rating >= 3:
-                    rating = rating / 5
-                else:
-                    rating = 0.01
-                self.attractiveness_means[user_id][item_id] = rating
+        self.item_features, indptr, indices, values = load_movielens(data_dir)
+        self.attractiveness_means = np.zeros((NUM_USERS, NUM_ITEMS))
+        user_ids = np.repeat(np.arange(NUM_USERS), np.diff(indptr))
+        self.attractiveness_means[user_ids, indices] = values
 
     def _reset(self):
         self.done = False
@@ -89,9 +156,13 @@ class MovieLens100KEnv:
         # List of all the items that the user has rated in the past
         self.current_item_pool = np.flatnonzero(self.attractiveness_means[self.current_user_id])
         if self.item_pool_size and (len(self.current_item_pool) > self.item_pool_size):
-            random_indices = np.random.choice(
-                len(self.current_item_pool), size=self.item_pool_size, replace=False
-            )
+            if self.seed is None:
+                random_indices = np.random.choice(
+                    len(self.current_item_pool), size=self.item_pool_size, replace=False
+                )
+            else:
+                keys = self._pool_rng.random_sample(len(self.current_item_pool))
+                random_indices = np.argsort(keys, kind="stable")[: self.item_pool_size]
             self.current_item_pool = self.current_item_pool[random_indices]
         self.current_items_embedding = self.item_features[self.current_item_pool]
 
@@ -123,14 +194,23 @@ class MovieLens100KEnv:
         recommended_item_ids = self.current_item_pool[actions]
         attraction_probs = self.attractiveness_means[self.step_count][recommended_item_ids]
 
-        random_indices = np.random.choice(len(recommended_item_ids), size=self.top_k, replace=False)
+        if self.seed is None:
+            random_indices = np.random.choice(
+                len(recommended_item_ids), size=self.top_k, replace=False
+            )
+        else:
+            # The expected reward does not depend on the order of the random items
+            random_indices = np.arange(self.top_k)
         random_item_ids = self.current_item_pool[random_indices]
         random_attraction_probs = self.attractiveness_means[self.step_count][random_item_ids]
         # Simulate user behavior using a cascading click model.
         # User scans the list top-down and clicks on an item with prob = attractiveness_means.
         # User stops seeing the list after the first click.
 
-        clicks = np.random.binomial(1, attraction_probs)
+        if self.seed is None:
+            clicks = np.random.binomial(1, attraction_probs)
+        else:
+            clicks = (self._click_rng.random_sample(len(attraction_probs)) < attraction_probs) * 1
         if clicks.sum() > 1:
             first_click = np.flatnonzero(clicks)[0]
             clicks = clicks[: first_click + 1]
@@ -145,3 +225,129 @@ class MovieLens100KEnv:
         regret_random = expected_optimal_reward - expected_reward_random
 
         return clicks, regret, regret_random
+
+
+class MovieLensBatchSimulator:
+    """
+    Simulates MovieLens100KEnv for batch_size consecutive users at once.
+
+    Step t of the simulator covers steps t * batch_size ... (t + 1) * batch_size - 1 of
+    MovieLens100KEnv. The item pools of a batch are padded to the largest one, every
+    observation and feedback is an array with one row per user, and the cascade feedback
+    of the whole batch is computed with array operations. With the same seed, the pools,
+    clicks and regrets are those of MovieLens100KEnv(seed=seed).
+    """
+
+    def __init__(
+        self,
+        data_dir="./ml-100k",
+        batch_size=64,
+        item_pool_size=None,
+        top_k=5,
+        max_users=100,
+        seed=0,
+    ):
+        self.item_features, self.indptr, self.indices, self.values = load_movielens(data_dir)
+        self.batch_size = batch_size
+        self.item_pool_size = item_pool_size
+        self.top_k = top_k
+        self.num_cycle_users = min(max_users, NUM_USERS) if max_users else NUM_USERS
+        self._pool_rng, self._click_rng = _seeded_rngs(seed)
+        self.step_count = 0
+
+    def reset(self):
+        self.step_count = 0
+        self._regulate_item_pools()
+        return self.current_items_embedding, self.current_pool_sizes
+
+    def _regulate_item_pools(self):
+        self.current_user_ids = (
+            self.step_count + np.arange(self.batch_size)
+        ) % self.num_cycle_users
+        starts = self.indptr[self.current_user_ids]
+        sizes = self.indptr[self.current_user_ids + 1] - starts
+        width = sizes.max()
+        positions = np.arange(width)
+        valid = positions < sizes[:, None]
+        flat = np.where(valid, starts[:, None] + positions, 0)
+        item_ids = np.where(valid, self.indices[flat], -1)
+        values = np.where(valid, self.values[flat], 0.0)
+
+        if self.item_pool_size:
+            sampled = sizes > self.item_pool_size
+            if sampled.any():
+                # Random keys in the order MovieLens100KEnv draws them, pools sorted by key
+                keys = np.full((sampled.sum(), width), np.inf)
+                draws = self._pool_rng.random_sample(sizes[sampled].sum())
+                keys[valid[sampled]] = draws
+                order = np.argsort(keys, axis=1, kind="stable")[:, : self.item_pool_size]
+                item_ids = item_ids[:, : max(self.item_pool_size, width)].copy()
+                values = values.copy()
+                item_ids[sampled, : self.item_pool_size] = np.take_along_axis(
+                    item_ids[sampled], order, axis=1
+                )
+                values[sampled, : self.item_pool_size] = np.take_along_axis(
+                    values[sampled], order, axis=1
+                )
+                sizes = np.minimum(sizes, self.item_pool_size)
+                width = sizes.max()
+                item_ids, values = item_ids[:, :width], values[:, :width]
+                valid = positions[:width] < sizes[:, None]
+                item_ids = np.where(valid, item_ids, -1)
+                values = np.where(valid, values, 0.0)
+
+        self.current_item_pools = item_ids
+        self.current_pool_values = values
+        self.current_pool_sizes = sizes
+        self.current_items_embedding = np.where(
+            valid[:, :, None], self.item_features[np.maximum(item_ids, 0)], 0.0
+        )
+
+    def step(self, actions):
+        """
+        actions: (batch_size, top_k) indices into the item pools of the batch users.
+
+        Returns the next observations, the clicks of every user and info with their regrets.
+        """
+        actions = np.asarray(actions)
+        assert actions.shape == (self.batch_size, self.top_k), "Size of actions does not match"
+        clicks, regrets, random_regrets = self.get_feedback(actions)
+        info = {"regret": regrets, "random_regret": random_regrets}
+        self.step_count += self.batch_size
+        self._regulate_item_pools()
+        return (self.current_items_embedding, self.current_pool_sizes), clicks, False, info
+
+    def get_feedback(self, actions):
+        """
+        Cascade feedback of every user in the batch.
+
+        Returns clicks as a (batch_size, top_k) array with zeros past the first click,
+        together with the regret and the random regret of every user.
+        MovieLens100KEnv returns the clicks of a user up to the first click when there are
+        several, see clicks_to_lists.
+        """
+        attraction_probs = np.take_along_axis(self.current_pool_values, actions, axis=1)
+        random_attraction_probs = self.current_pool_values[:, : self.top_k]
+
+        clicks = (self._click_rng.random_sample(attraction_probs.shape) < attraction_probs) * 1
+
+        expected_reward = 1 - np.prod(1 - attraction_probs, axis=1)
+        expected_reward_random = 1 - np.prod(1 - random_attraction_probs, axis=1)
+
+        optimal_attraction_probs = -np.sort(-self.current_pool_values, axis=1)[:, : self.top_k]
+        expected_optimal_reward = 1 - np.prod(1 - optimal_attraction_probs, axis=1)
+        regret = expected_optimal_reward - expected_reward
+        regret_random = expected_optimal_reward - expected_reward_random
+
+        return clicks, regret, regret_random
+
+
+def clicks_to_lists(clicks):
+    """
+    Cut every row of MovieLensBatchSimulator clicks after its first click, when it has
+    several, like MovieLens100KEnv.get_feedback does.
+    """
+    counts = clicks.sum(axis=1)
+    first_click = clicks.argmax(axis=1)
+    lengths = np.where(counts > 1, first_click + 1, clicks.shape[1])
+    return [row[:length] for row, length in zip(clicks, lengths)]
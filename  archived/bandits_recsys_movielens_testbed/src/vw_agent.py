@@ -1,10 +1,16 @@
 import json
 import logging
 import os
+import selectors
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
+# Learn examples are sent with the next prediction, or once this many are pending
+MAX_PENDING_EXAMPLES = 256
+READ_SIZE = 64 * 1024
+
 
 class VWError(Exception):
     """Class for errors"""
@@ -21,6 +27,33 @@ class VWModelDown(Exception):
         super(VWModelDown, self).__init__("The model is down")
 
 
+def parse_predictions(lines):
+    """
+    Parse VW action scores lines ("action:prob,action:prob,...") into the chosen action
+    and its probability for every line.
+
+    The first pair of a line is the chosen action. If its probability is 0, the scores are
+    normalized and the best action is chosen instead.
+    """
+    if any(len(line.strip()) == 0 for line in lines):
+        raise VWError("No output gotten from VW")
+    pair_counts = np.array([line.count(b":") for line in lines])
+    values = b" ".join(lines).replace(b",", b" ").replace(b":", b" ").split()
+    pairs = np.array(values, dtype=np.float64).reshape(-1, 2)
+    first = np.concatenate([[0], np.cumsum(pair_counts)[:-1]])
+    actions = pairs[first, 0].astype(np.int64)
+    probs = pairs[first, 1]
+
+    for i in np.flatnonzero(probs == 0):
+        line_pairs = pairs[first[i] : first[i] + pair_counts[i]]
+        item_scores = np.zeros(len(line_pairs))
+        item_scores[line_pairs[:, 0].astype(np.int64)] = line_pairs[:, 1]
+        item_probs = item_scores / item_scores.sum()
+        actions[i] = np.argmax(item_probs)
+        probs[i] = item_probs[actions[i]]
+    return actions.tolist(), probs.tolist()
+
+
 class VWAgent:
     def __init__(
         self,
@@ -98,17 +131,22 @@ class VWAgent:
         if self.current_proc is not None:
             raise VWError("Cannot start a model with an active current_proc")
 
-        # note bufsize=1 will make sure we immediately flush each output
-        # line so that we can keep scoring the model.
-        # bufsize=1 means line buffered.
+        # Unbuffered pipes, the examples are batched in _pending_input and written and read
+        # with _exchange, which never blocks on a full pipe.
         self.current_proc = subprocess.Popen(
             self.cmd,
-            bufsize=1,
+            bufsize=0,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=False,
         )
+        os.set_blocking(self.current_proc.stdin.fileno(), False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.current_proc.stdout, selectors.EVENT_READ)
+        self._pending_input = bytearray()
+        self._pending_lines = 0
+        self._output = bytearray()
 
         self.logger.info("Started VW process!")
 
@@ -125,35 +163,18 @@ class VWAgent:
         candidate_ids=None,
         cost_fn=None,
     ):
-
         if not cost_fn:
             cost_fn = lambda x: 1 - x
 
         cost = cost_fn(reward)
 
-        shared_vw_features = None
-        item_vw_features = None
-
-        shared_feature_dim = 0
-        if shared_features is not None:
-            shared_vw_features = self.transform_context(shared_features)
-            shared_feature_dim = len(shared_features)
-
-        if user_id is not None:
-            if shared_vw_features:
-                shared_vw_features += " user_%s" % user_id
-            else:
-                shared_vw_features = "user_%s" % user_id
-
-        start_index = shared_feature_dim + 1
-        num_actions = self.num_actions
+        # Only the features of the chosen arm are sent, the other arms are not transformed
         if candidate_arms_features is not None:
-            item_vw_features = [
-                self.transform_context(i, start_index) for i in candidate_arms_features
-            ]
-            num_actions = len(item_vw_features)
-        else:
-            item_vw_features = [f"a{i}" for i in range(num_actions)]
+            candidate_arms_features = [candidate_arms_features[action_index]]
+            action_index = 0
+        shared_vw_features, item_vw_features = self._vw_features(
+            shared_features, candidate_arms_features, user_id
+        )
 
         parsed_example = self.generate_experience_string_multiline(
             shared_vw_features, item_vw_features, action_index, cost, action_prob
@@ -165,13 +186,56 @@ class VWAgent:
         if self.current_proc.returncode is not None:
             raise VWModelDown()
 
-        self.current_proc.stdin.write(parsed_example.encode())
-        self.current_proc.stdin.flush()
-        self.current_proc.stdout.flush()
+        # VW will make a prediction on each training instance too. The example is sent
+        # with the next prediction and its output lines are skipped then.
+        self._pending_input += parsed_example.encode()
+        self._pending_lines += 2
+        if self._pending_lines >= 2 * MAX_PENDING_EXAMPLES:
+            self.flush()
+
+    def flush(self):
+        """
+        Sends the pending learn examples and waits until VW has processed them
+        """
+        if self._pending_lines:
+            self._exchange(0)
+
+    def _exchange(self, num_lines):
+        """
+        Writes the pending input to VW and returns num_lines output lines, after
+        skipping the lines of the pending learn examples.
 
-        # VW will make a prediction on each training instance too.
-        self.current_proc.stdout.readline()
-        self.current_proc.stdout.readline()
+        Writing and reading are interleaved with a selector, so a large batch
+        never blocks on a full pipe.
+        """
+        skipped_lines = self._pending_lines
+        num_lines += skipped_lines
+        stdin_fd = self.current_proc.stdin.fileno()
+        stdout_fd = self.current_proc.stdout.fileno()
+        data = memoryview(bytes(self._pending_input))
+        self._pending_input.clear()
+        self._pending_lines = 0
+
+        lines = []
+        selector = self._selector
+        if len(data):
+            selector.register(stdin_fd, selectors.EVENT_WRITE)
+        while len(lines) < num_lines:
+            for key, _ in selector.select():
+                if key.fd == stdin_fd:
+                    data = data[os.write(stdin_fd, data) :]
+                    if not len(data):
+                        selector.unregister(stdin_fd)
+                    continue
+                chunk = os.read(stdout_fd, READ_SIZE)
+                if not chunk:
+                    raise VWModelDown()
+                self._output += chunk
+                end = self._output.rfind(b"\n") + 1
+                if end:
+                    lines.extend(bytes(self._output[:end]).split(b"\n")[:-1])
+                    del self._output[:end]
+        return lines[skipped_lines:]
 
     def _choose_action(self, vw_prediction_str):
         # TODO: Error handling in parsing the given example
@@ -181,41 +245,93 @@ class VWAgent:
         if self.current_proc.returncode is not None:
             raise VWModelDown()
 
-        # TODO: Write to stdin in chunks so that PIPE buffer never overflows
-        self.current_proc.stdin.write(vw_prediction_str.encode())
+        self._pending_input += vw_prediction_str.encode()
+        # Need an extra line as VW returns a blank line
+        vw_scores_string, _ = self._exchange(2)
+        self.last_scores_string = vw_scores_string.decode()
 
-        # we need to flush to score & collect the score
-        # otherwise one needs to wait for the process to end
-        self.current_proc.stdin.flush()
-        self.current_proc.stdout.flush()
-
-        vw_scores_string = self.current_proc.stdout.readline().decode()
-        if len(vw_scores_string.strip()) == 0:
-            print("No output gotten from VW")
-        else:
-            self.last_scores_string = vw_scores_string
-
-        # Need an extra readline as VW returns a blank line
-        self.current_proc.stdout.readline().decode()
-
-        action, prob = vw_scores_string.strip().split(",")[0].split(":")
-        action = int(action)
-        prob = float(prob)
-        if prob == 0:
-            scores_dict = eval("{" + vw_scores_string + "}")
-            item_scores = np.array([scores_dict[i] for i in range(len(scores_dict))])
-            item_probs = item_scores / item_scores.sum()
-            action = np.argmax(item_probs)
-            prob = item_probs[action]
-        return action, prob
+        actions, probs = parse_predictions([vw_scores_string])
+        return actions[0], probs[0]
 
     def choose_actions(
         self, shared_features, candidate_arms_features, user_id=None, candidate_ids=None, top_k=None
     ):
-        shared_vw_features = None
-        item_vw_features = None
-        action_ids = None
         top_k_actions = top_k if top_k else self.top_k
+        shared_vw_features, item_vw_features = self._vw_features(
+            shared_features, candidate_arms_features, user_id
+        )
+        action_ids = list(range(len(item_vw_features)))
+
+        actions, probs = [], []
+        best_action_index, action_prob = None, None
+        for k in range(top_k_actions):
+            if k > 0:
+                item_vw_features.pop(best_action_index)
+                action_ids.pop(best_action_index)
+            parsed_example = self.generate_prediction_string_multiline(
+                shared_features=shared_vw_features, item_features=item_vw_features
+            )
+            best_action_index, action_prob = self._choose_action(parsed_example)
+            actions.append(action_ids[best_action_index])
+            probs.append(action_prob)
+
+        return actions, probs
+
+    def choose_actions_batch(
+        self,
+        shared_features,
+        candidate_arms_features,
+        user_ids=None,
+        candidate_ids=None,
+        top_k=None,
+    ):
+        """
+        choose_actions for a batch of users, with one list entry per user in every argument.
+
+        Round k of every user is written to VW in one block and the scores are read back
+        as one block, so a batch takes top_k round trips instead of top_k per user.
+        Predictions do not update the model, so the result is the same as calling
+        choose_actions for every user in turn.
+        """
+        top_k_actions = top_k if top_k else self.top_k
+        num_users = len(shared_features)
+        if user_ids is None:
+            user_ids = [None] * num_users
+        if candidate_arms_features is None:
+            candidate_arms_features = [None] * num_users
+        features = [
+            self._vw_features(shared, items, user_id)
+            for shared, items, user_id in zip(shared_features, candidate_arms_features, user_ids)
+        ]
+        action_ids = [list(range(len(items))) for _, items in features]
+
+        if self.current_proc is None:
+            raise VWError("trying to score model when current_proc is None")
+        if self.current_proc.returncode is not None:
+            raise VWModelDown()
+
+        actions = [[] for _ in range(num_users)]
+        probs = [[] for _ in range(num_users)]
+        for k in range(top_k_actions):
+            for shared_vw_features, item_vw_features in features:
+                self._pending_input += self.generate_prediction_string_multiline(
+                    shared_features=shared_vw_features, item_features=item_vw_features
+                ).encode()
+            # every example returns its scores and a blank line
+            best_indices, best_probs = parse_predictions(self._exchange(2 * num_users)[::2])
+            for i, (best_action_index, action_prob) in enumerate(zip(best_indices, best_probs)):
+                actions[i].append(action_ids[i][best_action_index])
+                probs[i].append(action_prob)
+                features[i][1].pop(best_action_index)
+                action_ids[i].pop(best_action_index)
+
+        return list(zip(actions, probs))
+
+    def _vw_features(self, shared_features, candidate_arms_features, user_id):
+        """
+        Returns the VW shared features and the list of VW features of every candidate arm
+        """
+        shared_vw_features = None
 
         shared_feature_dim = 0
         if shared_features is not None:
@@ -229,32 +345,13 @@ class VWAgent:
                 shared_vw_features = "user_%s" % user_id
 
         start_index = shared_feature_dim + 1
-        num_actions = self.num_actions
-
         if candidate_arms_features is not None:
             item_vw_features = [
                 self.transform_context(i, start_index) for i in candidate_arms_features
             ]
-            num_actions = len(item_vw_features)
         else:
-            item_vw_features = [f"a{i}" for i in range(num_actions)]
-
-        action_ids = list(range(num_actions))
-
-        actions, probs = [], []
-        best_action_index, action_prob = None, None
-        for k in range(top_k_actions):
-            if k > 0:
-                item_vw_features.pop(best_action_index)
-                action_ids.pop(best_action_index)
-            parsed_example = self.generate_prediction_string_multiline(
-                shared_features=shared_vw_features, item_features=item_vw_features
-            )
-            best_action_index, action_prob = self._choose_action(parsed_example)
-            actions.append(action_ids[best_action_index])
-            probs.append(action_prob)
-
-        return actions, probs
+            item_vw_features = [f"a{i}" for i in range(self.num_actions)]
+        return shared_vw_features, item_vw_features
 
     @staticmethod
     def generate_prediction_string_multiline(shared_features, item_features):
@@ -324,6 +421,9 @@ class VWAgent:
         """
         training_info = ""
         if self.current_proc is not None:
+            # VW has to write the predictions of the pending learn examples before it exits
+            self.flush()
+            self._selector.close()
             self.current_proc.stdin.close()
             self.current_proc.stdout.close()
             training_info = self.current_proc.stderr.read()
@@ -339,3 +439,50 @@ class VWAgent:
 
         self.closed = True
         return training_info
+
+
+class VWAgentPool:
+    """
+    Pool of VW processes serving the same model, for parallel evaluation.
+
+    choose_actions_batch splits the users between the processes and scores the parts
+    concurrently. The processes do not share updates, so use the pool with test_only models.
+    """
+
+    def __init__(self, num_procs, **agent_kwargs):
+        self.agents = [VWAgent(**agent_kwargs) for _ in range(num_procs)]
+        self.executor = ThreadPoolExecutor(max_workers=num_procs)
+
+    def start(self):
+        for agent in self.agents:
+            agent.start()
+
+    def choose_actions_batch(
+        self,
+        shared_features,
+        candidate_arms_features,
+        user_ids=None,
+        candidate_ids=None,
+        top_k=None,
+    ):
+        num_users = len(shared_features)
+        if user_ids is None:
+            user_ids = [None] * num_users
+        if candidate_arms_features is None:
+            candidate_arms_features = [None] * num_users
+        bounds = np.linspace(0, num_users, len(self.agents) + 1).astype(int)
+        futures = [
+            self.executor.submit(
+                agent.choose_actions_batch,
+                shared_features[start:end],
+                candidate_arms_features[start:end],
+                user_ids[start:end],
+                top_k=top_k,
+            )
+            for agent, start, end in zip(self.agents, bounds[:-1], bounds[1:])
+        ]
+        return [result for future in futures for result in future.result()]
+
+    def close(self):
+        self.executor.shutdown()
+        return [agent.close() for agent in self.agents]
@@ -0,0 +1,142 @@
+"""
+Compares the edge counts and build times of the homogeneous edgelist modes of graph_data_preprocessor.py on
+synthetic identity columns: card numbers shared by a few transactions, a handful of card types, and email domains
+with a heavy tailed popularity.
+
+The vectorized clique mode is checked against the previous pairwise combinations loop, which is only run on the
+smallest size as it checks every new edge against the list of all edges.
+
+    python benchmark_homogeneous_edgelist.py --transactions 200 10000 100000 --max-clique-size 32 128
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from graph_data_preprocessor import create_homogeneous_edgelist
+
+ID_COLS = ["card_no", "card_type", "email_domain"]
+
+
+def make_relations(n_transactions, seed=0):
+    rng = np.random.RandomState(seed)
+    transactions = pd.DataFrame(
+        {
+            "TransactionID": 2987000 + np.arange(n_transactions),
+            "card_no": rng.randint(0, max(n_transactions // 3, 1), size=n_transactions).astype(
+                float
+            ),
+            "card_type": rng.choice(
+                ["visa", "mastercard", "discover", "american express"],
+                size=n_transactions,
+                p=[0.6, 0.3, 0.06, 0.04],
+            ),
+            "email_domain": ["domain{}.com".format(d) for d in rng.zipf(1.8, size=n_transactions)],
+        }
+    )
+    # some transactions miss identity values
+    transactions.loc[rng.random_sample(n_transactions) < 0.1, "email_domain"] = np.nan
+    return {etype: transactions[["TransactionID", etype]].dropna() for etype in ID_COLS}
+
+
+def create_homogeneous_edgelist_combinations(edges, output_dir):
+    """The previous create_homogeneous_edgelist."""
+    homogeneous_edges = []
+    for etype, relations in edges.items():
+        for edge_relation, frame in relations.groupby(etype):
+            new_edges = [
+                (a, b)
+                for (a, b) in combinations(frame.TransactionID.values, 2)
+                if (a, b) not in homogeneous_edges and (b, a) not in homogeneous_edges
+            ]
+            homogeneous_edges.extend(new_edges)
+
+    with open(os.path.join(output_dir, "homogeneous_edgelist.csv"), "w") as f:
+        f.writelines(map(lambda x: "{}, {}\n".format(x[0], x[1]), homogeneous_edges))
+    return len(homogeneous_edges)
+
+
+def read_edgelist(output_dir):
+    with open(os.path.join(output_dir, "homogeneous_edgelist.csv")) as f:
+        return [tuple(int(node) for node in line.split(",")) for line in f]
+
+
+def check_clique_edges(output_dir, n_transactions=200):
+    edges = make_relations(n_transactions)
+    create_homogeneous_edgelist_combinations(edges, output_dir)
+    previous = read_edgelist(output_dir)
+    create_homogeneous_edgelist(edges, output_dir)
+    assert read_edgelist(output_dir) == previous, "clique edges differ"
+
+    # a cap larger than every group leaves the cliques unchanged
+    create_homogeneous_edgelist(edges, output_dir, max_clique_size=n_transactions)
+    assert read_edgelist(output_dir) == previous, "capped clique edges differ"
+
+    create_homogeneous_edgelist(edges, output_dir, max_clique_size=8)
+    capped = read_edgelist(output_dir)
+    assert set(capped) <= set(previous) | {(b, a) for a, b in previous}
+    degrees = np.bincount(np.array(capped).ravel() - 2987000)
+    assert degrees.max() <= len(ID_COLS) * 7, "capped cliques are larger than the cap"
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, nargs="+", default=[200, 10000, 100000])
+    parser.add_argument("--max-clique-size", type=int, nargs="+", default=[32, 128])
+    parser.add_argument(
+        "--max-clique-edges",
+        type=int,
+        default=200000000,
+        help="skip the full cliques above this many edges",
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        check_clique_edges(output_dir)
+        print("vectorized cliques match the previous edgelist")
+
+        print("{:>12} {:<26} {:>14} {:>10}".format("transactions", "mode", "edges", "seconds"))
+        for i, n_transactions in enumerate(args.transactions):
+            edges = make_relations(n_transactions)
+            rows = []
+            if i == 0:
+                n_edges, elapsed = timed(
+                    create_homogeneous_edgelist_combinations, edges, output_dir
+                )
+                rows.append(("previous clique", n_edges, elapsed))
+            group_sizes = np.concatenate(
+                [relations[etype].value_counts().values for etype, relations in edges.items()]
+            )
+            clique_edges = int((group_sizes * (group_sizes - 1) // 2).sum())
+            if clique_edges <= args.max_clique_edges:
+                n_edges, elapsed = timed(create_homogeneous_edgelist, edges, output_dir)
+                rows.append(("clique", n_edges, elapsed))
+            else:
+                rows.append(("clique (not built)", clique_edges, float("nan")))
+            for max_clique_size in args.max_clique_size:
+                n_edges, elapsed = timed(
+                    create_homogeneous_edgelist, edges, output_dir, max_clique_size=max_clique_size
+                )
+                rows.append(("clique, max size {}".format(max_clique_size), n_edges, elapsed))
+            n_edges, elapsed = timed(create_homogeneous_edgelist, edges, output_dir, mode="star")
+            rows.append(("star", n_edges, elapsed))
+            for name, n_edges, elapsed in rows:
+                print(
+                    "{:>12} {:<26} {:>14} {:>10.2f}".format(n_transactions, name, n_edges, elapsed)
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 import argparse
 import logging
 import os
+import time
 
 import pandas as pd
 import numpy as np
-from itertools import combinations
 
 
 def parse_args():
@@ -20,6 +20,12 @@ def parse_args():
     parser.add_argument('--valid-data-ratio', type=float, default=0.2, help='fraction of data to use in validation set')
     parser.add_argument('--construct-homogeneous', action="store_true", default=False,
                         help='use bipartite graphs edgelists to construct homogenous graph edgelist')
+    parser.add_argument('--homogeneous-edges', type=str, default='clique', choices=['clique', 'star'],
+                        help='clique: edges between all the transactions sharing an identity value, '
+                             'star: edges between every transaction and a node for each of its identity values')
+    parser.add_argument('--max-clique-size', type=int, default=0,
+                        help='in clique mode, split the groups of transactions sharing a value into random cliques '
+                             'of at most this many transactions, 0 for no limit')
     return parser.parse_args()
 
 
@@ -109,17 +115,86 @@ def get_relations_and_edgelist(transactions_df, identity_df, transactions_id_col
     return edges
 
 
-def create_homogeneous_edgelist(edges, output_dir):
+def split_large_groups(group_codes, max_group_size, rng):
+    """
+    Splits the groups larger than max_group_size into random groups of at most max_group_size members.
+
+    :param group_codes: group of every row, rows of a group are contiguous and groups are numbered in order
+    :return: np.ndarray of the new group of every row, rows of a group are contiguous
+    """
+    group_sizes = np.bincount(group_codes)
+    sizes = group_sizes[group_codes]
+    n_splits = -(-sizes // max_group_size)
+    starts = np.concatenate([[0], np.cumsum(group_sizes)[:-1]])[group_codes]
+    # random rank of every row inside its group, balanced sub groups of the ranks
+    order = np.lexsort((rng.random_sample(len(group_codes)), group_codes))
+    ranks = np.empty(len(group_codes), dtype=np.int64)
+    ranks[order] = np.arange(len(group_codes)) - starts[order]
+    sub_groups = ranks * n_splits // sizes
+    order = np.lexsort((sub_groups, group_codes))
+    return order, pd.factorize(pd.MultiIndex.from_arrays([group_codes[order], sub_groups[order]]))[0]
+
+
+def clique_edges(members, group_codes):
+    """
+    All the pairs of members of every group, in the order of itertools.combinations over the rows of each group.
+
+    :param members: member of every row, rows of a group are contiguous
+    :param group_codes: group of every row
+    :return: (np.ndarray, np.ndarray) sources and sinks
+    """
+    group_sizes = np.bincount(group_codes)
+    starts = np.concatenate([[0], np.cumsum(group_sizes)[:-1]])
+    positions = np.arange(len(members))
+    # every row is paired with the rows after it in its group
+    n_pairs = starts[group_codes] + group_sizes[group_codes] - positions - 1
+    first_pair = np.cumsum(n_pairs) - n_pairs
+    sources = np.repeat(positions, n_pairs)
+    sinks = np.arange(n_pairs.sum()) - np.repeat(first_pair, n_pairs) + sources + 1
+    return members[sources], members[sinks]
+
+
+def create_homogeneous_edgelist(edges, output_dir, mode='clique', max_clique_size=0, seed=0):
+    """
+    Writes the homogeneous graph edgelist connecting the transactions through their identity values.
+
+    :param edges: dictionary from relation type to the dataframe of its transaction, identity value edges
+    :param mode: clique: an edge between every pair of transactions sharing a value, counted once across relations.
+        star: an edge between every transaction and a node '<relation type>:<value>' for each of its identity values.
+    :param max_clique_size: in clique mode, the transactions sharing a value are split into random cliques of at most
+        this many transactions, 0 for no limit. Bounds the edges of popular values such as a common email domain.
+    :return: number of edges written
+    """
+    start = time.time()
+    rng = np.random.RandomState(seed)
     homogeneous_edges = []
     for etype, relations in edges.items():
-        for edge_relation, frame in relations.groupby(etype):
-            new_edges = [(a, b) for (a, b) in combinations(frame.TransactionID.values, 2)
-                         if (a, b) not in homogeneous_edges and (b, a) not in homogeneous_edges]
-            homogeneous_edges.extend(new_edges)
-
-    with open(os.path.join(output_dir, 'homogeneous_edgelist.csv'), 'w') as f:
-        f.writelines(map(lambda x: "{}, {}\n".format(x[0], x[1]), homogeneous_edges))
-    logging.info("Wrote homogeneous edgelist to file: {}".format(os.path.join(output_dir, 'homogeneous_edgelist.csv')))
+        if mode == 'star':
+            entities = etype + ':' + relations[etype].astype(str)
+            homogeneous_edges.append(pd.DataFrame({'source': relations.TransactionID.values, 'sink': entities.values}))
+            continue
+        # rows of the same value are contiguous, in the order of groupby
+        relations = relations.sort_values(etype, kind='stable')
+        members = relations.TransactionID.values
+        group_codes = pd.factorize(relations[etype], sort=True)[0]
+        if max_clique_size:
+            order, group_codes = split_large_groups(group_codes, max_clique_size, rng)
+            members = members[order]
+        sources, sinks = clique_edges(members, group_codes)
+        homogeneous_edges.append(pd.DataFrame({'source': sources, 'sink': sinks}))
+
+    homogeneous_edges = pd.concat(homogeneous_edges, ignore_index=True)
+    if mode == 'star':
+        homogeneous_edges = homogeneous_edges.drop_duplicates()
+    else:
+        # an edge is kept once whatever its direction, as first found
+        pairs = np.sort(homogeneous_edges.values, axis=1)
+        homogeneous_edges = homogeneous_edges[~pd.DataFrame(pairs).duplicated().values]
+
+    homogeneous_edges.to_csv(os.path.join(output_dir, 'homogeneous_edgelist.csv'), index=False, header=False)
+    logging.info("Wrote {} {} edges to homogeneous edgelist file: {} in {:.1f}s".format(
+        len(homogeneous_edges), mode, os.path.join(output_dir, 'homogeneous_edgelist.csv'), time.time() - start))
+    return len(homogeneous_edges)
 
 
 if __name__ == '__main__':
@@ -138,7 +213,7 @@ if __name__ == '__main__':
     relational_edges = get_relations_and_edgelist(transactions, identity, args.id_cols, args.output_dir)
 
     if args.construct_homogeneous:
-        create_homogeneous_edgelist(relational_edges, args.output_dir)
+        create_homogeneous_edgelist(relational_edges, args.output_dir, args.homogeneous_edges, args.max_clique_size)
 
 
 
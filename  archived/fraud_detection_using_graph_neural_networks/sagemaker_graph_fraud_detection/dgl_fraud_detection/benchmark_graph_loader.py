@@ -0,0 +1,260 @@
+"""
+Checks and benchmarks the graph loading of data.py on synthetic edgelists shaped like the output of
+graph_data_preprocessor.py: a features.csv of transactions and one relation_<type>_edgelist.csv per identity column.
+
+The arrays are checked against the previous line by line parser with Python dict id maps, then the edges/sec of
+the previous parser, of the chunked parser and of the npz cache are compared. The heterograph construction is
+timed too when dgl is installed.
+
+    python benchmark_graph_loader.py --edges 10000000 --baseline-edges 2000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from data import load_graph_arrays, read_edges
+
+RELATIONS = ["card_no", "card_type", "email_domain", "DeviceInfo", "id_30"]
+
+
+def write_synthetic_graph(data_dir, n_edges, n_features=20, seed=0):
+    """Writes features.csv and edgelists with n_edges edges in total, returns their file names."""
+    rng = np.random.RandomState(seed)
+    n_transactions = max(n_edges // len(RELATIONS), 1)
+    transaction_ids = 2987000 + rng.permutation(n_transactions + n_transactions // 10)
+    edge_files = []
+    for i, relation in enumerate(RELATIONS):
+        n_entities = max(n_transactions // 10 ** (i % 3 + 1), 1)
+        sources = transaction_ids[rng.randint(0, n_transactions, size=n_transactions)]
+        sinks = rng.zipf(1.5, size=n_transactions) % n_entities
+        edge_files.append("relation_{}_edgelist.csv".format(relation))
+        with open(os.path.join(data_dir, edge_files[-1]), "w") as f:
+            f.write("TransactionID,{}\n".format(relation))
+            f.writelines("{},{}.0\n".format(a, b) for a, b in zip(sources.tolist(), sinks.tolist()))
+    # some transactions have features but no edges
+    features = np.round(rng.normal(size=(len(transaction_ids), n_features)), 4)
+    with open(os.path.join(data_dir, "features.csv"), "w") as f:
+        for node_id, row in zip(transaction_ids, features):
+            f.write("{},{}\n".format(node_id, ",".join(map(str, row))))
+    return edge_files
+
+
+def _get_node_idx(id_to_node, node_type, node_id, ptr):
+    if node_type in id_to_node:
+        if node_id in id_to_node[node_type]:
+            node_idx = id_to_node[node_type][node_id]
+        else:
+            id_to_node[node_type][node_id] = ptr
+            node_idx = ptr
+            ptr += 1
+    else:
+        id_to_node[node_type] = {}
+        id_to_node[node_type][node_id] = ptr
+        node_idx = ptr
+        ptr += 1
+
+    return node_idx, id_to_node, ptr
+
+
+def parse_edgelist_lines(edges, id_to_node, header=False, source_type="user", sink_type="user"):
+    """The previous parse_edgelist."""
+    edge_list = []
+    source_pointer, sink_pointer = 0, 0
+    with open(edges, "r") as fh:
+        for i, line in enumerate(fh):
+            source, sink = line.strip().split(",")
+            if i == 0:
+                if header:
+                    source_type, sink_type = source, sink
+                if source_type in id_to_node:
+                    source_pointer = max(id_to_node[source_type].values()) + 1
+                if sink_type in id_to_node:
+                    sink_pointer = max(id_to_node[sink_type].values()) + 1
+                continue
+
+            source_node, id_to_node, source_pointer = _get_node_idx(
+                id_to_node, source_type, source, source_pointer
+            )
+            if source_type == sink_type:
+                sink_node, id_to_node, source_pointer = _get_node_idx(
+                    id_to_node, sink_type, sink, source_pointer
+                )
+            else:
+                sink_node, id_to_node, sink_pointer = _get_node_idx(
+                    id_to_node, sink_type, sink, sink_pointer
+                )
+
+            edge_list.append((source_node, sink_node))
+
+    return edge_list, id_to_node, source_type, sink_type
+
+
+def get_features_lines(id_to_node, node_features):
+    """The previous get_features."""
+    indices, features, new_nodes = [], [], []
+    max_node = max(id_to_node.values())
+    with open(node_features, "r") as fh:
+        for line in fh:
+            node_feats = line.strip().split(",")
+            node_id = node_feats[0]
+            feats = np.array(list(map(float, node_feats[1:])))
+            features.append(feats)
+            if node_id not in id_to_node:
+                max_node += 1
+                id_to_node[node_id] = max_node
+                new_nodes.append(max_node)
+
+            indices.append(id_to_node[node_id])
+
+    features = np.array(features).astype("float32")
+    features = features[np.argsort(indices), :]
+    return features, new_nodes
+
+
+def read_edges_lines(edges):
+    """The previous read_edges without a node file."""
+    node_pointer = 0
+    id_to_node = {}
+    sources, sinks = [], []
+    with open(edges, "r") as fh:
+        for line in fh:
+            source, sink = line.strip().split(",")
+            if source not in id_to_node:
+                id_to_node[source] = node_pointer
+                node_pointer += 1
+            if sink not in id_to_node:
+                id_to_node[sink] = node_pointer
+                node_pointer += 1
+            sources.append(id_to_node[source])
+            sinks.append(id_to_node[sink])
+    return sources, sinks, id_to_node
+
+
+def load_graph_lines(edge_paths, nodes, target_node_type):
+    """The previous construct_graph up to the heterograph."""
+    edgelists, id_to_node = {}, {}
+    for i, edge in enumerate(edge_paths):
+        edgelist, id_to_node, src, dst = parse_edgelist_lines(edge, id_to_node, header=True)
+        if src == target_node_type:
+            src = "target"
+        if dst == target_node_type:
+            dst = "target"
+        edgelists[(src, "relation{}".format(i), dst)] = edgelist
+        edgelists[(dst, "reverse_relation{}".format(i), src)] = [(b, a) for a, b in edgelist]
+    features, new_nodes = get_features_lines(id_to_node[target_node_type], nodes)
+    edgelists[("target", "self_relation", "target")] = [
+        (t, t) for t in id_to_node[target_node_type].values()
+    ]
+    return edgelists, features, new_nodes, id_to_node
+
+
+def heterograph_inputs(arrays):
+    """The edge arrays of construct_graph."""
+    edgelists = {}
+    for i, (src, dst) in enumerate(arrays["relations"].tolist()):
+        sources, sinks = arrays["sources{}".format(i)], arrays["sinks{}".format(i)]
+        edgelists[(src, "relation{}".format(i), dst)] = (sources, sinks)
+        edgelists[(dst, "reverse_relation{}".format(i), src)] = (sinks, sources)
+    target_nodes = np.arange(len(arrays["node_ids_target"]))
+    edgelists[("target", "self_relation", "target")] = (target_nodes, target_nodes)
+    return edgelists
+
+
+def check_equivalence(data_dir, target_node_type="TransactionID"):
+    edge_files = write_synthetic_graph(data_dir, 50000)
+    edge_paths = [os.path.join(data_dir, edge) for edge in edge_files]
+    nodes = os.path.join(data_dir, "features.csv")
+
+    edgelists, features, new_nodes, id_to_node = load_graph_lines(
+        edge_paths, nodes, target_node_type
+    )
+    for cache_dir in [None, data_dir, data_dir]:
+        arrays = load_graph_arrays(edge_paths, nodes, target_node_type, cache_dir)
+        for etype, (sources, sinks) in heterograph_inputs(arrays).items():
+            assert edgelists[etype] == list(zip(sources.tolist(), sinks.tolist())), etype
+        assert np.array_equal(arrays["features"], features)
+        assert arrays["new_nodes"].tolist() == new_nodes
+        for ntype, ids in id_to_node.items():
+            name = "target" if ntype == target_node_type else ntype
+            assert arrays["node_ids_{}".format(name)].tolist() == list(ids), ntype
+
+    homogeneous = os.path.join(data_dir, "homogeneous_edgelist.csv")
+    with open(homogeneous, "w") as f:
+        f.write("1, 2\n2, 3\n3, 1\n1, 4\n")
+    sources, sinks, id_to_node = read_edges_lines(homogeneous)
+    new_sources, new_sinks, _, new_id_to_node = read_edges(homogeneous)
+    assert (new_sources.tolist(), new_sinks.tolist(), new_id_to_node) == (
+        sources,
+        sinks,
+        id_to_node,
+    )
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edges", type=int, default=10000000)
+    parser.add_argument(
+        "--baseline-edges",
+        type=int,
+        default=2000000,
+        help="edges parsed by the previous parser, which is much slower",
+    )
+    args = parser.parse_args()
+
+    try:
+        import dgl
+    except ImportError:
+        dgl = None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        check_equivalence(tmp_dir)
+        print("arrays match the previous parser")
+
+    print("{:<28} {:>10} {:>14}".format("", "seconds", "edges/sec"))
+    for n_edges, baseline in [(args.baseline_edges, True), (args.edges, False)]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            edge_files = write_synthetic_graph(tmp_dir, n_edges)
+            edge_paths = [os.path.join(tmp_dir, edge) for edge in edge_files]
+            nodes = os.path.join(tmp_dir, "features.csv")
+
+            rows = []
+            if baseline:
+                (edgelists, _, _, _), elapsed = timed(
+                    load_graph_lines, edge_paths, nodes, "TransactionID"
+                )
+                rows.append(("line by line", elapsed))
+                if dgl is not None:
+                    _, elapsed = timed(dgl.heterograph, edgelists)
+                    rows.append(("  heterograph from tuples", elapsed))
+                del edgelists
+            else:
+                _, elapsed = timed(load_graph_arrays, edge_paths, nodes, "TransactionID")
+                rows.append(("chunked arrays", elapsed))
+                _, elapsed = timed(load_graph_arrays, edge_paths, nodes, "TransactionID", tmp_dir)
+                rows.append(("chunked arrays + cache write", elapsed))
+                arrays, elapsed = timed(
+                    load_graph_arrays, edge_paths, nodes, "TransactionID", tmp_dir
+                )
+                rows.append(("npz cache", elapsed))
+                if dgl is not None:
+                    _, elapsed = timed(dgl.heterograph, heterograph_inputs(arrays))
+                    rows.append(("  heterograph from arrays", elapsed))
+
+            print("{} edges".format(n_edges))
+            for name, elapsed in rows:
+                print("{:<28} {:>10.2f} {:>14.0f}".format(name, elapsed, n_edges / elapsed))
+    if dgl is None:
+        print("dgl is not installed, heterograph construction was not timed")
+
+
+if __name__ == "__main__":
+    main()
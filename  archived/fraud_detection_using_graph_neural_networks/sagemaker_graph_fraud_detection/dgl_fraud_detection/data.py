@@ -1,32 +1,64 @@
+import csv
+import hashlib
+import os
+
 import numpy as np
 import pandas as pd
 
+EDGE_CHUNK_SIZE = 1000000
+GRAPH_CACHE_VERSION = 1
+
 
-def get_features(id_to_node, node_features):
+def read_csv_chunks(path, chunksize=EDGE_CHUNK_SIZE, skiprows=0, dtype=object):
+    """
+    Reads a headerless comma separated file in chunks of rows, splitting lines on commas only as line.split(",")
+    would, without quoting or stripping the fields.
     """
+    try:
+        return pd.read_csv(path, header=None, skiprows=skiprows, dtype=dtype, chunksize=chunksize, na_filter=False,
+                           quoting=csv.QUOTE_NONE)
+    except pd.errors.EmptyDataError:
+        return iter(())
 
-    :param id_to_node: dictionary mapping node names(id) to dgl node idx
+
+def map_node_ids(ids, node_ids, node_type):
+    """
+    Maps node names(id) to dgl node indices, adding the names not seen yet in order of first appearance.
+
+    :param ids: array of node names
+    :param node_ids: dictionary from node type to the array of node names of that type, the index of a name is its
+        dgl node idx. Updated with the new names.
+    :param node_type: type of the nodes in ids
+    :return: np.ndarray of dgl node indices
+    """
+    known = node_ids.get(node_type, np.array([], dtype=object))
+    # the known names are unique and come first, so they keep their index and the new names are numbered after them
+    codes, uniques = pd.factorize(np.concatenate([known, np.asarray(ids, dtype=object)]))
+    node_ids[node_type] = np.asarray(uniques, dtype=object)
+    return codes[len(known):]
+
+
+def get_features(node_ids, node_features):
+    """
+
+    :param node_ids: array of node names(id) of the target nodes, the index of a name is its dgl node idx
     :param node_features: path to file containing node features
-    :return: (np.ndarray, list) node feature matrix in order and new nodes not yet in the graph
-    """
-    indices, features, new_nodes = [], [], []
-    max_node = max(id_to_node.values())
-    with open(node_features, "r") as fh:
-        for line in fh:
-            node_feats = line.strip().split(",")
-            node_id = node_feats[0]
-            feats = np.array(list(map(float, node_feats[1:])))
-            features.append(feats)
-            if node_id not in id_to_node:
-                max_node += 1
-                id_to_node[node_id] = max_node
-                new_nodes.append(max_node)
-
-            indices.append(id_to_node[node_id])
-
-    features = np.array(features).astype('float32')
+    :return: (np.ndarray, np.ndarray, np.ndarray) node feature matrix in order, new nodes not yet in the graph and
+        the node names of the target nodes including the new nodes
+    """
+    ids, features = [], []
+    for chunk in read_csv_chunks(node_features, dtype={0: object}):
+        ids.append(chunk[0].values)
+        features.append(chunk.drop(columns=0).values.astype('float32'))
+    ids, features = np.concatenate(ids), np.concatenate(features)
+
+    node_ids = {'target': node_ids}
+    n_nodes = len(node_ids['target'])
+    indices = map_node_ids(ids, node_ids, 'target')
+    new_nodes = np.arange(n_nodes, len(node_ids['target']))
+
     features = features[np.argsort(indices), :]
-    return features, new_nodes
+    return features, new_nodes, node_ids['target']
 
 
 def get_labels(id_to_node, n_nodes, target_node_type, labels_path, masked_nodes_path_valid, masked_nodes_path_test, additional_mask_rate=0):
@@ -42,10 +74,15 @@ def get_labels(id_to_node, n_nodes, target_node_type, labels_path, masked_nodes_
     """
     node_to_id = {v: k for k, v in id_to_node.items()}
     user_to_label = pd.read_csv(labels_path).astype({target_node_type:str}).set_index(target_node_type)
-    labels = user_to_label.loc[pd.Series(node_to_id)[np.arange(n_nodes)].values].values.flatten()
+    node_names = pd.Series(node_to_id)[np.arange(n_nodes)].values
+    labels = user_to_label.reindex(node_names).values.flatten()
+    # nodes missing from the labels file, such as identity value nodes, are never trained on
+    unlabeled = ~np.isin(node_names, user_to_label.index)
+    labels[unlabeled] = 0
     masked_nodes_valid = read_masked_nodes(masked_nodes_path_valid)
     masked_nodes_test = read_masked_nodes(masked_nodes_path_test)
     train_mask, valid_mask, test_mask = _get_mask(id_to_node, node_to_id, n_nodes, masked_nodes_valid, masked_nodes_test, additional_mask_rate=additional_mask_rate)
+    train_mask[unlabeled] = 0
     return labels, train_mask, valid_mask, test_mask
 
 
@@ -68,7 +105,8 @@ def _get_mask(id_to_node, node_to_id, num_nodes, masked_nodes_valid, masked_node
     :param id_to_node: dictionary mapping node names(id) to dgl node idx
     :param node_to_id: dictionary mapping dgl node idx to node names(id)
     :param num_nodes: number of user/account nodes in the graph
-    :param masked_nodes: list of nodes to be masked during training, nodes without labels
+    :param masked_nodes_valid: list of validation nodes to be masked during training
+    :param masked_nodes_test: list of test nodes to be masked during training, nodes without labels
     :param additional_mask_rate: float for additional masking of nodes with labels during training
     :return: (list, list) train and test mask array
     """
@@ -82,62 +120,44 @@ def _get_mask(id_to_node, node_to_id, num_nodes, masked_nodes_valid, masked_node
         train_mask[id_to_node[node_id]] = 0
         test_mask[id_to_node[node_id]] = 1
     if additional_mask_rate and additional_mask_rate < 1:
+        masked_nodes = set(masked_nodes_valid).union(masked_nodes_test)
         unmasked = np.array([idx for idx in range(num_nodes) if node_to_id[idx] not in masked_nodes])
         yet_unmasked = np.random.permutation(unmasked)[:int(additional_mask_rate*num_nodes)]
         train_mask[yet_unmasked] = 0
     return train_mask, valid_mask, test_mask
 
 
-def _get_node_idx(id_to_node, node_type, node_id, ptr):
-    if node_type in id_to_node:
-        if node_id in id_to_node[node_type]:
-            node_idx = id_to_node[node_type][node_id]
-        else:
-            id_to_node[node_type][node_id] = ptr
-            node_idx = ptr
-            ptr += 1
-    else:
-        id_to_node[node_type] = {}
-        id_to_node[node_type][node_id] = ptr
-        node_idx = ptr
-        ptr += 1
-
-    return node_idx, id_to_node, ptr
-
-
-def parse_edgelist(edges, id_to_node, header=False, source_type='user', sink_type='user'):
+def parse_edgelist(edges, node_ids, header=False, source_type='user', sink_type='user'):
     """
-    Parse an edgelist path file and return the edges as a list of tuple
+    Parse an edgelist path file in chunks and return the edges as arrays of dgl node indices
     :param edges: path to comma separated file containing bipartite edges with header for edgetype
-    :param id_to_node: dictionary containing mapping for node names(id) to dgl node indices
+    :param node_ids: dictionary from node type to the array of node names(id) of that type, the index of a name is its
+        dgl node idx. Updated with the nodes of the edgelist.
     :param header: boolean whether or not the file has a header row
     :param source_type: type of the source node in the edge. defaults to 'user' if no header
     :param sink_type: type of the sink node in the edge. defaults to 'user' if no header.
-    :return: (list, dict) a list containing edges of a single relationship type as tuples and updated id_to_node dict.
+    :return: (np.ndarray, np.ndarray, dict, str, str) sources and sinks of a single relationship type, the updated
+        node_ids dict and the source and sink types.
     """
-    edge_list = []
-    source_pointer, sink_pointer = 0, 0
-    with open(edges, "r") as fh:
-        for i, line in enumerate(fh):
-            source, sink = line.strip().split(",")
-            if i == 0:
-                if header:
-                    source_type, sink_type = source, sink
-                if source_type in id_to_node:
-                    source_pointer = max(id_to_node[source_type].values()) + 1
-                if sink_type in id_to_node:
-                    sink_pointer = max(id_to_node[sink_type].values()) + 1
-                continue
-
-            source_node, id_to_node, source_pointer = _get_node_idx(id_to_node, source_type, source, source_pointer)
-            if source_type == sink_type:
-                sink_node, id_to_node, source_pointer = _get_node_idx(id_to_node, sink_type, sink, source_pointer)
-            else:
-                sink_node, id_to_node, sink_pointer = _get_node_idx(id_to_node, sink_type, sink, sink_pointer)
-
-            edge_list.append((source_node, sink_node))
+    if header:
+        with open(edges, "r") as fh:
+            source_type, sink_type = fh.readline().strip().split(",")
 
-    return edge_list, id_to_node, source_type, sink_type
+    sources, sinks = [], []
+    for chunk in read_csv_chunks(edges, skiprows=int(header)):
+        if chunk.shape[1] != 2:
+            raise ValueError("Expected 2 columns in edgelist {}, found {}".format(edges, chunk.shape[1]))
+        chunk_sources, chunk_sinks = chunk[0].values, chunk[1].values
+        if source_type == sink_type:
+            # sources and sinks share their indices, numbered in the order of the rows
+            nodes = map_node_ids(np.column_stack((chunk_sources, chunk_sinks)).ravel(), node_ids, source_type)
+            sources.append(nodes[0::2])
+            sinks.append(nodes[1::2])
+        else:
+            sources.append(map_node_ids(chunk_sources, node_ids, source_type))
+            sinks.append(map_node_ids(chunk_sinks, node_ids, sink_type))
+    empty = np.array([], dtype=np.int64)
+    return np.concatenate([empty] + sources), np.concatenate([empty] + sinks), node_ids, source_type, sink_type
 
 
 def read_edges(edges, nodes=None):
@@ -146,40 +166,102 @@ def read_edges(edges, nodes=None):
 
     :param edges: path to comma separated file containing all edges
     :param nodes: path to comma separated file containing all nodes + features
-    :return: (list, list, list, dict) sources, sinks, features and id_to_node dictionary containing mappings
-    from node names(id) to dgl node indices
+    :return: (np.ndarray, np.ndarray, np.ndarray, dict) sources, sinks, features and id_to_node dictionary containing
+        mappings from node names(id) to dgl node indices
     """
-    node_pointer = 0
-    id_to_node = {}
-    features = []
-    sources, sinks = [], []
+    node_ids = {}
+    features = np.zeros((0, 0), dtype='float32')
     if nodes is not None:
-        with open(nodes, "r") as fh:
-            for line in fh:
-                node_feats = line.strip().split(",")
-                node_id = node_feats[0]
-                if node_id not in id_to_node:
-                    id_to_node[node_id] = node_pointer
-                    node_pointer += 1
-                    if len(node_feats) > 1:
-                        feats = np.array(list(map(float, node_feats[1:])))
-                        features.append(feats)
-        with open(edges, "r") as fh:
-            for line in fh:
-                source, sink = line.strip().split(",")
-                sources.append(id_to_node[source])
-                sinks.append(id_to_node[sink])
+        ids, node_features = [], []
+        for chunk in read_csv_chunks(nodes, dtype={0: object}):
+            ids.append(chunk[0].values)
+            node_features.append(chunk.drop(columns=0).values.astype('float32'))
+        ids = np.concatenate(ids)
+        # the first row of a node gives its features
+        _, first_rows = np.unique(map_node_ids(ids, node_ids, 'node'), return_index=True)
+        if node_features[0].shape[1] > 0:
+            features = np.concatenate(node_features)[first_rows]
+
+        # nodes without features, such as the identity value nodes of a star expanded edgelist, are numbered after
+        # the nodes with features and get zero features
+        n_feature_nodes = len(node_ids['node'])
+        sources, sinks, node_ids, _, _ = parse_edgelist(edges, node_ids, source_type='node', sink_type='node')
+        if len(features):
+            padding = np.zeros((len(node_ids['node']) - n_feature_nodes, features.shape[1]), dtype='float32')
+            features = np.concatenate([features, padding])
     else:
-        with open(edges, "r") as fh:
-            for line in fh:
-                source, sink = line.strip().split(",")
-                if source not in id_to_node:
-                    id_to_node[source] = node_pointer
-                    node_pointer += 1
-                if sink not in id_to_node:
-                    id_to_node[sink] = node_pointer
-                    node_pointer += 1
-                sources.append(id_to_node[source])
-                sinks.append(id_to_node[sink])
+        sources, sinks, node_ids, _, _ = parse_edgelist(edges, node_ids, source_type='node', sink_type='node')
 
+    ids = node_ids.get('node', [])
+    id_to_node = dict(zip(ids, range(len(ids))))
     return sources, sinks, features, id_to_node
+
+
+def _file_digest(path, digest):
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+
+
+def graph_cache_path(cache_dir, edge_paths, nodes, target_node_type):
+    """
+    Path of the cached arrays of a graph, named after the hash of the content of its input files.
+    """
+    digest = hashlib.sha256("{}|{}".format(GRAPH_CACHE_VERSION, target_node_type).encode())
+    for path in list(edge_paths) + [nodes]:
+        digest.update(os.path.basename(path).encode())
+        _file_digest(path, digest)
+    return os.path.join(cache_dir, "graph-{}.npz".format(digest.hexdigest()[:32]))
+
+
+def parse_graph_arrays(edge_paths, nodes, target_node_type):
+    """
+    Parse the edgelists and target node features of a heterogeneous graph into arrays.
+
+    :param edge_paths: paths to the edgelists with header, one per relation
+    :param nodes: path to comma separated file containing target node names(id) + features
+    :param target_node_type: node type of the nodes with features, named 'target' in the returned arrays
+    :return: dict of arrays. 'relations' holds the (source type, sink type) of every relation and 'sources{i}' and
+        'sinks{i}' its edges, 'features' the target node features and 'node_ids_{type}' the node names of every type.
+    """
+    node_ids, arrays, relations = {}, {}, []
+    for i, edges in enumerate(edge_paths):
+        sources, sinks, node_ids, src, dst = parse_edgelist(edges, node_ids, header=True)
+        relations.append((src, dst))
+        arrays['sources{}'.format(i)], arrays['sinks{}'.format(i)] = sources, sinks
+
+    target_ids = node_ids.get(target_node_type, np.array([], dtype=object))
+    features, new_nodes, node_ids[target_node_type] = get_features(target_ids, nodes)
+    arrays['features'] = features
+    arrays['new_nodes'] = new_nodes
+    arrays['relations'] = np.array(
+        [['target' if ntype == target_node_type else ntype for ntype in relation] for relation in relations],
+        dtype=str).reshape(-1, 2)
+    for ntype, ids in node_ids.items():
+        arrays['node_ids_{}'.format('target' if ntype == target_node_type else ntype)] = ids.astype(str)
+    return arrays
+
+
+def load_graph_arrays(edge_paths, nodes, target_node_type, cache_dir=None):
+    """
+    Same as parse_graph_arrays, reading the arrays from an npz cache in cache_dir when the input files did not change.
+    The cache is written on the first run, it is skipped if cache_dir is None or not writable.
+    """
+    if cache_dir is None:
+        return parse_graph_arrays(edge_paths, nodes, target_node_type)
+
+    cache_path = graph_cache_path(cache_dir, edge_paths, nodes, target_node_type)
+    if os.path.exists(cache_path):
+        print("Loading graph arrays from cache {}".format(cache_path))
+        with np.load(cache_path, allow_pickle=False) as cache:
+            return dict(cache)
+
+    arrays = parse_graph_arrays(edge_paths, nodes, target_node_type)
+    try:
+        tmp_path = cache_path + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, cache_path)
+        print("Cached graph arrays in {}".format(cache_path))
+    except OSError as e:
+        print("Could not cache graph arrays in {}: {}".format(cache_dir, e))
+    return arrays
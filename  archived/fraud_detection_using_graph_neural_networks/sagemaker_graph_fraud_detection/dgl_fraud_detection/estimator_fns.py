@@ -12,6 +12,8 @@ def parse_args():
     parser.add_argument('--nodes', type=str, default='features.csv')
     parser.add_argument('--target-ntype', type=str, default='TransactionID')
     parser.add_argument('--edges', type=str, default='relation*')
+    parser.add_argument('--graph-cache-dir', type=str, default=None,
+                        help='directory of the cached graph arrays, default: training dir')
     parser.add_argument('--heterogeneous', type=lambda x: (str(x).lower() in ['true', '1', 'yes']),
                         default=True, help='use hetero graph')
     parser.add_argument('--no-features', type=lambda x: (str(x).lower() in ['true', '1', 'yes']),
@@ -13,24 +13,22 @@ def get_edgelists(edgelist_expression, directory):
     compiled_expression = re.compile(edgelist_expression)
     return [filename for filename in files if compiled_expression.match(filename)]
 
-def construct_graph(training_dir, edges, nodes, target_node_type, heterogeneous=True):
+def construct_graph(training_dir, edges, nodes, target_node_type, heterogeneous=True, cache_dir=None):
     if heterogeneous:
         print("Getting relation graphs from the following edge lists : {} ".format(edges))
-        edgelists, id_to_node = {}, {}
-        for i, edge in enumerate(edges):
-            edgelist, id_to_node, src, dst = parse_edgelist(os.path.join(training_dir, edge), id_to_node, header=True)
-            if src == target_node_type:
-                src = 'target'
-            if dst == target_node_type:
-                dst = 'target'
-            edgelists[(src, 'relation{}'.format(i), dst)] = edgelist
-            print("Read edges for relation{} from edgelist: {}".format(i, os.path.join(training_dir, edge)))
+        edge_paths = [os.path.join(training_dir, edge) for edge in edges]
+        arrays = load_graph_arrays(edge_paths, os.path.join(training_dir, nodes), target_node_type, cache_dir)
+        edgelists = {}
+        for i, (src, dst) in enumerate(arrays['relations'].tolist()):
+            sources, sinks = arrays['sources{}'.format(i)], arrays['sinks{}'.format(i)]
+            edgelists[(src, 'relation{}'.format(i), dst)] = (sources, sinks)
+            print("Read edges for relation{} from edgelist: {}".format(i, edge_paths[i]))
 
             # reverse edge list so that relation is undirected
-            edgelists[(dst, 'reverse_relation{}'.format(i), src)] = [(b, a) for a, b in edgelist]
+            edgelists[(dst, 'reverse_relation{}'.format(i), src)] = (sinks, sources)
 
         # get features for target nodes
-        features, new_nodes = get_features(id_to_node[target_node_type], os.path.join(training_dir, nodes))
+        features = arrays['features']
         print("Read in features for target nodes")
         # handle target nodes that have features but don't have any connections
         # if new_nodes:
@@ -38,7 +36,8 @@ def construct_graph(training_dir, edges, nodes, target_node_type, heterogeneous=
         #     edgelists[('none', 'reverse_relation{}'.format(i + 1), 'target')] = [(0, node) for node in new_nodes]
 
         # add self relation
-        edgelists[('target', 'self_relation', 'target')] = [(t, t) for t in id_to_node[target_node_type].values()]
+        target_nodes = np.arange(len(arrays['node_ids_target']))
+        edgelists[('target', 'self_relation', 'target')] = (target_nodes, target_nodes)
 
         g = dgl.heterograph(edgelists)
         print(
@@ -48,21 +47,21 @@ def construct_graph(training_dir, edges, nodes, target_node_type, heterogeneous=
 
         g.nodes['target'].data['features'] = features
 
-        id_to_node = id_to_node[target_node_type]
+        id_to_node = dict(zip(arrays['node_ids_target'].tolist(), range(len(target_nodes))))
 
     else:
         sources, sinks, features, id_to_node = read_edges(os.path.join(training_dir, edges[0]),
                                                           os.path.join(training_dir, nodes))
 
         # add self relation
-        all_nodes = sorted(id_to_node.values())
-        sources.extend(all_nodes)
-        sinks.extend(all_nodes)
+        all_nodes = np.arange(len(id_to_node))
+        sources = np.concatenate([sources, all_nodes])
+        sinks = np.concatenate([sinks, all_nodes])
 
         g = dgl.graph((sources, sinks))
 
-        if features:
-            g.ndata['features'] = np.array(features).astype('float32')
+        if len(features):
+            g.ndata['features'] = features
 
         print('read graph from node list and edge list')
 
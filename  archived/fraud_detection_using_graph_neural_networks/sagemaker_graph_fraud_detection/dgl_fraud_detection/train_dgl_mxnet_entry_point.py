@@ -195,7 +195,7 @@ if __name__ == '__main__':
     args.edges = get_edgelists(args.edges, args.training_dir)
 
     g, features, id_to_node = construct_graph(args.training_dir, args.edges, args.nodes, args.target_ntype,
-                                              args.heterogeneous)
+                                              args.heterogeneous, args.graph_cache_dir or args.training_dir)
 
     features = normalize(nd.array(features))
     if args.heterogeneous:
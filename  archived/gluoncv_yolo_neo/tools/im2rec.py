@@ -26,8 +26,10 @@ curr_path = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.join(curr_path, "../python"))
 import argparse
 import random
+import shutil
 import time
 import traceback
+import zlib
 
 import cv2
 import mxnet as mx
@@ -37,6 +39,11 @@ try:
 except ImportError:
     multiprocessing = None
 
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 
 def list_image(root, recursive, exts):
     i = 0
@@ -122,7 +129,8 @@ def read_list(path_in):
             yield item
 
 
-def image_encode(args, i, item, q_out):
+def image_encode(args, item):
+    """Read, transform and pack the image of a list item, or return None if it fails."""
     fullpath = os.path.join(args.root, item[1])
 
     if len(item) > 3 and args.pack_label:
@@ -134,25 +142,21 @@ def image_encode(args, i, item, q_out):
         try:
             with open(fullpath, "rb") as fin:
                 img = fin.read()
-            s = mx.recordio.pack(header, img)
-            q_out.put((i, s, item))
+            return mx.recordio.pack(header, img)
         except Exception as e:
             traceback.print_exc()
             print("pack_img error:", item[1], e)
-            q_out.put((i, None, item))
-        return
+            return None
 
     try:
         img = cv2.imread(fullpath, args.color)
     except:
         traceback.print_exc()
         print("imread error trying to load file: %s " % fullpath)
-        q_out.put((i, None, item))
-        return
+        return None
     if img is None:
         print("imread read blank (None) image for file: %s" % fullpath)
-        q_out.put((i, None, item))
-        return
+        return None
     if args.center_crop:
         if img.shape[0] > img.shape[1]:
             margin = (img.shape[0] - img.shape[1]) // 2
@@ -168,56 +172,152 @@ def image_encode(args, i, item, q_out):
         img = cv2.resize(img, newsize)
 
     try:
-        s = mx.recordio.pack_img(header, img, quality=args.quality, img_fmt=args.encoding)
-        q_out.put((i, s, item))
+        return mx.recordio.pack_img(header, img, quality=args.quality, img_fmt=args.encoding)
     except Exception as e:
         traceback.print_exc()
         print("pack_img error on file: %s" % fullpath, e)
-        q_out.put((i, None, item))
+        return None
+
+
+# Arguments that change the encoded records, a shard is only reused if they are the same
+ENCODING_ARGS = [
+    "root",
+    "pass_through",
+    "resize",
+    "center_crop",
+    "quality",
+    "color",
+    "encoding",
+    "pack_label",
+]
+
+
+def shard_paths(args, working_dir, fname, start, items):
+    """Return the .idx and .rec paths of the shard holding the items of a list from start.
+
+    The names hold a checksum of the items and of the encoding arguments, so that
+    the shards of a previous run are only reused for the same list and settings.
+    """
+    settings = [getattr(args, name) for name in ENCODING_ARGS]
+    checksum = zlib.crc32(repr((settings, items)).encode("utf-8")) & 0xFFFFFFFF
+    name = os.path.splitext(os.path.basename(fname))[0] + ".part-%d-%d-%08x" % (
+        start,
+        start + len(items),
+        checksum,
+    )
+    return os.path.join(working_dir, name + ".idx"), os.path.join(working_dir, name + ".rec")
+
+
+def write_shard(args, shard):
+    """Encode the items of a shard and write them to its own .idx/.rec files.
+
+    The records are written to temporary files, which are renamed when the
+    shard is complete. A shard whose files exist is skipped, so an interrupted
+    run resumes from the shards it has not finished.
+    """
+    path_idx, path_rec, items = shard
+    if os.path.isfile(path_idx) and os.path.isfile(path_rec):
         return
+    pre_time = time.time()
+    record = mx.recordio.MXIndexedRecordIO(path_idx + ".tmp", path_rec + ".tmp", "w")
+    for item in items:
+        s = image_encode(args, item)
+        if s is not None:
+            record.write_idx(item[0], s)
+    record.close()
+    os.rename(path_rec + ".tmp", path_rec)
+    os.rename(path_idx + ".tmp", path_idx)
+    print(
+        "time: %.2f count: %d shard: %s"
+        % (time.time() - pre_time, len(items), os.path.basename(path_rec))
+    )
 
 
-def read_worker(args, q_in, q_out):
+def shard_worker(args, q_in):
     while True:
-        deq = q_in.get()
-        if deq is None:
+        shard = q_in.get()
+        if shard is None:
             break
-        i, item = deq
-        image_encode(args, i, item, q_out)
+        write_shard(args, shard)
 
 
-def write_worker(q_out, fname, working_dir):
-    pre_time = time.time()
-    count = 0
+def merge_shards(shards, fname, working_dir):
+    """Concatenate the shard .rec files in order and offset their .idx positions."""
     fname = os.path.basename(fname)
-    fname_rec = os.path.splitext(fname)[0] + ".rec"
-    fname_idx = os.path.splitext(fname)[0] + ".idx"
-    record = mx.recordio.MXIndexedRecordIO(
-        os.path.join(working_dir, fname_idx), os.path.join(working_dir, fname_rec), "w"
+    path_rec = os.path.join(working_dir, os.path.splitext(fname)[0] + ".rec")
+    path_idx = os.path.join(working_dir, os.path.splitext(fname)[0] + ".idx")
+    offset = 0
+    with open(path_rec + ".tmp", "wb") as frec, open(path_idx + ".tmp", "w") as fidx:
+        for shard_idx, shard_rec, _ in shards:
+            with open(shard_rec, "rb") as fin:
+                shutil.copyfileobj(fin, frec, 16 * 1024 * 1024)
+            with open(shard_idx) as fin:
+                for line in fin:
+                    key, pos = line.strip().split("\t")
+                    fidx.write("%s\t%d\n" % (key, int(pos) + offset))
+            offset += os.path.getsize(shard_rec)
+    os.replace(path_rec + ".tmp", path_rec)
+    os.replace(path_idx + ".tmp", path_idx)
+    # Also remove the shards left by runs with another list, shard size or settings
+    shard_prefix = os.path.splitext(fname)[0] + ".part-"
+    for name in os.listdir(working_dir):
+        if name.startswith(shard_prefix):
+            os.remove(os.path.join(working_dir, name))
+
+
+def write_record(args, fname, working_dir):
+    """Pack the images of a .lst file into a .rec/.idx database in the order of the list.
+
+    The list is split into shards of args.shard_size items, which the workers
+    encode and write to separate files in parallel. The workers write the
+    records themselves, so encoded images are never sent between processes and
+    each worker only holds the image it is encoding. The shards are then
+    merged into the final .rec/.idx files.
+    """
+    image_list = list(read_list(fname))
+    shards = []
+    for start in range(0, len(image_list), args.shard_size):
+        items = image_list[start : start + args.shard_size]
+        shards.append(shard_paths(args, working_dir, fname, start, items) + (items,))
+
+    done = sum(
+        os.path.isfile(path_idx) and os.path.isfile(path_rec) for path_idx, path_rec, _ in shards
     )
-    buf = {}
-    more = True
-    while more:
-        deq = q_out.get()
-        if deq is not None:
-            i, s, item = deq
-            buf[i] = (s, item)
-        else:
-            more = False
-        while count in buf:
-            s, item = buf[count]
-            del buf[count]
-            if s is not None:
-                record.write_idx(item[0], s)
+    if done:
+        print("Resuming with %d of %d shards already written" % (done, len(shards)))
+
+    if args.num_thread > 1 and multiprocessing is not None:
+        # Bounded so that the list is handed out as the workers progress
+        q_in = multiprocessing.Queue(2 * args.num_thread)
+        workers = [
+            multiprocessing.Process(target=shard_worker, args=(args, q_in))
+            for i in range(args.num_thread)
+        ]
+        for p in workers:
+            p.start()
+        for task in shards + [None] * len(workers):
+            # Stop waiting for room in the queue if all the workers died
+            while True:
+                try:
+                    q_in.put(task, timeout=1)
+                    break
+                except queue.Full:
+                    if not any(p.is_alive() for p in workers):
+                        raise RuntimeError(
+                            "the workers failed, run again to resume from the written shards"
+                        )
+        for p in workers:
+            p.join()
+        if any(p.exitcode != 0 for p in workers):
+            raise RuntimeError("a worker failed, run again to resume from the written shards")
+    else:
+        for shard in shards:
+            write_shard(args, shard)
 
-            if count % 1000 == 0:
-                cur_time = time.time()
-                print("time:", cur_time - pre_time, " count:", count)
-                pre_time = cur_time
-            count += 1
+    merge_shards(shards, fname, working_dir)
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
         description="Create an image list or \
@@ -289,9 +389,15 @@ def parse_args():
         "--num-thread",
         type=int,
         default=1,
-        help="number of thread to use for encoding. order of images will be different\
-        from the input list if >1. the input list will be modified to match the\
-        resulting order.",
+        help="number of processes to use for encoding. Each process writes its own\
+        shards of the database, which are merged in the order of the input list.",
+    )
+    rgroup.add_argument(
+        "--shard-size",
+        type=int,
+        default=1000,
+        help="number of images per shard. An interrupted run resumes from the\
+        shards that are not written yet.",
     )
     rgroup.add_argument(
         "--color",
@@ -315,7 +421,7 @@ def parse_args():
         action="store_true",
         help="Whether to also pack multi dimensional label in the record file",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     args.prefix = os.path.abspath(args.prefix)
     args.root = os.path.abspath(args.root)
     return args
@@ -340,58 +446,6 @@ if __name__ == "__main__":
             if fname.startswith(args.prefix) and fname.endswith(".lst"):
                 print("Creating .rec file from", fname, "in", working_dir)
                 count += 1
-                image_list = read_list(fname)
-                # -- write_record -- #
-                if args.num_thread > 1 and multiprocessing is not None:
-                    q_in = [multiprocessing.Queue(1024) for i in range(args.num_thread)]
-                    q_out = multiprocessing.Queue(1024)
-                    read_process = [
-                        multiprocessing.Process(target=read_worker, args=(args, q_in[i], q_out))
-                        for i in range(args.num_thread)
-                    ]
-                    for p in read_process:
-                        p.start()
-                    write_process = multiprocessing.Process(
-                        target=write_worker, args=(q_out, fname, working_dir)
-                    )
-                    write_process.start()
-
-                    for i, item in enumerate(image_list):
-                        q_in[i % len(q_in)].put((i, item))
-                    for q in q_in:
-                        q.put(None)
-                    for p in read_process:
-                        p.join()
-
-                    q_out.put(None)
-                    write_process.join()
-                else:
-                    print("multiprocessing not available, fall back to single threaded encoding")
-                    try:
-                        import Queue as queue
-                    except ImportError:
-                        import queue
-                    q_out = queue.Queue()
-                    fname = os.path.basename(fname)
-                    fname_rec = os.path.splitext(fname)[0] + ".rec"
-                    fname_idx = os.path.splitext(fname)[0] + ".idx"
-                    record = mx.recordio.MXIndexedRecordIO(
-                        os.path.join(working_dir, fname_idx),
-                        os.path.join(working_dir, fname_rec),
-                        "w",
-                    )
-                    cnt = 0
-                    pre_time = time.time()
-                    for i, item in enumerate(image_list):
-                        image_encode(args, i, item, q_out)
-                        if q_out.empty():
-                            continue
-                        _, s, _ = q_out.get()
-                        record.write_idx(item[0], s)
-                        if cnt % 1000 == 0:
-                            cur_time = time.time()
-                            print("time:", cur_time - pre_time, " count:", cnt)
-                            pre_time = cur_time
-                        cnt += 1
+                write_record(args, fname, working_dir)
         if not count:
             print("Did not find and list file with prefix %s" % args.prefix)
@@ -0,0 +1,120 @@
+"""Counts DynamoDB calls made by the batch metadata access layer against a mocked table.
+
+Compares the previous single-query / per-item access patterns with the paginated,
+batched ones in shared/db.py for a parent batch with many children:
+
+    python benchmark_db_calls.py --children 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from unittest.mock import patch
+
+import boto3
+from moto import mock_dynamodb
+
+# shared/db.py creates its DynamoDB resource at import time.
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda_src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda_test"))
+
+from boto3.dynamodb.conditions import Key  # noqa: E402
+from shared import db  # noqa: E402
+from shared.constants import BatchMetadataTableAttributes as Attributes  # noqa: E402
+from shared.constants import BatchMetadataType, BatchStatus  # noqa: E402
+from test_shared.db_test import create_table, insert_batch_tree  # noqa: E402
+
+
+def legacy_get_child_batch_metadata(parent_batch_id, metadata_type):
+    """Previous implementation: one query page, type filtered client side."""
+    response = db.batch_execution_metadata_table.query(
+        IndexName="ParentBatchIdIndex",
+        KeyConditionExpression=Key(Attributes.PARENT_BATCH_ID).eq(parent_batch_id),
+    )
+    return [
+        item for item in response["Items"] if item[Attributes.BATCH_METADATA_TYPE] == metadata_type
+    ]
+
+
+def legacy_mark_batch_and_children_failed(batch_id, error_message=""):
+    """Previous implementation: one update_item per batch, one query page per batch."""
+    db.update_batch_status(batch_id, BatchStatus.INTERNAL_ERROR, error_message=error_message)
+    response = db.batch_execution_metadata_table.query(
+        IndexName="ParentBatchIdIndex",
+        KeyConditionExpression=Key(Attributes.PARENT_BATCH_ID).eq(batch_id),
+    )
+    for item in response["Items"]:
+        legacy_mark_batch_and_children_failed(item[Attributes.BATCH_ID], error_message)
+
+
+def measure(name, calls, fn, *args):
+    calls.clear()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    summary = ", ".join(f"{operation}={count}" for operation, count in sorted(calls.items()))
+    items = f"{len(result)} items" if result is not None else ""
+    print(f"{name:<40} {items:>12}  {summary}  ({elapsed:.2f} s against moto)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--children", type=int, default=10000)
+    args = parser.parse_args()
+
+    with mock_dynamodb():
+        dynamodb = boto3.resource("dynamodb")
+        table = create_table(dynamodb)
+        insert_batch_tree(table, args.children)
+
+        calls = Counter()
+        dynamodb.meta.client.meta.events.register(
+            "before-call.dynamodb.*",
+            lambda model, **kwargs: calls.update([model.name]),
+        )
+
+        with patch.multiple(db, dynamodb=dynamodb, batch_execution_metadata_table=table):
+            job_level = BatchMetadataType.JOB_LEVEL
+            measure(
+                "legacy get_child_batch_metadata",
+                calls,
+                legacy_get_child_batch_metadata,
+                "parent",
+                job_level,
+            )
+            measure(
+                "get_child_batch_metadata", calls, db.get_child_batch_metadata, "parent", job_level
+            )
+
+            batch_ids = [f"parent/{i}" for i in range(min(args.children, 1000))]
+            measure(
+                "legacy get_batch_metadata x 1000",
+                calls,
+                lambda ids: [db.get_batch_metadata(batch_id) for batch_id in ids],
+                batch_ids,
+            )
+            measure("get_batch_metadata_many x 1000", calls, db.get_batch_metadata_many, batch_ids)
+
+            measure(
+                "legacy mark_batch_and_children_failed",
+                calls,
+                legacy_mark_batch_and_children_failed,
+                "parent",
+                "failure",
+            )
+            measure(
+                "mark_batch_and_children_failed",
+                calls,
+                db.mark_batch_and_children_failed,
+                "parent",
+                "failure",
+            )
+
+
+if __name__ == "__main__":
+    main()
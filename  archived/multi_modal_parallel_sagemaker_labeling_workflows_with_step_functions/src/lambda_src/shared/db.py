@@ -1,8 +1,9 @@
 import os
+import time
 from decimal import Decimal
 
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
 from shared import log
 
 from .constants import BatchCurrentStep
@@ -11,10 +12,65 @@ from .constants import BatchMetadataType, BatchStatus
 
 BATCH_EXECUTION_METADATA_TABLE_NAME = os.getenv("BATCH_EXECUTION_METADATA_TABLE_NAME", "")
 
+# Service limits for the batched read / write APIs.
+BATCH_GET_MAX_KEYS = 100
+TRANSACT_WRITE_MAX_ITEMS = 100
+MAX_RETRIES = 8
+
 dynamodb = boto3.resource("dynamodb")
 batch_execution_metadata_table = dynamodb.Table(BATCH_EXECUTION_METADATA_TABLE_NAME)
 
 
+def query_pages(**kwargs):
+    """Yields every item matching a table or index query, following LastEvaluatedKey.
+
+    A single query response holds at most 1 MB of items, so larger results are fetched
+    page by page as the caller iterates.
+
+    :param kwargs: arguments passed through to Table.query
+    """
+    while True:
+        response = batch_execution_metadata_table.query(**kwargs)
+        yield from response.get("Items", [])
+
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if last_evaluated_key is None:
+            return
+        kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+
+def backoff(attempt):
+    """Sleeps before retrying a throttled or conflicting request."""
+    time.sleep(min(2**attempt * 0.05, 2))
+
+
+def chunks(items, size):
+    """Splits a list into consecutive lists of at most size items."""
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def iter_child_batch_metadata(parent_batch_id, metadata_type=None, attributes=None):
+    """Yields the metadata of all children of a parent batch.
+
+    :param parent_batch_id: id of the parent batch metadata of interest
+    :param metadata_type: only yield children of this type, filtered server side
+    :param attributes: only fetch these attributes of every child
+    """
+    kwargs = {
+        "IndexName": "ParentBatchIdIndex",
+        "KeyConditionExpression": Key(Attributes.PARENT_BATCH_ID).eq(parent_batch_id),
+    }
+    if metadata_type is not None:
+        kwargs["FilterExpression"] = Attr(Attributes.BATCH_METADATA_TYPE).eq(metadata_type)
+    if attributes is not None:
+        kwargs["ProjectionExpression"] = ", ".join(f"#attr{i}" for i in range(len(attributes)))
+        kwargs["ExpressionAttributeNames"] = {
+            f"#attr{i}": attribute for i, attribute in enumerate(attributes)
+        }
+    return query_pages(**kwargs)
+
+
 def get_child_batch_metadata(parent_batch_id, metadata_type):
     """Returns all the metadata associated to the parent batch.
 
@@ -28,17 +84,7 @@ def get_child_batch_metadata(parent_batch_id, metadata_type):
     :param metadata_type: type of the metadata
     :param parent_batch_id: id of the parent batch metadata of interest
     """
-    response = batch_execution_metadata_table.query(
-        IndexName="ParentBatchIdIndex",
-        KeyConditionExpression=Key(Attributes.PARENT_BATCH_ID).eq(parent_batch_id),
-    )
-
-    items = []
-    for item in response["Items"]:
-        if item[Attributes.BATCH_METADATA_TYPE] == metadata_type:
-            items.append(item)
-
-    return items
+    return list(iter_child_batch_metadata(parent_batch_id, metadata_type))
 
 
 def get_batch_metadata(batch_id):
@@ -60,6 +106,36 @@ def get_batch_metadata(batch_id):
     return response["Item"] if "Item" in response else None
 
 
+def get_batch_metadata_many(batch_ids):
+    """Fetches many batch execution metadata with BatchGetItem.
+
+    Keys are requested 100 at a time and unprocessed keys are retried with backoff.
+    Missing batches are skipped, the order of the returned items is not defined.
+
+    :param batch_ids: ids of the batch execution metadata to fetch
+    """
+    table_name = batch_execution_metadata_table.name
+    unique_batch_ids = list(dict.fromkeys(batch_ids))
+
+    items = []
+    for batch_id_chunk in chunks(unique_batch_ids, BATCH_GET_MAX_KEYS):
+        request_items = {
+            table_name: {"Keys": [{Attributes.BATCH_ID: batch_id} for batch_id in batch_id_chunk]}
+        }
+        for attempt in range(MAX_RETRIES + 1):
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            items.extend(response["Responses"].get(table_name, []))
+
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+            backoff(attempt)
+        else:
+            raise Exception(f"BatchGetItem left unprocessed keys: {request_items}")
+
+    return items
+
+
 def get_child_batch_metadata_all(
     parent_batch_id,
 ):
@@ -67,12 +143,7 @@ def get_child_batch_metadata_all(
 
     :param batch_id: id to retrieve the associated batch_execution_metadata
     """
-    response = batch_execution_metadata_table.query(
-        IndexName="ParentBatchIdIndex",
-        KeyConditionExpression=Key(Attributes.PARENT_BATCH_ID).eq(parent_batch_id),
-    )
-
-    return response["Items"]
+    return list(iter_child_batch_metadata(parent_batch_id))
 
 
 def get_batch_metadata_by_labeling_job_name(labeling_job_name, metadata_type=None):
@@ -88,24 +159,15 @@ def get_batch_metadata_by_labeling_job_name(labeling_job_name, metadata_type=Non
     :param labeling_job_name: Name of the sagemaker GT Labeling Job
     :param metadata_type: metadata type of the batch
     """
-    response = batch_execution_metadata_table.query(
-        IndexName="LabelingJobNameIndex",
-        KeyConditionExpression=Key(Attributes.LABELING_JOB_NAME).eq(labeling_job_name),
-    )
-
-    if metadata_type is None:
-        return response["Items"]
-
-    singular_item = []
-    for item in response["Items"]:
-        if (
-            item[Attributes.LABELING_JOB_NAME] == labeling_job_name
-            and item[Attributes.BATCH_METADATA_TYPE] == metadata_type
-        ):
-            singular_item.append(item)
+    kwargs = {
+        "IndexName": "LabelingJobNameIndex",
+        "KeyConditionExpression": Key(Attributes.LABELING_JOB_NAME).eq(labeling_job_name),
+    }
+    if metadata_type is not None:
+        kwargs["FilterExpression"] = Attr(Attributes.BATCH_METADATA_TYPE).eq(metadata_type)
 
     # Return a list to make API return type to be consistent.
-    return singular_item
+    return list(query_pages(**kwargs))
 
 
 def update_batch_status(
@@ -540,12 +602,68 @@ def mark_batch_and_children_failed(
 
     :param batch_id: Unique ID of the batch to mark as deleted.
     :param error_message: Optional error message to store in dynamo with frame.
+
+    The batch tree is walked breadth first fetching only child ids and types, frames
+    are leaves and are not queried for children. The status updates are then written
+    with TransactWriteItems, up to 100 batches per request.
     """
-    update_batch_status(batch_id, BatchStatus.INTERNAL_ERROR, error_message=error_message)
+    batch_ids = [batch_id]
+    parent_batch_ids = [batch_id]
+    seen = {batch_id}
+    for parent_batch_id in parent_batch_ids:
+        for item in iter_child_batch_metadata(
+            parent_batch_id, attributes=[Attributes.BATCH_ID, Attributes.BATCH_METADATA_TYPE]
+        ):
+            child_batch_id = item[Attributes.BATCH_ID]
+            if child_batch_id in seen:
+                continue
+            seen.add(child_batch_id)
+            batch_ids.append(child_batch_id)
+            if item.get(Attributes.BATCH_METADATA_TYPE) != BatchMetadataType.FRAME_LEVEL:
+                parent_batch_ids.append(child_batch_id)
+
+    update_batch_status_many(batch_ids, BatchStatus.INTERNAL_ERROR, error_message=error_message)
 
-    items = get_child_batch_metadata_all(batch_id)
-    for item in items:
-        mark_batch_and_children_failed(item["BatchId"], error_message)
+
+def update_batch_status_many(batch_ids, status, error_message=""):
+    """Updates the status and error message of many batches with TransactWriteItems.
+
+    A transaction cancelled by a concurrent write to one of its batches is retried
+    with backoff.
+
+    :param batch_ids: ids of the batches to update
+    :param status: batch_meta_Data status to be in
+    :param error_message: message to indicate any issue.
+    """
+    client = dynamodb.meta.client
+    table_name = batch_execution_metadata_table.name
+    expression_attribute_values = {":s": status, ":message": error_message}
+    # A transaction may not touch the same item twice.
+    unique_batch_ids = list(dict.fromkeys(batch_ids))
+    for batch_id_chunk in chunks(unique_batch_ids, TRANSACT_WRITE_MAX_ITEMS):
+        transact_items = [
+            {
+                "Update": {
+                    "TableName": table_name,
+                    "Key": {Attributes.BATCH_ID: batch_id},
+                    "UpdateExpression": "set #st=:s, #errorMessage=:message",
+                    "ExpressionAttributeValues": expression_attribute_values,
+                    "ExpressionAttributeNames": {
+                        "#st": Attributes.BATCH_STATUS,
+                        "#errorMessage": Attributes.MESSAGE,
+                    },
+                }
+            }
+            for batch_id in batch_id_chunk
+        ]
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                client.transact_write_items(TransactItems=transact_items)
+                break
+            except client.exceptions.TransactionCanceledException:
+                if attempt == MAX_RETRIES:
+                    raise
+                backoff(attempt)
 
 
 def get_batches_by_type_status(batch_type, batch_status):
@@ -560,20 +678,18 @@ def get_batches_by_type_status(batch_type, batch_status):
     Dynamo db item or None if doesn't exist
     """
     try:
-        # TODO: Replace with get_item
-        response = batch_execution_metadata_table.query(
-            IndexName="BatchMetadataTypeStatusIndex",
-            KeyConditionExpression=Key("BatchMetadataType").eq(batch_type)
-            & Key("BatchStatus").eq(batch_status),
+        items = list(
+            query_pages(
+                IndexName="BatchMetadataTypeStatusIndex",
+                KeyConditionExpression=Key("BatchMetadataType").eq(batch_type)
+                & Key("BatchStatus").eq(batch_status),
+            )
         )
-        log.logger.info("DDB response {}".format(response))
+        log.logger.info("DDB returned {} items".format(len(items)))
     except Exception as err:
         log.logger.error(
             f"failed to query DynamoDB for batch type {batch_type} status {batch_status}, error: {err}"
         )
         return None
 
-    items = response.get("Items")
-    if items is None:
-        return []
     return items
@@ -0,0 +1,172 @@
+import os
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+import boto3
+from moto import mock_dynamodb
+from shared import db
+from shared.constants import BatchMetadataTableAttributes as Attributes
+from shared.constants import BatchMetadataType, BatchStatus
+
+NUM_CHILD_BATCHES = 10000
+
+# Padding pushes a full query of the children past the 1 MB page size.
+PADDING = "x" * 200
+
+
+def index(name, hash_key, range_key=None):
+    key_schema = [{"AttributeName": hash_key, "KeyType": "HASH"}]
+    if range_key is not None:
+        key_schema.append({"AttributeName": range_key, "KeyType": "RANGE"})
+    return {"IndexName": name, "KeySchema": key_schema, "Projection": {"ProjectionType": "ALL"}}
+
+
+def create_table(dynamodb):
+    """Batch execution metadata table with the indexes of cloudformation/workflow.yml"""
+    attribute_names = [
+        Attributes.BATCH_ID,
+        Attributes.BATCH_STATUS,
+        Attributes.PARENT_BATCH_ID,
+        Attributes.BATCH_METADATA_TYPE,
+        Attributes.LABELING_JOB_NAME,
+    ]
+    return dynamodb.create_table(
+        TableName="batch-execution-metadata",
+        AttributeDefinitions=[
+            {"AttributeName": name, "AttributeType": "S"} for name in attribute_names
+        ],
+        KeySchema=[{"AttributeName": Attributes.BATCH_ID, "KeyType": "HASH"}],
+        GlobalSecondaryIndexes=[
+            index("ParentBatchIdIndex", Attributes.PARENT_BATCH_ID),
+            index("LabelingJobNameIndex", Attributes.LABELING_JOB_NAME),
+            index(
+                "BatchMetadataTypeStatusIndex",
+                Attributes.BATCH_METADATA_TYPE,
+                Attributes.BATCH_STATUS,
+            ),
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def insert_batch_tree(table, num_child_batches):
+    """A parent batch with num_child_batches children, one of which has 3 children."""
+    with table.batch_writer() as writer:
+        writer.put_item(
+            Item={
+                Attributes.BATCH_ID: "parent",
+                Attributes.BATCH_STATUS: BatchStatus.IN_PROGRESS,
+                Attributes.BATCH_METADATA_TYPE: BatchMetadataType.INPUT,
+            }
+        )
+        for i in range(num_child_batches):
+            writer.put_item(
+                Item={
+                    Attributes.BATCH_ID: f"parent/{i}",
+                    Attributes.PARENT_BATCH_ID: "parent",
+                    Attributes.BATCH_STATUS: BatchStatus.IN_PROGRESS,
+                    Attributes.BATCH_METADATA_TYPE: BatchMetadataType.JOB_LEVEL
+                    if i % 2
+                    else BatchMetadataType.FRAME_LEVEL,
+                    Attributes.LABELING_JOB_NAME: "job",
+                    Attributes.MESSAGE: PADDING,
+                }
+            )
+        for i in range(3):
+            writer.put_item(
+                Item={
+                    Attributes.BATCH_ID: f"parent/1/{i}",
+                    Attributes.PARENT_BATCH_ID: "parent/1",
+                    Attributes.BATCH_STATUS: BatchStatus.IN_PROGRESS,
+                    Attributes.BATCH_METADATA_TYPE: BatchMetadataType.FRAME_LEVEL,
+                }
+            )
+
+
+class DynamoTestCase(TestCase):
+    """Loads the batch tree into a mocked table once for all tests of the class."""
+
+    num_child_batches = NUM_CHILD_BATCHES
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+        cls.mock = mock_dynamodb()
+        cls.mock.start()
+        dynamodb = boto3.resource("dynamodb")
+        cls.table = create_table(dynamodb)
+        insert_batch_tree(cls.table, cls.num_child_batches)
+
+        cls.patcher = patch.multiple(
+            db, dynamodb=dynamodb, batch_execution_metadata_table=cls.table
+        )
+        cls.patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.patcher.stop()
+        cls.mock.stop()
+
+
+class TestCase(DynamoTestCase):
+    def test_get_child_batch_metadata_all_follows_pages(self):
+        with patch.object(self.table, "query", wraps=self.table.query) as query_mock:
+            items = db.get_child_batch_metadata_all("parent")
+
+        self.assertGreater(query_mock.call_count, 1)
+        self.assertEqual(NUM_CHILD_BATCHES, len(items))
+        self.assertEqual(NUM_CHILD_BATCHES, len({item[Attributes.BATCH_ID] for item in items}))
+
+    def test_get_child_batch_metadata_filters_type(self):
+        items = db.get_child_batch_metadata("parent", BatchMetadataType.JOB_LEVEL)
+
+        self.assertEqual(NUM_CHILD_BATCHES // 2, len(items))
+        for item in items:
+            self.assertEqual(BatchMetadataType.JOB_LEVEL, item[Attributes.BATCH_METADATA_TYPE])
+
+    def test_get_batch_metadata_by_labeling_job_name(self):
+        self.assertEqual(NUM_CHILD_BATCHES, len(db.get_batch_metadata_by_labeling_job_name("job")))
+        items = db.get_batch_metadata_by_labeling_job_name("job", BatchMetadataType.FRAME_LEVEL)
+        self.assertEqual(NUM_CHILD_BATCHES // 2, len(items))
+
+    def test_get_batches_by_type_status(self):
+        items = db.get_batches_by_type_status(BatchMetadataType.JOB_LEVEL, BatchStatus.IN_PROGRESS)
+
+        self.assertEqual(NUM_CHILD_BATCHES // 2, len(items))
+
+    def test_get_batch_metadata_many(self):
+        batch_ids = [f"parent/{i}" for i in range(250)] + ["parent/0", "missing"]
+
+        items = db.get_batch_metadata_many(batch_ids)
+
+        self.assertEqual(250, len(items))
+        self.assertEqual(
+            {f"parent/{i}" for i in range(250)}, {item[Attributes.BATCH_ID] for item in items}
+        )
+
+
+class MarkFailedTestCase(DynamoTestCase):
+    # moto snapshots every table on each transaction, keep the tree small enough to stay fast.
+    num_child_batches = 1000
+
+    def test_mark_batch_and_children_failed(self):
+        db.mark_batch_and_children_failed("parent", "failure")
+
+        failed = db.get_batches_by_type_status(
+            BatchMetadataType.FRAME_LEVEL, BatchStatus.INTERNAL_ERROR
+        ) + db.get_batches_by_type_status(BatchMetadataType.JOB_LEVEL, BatchStatus.INTERNAL_ERROR)
+        self.assertEqual(self.num_child_batches + 3, len(failed))
+        for item in failed:
+            self.assertEqual("failure", item[Attributes.MESSAGE])
+
+        parent = db.get_batch_metadata("parent")
+        self.assertEqual(BatchStatus.INTERNAL_ERROR, parent[Attributes.BATCH_STATUS])
+        self.assertEqual("failure", parent[Attributes.MESSAGE])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+"""
+Checks and benchmarks the batched sub-network evaluation of evaluate_subnetworks.py.
+
+The vectorised pareto front of multi_objective.py, used from LOOP_SIZE points with more than
+two costs, is checked against the previous loop and timed for several numbers of points. If
+torch and transformers are installed, a tiny BERT-like super-network and synthetic tokenised
+batches are written to a temporary directory, and the candidates/hour of the previous
+evaluation, which loads the model and moves the batches to the device for every sub-network,
+are compared with evaluating all sub-networks on the same model and cached batches. Both must
+predict the same labels.
+
+    python benchmark_evaluate_subnetworks.py --points 1000 10000 --subnetworks 20
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from multi_objective import _get_pareto_optimal_loop as get_pareto_optimal_loop
+from multi_objective import get_pareto_optimal, get_pareto_ranks
+
+
+def make_costs(n_points, n_costs, seed=0, ties=False):
+    rng = np.random.RandomState(seed)
+    if ties:
+        return rng.randint(0, 10, size=(n_points, n_costs)).astype(float)
+    return rng.random_sample((n_points, n_costs))
+
+
+def check_pareto():
+    for n_points, n_costs, ties in [
+        (1, 2, False),
+        (500, 2, False),
+        (500, 3, False),
+        (300, 2, True),
+        (300, 3, True),
+        (5000, 3, False),
+        (5000, 4, True),
+    ]:
+        costs = make_costs(n_points, n_costs, seed=n_points + n_costs, ties=ties)
+        expected = get_pareto_optimal_loop(costs)
+        assert np.array_equal(get_pareto_optimal(costs), expected)
+
+        ranks = get_pareto_ranks(costs)
+        assert np.array_equal(ranks == 0, expected)
+        for rank in range(1, ranks.max() + 1):
+            # every front is the pareto front of the points that are not in earlier fronts
+            remaining = np.flatnonzero(ranks >= rank)
+            assert np.array_equal(
+                ranks[remaining] == rank, get_pareto_optimal_loop(costs[remaining])
+            )
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_pareto(points):
+    print(
+        "{:>8} {:>6} {:>12} {:>12} {:>12}".format(
+            "points", "costs", "loop s", "vector s", "ranks s"
+        )
+    )
+    for n_costs in [2, 3]:
+        for n_points in points:
+            # validation error falls with the number of parameters, as for the
+            # sub-networks, the third cost is a noisy latency
+            rng = np.random.RandomState(0)
+            n_params = rng.randint(10**6, 10**8, size=n_points)
+            error = 1 / np.log(n_params) + 0.02 * rng.random_sample(n_points)
+            latency = n_params * (1 + rng.random_sample(n_points))
+            costs = np.column_stack([n_params, error, latency][:n_costs])
+            expected, loop_time = timed(get_pareto_optimal_loop, costs)
+            is_pareto, vector_time = timed(get_pareto_optimal, costs)
+            assert np.array_equal(is_pareto, expected)
+            _, ranks_time = timed(get_pareto_ranks, costs)
+            print(
+                "{:>8} {:>6} {:>12.4f} {:>12.4f} {:>12.4f}".format(
+                    n_points, n_costs, loop_time, vector_time, ranks_time
+                )
+            )
+
+
+class Accuracy:
+    def compute(self, predictions, references):
+        return {"accuracy": float(np.mean(predictions == references))}
+
+
+def benchmark_subnetworks(num_subnetworks, num_samples, batch_size):
+    import torch
+    from torch.utils.data import DataLoader
+    from transformers import AutoModelForSequenceClassification, BertConfig
+
+    from evaluate_subnetwork import (
+        cache_batches,
+        create_masks,
+        evaluate_masks,
+        load_supernet,
+    )
+    from evaluate_subnetworks import evaluate_subnetworks, sample_subnetworks
+    from mask import mask_bert
+
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=1000,
+        hidden_size=128,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        intermediate_size=512,
+    )
+    rng = np.random.RandomState(0)
+    seq_len = 128
+    samples = [
+        {
+            "input_ids": torch.tensor(rng.randint(0, config.vocab_size, size=seq_len)),
+            "attention_mask": torch.ones(seq_len, dtype=torch.long),
+            "token_type_ids": torch.zeros(seq_len, dtype=torch.long),
+            "labels": torch.tensor(rng.randint(0, 2)),
+        }
+        for _ in range(num_samples)
+    ]
+    dataloader = DataLoader(samples, batch_size=batch_size)
+    subnetworks = sample_subnetworks(config, num_subnetworks, rng)
+    device = torch.device("cpu")
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        AutoModelForSequenceClassification.from_config(config).save_pretrained(model_dir)
+
+        # The previous evaluate_subnetwork.py, one job per sub-network
+        start = time.perf_counter()
+        previous = []
+        for subnetwork in subnetworks:
+            model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+            model.to(device)
+            head_mask, neuron_mask = create_masks(model.config, *subnetwork.values(), device)
+            mask_bert(model, neuron_mask, head_mask)
+            model.eval()
+            predictions = []
+            for batch in dataloader:
+                batch = {k: v.to(device) for k, v in batch.items()}
+                with torch.no_grad():
+                    outputs = model(head_mask=head_mask, **batch)
+                predictions.append(torch.argmax(outputs.logits, dim=-1))
+            previous.append(torch.cat(predictions).numpy())
+        previous_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        model, n_params_fixed = load_supernet(model_dir, "bert", device)
+        batches, references = cache_batches(dataloader, device)
+        for subnetwork, expected in zip(subnetworks, previous):
+            head_mask, neuron_mask = create_masks(model.config, *subnetwork.values(), device)
+            predictions = evaluate_masks(model, batches, head_mask, neuron_mask, False)
+            assert np.array_equal(predictions, expected), "predictions differ"
+        results = evaluate_subnetworks(
+            model,
+            batches,
+            references,
+            subnetworks,
+            Accuracy(),
+            "accuracy",
+            n_params_fixed,
+            False,
+        )
+        shared_time = time.perf_counter() - start
+
+    # the shared run evaluates every sub-network twice, once for the check above
+    shared_time /= 2
+    print("sub-networks predict the same labels with the shared super-network")
+    print(
+        "{} sub-networks, {} samples, {} pareto optimal".format(
+            len(results), num_samples, sum(r["pareto_rank"] == 0 for r in results)
+        )
+    )
+    print("{:<36} {:>14}".format("", "candidates/h"))
+    print(
+        "{:<36} {:>14.0f}".format(
+            "model load per sub-network", num_subnetworks / previous_time * 3600
+        )
+    )
+    print(
+        "{:<36} {:>14.0f}".format(
+            "shared super-network, cached batches", num_subnetworks / shared_time * 3600
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--subnetworks", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    check_pareto()
+    print("pareto fronts match the previous loop")
+    benchmark_pareto(args.points)
+
+    try:
+        import torch  # noqa: F401
+        import transformers  # noqa: F401
+    except ImportError:
+        print("torch and transformers are not installed, sub-networks were not evaluated")
+        return
+    benchmark_subnetworks(args.subnetworks, args.samples, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Calibration report of the latency lookup table of cost_model.py on this machine.
+
+The layer primitives of a BERT super-network are profiled once and saved to --table.
+Then sub-networks are sampled from sampling.SmallSearchSpace, and the predicted
+latency of each is compared with the measured latency of the pruned sub-network.
+The report lists both, the Pearson and Spearman correlations, the relative errors,
+and the time to predict a latency compared with the time to measure it.
+
+Without --model-name-or-path a tiny BERT-like super-network with random weights is
+used, so that the script runs without downloading a checkpoint.
+
+    python calibrate_cost_model.py --num-subnetworks 50 --batch-size 1 --seq-len 128
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from scipy.stats import pearsonr, spearmanr
+from transformers import AutoModelForSequenceClassification, BertConfig
+
+from cost_model import CostModel
+from estimate_efficency import compute_parameters, measure_latency
+from extract_subnetworks import prune_bert
+from sampling import SmallSearchSpace
+
+
+def load_model(model_name_or_path):
+    if model_name_or_path is not None:
+        return AutoModelForSequenceClassification.from_pretrained(model_name_or_path)
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=1000,
+        hidden_size=256,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        intermediate_size=1024,
+    )
+    return AutoModelForSequenceClassification.from_config(config)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-name-or-path", default=None)
+    parser.add_argument("--num-subnetworks", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--seq-len", type=int, default=128)
+    parser.add_argument("--repetitions", type=int, default=50)
+    parser.add_argument("--table", default="latency_table.json")
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    model = load_model(args.model_name_or_path).to(device).eval()
+    config = model.config
+
+    start = time.perf_counter()
+    cost_model = CostModel.profile(
+        model,
+        batch_size=args.batch_size,
+        seq_len=args.seq_len,
+        repetitions=args.repetitions,
+    )
+    profile_time = time.perf_counter() - start
+    cost_model.save(args.table)
+    cost_model = CostModel.load(args.table, cost_model.target)
+    print(f"profiled {cost_model.target} in {profile_time:.1f}s, saved to {args.table}")
+
+    sampler = SmallSearchSpace(config, rng=np.random.RandomState(0))
+    masks = [sampler() for _ in range(args.num_subnetworks)]
+    masks.append(sampler.get_smallest_sub_network())
+    masks.append(
+        (
+            torch.ones((config.num_hidden_layers, config.num_attention_heads)),
+            torch.ones((config.num_hidden_layers, config.intermediate_size)),
+        )
+    )
+
+    start = time.perf_counter()
+    predicted = np.array([cost_model.predict_latency(h, n) for h, n in masks])
+    predict_time = (time.perf_counter() - start) / len(masks)
+    stacked = cost_model.predict_latency(
+        torch.stack([h for h, _ in masks]), torch.stack([n for _, n in masks])
+    )
+    assert np.allclose(stacked, predicted)
+
+    input_ids = torch.randint(config.vocab_size, (args.batch_size, args.seq_len), device=device)
+    attention_mask = torch.ones_like(input_ids)
+    measured = []
+    start = time.perf_counter()
+    for head_mask, neuron_mask in masks:
+        sub_network = prune_bert(model, head_mask, neuron_mask)
+        measured.append(
+            measure_latency(
+                lambda: sub_network(input_ids=input_ids, attention_mask=attention_mask),
+                device,
+                repetitions=args.repetitions,
+            )
+        )
+
+        n_params = cost_model.predict_parameters(head_mask, neuron_mask)
+        assert n_params == cost_model.fixed_parameters + compute_parameters(
+            dmodel=config.hidden_size,
+            dhead=config.hidden_size // config.num_attention_heads,
+            num_heads_per_layer=head_mask.sum(dim=1),
+            num_neurons_per_layer=neuron_mask.sum(dim=1),
+        )
+    measure_time = (time.perf_counter() - start) / len(masks)
+    measured = np.array(measured)
+
+    print(
+        "{:>7} {:>6} {:>6} {:>14} {:>14} {:>8}".format(
+            "layers", "heads", "units", "predicted us", "measured us", "error"
+        )
+    )
+    for (head_mask, neuron_mask), p, m in zip(masks, predicted, measured):
+        num_layers = int((head_mask.sum(dim=1) > 0).sum())
+        print(
+            "{:>7} {:>6} {:>6} {:>14.0f} {:>14.0f} {:>7.1f}%".format(
+                num_layers,
+                int(head_mask[0].sum()),
+                int(neuron_mask[0].sum()),
+                p,
+                m,
+                100 * (p - m) / m,
+            )
+        )
+
+    relative_error = np.abs(predicted - measured) / measured
+    print(f"pearson r: {pearsonr(predicted, measured)[0]:.4f}")
+    print(f"spearman rho: {spearmanr(predicted, measured)[0]:.4f}")
+    print(
+        f"relative error: mean {100 * relative_error.mean():.1f}%, "
+        f"max {100 * relative_error.max():.1f}%"
+    )
+    print(
+        f"time per sub-network: {predict_time * 1e6:.1f}us predicted, "
+        f"{measure_time * 1e6:.0f}us measured ({measure_time / predict_time:.0f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
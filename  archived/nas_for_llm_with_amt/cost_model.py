@@ -0,0 +1,211 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+import copy
+import json
+import os
+import platform
+
+import numpy as np
+import torch
+
+from estimate_efficency import measure_latency
+from extract_subnetworks import prune_bert_layer
+
+
+def default_target(device):
+    """
+    Name of the hardware the latencies are measured on
+    """
+    if device.type == "cuda":
+        return f"cuda-{torch.cuda.get_device_name(device)}"
+    return f"cpu-{platform.machine()}-{torch.get_num_threads()}threads"
+
+
+class CostModel(object):
+    """
+    Lookup table of the latencies of the layer primitives of a BERT super-network,
+    measured once per hardware target. The latency of a sub-network is the latency
+    of the model without encoder layers plus, for every layer that is not dropped,
+    the latency of its attention with the number of heads it keeps and of its
+    feed-forward network with the number of units it keeps.
+    """
+
+    def __init__(
+        self,
+        target,
+        batch_size,
+        seq_len,
+        hidden_size,
+        attention_head_size,
+        fixed_parameters,
+        fixed_us,
+        attention_us,
+        ffn_units,
+        ffn_us,
+    ):
+        self.target = target
+        self.batch_size = batch_size
+        self.seq_len = seq_len
+        self.hidden_size = hidden_size
+        self.attention_head_size = attention_head_size
+        self.fixed_parameters = fixed_parameters
+        self.fixed_us = fixed_us
+        # latency of the attention with 0, 1, ..., num_attention_heads heads
+        self.attention_us = np.asarray(attention_us, dtype=float)
+        # latency of the feed-forward network for a grid of numbers of units
+        self.ffn_units = np.asarray(ffn_units, dtype=float)
+        self.ffn_us = np.asarray(ffn_us, dtype=float)
+
+    @classmethod
+    def profile(
+        cls,
+        model,
+        batch_size=1,
+        seq_len=128,
+        num_ffn_units=17,
+        repetitions=100,
+        target=None,
+    ):
+        """
+        Measure the latencies of the layer primitives of the super-network on the device it is on
+        """
+        device = next(model.parameters()).device
+        config = model.config
+        model = copy.deepcopy(model).eval()
+
+        input_ids = torch.randint(config.vocab_size, (batch_size, seq_len), device=device)
+        attention_mask = torch.ones_like(input_ids)
+
+        layers = model.bert.encoder.layer
+        with torch.no_grad():
+            hidden_states = model.bert.embeddings(input_ids=input_ids)
+        extended_attention_mask = model.get_extended_attention_mask(attention_mask, input_ids.shape)
+
+        # mask_bert drops the attention of a layer without heads
+        attention_us = [0.0]
+        for num_heads in range(1, config.num_attention_heads + 1):
+            attention = prune_bert_layer(
+                copy.deepcopy(layers[0]), num_heads, config.intermediate_size
+            ).attention
+            attention_us.append(
+                measure_latency(
+                    lambda: attention(hidden_states, attention_mask=extended_attention_mask),
+                    device,
+                    repetitions=repetitions,
+                )
+            )
+
+        ffn_units = np.unique(np.linspace(0, config.intermediate_size, num_ffn_units).astype(int))
+        ffn_us = []
+        for num_units in ffn_units:
+            layer = prune_bert_layer(
+                copy.deepcopy(layers[0]), config.num_attention_heads, int(num_units)
+            )
+            ffn_us.append(
+                measure_latency(
+                    lambda: layer.output(layer.intermediate(hidden_states), hidden_states),
+                    device,
+                    repetitions=repetitions,
+                )
+            )
+
+        # everything but the encoder layers, including the overhead of a forward pass
+        model.bert.encoder.layer = torch.nn.ModuleList([])
+        fixed_us = measure_latency(
+            lambda: model(input_ids=input_ids, attention_mask=attention_mask),
+            device,
+            repetitions=repetitions,
+        )
+        fixed_parameters = sum(
+            p.numel()
+            for module in [model.bert.embeddings, model.bert.pooler, model.classifier]
+            for p in module.parameters()
+            if p.requires_grad
+        )
+
+        return cls(
+            target=target or default_target(device),
+            batch_size=batch_size,
+            seq_len=seq_len,
+            hidden_size=config.hidden_size,
+            attention_head_size=config.hidden_size // config.num_attention_heads,
+            fixed_parameters=fixed_parameters,
+            fixed_us=fixed_us,
+            attention_us=attention_us,
+            ffn_units=ffn_units,
+            ffn_us=ffn_us,
+        )
+
+    def predict_latency(self, head_mask, neuron_mask):
+        """
+        Latency in microseconds of the sub-network selected by masks of shape
+        (num_layers, num_heads) and (num_layers, intermediate_size), as returned
+        by sampling.SearchSpace. Stacked masks with leading dimensions for
+        several sub-networks return an array of latencies.
+        """
+        num_heads = np.asarray(head_mask).sum(axis=-1).astype(int)
+        num_units = np.asarray(neuron_mask).sum(axis=-1)
+        # like mask_bert, the feed-forward network of a layer without units is dropped
+        # and the latency of the attention without heads is 0
+        ffn_us = np.interp(num_units, self.ffn_units, self.ffn_us) * (num_units > 0)
+        return self.fixed_us + np.sum(self.attention_us[num_heads] + ffn_us, axis=-1)
+
+    def predict_parameters(self, head_mask, neuron_mask):
+        """
+        Number of parameters of the sub-network selected by the masks, the same as
+        estimate_efficency.compute_parameters plus the embeddings and the classifier
+        """
+        num_heads = np.asarray(head_mask).sum(axis=-1).astype(np.int64)
+        num_units = np.asarray(neuron_mask).sum(axis=-1).astype(np.int64)
+        dmodel, dhead = self.hidden_size, self.attention_head_size
+        n_layer_norm = 2 * dmodel
+        n_attention = (dmodel * dhead + dhead) * num_heads * 3
+        n_attention += dmodel * dmodel + dmodel + n_layer_norm
+        n_ffn = 2 * dmodel * num_units + dmodel + num_units + n_layer_norm
+        n_layers = n_attention * (num_heads > 0) + n_ffn * (num_units > 0)
+        return self.fixed_parameters + np.sum(n_layers, axis=-1)
+
+    def to_dict(self):
+        return {
+            "batch_size": self.batch_size,
+            "seq_len": self.seq_len,
+            "hidden_size": self.hidden_size,
+            "attention_head_size": self.attention_head_size,
+            "fixed_parameters": self.fixed_parameters,
+            "fixed_us": self.fixed_us,
+            "attention_us": self.attention_us.tolist(),
+            "ffn_units": self.ffn_units.tolist(),
+            "ffn_us": self.ffn_us.tolist(),
+        }
+
+    def save(self, path):
+        """
+        Add the lookup table of this hardware target to the json file at path
+        """
+        tables = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                tables = json.load(f)
+        tables[self.target] = self.to_dict()
+        with open(path, "w") as f:
+            json.dump(tables, f, indent=2)
+
+    @classmethod
+    def load(cls, path, target):
+        with open(path) as f:
+            tables = json.load(f)
+        if target not in tables:
+            raise KeyError(
+                f"No latency table for {target} in {path}, run CostModel.profile on it first"
+            )
+        return cls(target=target, **tables[target])
@@ -10,6 +10,8 @@
 # on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
 # express or implied. See the License for the specific language governing
 # permissions and limitations under the License.
+import time
+
 import torch
 import numpy as np
 
@@ -99,3 +101,22 @@ def compute_latency(model, tokenizer, batch, device):
     mean_syn = np.sum(timings) / repetitions
 
     return mean_syn
+
+
+def measure_latency(fn, device, repetitions=100, warmup=10):
+    """
+    Median wall-clock latency of fn() in microseconds, on CPU or GPU
+    """
+    timings = np.zeros(repetitions)
+    with torch.no_grad():
+        for _ in range(warmup):
+            fn()
+        for rep in range(repetitions):
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            fn()
+            if device.type == "cuda":
+                torch.cuda.synchronize()
+            timings[rep] = time.perf_counter() - start
+    return float(np.median(timings) * 1e6)
@@ -62,10 +62,94 @@ class SearchArguments:
     num_heads: int = field()
     num_units: int = field()
     checkpoint_dir_model: str = field(
-        metadata={"help": ""}, default=os.environ["SM_CHANNEL_MODEL"]
+        metadata={"help": ""}, default=os.environ.get("SM_CHANNEL_MODEL")
     )
 
 
+def load_supernet(model_dir, model_type, device):
+    """
+    Load the super-network once, all sub-networks share its weights
+    :return: the model and its number of parameters outside of the encoder layers
+    """
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+
+    if model_type.startswith("bert"):
+        n_params_emb = sum(
+            p.numel() for p in model.bert.embeddings.parameters() if p.requires_grad
+        )
+        n_params_pooler = sum(
+            p.numel() for p in model.bert.pooler.parameters() if p.requires_grad
+        )
+        n_params_classifier = sum(
+            p.numel() for p in model.classifier.parameters() if p.requires_grad
+        )
+        n_params_classifier += n_params_pooler
+
+    else:
+        raise AttributeError(f"Model {model_type} is not supported at this point!")
+
+    model.to(device)
+    model.eval()
+    return model, n_params_emb + n_params_classifier
+
+
+def cache_batches(dataloader, device):
+    """
+    Move the tokenized batches to the device once so that they can be reused by all sub-networks
+    :return: the model inputs of every batch and all labels as a numpy array
+    """
+    batches, references = [], []
+    for batch in dataloader:
+        references.append(batch["labels"])
+        batches.append({k: v.to(device) for k, v in batch.items() if k != "labels"})
+    return batches, torch.cat(references).numpy()
+
+
+def create_masks(config, num_layers, num_heads, num_units, device):
+    """
+    Masks that keep the first num_heads heads and num_units units of the first num_layers layers
+    """
+    head_mask = torch.ones((config.num_hidden_layers, config.num_attention_heads))
+    neuron_mask = torch.ones((config.num_hidden_layers, config.intermediate_size))
+
+    head_mask[num_layers:, :] = 0
+    head_mask[:num_layers, num_heads:] = 0
+    neuron_mask[num_layers:, :] = 0
+    neuron_mask[:num_layers, num_units:] = 0
+
+    return head_mask.to(device), neuron_mask.to(device)
+
+
+def count_parameters(config, head_mask, neuron_mask):
+    return compute_parameters(
+        dmodel=config.hidden_size,
+        dhead=int(config.hidden_size / config.num_attention_heads),
+        num_heads_per_layer=head_mask.sum(dim=1),
+        num_neurons_per_layer=neuron_mask.sum(dim=1),
+    )
+
+
+def evaluate_masks(model, batches, head_mask, neuron_mask, is_regression):
+    """
+    Predictions of the sub-network selected by the masks on the cached batches.
+    The masks are removed from the model afterwards, so that the next sub-network
+    can be evaluated with the same model.
+    """
+    handles = mask_bert(model, neuron_mask, head_mask)
+    predictions = []
+    try:
+        with torch.no_grad():
+            for batch in batches:
+                logits = model(head_mask=head_mask, **batch).logits
+                predictions.append(
+                    logits.squeeze(-1) if is_regression else torch.argmax(logits, dim=-1)
+                )
+    finally:
+        for handle in handles:
+            handle.remove()
+    return torch.cat(predictions).cpu().numpy()
+
+
 def main():
     parser = HfArgumentParser(
         (ModelArguments, DataTrainingArguments, TrainingArguments, SearchArguments)
@@ -111,74 +195,23 @@ def main():
         training_args=training_args, model_args=model_args, data_args=data_args
     )
 
-    model = AutoModelForSequenceClassification.from_pretrained(
-        training_args.output_dir
-    )
-
-    config = model.config
-    if model_type.startswith("bert"):
-        attention_size = config.hidden_size
-        num_attention_heads = config.num_attention_heads
-        attention_head_size = int(attention_size / num_attention_heads)
-        num_layers = config.num_hidden_layers
-        intermediate_size = config.intermediate_size
-        mask = mask_bert
-
-        n_params_emb = sum(
-            p.numel() for p in model.bert.embeddings.parameters() if p.requires_grad
-        )
-        n_params_pooler = sum(
-            p.numel() for p in model.bert.pooler.parameters() if p.requires_grad
-        )
-        n_params_classifier = sum(
-            p.numel() for p in model.classifier.parameters() if p.requires_grad
-        )
-        n_params_classifier += n_params_pooler
-
-    else:
-        raise AttributeError(f'Model {model_type} is not supported at this point!')
-
     device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-    model.to(device)
+    model, n_params_fixed = load_supernet(training_args.output_dir, model_type, device)
+    batches, references = cache_batches(eval_dataloader, device)
 
     metric_name = TASKINFO[data_args.task_name]["metric"]
 
-    head_mask = torch.ones((num_layers, num_attention_heads))
-    neuron_mask = torch.ones((num_layers, intermediate_size))
-
-    head_mask[search_args.num_layers:, :] = 0
-    head_mask[: search_args.num_layers:, search_args.num_heads:] = 0
-    neuron_mask[search_args.num_layers:, :] = 0
-    neuron_mask[: search_args.num_layers:, search_args.num_units:] = 0
-
-    head_mask = head_mask.to(device)
-    neuron_mask = neuron_mask.to(device)
-    n_params_model = compute_parameters(
-        dmodel=attention_size,
-        dhead=attention_head_size,
-        num_heads_per_layer=head_mask.sum(dim=1),
-        num_neurons_per_layer=neuron_mask.sum(dim=1),
+    head_mask, neuron_mask = create_masks(
+        model.config,
+        search_args.num_layers,
+        search_args.num_heads,
+        search_args.num_units,
+        device,
     )
-    n_params = n_params_emb + n_params_model + n_params_classifier
-
-    handles = mask(model, neuron_mask, head_mask)
-
-    model.eval()
-
-    for batch in eval_dataloader:
-        batch = {k: v.to(device) for k, v in batch.items()}
-
-        with torch.no_grad():
-            outputs = model(head_mask=head_mask, **batch)
-
-        logits = outputs.logits
-        predictions = (
-            torch.squeeze(logits) if is_regression else torch.argmax(logits, dim=-1)
-        )
-
-        metric.add_batch(predictions=predictions, references=batch["labels"])
+    n_params = n_params_fixed + count_parameters(model.config, head_mask, neuron_mask)
 
-    eval_metric = metric.compute()
+    predictions = evaluate_masks(model, batches, head_mask, neuron_mask, is_regression)
+    eval_metric = metric.compute(predictions=predictions, references=references)
 
     print(f"number of parameters: {n_params}")
     print(f"validation error: {1 - eval_metric[metric_name]}")
@@ -0,0 +1,220 @@
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+import json
+import logging
+import os
+import sys
+import tarfile
+import time
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import torch
+import datasets
+
+from transformers import (
+    HfArgumentParser,
+    TrainingArguments,
+    set_seed,
+)
+
+from evaluate import load
+
+from task_data import TASKINFO
+from hf_args import DataTrainingArguments, ModelArguments
+from load_glue_datasets import load_glue_datasets
+from multi_objective import get_pareto_ranks
+from sampling import get_num_heads_choices
+from evaluate_subnetwork import (
+    cache_batches,
+    count_parameters,
+    create_masks,
+    evaluate_masks,
+    load_supernet,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchSearchArguments:
+    """
+    Arguments to define the sub-networks that are evaluated in a single job
+    """
+
+    num_subnetworks: int = field(
+        default=100,
+        metadata={"help": "Number of sub-networks sampled from the search space."},
+    )
+    subnetworks_file: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "JSON list of sub-networks, each with num_layers, num_heads and num_units, "
+            "to evaluate instead of sampling them."
+        },
+    )
+    results_file: str = field(
+        default=os.path.join(os.environ.get("SM_MODEL_DIR", "."), "subnetworks.json"),
+        metadata={"help": "Where to write the results of all sub-networks."},
+    )
+    checkpoint_dir_model: str = field(
+        metadata={"help": ""}, default=os.environ.get("SM_CHANNEL_MODEL")
+    )
+
+
+def sample_subnetworks(config, num_subnetworks, rng):
+    """
+    Sample sub-networks from the same search space as the tuning job of the notebook:
+    any number of layers and units, and a number of heads from get_num_heads_choices.
+    """
+    heads = get_num_heads_choices(config.num_attention_heads)
+    return [
+        {
+            "num_layers": int(rng.randint(0, config.num_hidden_layers + 1)),
+            "num_heads": int(rng.choice(heads)),
+            "num_units": int(rng.randint(0, config.intermediate_size + 1)),
+        }
+        for _ in range(num_subnetworks)
+    ]
+
+
+def evaluate_subnetworks(
+    model,
+    batches,
+    references,
+    subnetworks,
+    metric,
+    metric_name,
+    n_params_fixed,
+    is_regression,
+):
+    """
+    Evaluate all sub-networks with the weights of the same super-network.
+    Sub-networks that are sampled several times are only evaluated once.
+    """
+    device = next(model.parameters()).device
+    results = {}
+    for subnetwork in subnetworks:
+        key = (
+            subnetwork["num_layers"],
+            subnetwork["num_heads"],
+            subnetwork["num_units"],
+        )
+        if key in results:
+            continue
+        head_mask, neuron_mask = create_masks(model.config, *key, device)
+        predictions = evaluate_masks(model, batches, head_mask, neuron_mask, is_regression)
+        eval_metric = metric.compute(predictions=predictions, references=references)
+        results[key] = {
+            "num_layers": key[0],
+            "num_heads": key[1],
+            "num_units": key[2],
+            "num_parameters": n_params_fixed
+            + count_parameters(model.config, head_mask, neuron_mask),
+            "validation_error": float(1 - eval_metric[metric_name]),
+        }
+        logger.info(results[key])
+    results = list(results.values())
+
+    costs = np.array([[r["num_parameters"], r["validation_error"]] for r in results])
+    for result, rank in zip(results, get_pareto_ranks(costs)):
+        result["pareto_rank"] = int(rank)
+    return results
+
+
+def main():
+    parser = HfArgumentParser(
+        (ModelArguments, DataTrainingArguments, TrainingArguments, BatchSearchArguments)
+    )
+
+    (
+        model_args,
+        data_args,
+        training_args,
+        search_args,
+    ) = parser.parse_args_into_dataclasses()
+
+    # Setup logging
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        datefmt="%m/%d/%Y %H:%M:%S",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+
+    log_level = training_args.get_process_log_level()
+    logger.setLevel(log_level)
+    datasets.utils.logging.set_verbosity(log_level)
+
+    # Set seed before initializing model
+    if int(training_args.seed) == -1:
+        training_args.seed = np.random.randint(2**32 - 1)
+    set_seed(training_args.seed)
+
+    # Extract tar ball
+    tar = tarfile.open(search_args.checkpoint_dir_model + "/model.tar.gz")
+    tar.extractall(training_args.output_dir)
+    tar.close()
+
+    is_regression = data_args.task_name == "stsb"
+
+    # Evaluation metric
+    metric = load("glue", data_args.task_name)
+    metric_name = TASKINFO[data_args.task_name]["metric"]
+
+    # Load data
+    _, eval_dataloader, _ = load_glue_datasets(
+        training_args=training_args, model_args=model_args, data_args=data_args
+    )
+
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    model, n_params_fixed = load_supernet(
+        training_args.output_dir, model_args.model_name_or_path, device
+    )
+    batches, references = cache_batches(eval_dataloader, device)
+
+    if search_args.subnetworks_file is not None:
+        with open(search_args.subnetworks_file) as f:
+            subnetworks = json.load(f)
+    else:
+        subnetworks = sample_subnetworks(
+            model.config,
+            search_args.num_subnetworks,
+            np.random.RandomState(training_args.seed),
+        )
+
+    start = time.time()
+    results = evaluate_subnetworks(
+        model,
+        batches,
+        references,
+        subnetworks,
+        metric,
+        metric_name,
+        n_params_fixed,
+        is_regression,
+    )
+    elapsed = time.time() - start
+
+    os.makedirs(os.path.dirname(os.path.abspath(search_args.results_file)), exist_ok=True)
+    with open(search_args.results_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"number of sub-networks: {len(results)}")
+    print(f"candidates per hour: {len(results) / elapsed * 3600:.1f}")
+    print(f"pareto optimal sub-networks: {sum(r['pareto_rank'] == 0 for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,15 @@
 # on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
 # express or implied. See the License for the specific language governing
 # permissions and limitations under the License.
+import copy
 from collections import OrderedDict
 
+import torch
 import torch.nn as nn
 
 from transformers import AutoModelForSequenceClassification
 from transformers.models.bert.modeling_bert import BertForSequenceClassification, BertForMultipleChoice, BertConfig
+from transformers.pytorch_utils import prune_linear_layer
 
 
 def copy_linear_layer(new_layer, old_layer, weight_shape, bias_shape):
@@ -124,3 +127,35 @@ def get_final_bert_model(original_model, new_model_config):
         )
 
     return new_model
+
+
+def prune_bert_layer(layer, num_heads, num_units):
+    """
+    Remove all but the first num_heads heads and num_units units of a BERT layer in place
+    """
+    attention = layer.attention
+    heads = set(range(num_heads, attention.self.num_attention_heads)) - attention.pruned_heads
+    if len(heads) > 0:
+        attention.prune_heads(heads)
+
+    index = torch.arange(num_units, device=layer.intermediate.dense.weight.device)
+    layer.intermediate.dense = prune_linear_layer(layer.intermediate.dense, index, dim=0)
+    layer.output.dense = prune_linear_layer(layer.output.dense, index, dim=1)
+    return layer
+
+
+def prune_bert(model, head_mask, neuron_mask):
+    """
+    Copy of the model that only contains the heads and units kept by the masks, so that its latency
+    can be measured. Layers without heads and units are removed, as they are dropped by mask_bert.
+    Like the masks of sampling.SearchSpace, the kept heads and units have to be the first ones.
+    """
+    model = copy.deepcopy(model)
+    layers = []
+    for layer, heads, units in zip(model.bert.encoder.layer, head_mask, neuron_mask):
+        num_heads, num_units = int(heads.sum()), int(units.sum())
+        if num_heads > 0 or num_units > 0:
+            layers.append(prune_bert_layer(layer, num_heads, num_units))
+    model.bert.encoder.layer = nn.ModuleList(layers)
+    model.config.num_hidden_layers = len(layers)
+    return model.eval()
@@ -10,25 +10,161 @@
 # on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
 # express or implied. See the License for the specific language governing
 # permissions and limitations under the License.
+from bisect import bisect_right
+
 import numpy as np
 
+# Number of points compared to each other at once
+BLOCK_SIZE = 512
+# Below this number of points and with more than two costs, the loop over the
+# points on the front is faster than the comparisons in blocks
+LOOP_SIZE = 4096
+# Number of points whose ranks are assigned at once
+RANKS_BLOCK_SIZE = 256
 
-def get_pareto_optimal(costs: np.ndarray):
+
+def _lexsort(costs: np.ndarray):
     """
-    Find the pareto-optimal points
-    :param costs: (n_points, m_cost_values) array
-    :return: (n_points, 1) indicator if point is on pareto front or not.
+    Order of the points by their first cost, then by their second cost and so on,
+    identical points keep their order. A point can only be dominated by points
+    that come before it.
     """
-    assert type(costs) == np.ndarray
-    assert costs.ndim == 2
+    keys = (np.arange(costs.shape[0]),) + tuple(costs.T[::-1])
+    return np.lexsort(keys)
+
+
+def _weakly_dominated(costs: np.ndarray, points: np.ndarray):
+    """
+    Indicator for every point if one of costs has no larger cost than it
+    """
+    dominated = np.zeros(points.shape[0], dtype=bool)
+    step = max(1, BLOCK_SIZE**2 // max(1, points.shape[0]))
+    for start in range(0, costs.shape[0], step):
+        c = costs[start : start + step, None, :]
+        dominated |= np.any(np.all(c <= points[None], axis=2), axis=0)
+    return dominated
 
-    # first assume all points are pareto optimal
+
+def _get_pareto_optimal_loop(costs: np.ndarray):
+    """
+    Removes the points dominated by every point on the front in turn
+    """
     is_pareto = np.ones(costs.shape[0], dtype=bool)
     for i, c in enumerate(costs):
         if is_pareto[i]:
-            # determine all points that have a smaller cost
             all_with_lower_costs = np.any(costs < c, axis=1)
             keep_on_front = np.logical_and(all_with_lower_costs, is_pareto)
             is_pareto = keep_on_front
-            is_pareto[i] = True  # keep self
+            is_pareto[i] = True
     return is_pareto
+
+
+def get_pareto_optimal(costs: np.ndarray):
+    """
+    Find the pareto-optimal points
+    :param costs: (n_points, m_cost_values) array
+    :return: (n_points,) indicator if point is on pareto front or not. Of
+        identical points only the first one is on the front.
+    """
+    assert type(costs) == np.ndarray
+    assert costs.ndim == 2
+
+    order = _lexsort(costs)
+    sorted_costs = costs[order]
+    is_pareto = np.zeros(costs.shape[0], dtype=bool)
+    if costs.shape[1] == 2:
+        # a point is on the front if its second cost is smaller than the
+        # second cost of all points with a smaller or equal first cost
+        second = sorted_costs[:, 1]
+        lowest_before = np.minimum.accumulate(np.concatenate([[np.inf], second[:-1]]))
+        is_pareto[order] = second < lowest_before
+        return is_pareto
+    if costs.shape[0] < LOOP_SIZE:
+        return _get_pareto_optimal_loop(costs)
+
+    front = sorted_costs[:0]
+    for start in range(0, costs.shape[0], BLOCK_SIZE):
+        block = sorted_costs[start : start + BLOCK_SIZE]
+        keep = ~_weakly_dominated(front, block)
+        # dominated by the points of the block that come before it
+        candidates = block[keep]
+        dominated = np.all(candidates[None, :, :] <= candidates[:, None, :], axis=2)
+        keep[keep] = ~np.any(np.tril(dominated, k=-1), axis=1)
+        is_pareto[order[start : start + BLOCK_SIZE]] = keep
+        front = np.concatenate([front, block[keep]])
+    return is_pareto
+
+
+def _front_dominates(front: np.ndarray, points: np.ndarray):
+    """
+    Indicator for every point if a point of the front has no larger cost than it,
+    the points of the front come before the points in lexicographic order
+    """
+    if front.shape[1] != 3:
+        return _weakly_dominated(front, points)
+    # the first cost of the front is never larger, so only the second and third
+    # costs are compared: the lowest third cost of the front among the points
+    # with no larger second cost than the point
+    order = np.argsort(front[:, 1], kind="stable")
+    second = front[order, 1]
+    lowest_third = np.minimum.accumulate(front[order, 2])
+    index = np.searchsorted(second, points[:, 1], side="right") - 1
+    return (index >= 0) & (lowest_third[np.maximum(index, 0)] <= points[:, 2])
+
+
+def get_pareto_ranks(costs: np.ndarray):
+    """
+    Non-dominated sort of the points
+    :param costs: (n_points, m_cost_values) array
+    :return: (n_points,) index of the front of every point. Points with rank 0
+        are the ones returned by get_pareto_optimal, points with rank 1 are
+        pareto-optimal once these are removed, and so on.
+    """
+    assert type(costs) == np.ndarray
+    assert costs.ndim == 2
+
+    ranks = np.zeros(costs.shape[0], dtype=int)
+    order = _lexsort(costs)
+    if costs.shape[1] == 2:
+        # the last point of every front has its lowest second cost, a point is
+        # dominated by all fronts where that cost is not larger than its own
+        lowest = []
+        for i, second in zip(order, costs[order, 1].tolist()):
+            rank = bisect_right(lowest, second)
+            if rank == len(lowest):
+                lowest.append(second)
+            else:
+                lowest[rank] = second
+            ranks[i] = rank
+        return ranks
+
+    sorted_costs = costs[order]
+    fronts = []
+    for start in range(0, costs.shape[0], RANKS_BLOCK_SIZE):
+        block = sorted_costs[start : start + RANKS_BLOCK_SIZE]
+        # every point of a front is dominated by a point of the previous front,
+        # so the fronts that dominate a point come before the ones that do not
+        dominated = np.ones((len(fronts) + 1, block.shape[0]), dtype=bool)
+        for rank, front in enumerate(fronts):
+            dominated[rank] = _front_dominates(front, block)
+        dominated[-1] = False
+        block_ranks = np.argmin(dominated, axis=0)
+
+        # a point is also in a later front than the points of the block that
+        # dominate it, which all come before it
+        within = np.triu(np.all(block[:, None, :] <= block[None, :, :], axis=2), k=1)
+        while True:
+            after = np.max(np.where(within, block_ranks[:, None] + 1, 0), axis=0)
+            new_ranks = np.maximum(block_ranks, after)
+            if np.array_equal(new_ranks, block_ranks):
+                break
+            block_ranks = new_ranks
+
+        ranks[order[start : start + RANKS_BLOCK_SIZE]] = block_ranks
+        for rank in np.unique(block_ranks).tolist():
+            points = block[block_ranks == rank]
+            if rank == len(fronts):
+                fronts.append(points)
+            else:
+                fronts[rank] = np.concatenate([fronts[rank], points])
+    return ranks
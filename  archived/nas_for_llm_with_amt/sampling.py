@@ -14,6 +14,14 @@ import numpy as np
 import torch
 
 
+def get_num_heads_choices(num_heads):
+    """
+    Numbers of heads of the sub-networks, halving the number of heads of the super-network,
+    e.g. [12, 6, 3, 1] like the CategoricalParameter of the notebook for 12 heads
+    """
+    return [int(num_heads / 2 ** i) for i in range(int(np.log2(num_heads)) + 1)]
+
+
 class SearchSpace(object):
     """
     Setting the mask to 1 means we keep the corresponding head / unit
@@ -49,7 +57,7 @@ class SearchSpace(object):
 class SmallSearchSpace(SearchSpace):
     def __call__(self, *args, **kwargs):
         num_layers = self.rng.randint(self.num_layers)
-        num_heads = self.rng.choice([int(self.num_heads / 2 ** i) for i in range(int(np.log2(self.num_heads)) + 1)])
+        num_heads = self.rng.choice(get_num_heads_choices(self.num_heads))
         num_units = self.rng.randint(1, self.intermediate_size)
 
         return self._create_mask(num_layers, num_heads, num_units)
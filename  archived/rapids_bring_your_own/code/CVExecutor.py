@@ -0,0 +1,208 @@
+#
+# Copyright (c) 2019-2020, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+hpo_log = logging.getLogger("hpo_log")
+
+# workflow and fold state shared with forked fold workers [ read-only ]
+_fold_worker_state = {}
+
+
+class CVExecutor:
+    """
+    Cross-validation driver that ingests and cleans the dataset once for all folds.
+
+    For the single-CPU workflow the cleaned dataset is written to a memory-mapped
+    columnar file, train/test indices are precomputed for every fold, and folds run
+    in parallel worker processes. Multi-CPU and GPU workflows keep fitting on their
+    dask/cudf collections fold by fold, but reuse the ingested and cleaned dataset.
+
+    Per-phase timings [ ingest, split, fit, predict ] are emitted next to the
+    final score so they can be collected as HPO metrics.
+    """
+
+    phases = ["ingest", "split", "fit", "predict"]
+
+    def __init__(self, hpo_config, ml_workflow):
+        self.hpo_config = hpo_config
+        self.ml_workflow = ml_workflow
+        self.timings = defaultdict(float)
+
+        self.n_parallel_folds = 1
+        if hpo_config.compute_type == "single-CPU":
+            self.n_parallel_folds = int(
+                os.environ.get("CV_PARALLEL_FOLDS", min(hpo_config.cv_folds, os.cpu_count()))
+            )
+
+    def run(self):
+        start_time = time.perf_counter()
+        dataset = self.ml_workflow.handle_missing_data(self.ml_workflow.ingest_data())
+        self.timings["ingest"] += time.perf_counter() - start_time
+
+        if self.n_parallel_folds > 1:
+            self.run_parallel_folds(dataset)
+        else:
+            self.run_sequential_folds(dataset)
+
+        self.emit_timings()
+        self.ml_workflow.emit_final_score()
+
+    def run_sequential_folds(self, dataset):
+        for i_fold in range(self.hpo_config.cv_folds):
+            start_time = time.perf_counter()
+            X_train, X_test, y_train, y_test = self.ml_workflow.split_dataset(
+                dataset, random_state=i_fold
+            )
+            split_done = time.perf_counter()
+            trained_model = self.ml_workflow.fit(X_train, y_train)
+            fit_done = time.perf_counter()
+            predictions = self.ml_workflow.predict(trained_model, X_test)
+            predict_done = time.perf_counter()
+
+            self.timings["split"] += split_done - start_time
+            self.timings["fit"] += fit_done - split_done
+            self.timings["predict"] += predict_done - fit_done
+
+            score = self.ml_workflow.score(y_test, predictions)
+            self.ml_workflow.save_best_model(score, trained_model)
+
+            # restart cluster to avoid memory creep [ for multi-CPU/GPU ]
+            self.ml_workflow.cleanup(i_fold)
+
+    def run_parallel_folds(self, dataset):
+        cache_directory = tempfile.mkdtemp(
+            prefix="cv_cache_", dir=self.hpo_config.output_artifacts_directory
+        )
+        try:
+            start_time = time.perf_counter()
+            write_columnar_cache(dataset, cache_directory, self.hpo_config.dataset_dtype)
+            fold_indices = compute_fold_indices(len(dataset), self.hpo_config.cv_folds)
+            self.timings["split"] += time.perf_counter() - start_time
+
+            # split the cores between the folds instead of letting every fold use all of them
+            self.ml_workflow.n_threads = max(1, os.cpu_count() // self.n_parallel_folds)
+            _fold_worker_state.update(
+                ml_workflow=self.ml_workflow,
+                cache_directory=cache_directory,
+                fold_indices=fold_indices,
+            )
+            hpo_log.info(
+                f"> running {self.hpo_config.cv_folds} folds"
+                f" on {self.n_parallel_folds} worker processes"
+                f" with {self.ml_workflow.n_threads} threads each"
+            )
+            with ProcessPoolExecutor(
+                max_workers=self.n_parallel_folds, mp_context=multiprocessing.get_context("fork")
+            ) as executor:
+                results = list(executor.map(run_fold, range(self.hpo_config.cv_folds)))
+        finally:
+            _fold_worker_state.clear()
+            shutil.rmtree(cache_directory, ignore_errors=True)
+
+        for i_fold, (score, trained_model, fold_timings) in enumerate(results):
+            for phase, exec_time in fold_timings.items():
+                self.timings[phase] += exec_time
+            hpo_log.info(f"> fold {i_fold} score = {score}")
+            self.ml_workflow.cv_fold_scores.append(score)
+            self.ml_workflow.save_best_model(score, trained_model)
+            self.ml_workflow.cleanup(i_fold)
+
+    def emit_timings(self):
+        """Emit per-phase timings [ summed over folds ] for parsing as HPO metrics"""
+        for phase in self.phases:
+            hpo_log.info(f"{phase}-time: {self.timings[phase]:.5f};")
+
+
+def write_columnar_cache(dataset, cache_directory, dtype):
+    """
+    Store a cleaned pandas dataset as one column-major .npy file so each column is
+    contiguous on disk, and fold workers can memory-map it instead of re-reading
+    the source files.
+    """
+    values = numpy.asfortranarray(dataset.to_numpy(dtype=dtype))
+    numpy.save(os.path.join(cache_directory, "dataset.npy"), values)
+
+    columns = list(dataset.columns)
+    with open(os.path.join(cache_directory, "columns.json"), "w") as f:
+        json.dump(columns, f)
+
+    hpo_log.info(f"> cached {values.shape} dataset in {cache_directory}")
+    return columns
+
+
+def read_columnar_cache(cache_directory):
+    values = numpy.load(os.path.join(cache_directory, "dataset.npy"), mmap_mode="r")
+    with open(os.path.join(cache_directory, "columns.json")) as f:
+        columns = json.load(f)
+    return values, columns
+
+
+def compute_fold_indices(n_samples, cv_folds):
+    """
+    Train/test row indices for every fold, matching the single-CPU workflow's
+    train_test_split(..., random_state=i_fold) reshuffles.
+    """
+    from sklearn.model_selection import train_test_split
+
+    sample_index = numpy.arange(n_samples)
+    return [train_test_split(sample_index, random_state=i_fold) for i_fold in range(cv_folds)]
+
+
+def run_fold(i_fold):
+    """Fit and score one fold inside a forked worker process"""
+    import pandas
+
+    ml_workflow = _fold_worker_state["ml_workflow"]
+    hpo_config = ml_workflow.hpo_config
+    label_column = hpo_config.label_column
+    fold_timings = {}
+
+    start_time = time.perf_counter()
+    values, columns = read_columnar_cache(_fold_worker_state["cache_directory"])
+    train_index, test_index = _fold_worker_state["fold_indices"][i_fold]
+    label_index = columns.index(label_column)
+    feature_index = [i for i in range(len(columns)) if i != label_index]
+    feature_columns = [columns[i] for i in feature_index]
+
+    X_train = pandas.DataFrame(
+        values[numpy.ix_(train_index, feature_index)], columns=feature_columns
+    )
+    X_test = pandas.DataFrame(values[numpy.ix_(test_index, feature_index)], columns=feature_columns)
+    y_train = pandas.Series(values[train_index, label_index], name=label_column)
+    y_test = pandas.Series(values[test_index, label_index], name=label_column)
+    fold_timings["split"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    trained_model = ml_workflow.fit(X_train, y_train)
+    fold_timings["fit"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    predictions = ml_workflow.predict(trained_model, X_test)
+    fold_timings["predict"] = time.perf_counter() - start_time
+
+    score = ml_workflow.score(y_test, predictions)
+    return score, trained_model, fold_timings
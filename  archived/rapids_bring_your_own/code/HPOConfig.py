@@ -149,9 +149,6 @@ class HPOConfig(object):
                 "objective": "binary:logistic",
             }
 
-            if "single-CPU" in self.compute_type:
-                model_params.update({"nthreads": os.cpu_count()})
-
             if "GPU" in self.compute_type:
                 model_params.update({"tree_method": "gpu_hist"})
             else:
@@ -0,0 +1,141 @@
+#
+# Copyright (c) 2019-2020, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy
+
+NPY_CONTENT_TYPE = "application/x-npy"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def parse_payload(payload, content_type):
+    """
+    Decode a request body into a 2D float array of samples,
+    JSON [ list of arrays ], NPY and Arrow IPC stream supported
+    """
+    if content_type == NPY_CONTENT_TYPE:
+        query_data = numpy.load(io.BytesIO(payload), allow_pickle=False)
+
+    elif content_type == ARROW_CONTENT_TYPE:
+        import pyarrow
+
+        table = pyarrow.ipc.open_stream(io.BytesIO(payload)).read_all()
+        query_data = numpy.column_stack(
+            [column.to_numpy(zero_copy_only=False) for column in table.columns]
+        )
+
+    else:
+        query_data = numpy.array(json.loads(payload))
+
+    return numpy.atleast_2d(query_data)
+
+
+def encode_predictions(predictions, accept):
+    """Encode predictions as JSON [ default ] or NPY, returns (body, mimetype)"""
+    if accept == NPY_CONTENT_TYPE:
+        buffer = io.BytesIO()
+        numpy.save(buffer, numpy.asarray(predictions))
+        return buffer.getvalue(), NPY_CONTENT_TYPE
+
+    return json.dumps(numpy.asarray(predictions).tolist()), "text/csv"
+
+
+class MicroBatcher:
+    """
+    Collect samples from concurrent requests into one batch and run a single
+    prediction for all of them. A batch is flushed once it holds max_batch_size
+    rows or once max_delay seconds have passed since its first request arrived.
+    Each caller gets back a Future resolving to the predictions for its own rows.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=256, max_delay=0.005):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.requests = queue.Queue()
+        self.n_batches = 0
+        self.n_samples = 0
+
+        self.worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, query_data):
+        """Queue a 2D array of samples, returns a Future with its predictions"""
+        future = Future()
+        self.requests.put((query_data, future))
+        return future
+
+    def predict(self, query_data, timeout=None):
+        """Blocking convenience wrapper around submit"""
+        return self.submit(query_data).result(timeout=timeout)
+
+    def _collect(self):
+        """Block for the first request, then gather more until size or deadline"""
+        pending = [self.requests.get()]
+        n_rows = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_delay
+
+        while n_rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(request)
+            n_rows += len(request[0])
+
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            arrays = [query_data for query_data, _ in pending]
+            futures = [future for _, future in pending]
+
+            try:
+                batch = arrays[0] if len(arrays) == 1 else numpy.concatenate(arrays)
+                predictions = numpy.asarray(self.predict_fn(batch))
+            except Exception as inference_error:
+                if len(pending) == 1:
+                    futures[0].set_exception(inference_error)
+                else:
+                    # isolate the failing request(s) [ e.g., wrong number of features ]
+                    self._run_individually(pending)
+                continue
+
+            self.n_batches += 1
+            self.n_samples += len(batch)
+
+            # hand each caller the slice of predictions matching its rows
+            offsets = numpy.cumsum([0] + [len(query_data) for query_data in arrays])
+            for future, start, end in zip(futures, offsets[:-1], offsets[1:]):
+                future.set_result(predictions[start:end])
+
+    def _run_individually(self, pending):
+        for query_data, future in pending:
+            try:
+                future.set_result(numpy.asarray(self.predict_fn(query_data)))
+            except Exception as inference_error:
+                future.set_exception(inference_error)
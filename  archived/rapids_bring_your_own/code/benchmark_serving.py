@@ -0,0 +1,133 @@
+#
+# Copyright (c) 2019-2020, NVIDIA CORPORATION.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Compare per-request inference [ current endpoint behaviour ] against micro-batched
+inference for small CPU XGBoost and RandomForest models under concurrent clients.
+
+    python benchmark_serving.py --clients 32 --requests 20000
+
+Pass --url to load test a running serve.py endpoint instead [ start it once with
+MICRO_BATCHING=false and once with MICRO_BATCHING=true ].
+"""
+
+import argparse
+import io
+import json
+import logging
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import xgboost
+from batching import NPY_CONTENT_TYPE, MicroBatcher
+from serve import run_inference
+from sklearn.ensemble import RandomForestClassifier
+
+N_FEATURES = 13  # airline dataset feature count
+
+
+def train_models(n_samples=20000, seed=0):
+    rng = numpy.random.RandomState(seed)
+    X = rng.rand(n_samples, N_FEATURES).astype("float32")
+    y = (X[:, 0] + X[:, 1] > 1.0).astype("float32")
+
+    xgb_model = xgboost.train(
+        {"max_depth": 5, "objective": "binary:logistic", "tree_method": "hist"},
+        xgboost.DMatrix(X, label=y),
+        num_boost_round=10,
+    )
+    rf_model = RandomForestClassifier(n_estimators=10, max_depth=5, n_jobs=1).fit(X, y)
+    return {"XGBoost": xgb_model, "RandomForest": rf_model}
+
+
+def run_clients(send, samples, n_clients):
+    def timed(sample):
+        start_time = time.perf_counter()
+        send(sample)
+        return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_clients) as executor:
+        latencies = numpy.array(list(executor.map(timed, samples)))
+    exec_time = time.perf_counter() - start_time
+    return len(samples) / exec_time, latencies * 1000
+
+
+def report(name, throughput, latencies):
+    print(
+        f"{name:<32} {throughput:>10.0f} req/s"
+        f"   p50 {numpy.percentile(latencies, 50):7.2f} ms"
+        f"   p99 {numpy.percentile(latencies, 99):7.2f} ms"
+    )
+
+
+def http_sender(url, content_type):
+    def send(sample):
+        if content_type == NPY_CONTENT_TYPE:
+            buffer = io.BytesIO()
+            numpy.save(buffer, sample)
+            body = buffer.getvalue()
+        else:
+            body = json.dumps(sample.tolist()).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+    return send
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-batch-delay-ms", type=float, default=5)
+    parser.add_argument("--url", type=str, default=None)
+    parser.add_argument("--content-type", type=str, default="application/json")
+    args = parser.parse_args()
+
+    samples = list(numpy.random.rand(args.requests, 1, N_FEATURES).astype("float32"))
+
+    if args.url is not None:
+        throughput, latencies = run_clients(
+            http_sender(args.url, args.content_type), samples, args.clients
+        )
+        report(f"{args.url} [{args.content_type}]", throughput, latencies)
+        return
+
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.WARNING)
+
+    for model_type, model in train_models().items():
+
+        def infer(batch):
+            return run_inference(model, model_type, "benchmark", batch, logger=logger)
+
+        report(f"{model_type} per-request", *run_clients(infer, samples, args.clients))
+
+        batcher = MicroBatcher(
+            infer,
+            max_batch_size=args.max_batch_size,
+            max_delay=args.max_batch_delay_ms / 1000.0,
+        )
+        report(f"{model_type} micro-batched", *run_clients(batcher.predict, samples, args.clients))
+        print(f"  mean batch size {batcher.n_samples / max(batcher.n_batches, 1):.1f}")
+
+
+if __name__ == "__main__":
+    main()
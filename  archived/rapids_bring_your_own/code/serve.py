@@ -15,7 +15,6 @@
 #
 
 import glob
-import json
 import logging
 import os
 import sys
@@ -25,8 +24,8 @@ from functools import lru_cache
 
 import flask
 import joblib
-import numpy
 import xgboost
+from batching import MicroBatcher, encode_predictions, parse_payload
 from flask import Flask, Response
 
 try:
@@ -43,6 +42,47 @@ except ImportError as gpu_import_error:
 # set to true to print incoming request headers and data
 DEBUG_FLAG = False
 
+# set MICRO_BATCHING=true to queue concurrent requests and predict on them as one batch,
+# flushed once MAX_BATCH_SIZE samples are queued or MAX_BATCH_DELAY_MS have elapsed
+MICRO_BATCHING_FLAG = os.environ.get("MICRO_BATCHING", "false").lower() == "true"
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "256"))
+MAX_BATCH_DELAY_MS = float(os.environ.get("MAX_BATCH_DELAY_MS", "5"))
+
+
+def run_inference(
+    reloaded_model, model_type, model_filename, query_data, xgboost_threshold=0.5, logger=None
+):
+    """Run CPU or GPU inference with a loaded model on a 2D array of samples"""
+    logger = logger or logging.getLogger(__name__)
+    start_time = time.perf_counter()
+
+    if model_type == "XGBoost":
+        logger.info("running inference using XGBoost model :" f"{model_filename}")
+
+        if GPU_INFERENCE_FLAG:
+            predictions = reloaded_model.predict(query_data)
+        else:
+            dm_deserialized_data = xgboost.DMatrix(query_data)
+            predictions = reloaded_model.predict(dm_deserialized_data)
+
+        predictions = (predictions > xgboost_threshold) * 1.0
+
+    elif model_type == "RandomForest":
+        logger.info("running inference using RandomForest model :" f"{model_filename}")
+
+        if "gpu" in model_filename and not GPU_INFERENCE_FLAG:
+            raise Exception(
+                "attempting to run CPU inference " "on a GPU trained RandomForest model"
+            )
+
+        predictions = reloaded_model.predict(query_data.astype("float32"))
+
+    logger.info(f"\n predictions: {predictions} \n")
+    exec_time = time.perf_counter() - start_time
+    logger.info(f" > inference finished in {exec_time:.5f} s \n")
+
+    return predictions
+
 
 def serve(xgboost_threshold=0.5):
     """Flask Inference Server for SageMaker hosting of RAPIDS Models"""
@@ -111,51 +151,37 @@ def serve(xgboost_threshold=0.5):
                 app.logger.debug(flask.request.content_type)
                 app.logger.debug(flask.request.get_data())
 
-            string_data = json.loads(flask.request.get_data())
-            query_data = numpy.array(string_data)
+            query_data = parse_payload(flask.request.get_data(), flask.request.content_type)
 
         except Exception:
             return Response(
                 response="Unable to parse input data"
-                "[ should be json/string encoded list of arrays ]",
+                "[ should be json/string encoded list of arrays, npy or arrow stream ]",
                 status=415,
                 mimetype="text/csv",
             )
 
-        # cached [reloading] of trained model to process incoming requests
-        reloaded_model, model_type, model_filename = load_trained_model()
-
         try:
-            start_time = time.perf_counter()
-            if model_type == "XGBoost":
-                app.logger.info("running inference using XGBoost model :" f"{model_filename}")
-
-                if GPU_INFERENCE_FLAG:
-                    predictions = reloaded_model.predict(query_data)
-                else:
-                    dm_deserialized_data = xgboost.DMatrix(query_data)
-                    predictions = reloaded_model.predict(dm_deserialized_data)
-
-                predictions = (predictions > xgboost_threshold) * 1.0
-
-            elif model_type == "RandomForest":
-                app.logger.info("running inference using RandomForest model :" f"{model_filename}")
-
-                if "gpu" in model_filename and not GPU_INFERENCE_FLAG:
-                    raise Exception(
-                        "attempting to run CPU inference " "on a GPU trained RandomForest model"
-                    )
-
-                predictions = reloaded_model.predict(query_data.astype("float32"))
-
-            app.logger.info(f"\n predictions: {predictions} \n")
-            exec_time = time.perf_counter() - start_time
-            app.logger.info(f" > inference finished in {exec_time:.5f} s \n")
+            if batcher is not None:
+                # wait for the batch holding this request to be predicted
+                predictions = batcher.predict(query_data)
+            else:
+                # cached [reloading] of trained model to process incoming requests
+                reloaded_model, model_type, model_filename = load_trained_model()
+                predictions = run_inference(
+                    reloaded_model,
+                    model_type,
+                    model_filename,
+                    query_data,
+                    xgboost_threshold,
+                    app.logger,
+                )
 
             # return predictions
-            return Response(
-                response=json.dumps(predictions.tolist()), status=200, mimetype="text/csv"
+            response, mimetype = encode_predictions(
+                predictions, flask.request.headers.get("Accept")
             )
+            return Response(response=response, status=200, mimetype=mimetype)
 
         # error during inference
         except Exception as inference_error:
@@ -167,8 +193,21 @@ def serve(xgboost_threshold=0.5):
     # initial [non-cached] reload of trained model
     reloaded_model, model_type, model_filename = load_trained_model()
 
-    # trigger start of Flask app
-    app.run(host="0.0.0.0", port=8080)
+    batcher = None
+    if MICRO_BATCHING_FLAG:
+        app.logger.info(
+            f"> micro-batching up to {MAX_BATCH_SIZE} samples" f" or {MAX_BATCH_DELAY_MS} ms \n"
+        )
+        batcher = MicroBatcher(
+            lambda batch: run_inference(
+                reloaded_model, model_type, model_filename, batch, xgboost_threshold, app.logger
+            ),
+            max_batch_size=MAX_BATCH_SIZE,
+            max_delay=MAX_BATCH_DELAY_MS / 1000.0,
+        )
+
+    # trigger start of Flask app [ threaded, so concurrent requests can share a batch ]
+    app.run(host="0.0.0.0", port=8080, threaded=True)
 
 
 if __name__ == "__main__":
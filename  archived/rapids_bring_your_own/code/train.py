@@ -18,6 +18,7 @@ import logging
 import sys
 import traceback
 
+from CVExecutor import CVExecutor
 from HPOConfig import HPOConfig
 from MLWorkflow import create_workflow
 
@@ -26,34 +27,12 @@ def train():
     hpo_config = HPOConfig(input_args=sys.argv[1:])
     ml_workflow = create_workflow(hpo_config)
 
-    # cross-validation to improve robustness via multiple train/test reshuffles
-    for i_fold in range(hpo_config.cv_folds):
-        # ingest
-        dataset = ml_workflow.ingest_data()
+    # cross-validation to improve robustness via multiple train/test reshuffles,
+    # ingesting and cleaning the dataset once and sharing it across folds
+    cv_executor = CVExecutor(hpo_config, ml_workflow)
 
-        # handle missing samples [ drop ]
-        dataset = ml_workflow.handle_missing_data(dataset)
-
-        # split into train and test set
-        X_train, X_test, y_train, y_test = ml_workflow.split_dataset(dataset, random_state=i_fold)
-
-        # train model
-        trained_model = ml_workflow.fit(X_train, y_train)
-
-        # use trained model to predict target labels of test data
-        predictions = ml_workflow.predict(trained_model, X_test)
-
-        # score test set predictions against ground truth
-        score = ml_workflow.score(y_test, predictions)
-
-        # save trained model [ if it sets a new-high score ]
-        ml_workflow.save_best_model(score, trained_model)
-
-        # restart cluster to avoid memory creep [ for multi-CPU/GPU ]
-        ml_workflow.cleanup(i_fold)
-
-    # emit final score to cloud HPO [i.e., SageMaker]
-    ml_workflow.emit_final_score()
+    # train, predict and score each fold, then emit final score and phase timings
+    cv_executor.run()
 
 
 def configure_logging():
@@ -38,6 +38,8 @@ class MLWorkflowSingleCPU(MLWorkflow):
 
         self.hpo_config = hpo_config
         self.dataset_cache = None
+        # threads of each fit, lowered when CV folds run in parallel
+        self.n_threads = os.cpu_count()
 
         self.cv_fold_scores = []
         self.best_score = -1
@@ -115,8 +117,9 @@ class MLWorkflowSingleCPU(MLWorkflow):
             hpo_log.info("> fit xgboost model")
             dtrain = xgboost.DMatrix(data=X_train, label=y_train)
             num_boost_round = self.hpo_config.model_params["num_boost_round"]
+            params = dict(self.hpo_config.model_params, nthread=self.n_threads)
             trained_model = xgboost.train(
-                dtrain=dtrain, params=self.hpo_config.model_params, num_boost_round=num_boost_round
+                dtrain=dtrain, params=params, num_boost_round=num_boost_round
             )
 
         elif "RandomForest" in self.hpo_config.model_type:
@@ -126,7 +129,7 @@ class MLWorkflowSingleCPU(MLWorkflow):
                 max_depth=self.hpo_config.model_params["max_depth"],
                 max_features=self.hpo_config.model_params["max_features"],
                 bootstrap=self.hpo_config.model_params["bootstrap"],
-                n_jobs=-1,
+                n_jobs=self.n_threads,
             ).fit(X_train, y_train)
 
         return trained_model
@@ -0,0 +1,214 @@
+"""
+Checks and benchmarks the pyEp socket transport against fake EnergyPlus processes.
+
+Every fake EnergyPlus is a child process that connects to our socket like EnergyPlus does,
+answers each input packet with an output packet, and sleeps --sim-time seconds per step to
+stand in for the simulation. The script checks that packets split across receives, or
+received together, are framed correctly, then compares steps/sec of:
+  - the previous transport (1024-byte recv and string concatenation), instance by instance
+  - ep_process.read with the reusable receive buffer, instance by instance
+  - ep_multiplexer stepping all instances together
+
+    python benchmark-pyep-socket.py --instances 1 4 16 --steps 2000
+"""
+
+import argparse
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from eplus.envs import pyEpError
+from eplus.envs.pyEp import ep_multiplexer, ep_process
+
+NUM_REAL = 5
+
+
+def expected_outputs(step, num_real):
+    return [step * 0.5 + k for k in range(num_real)]
+
+
+def output_packet(step, num_real):
+    reals = " ".join("%.15e" % value for value in expected_outputs(step, num_real))
+    return "2 0 %d 0 0 %.15e %s\n" % (num_real, step * 300.0, reals)
+
+
+def fake_eplus(port, steps, num_real, sim_time, fragment):
+    """Connects to port and plays the EnergyPlus side of the protocol for steps steps."""
+    sock = socket.create_connection(("localhost", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    inputs = sock.makefile("rb")
+
+    def send(packet):
+        packet = packet.encode("utf-8")
+        if fragment:
+            for i in range(0, len(packet), 7):
+                sock.sendall(packet[i : i + 7])
+                time.sleep(0.0001)
+        else:
+            sock.sendall(packet)
+
+    send(output_packet(0, num_real))
+    for step in range(1, steps + 1):
+        if not inputs.readline():
+            return
+        if sim_time:
+            time.sleep(sim_time)
+        send(output_packet(step, num_real))
+    try:
+        inputs.readline()
+        send("2 1 0 0 0 %.15e\n" % (steps * 300.0))
+        inputs.readline()
+    except OSError:
+        pass  # the simulation was closed before its final packet
+    sock.close()
+
+
+def start_fake_eplus(n, steps, sim_time=0.0, fragment=False):
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("localhost", 0))
+    server.listen(n)
+    port = server.getsockname()[1]
+    eps = []
+    for _ in range(n):
+        process = subprocess.Popen(
+            [sys.executable, __file__, "--fake-eplus", str(port), str(steps), str(NUM_REAL)]
+            + ["--sim-time", str(sim_time)]
+            + (["--fragment"] if fragment else [])
+        )
+        remote, _ = server.accept()
+        remote.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        eps.append(ep_process.from_socket(remote, process))
+    server.close()
+    return eps
+
+
+def stop_fake_eplus(eps):
+    for ep in eps:
+        ep.close()
+        ep.p.wait()
+
+
+def read_1024(ep):
+    """The previous ep_process.read."""
+    data = ""
+    while True:
+        packet = ep.remote.recv(1024)
+        packet = packet.decode("utf-8")
+        data = data + packet
+        if "\n" in packet:
+            break
+    return data
+
+
+def decode_packet_simple_1024(ep, packet):
+    """The previous ep_process.decode_packet_simple, without its error handling."""
+    comp = packet.split(" ")
+    comp = comp[:-1]
+    comp_values = [float(s) for s in comp]
+    return comp_values[6 : 6 + int(comp_values[2])]
+
+
+def check_framing():
+    # Several packets and the start of another one arrive in a single receive
+    left, right = socket.socketpair()
+    ep = ep_process.from_socket(left)
+    packets = [output_packet(step, NUM_REAL) for step in range(4)]
+    right.sendall("".join(packets[:3]).encode("utf-8") + packets[3][:10].encode("utf-8"))
+    for step in range(3):
+        assert ep.decode_packet_simple(ep.read()) == expected_outputs(step, NUM_REAL)
+    right.sendall(packets[3][10:].encode("utf-8"))
+    assert ep.read() == packets[3]
+    # Packets larger than the receive buffer, sent from a thread as they exceed the socket buffer
+    large = output_packet(0, 20000)
+    sender = threading.Thread(target=right.sendall, args=(large.encode("utf-8"),))
+    sender.start()
+    assert ep.read() == large
+    sender.join()
+    right.close()
+    try:
+        ep.read()
+        raise AssertionError("reading a closed socket must raise EpReadError")
+    except pyEpError.EpReadError:
+        pass
+    left.close()
+
+    # Packets split across many receives, read by single instances and by the multiplexer
+    steps = 50
+    eps = start_fake_eplus(3, steps, fragment=True)
+    multiplexer = ep_multiplexer(eps)
+    for outputs in [ep.decode_packet_simple(ep.read()) for ep in eps]:
+        assert outputs == expected_outputs(0, NUM_REAL)
+    for step in range(1, steps + 1):
+        for outputs in multiplexer.step_simple([[22.0, 15.0]] * len(eps), step * 300):
+            assert outputs == expected_outputs(step, NUM_REAL)
+    assert multiplexer.step_simple([[22.0, 15.0]] * len(eps), 0) == [[]] * len(eps)
+    multiplexer.close()
+    stop_fake_eplus(eps)
+
+
+def benchmark(n, steps, sim_time):
+    def sequential(read, decode):
+        eps = start_fake_eplus(n, steps, sim_time)
+        for ep in eps:
+            decode(ep, read(ep))
+        start = time.perf_counter()
+        for step in range(1, steps + 1):
+            for ep in eps:
+                ep.write(ep.encode_packet_simple([22.0, 15.0], step * 300))
+                assert decode(ep, read(ep))[0] == step * 0.5
+        elapsed = time.perf_counter() - start
+        stop_fake_eplus(eps)
+        return n * steps / elapsed
+
+    def multiplexed():
+        eps = start_fake_eplus(n, steps, sim_time)
+        multiplexer = ep_multiplexer(eps)
+        multiplexer.read_all()
+        setpoints = [[22.0, 15.0]] * n
+        start = time.perf_counter()
+        for step in range(1, steps + 1):
+            assert multiplexer.step_simple(setpoints, step * 300)[0][0] == step * 0.5
+        elapsed = time.perf_counter() - start
+        multiplexer.close()
+        stop_fake_eplus(eps)
+        return n * steps / elapsed
+
+    baseline = sequential(read_1024, decode_packet_simple_1024)
+    buffered = sequential(ep_process.read, ep_process.decode_packet_simple)
+    parallel = multiplexed()
+    print(
+        "{:>9} {:>14.0f} {:>14.0f} {:>14.0f} {:>8.1f}x".format(
+            n, baseline, buffered, parallel, parallel / baseline
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instances", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--sim-time", type=float, default=0.0, help="seconds per fake step")
+    parser.add_argument("--fake-eplus", nargs=3, type=int, metavar=("PORT", "STEPS", "NUM_REAL"))
+    parser.add_argument("--fragment", action="store_true")
+    args = parser.parse_args()
+
+    if args.fake_eplus:
+        fake_eplus(*args.fake_eplus, sim_time=args.sim_time, fragment=args.fragment)
+        return
+
+    check_framing()
+    print("packet framing checks passed")
+    print(
+        "{:>9} {:>14} {:>14} {:>14}".format(
+            "instances", "recv(1024)/s", "recv_into/s", "selectors/s"
+        )
+    )
+    for n in args.instances:
+        benchmark(n, args.steps, args.sim_time)
+
+
+if __name__ == "__main__":
+    main()
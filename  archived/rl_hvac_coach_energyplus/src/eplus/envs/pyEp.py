@@ -1,10 +1,71 @@
 import os
+import selectors
 import socket
 import subprocess
 import sys
 
 from eplus.envs import pyEpError
 
+RECV_BUFFER_SIZE = 64 * 1024
+
+FLAG_MESSAGES = {
+    1: "Simulation Finished. No output",
+    -10: "Initialization Error",
+    -20: "Time Integration Error",
+    -1: "An Unspecified Error Occured",
+}
+
+
+class packet_buffer:
+
+    """
+    Receive buffer splitting the EnergyPlus byte stream into packets
+
+    Bytes are received with recv_into into one reusable bytearray, and a packet is
+    returned as soon as its "\n" end flag is in the buffer. Bytes received after the end
+    flag are kept for the next packet. The buffer grows if a packet does not fit.
+    """
+
+    def __init__(self, size=RECV_BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.start = 0  # first byte not returned yet
+        self.end = 0  # end of the received bytes
+        self.scanned = 0  # bytes before this offset hold no end flag
+
+    def next_packet(self):
+        # Returns the next complete packet, or None if its end flag was not received yet
+        flag = self.buffer.find(b"\n", max(self.start, self.scanned), self.end)
+        if flag < 0:
+            self.scanned = self.end
+            return None
+        packet = bytes(self.buffer[self.start : flag + 1])
+        self.start = flag + 1
+        if self.start == self.end:
+            self.start = self.end = self.scanned = 0
+        return packet
+
+    def fill(self, sock):
+        # Receives once from sock, returns the number of bytes received
+        if self.end == len(self.buffer):
+            pending = self.end - self.start
+            if pending * 2 > len(self.buffer):
+                self.buffer.extend(bytearray(len(self.buffer)))
+            self.buffer[:pending] = self.buffer[self.start : self.end]
+            self.scanned -= self.start
+            self.start, self.end = 0, pending
+        with memoryview(self.buffer) as view:
+            received = sock.recv_into(view[self.end :])
+        self.end += received
+        return received
+
+    def read_packet(self, sock):
+        packet = self.next_packet()
+        while packet is None:
+            if self.fill(sock) == 0:
+                raise pyEpError.EpReadError
+            packet = self.next_packet()
+        return packet
+
 
 class ep_process:
 
@@ -69,8 +130,20 @@ class ep_process:
         s.listen(1)
         remote, address = s.accept()
         self.remote = remote
+        self.recv_buffer = packet_buffer()
         print("Got connection from Host " + str(address[0]) + " Port " + str(address[1]))
 
+    @classmethod
+    def from_socket(cls, remote, process=None):
+        """
+        Wrap an already connected EnergyPlus socket, e.g. one accepted by the caller
+        """
+        ep = cls.__new__(cls)
+        ep.p = process
+        ep.remote = remote
+        ep.recv_buffer = packet_buffer()
+        return ep
+
     def close(self):
         print("Closing E+")
         self.write("2 1\n")
@@ -78,25 +151,21 @@ class ep_process:
         self.remote.close()
 
     def read(self):
-        data = ""
-        try:
-            while True:
-                packet = self.remote.recv(1024)
-                packet = packet.decode("utf-8")
-                data = data + packet
-                if "\n" in packet:  # \n is end flag
-                    break
+        return self.read_bytes().decode("utf-8")
 
+    # Returns the next packet, up to and including its \n end flag, as bytes
+    def read_bytes(self):
+        try:
+            return self.recv_buffer.read_packet(self.remote)
         except socket.error:
             print("Socket Error")
             raise pyEpError.EpReadError
 
-        return data
-
     def write(self, packet):
         # try:
-        packet = packet.encode("utf-8")
-        self.remote.send(packet)
+        if isinstance(packet, str):
+            packet = packet.encode("utf-8")
+        self.remote.sendall(packet)
 
     # except socket.error as err:
     #    raise pyEpError.EpWriteError
@@ -147,26 +216,17 @@ class ep_process:
         return output
 
     # Returns a list of float outputs from E+
+    # Only the header and the reals are parsed, packet can be str or bytes
     def decode_packet_simple(self, packet):
-        comp = packet.split(" ")
-        comp = comp[:-1]
-        comp_values = [float(s) for s in comp]
+        comp = packet.split()
         output = []
-        if comp_values[0] == 2:  # Version 2
-            if comp_values[1] == 0:  # Simulation still running
-                num_real = int(comp_values[2])
-                time = comp_values[5]
-
-                reals = comp_values[6 : 6 + num_real]
-                output = reals
+        if float(comp[0]) == 2:  # Version 2
+            flag = float(comp[1])
+            if flag == 0:  # Simulation still running
+                num_real = int(float(comp[2]))
+                output = list(map(float, comp[6 : 6 + num_real]))
             else:
-                switch = {
-                    1: "Simulation Finished. No output",
-                    -10: "Initialization Error",
-                    -20: "Time Integration Error",
-                    -1: "An Unspecified Error Occured",
-                }
-                print(switch.get(comp_values[1]))
+                print(FLAG_MESSAGES.get(flag))
         else:
             raise pyEpError.VersionError
         return output
@@ -182,6 +242,62 @@ class ep_process:
         return output
 
 
+class ep_multiplexer:
+
+    """
+    Steps several EnergyPlus instances together
+
+    The input packets are written to every instance first, then the output packets are
+    read from whichever instance is ready, so the instances simulate their timesteps in
+    parallel instead of one after the other.
+
+    Arguments
+        eps -- list of ep_process instances
+    """
+
+    def __init__(self, eps):
+        self.eps = list(eps)
+        self.selector = selectors.DefaultSelector()
+        for i, ep in enumerate(self.eps):
+            self.selector.register(ep.remote, selectors.EVENT_READ, i)
+
+    def read_all(self):
+        # Returns the next packet of every instance, as bytes, in the order of eps
+        packets = [ep.recv_buffer.next_packet() for ep in self.eps]
+        pending = sum(packet is None for packet in packets)
+        while pending:
+            for key, _ in self.selector.select():
+                i = key.data
+                if packets[i] is not None:
+                    continue
+                ep = self.eps[i]
+                try:
+                    received = ep.recv_buffer.fill(ep.remote)
+                except socket.error:
+                    print("Socket Error")
+                    raise pyEpError.EpReadError
+                if received == 0:
+                    raise pyEpError.EpReadError
+                packets[i] = ep.recv_buffer.next_packet()
+                pending -= packets[i] is not None
+        return packets
+
+    def write_all(self, packets):
+        for ep, packet in zip(self.eps, packets):
+            ep.write(packet)
+
+    # Sends the setpoints of every instance and returns their outputs, as encode_packet_simple
+    # and decode_packet_simple do for a single instance
+    def step_simple(self, setpoints, time):
+        self.write_all(
+            [ep.encode_packet_simple(points, time) for ep, points in zip(self.eps, setpoints)]
+        )
+        return [ep.decode_packet_simple(packet) for ep, packet in zip(self.eps, self.read_all())]
+
+    def close(self):
+        self.selector.close()
+
+
 def set_bcvtb_home():
     path = os.path.dirname(os.path.abspath(__file__)) + "/bcvtb"
     os.environ["BCVTB_HOME"] = path  # visible in this process + all children
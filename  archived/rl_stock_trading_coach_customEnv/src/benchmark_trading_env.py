@@ -0,0 +1,177 @@
+"""
+Benchmark of price loading and environment stepping for the stock-trading environment.
+
+Checks that TradingVectorEnv follows the same transitions as State, then reports the time
+to load the prices with and without the binary cache, and the steps/sec of State with the
+previous per-element encode, State, and TradingVectorEnv. Without --csv, a synthetic
+one-minute price file is written to a temporary directory:
+
+    python benchmark_trading_env.py --bars 200000 --n-envs 16 64 256
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from data import load_relative
+from trading_env import Actions, State, TradingVectorEnv
+
+ENV_KWARGS = dict(bars_count=10, commission=0.1, reset_on_close=True, volumes=False)
+
+
+def write_synthetic_csv(file_name, bars, seed=0):
+    rng = np.random.RandomState(seed)
+    open_price = 1000.0 * np.exp(np.cumsum(rng.randn(bars) * 1e-3))
+    high = open_price * (1.0 + rng.rand(bars) * 2e-3)
+    low = open_price * (1.0 - rng.rand(bars) * 2e-3)
+    close = low + (high - low) * rng.rand(bars)
+    volume = rng.randint(1, 1000, size=bars)
+    with open(file_name, "wt", encoding="utf-8") as fd:
+        fd.write("<DATE>,<TIME>,<OPEN>,<HIGH>,<LOW>,<CLOSE>,<VOL>\n")
+        for i in range(bars):
+            fd.write(
+                "20160104,{:06d},{:.2f},{:.2f},{:.2f},{:.2f},{}\n".format(
+                    i % 1000000, open_price[i], high[i], low[i], close[i], volume[i]
+                )
+            )
+
+
+def encode_per_element(state):
+    """The previous State.encode, filling the observation one element at a time."""
+    res = np.ndarray(shape=state.shape, dtype=np.float32)
+    shift = 0
+    for bar_idx in range(-state.bars_count + 1, 1):
+        res[shift] = state._prices.high[state._offset + bar_idx]
+        shift += 1
+        res[shift] = state._prices.low[state._offset + bar_idx]
+        shift += 1
+        res[shift] = state._prices.close[state._offset + bar_idx]
+        shift += 1
+        if state.volumes:
+            res[shift] = state._prices.volume[state._offset + bar_idx]
+            shift += 1
+    res[shift] = float(state.have_position)
+    shift += 1
+    if not state.have_position:
+        res[shift] = 0.0
+    else:
+        res[shift] = (state._cur_close() - state.open_price) / state.open_price
+    return res
+
+
+def make_state(env_kwargs):
+    return State(
+        env_kwargs["bars_count"],
+        env_kwargs["commission"],
+        env_kwargs["reset_on_close"],
+        reward_on_close=env_kwargs.get("reward_on_close", False),
+        volumes=env_kwargs["volumes"],
+    )
+
+
+def sync_state(state, vector_env, prices, i):
+    name = vector_env.instruments[vector_env.instrument[i]]
+    offset = vector_env.offset[i] - vector_env.starts[vector_env.instrument[i]]
+    state.reset(prices[name], int(offset))
+
+
+def check_equivalence(prices, env_kwargs, n_envs=8, n_steps=5000, seed=0):
+    """Step State objects and a TradingVectorEnv with the same actions and compare them."""
+    vector_env = TradingVectorEnv(n_envs, prices=prices, seed=seed, **env_kwargs)
+    obs = vector_env.reset()
+    states = [make_state(env_kwargs) for _ in range(n_envs)]
+    for i, state in enumerate(states):
+        sync_state(state, vector_env, prices, i)
+        assert np.array_equal(state.encode(), obs[i])
+        assert np.array_equal(encode_per_element(state), obs[i])
+
+    action_rng = np.random.RandomState(seed)
+    for step in range(n_steps):
+        actions = action_rng.randint(0, len(Actions), size=n_envs)
+        obs, rewards, dones, info = vector_env.step(actions)
+        for i, state in enumerate(states):
+            reward, done = state.step(Actions(actions[i]))
+            assert np.isclose(reward, rewards[i], rtol=1e-6), f"step {step} env {i}"
+            assert done == dones[i], f"step {step} env {i}: dones differ"
+            if done:
+                assert np.array_equal(state.encode(), info["terminal_observation"][i])
+                sync_state(state, vector_env, prices, i)
+            assert np.array_equal(state.encode(), obs[i]), f"step {step} env {i}"
+
+
+def steps_per_second(step_fn, n_steps, steps_per_call):
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        step_fn()
+    return n_steps * steps_per_call / (time.perf_counter() - start)
+
+
+def benchmark_state(prices, env_kwargs, n_steps, encode):
+    state = make_state(env_kwargs)
+    rng = np.random.RandomState(0)
+    length = prices.close.shape[0]
+    actions = [Actions(a) for a in rng.randint(0, len(Actions), size=n_steps)]
+    step_iter = iter(actions)
+
+    def single_step():
+        _, done = state.step(next(step_iter))
+        encode(state)
+        if done:
+            state.reset(prices, rng.randint(length - 100) + 10)
+
+    state.reset(prices, 10)
+    return steps_per_second(single_step, n_steps, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", help="price file, a synthetic one is generated by default")
+    parser.add_argument("--bars", type=int, default=200000)
+    parser.add_argument("--n-envs", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--steps", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file = args.csv
+        if csv_file is None:
+            csv_file = os.path.join(tmp_dir, "SYNTH_160101_161231.csv")
+            write_synthetic_csv(csv_file, args.bars)
+
+        start = time.perf_counter()
+        load_relative(csv_file, use_cache=False)
+        csv_time = time.perf_counter() - start
+        load_relative(csv_file)
+        start = time.perf_counter()
+        relative = load_relative(csv_file)
+        cached_time = time.perf_counter() - start
+        print("load csv    {:>10.4f} s".format(csv_time))
+        print("load cache  {:>10.4f} s".format(cached_time))
+
+        prices = {"SYNTH": relative}
+        check_equivalence(prices, ENV_KWARGS)
+        print("TradingVectorEnv matches State")
+
+        baseline = benchmark_state(relative, ENV_KWARGS, args.steps, encode_per_element)
+        print("{:<26} {:>12.0f} steps/sec".format("State, per-element encode", baseline))
+        rate = benchmark_state(relative, ENV_KWARGS, args.steps, State.encode)
+        print("{:<26} {:>12.0f} steps/sec  {:>6.1f}x".format("State", rate, rate / baseline))
+
+        rng = np.random.RandomState(0)
+        for n_envs in args.n_envs:
+            vector_env = TradingVectorEnv(n_envs, prices=prices, seed=0, **ENV_KWARGS)
+            vector_env.reset()
+            n_steps = max(1, args.steps // n_envs) * 10
+            actions = rng.randint(0, len(Actions), size=(n_steps, n_envs))
+            step_iter = iter(actions)
+            rate = steps_per_second(lambda: vector_env.step(next(step_iter)), n_steps, n_envs)
+            print(
+                "{:<26} {:>12.0f} steps/sec  {:>6.1f}x".format(
+                    f"TradingVectorEnv n={n_envs}", rate, rate / baseline
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
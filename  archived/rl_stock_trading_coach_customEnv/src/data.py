@@ -1,62 +1,85 @@
 import collections
 import csv
 import glob
+import json
 import os
 
 import numpy as np
 
 Prices = collections.namedtuple("Prices", field_names=["open", "high", "low", "close", "volume"])
+PRICE_COLUMNS = ("<OPEN>", "<HIGH>", "<LOW>", "<CLOSE>", "<VOL>")
 
 
 def read_csv(file_name, sep=",", filter_data=True, fix_open_price=False):
     print("Reading", file_name)
     with open(file_name, "rt", encoding="utf-8") as fd:
-        reader = csv.reader(fd, delimiter=sep)
-        h = next(reader)
+        h = next(csv.reader(fd, delimiter=sep))
         if "<OPEN>" not in h and sep == ",":
-            return read_csv(file_name, ";")
-        indices = [h.index(s) for s in ("<OPEN>", "<HIGH>", "<LOW>", "<CLOSE>", "<VOL>")]
-        o, h, l, c, v = [], [], [], [], []
-        count_out = 0
-        count_filter = 0
-        count_fixed = 0
-        prev_vals = None
-        for row in reader:
-            vals = list(map(float, [row[idx] for idx in indices]))
-            if filter_data and all(map(lambda v: abs(v - vals[0]) < 1e-8, vals[:-1])):
-                count_filter += 1
-                continue
-
-            po, ph, pl, pc, pv = vals
-
-            # fix open price for current bar to match close price for the previous bar
-            if fix_open_price and prev_vals is not None:
-                ppo, pph, ppl, ppc, ppv = prev_vals
-                if abs(po - ppc) > 1e-8:
-                    count_fixed += 1
-                    po = ppc
-                    pl = min(pl, po)
-                    ph = max(ph, po)
-            count_out += 1
-            o.append(po)
-            c.append(pc)
-            h.append(ph)
-            l.append(pl)
-            v.append(pv)
-            prev_vals = vals
+            return read_csv(file_name, ";", filter_data, fix_open_price)
+        indices = [h.index(s) for s in PRICE_COLUMNS]
+        # Parse all rows at once, the columns come back in the order of PRICE_COLUMNS
+        vals = np.loadtxt(fd, delimiter=sep, usecols=indices, ndmin=2, dtype=np.float64)
+    count_in = len(vals)
+
+    if filter_data:
+        keep = ~np.all(np.abs(vals[:, :-1] - vals[:, :1]) < 1e-8, axis=1)
+        vals = vals[keep]
+    po, ph, pl, pc, pv = vals.T.copy()
+
+    # fix open price for current bar to match close price for the previous bar
+    count_fixed = 0
+    if fix_open_price and len(vals) > 1:
+        ppc = vals[:-1, 3]
+        fixed = np.abs(po[1:] - ppc) > 1e-8
+        count_fixed = int(fixed.sum())
+        po[1:] = np.where(fixed, ppc, po[1:])
+        pl[1:] = np.where(fixed, np.minimum(pl[1:], po[1:]), pl[1:])
+        ph[1:] = np.where(fixed, np.maximum(ph[1:], po[1:]), ph[1:])
     print(
         "Read done, got %d rows, %d filtered, %d open prices adjusted"
-        % (count_filter + count_out, count_filter, count_fixed)
+        % (count_in, count_in - len(vals), count_fixed)
     )
     return Prices(
-        open=np.array(o, dtype=np.float32),
-        high=np.array(h, dtype=np.float32),
-        low=np.array(l, dtype=np.float32),
-        close=np.array(c, dtype=np.float32),
-        volume=np.array(v, dtype=np.float32),
+        open=po.astype(np.float32),
+        high=ph.astype(np.float32),
+        low=pl.astype(np.float32),
+        close=pc.astype(np.float32),
+        volume=pv.astype(np.float32),
     )
 
 
+def read_cached(file_name, kind, reader):
+    """
+    Return reader(file_name), memory-mapped from a binary cache next to the CSV.
+
+    The prices are stored as one (5, bars) float32 array in "<file_name>.<kind>.npy", and
+    "<file_name>.<kind>.json" indexes it with the size and modification time of the CSV.
+    The cache is rebuilt when the CSV changes, and skipped if it can not be written.
+    """
+    array_path = "{}.{}.npy".format(file_name, kind)
+    index_path = "{}.{}.json".format(file_name, kind)
+    stat = os.stat(file_name)
+    index = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "fields": list(Prices._fields)}
+    try:
+        with open(index_path, "rt", encoding="utf-8") as fd:
+            if json.load(fd) == index:
+                return Prices(*np.load(array_path, mmap_mode="r"))
+    except (OSError, ValueError):
+        pass
+
+    prices = reader(file_name)
+    try:
+        tmp_path = "{}.{}.tmp.npy".format(file_name, kind)
+        np.save(tmp_path, np.stack(prices))
+        os.replace(tmp_path, array_path)
+        with open(index_path, "wt", encoding="utf-8") as fd:
+            json.dump(index, fd)
+    except OSError as e:
+        print("Could not cache", file_name, e)
+        return prices
+    return Prices(*np.load(array_path, mmap_mode="r"))
+
+
 def prices_to_relative(prices):
     """
     Convert prices to relative in respect to open price
@@ -70,7 +93,25 @@ def prices_to_relative(prices):
     return Prices(open=prices.open, high=rh, low=rl, close=rc, volume=prices.volume)
 
 
-def load_relative(csv_file):
+def bar_windows(prices, bars_count, volumes):
+    """
+    Sliding windows over the bars, as used in the observations: row i holds the
+    high, low, close (and volume) of bars i .. i + bars_count - 1, bar after bar.
+    The rows are strided views into one (bars, features) array, nothing is copied per window.
+    """
+    columns = [prices.high, prices.low, prices.close]
+    if volumes:
+        columns.append(prices.volume)
+    features = np.stack(columns, axis=1).astype(np.float32)
+    n_features = features.shape[1]
+    return np.lib.stride_tricks.sliding_window_view(features.ravel(), bars_count * n_features)[
+        ::n_features
+    ]
+
+
+def load_relative(csv_file, use_cache=True):
+    if use_cache:
+        return read_cached(csv_file, "relative", lambda f: prices_to_relative(read_csv(f)))
     return prices_to_relative(read_csv(csv_file))
 
 
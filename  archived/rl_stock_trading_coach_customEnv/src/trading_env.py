@@ -86,6 +86,135 @@ class TradingEnv(gym.Env):
         return TradingEnv(prices, **kwargs)
 
 
+class TradingVectorEnv:
+    """
+    Steps n_envs TradingEnv episodes together.
+
+    The prices of all instruments are concatenated, every episode keeps its offset in the
+    concatenated arrays, and a step updates the positions and offsets of all episodes with
+    array operations. Finished episodes are reset automatically, their final observation is
+    returned in info["terminal_observation"].
+    """
+
+    def __init__(
+        self,
+        n_envs,
+        prices=None,
+        bars_count=10,
+        commission=0.1,
+        reset_on_close=True,
+        random_ofs_on_reset=True,
+        reward_on_close=False,
+        volumes=False,
+        seed=None,
+    ):
+        if prices is None:
+            prices = {"YNDX": load_relative(DATA_DIR)}
+        assert isinstance(prices, dict)
+        self._prices = prices
+        self.n_envs = n_envs
+        self._state = State(
+            bars_count, commission, reset_on_close, reward_on_close=reward_on_close, volumes=volumes
+        )
+        self.bars_count = bars_count
+        self.commission_perc = commission
+        self.reset_on_close = reset_on_close
+        self.reward_on_close = reward_on_close
+        self.random_ofs_on_reset = random_ofs_on_reset
+        self.single_action_space = gym.spaces.Discrete(n=len(Actions))
+        self.single_observation_space = gym.spaces.Box(
+            low=-np.inf, high=np.inf, shape=self._state.shape, dtype=np.float32
+        )
+
+        self.instruments = list(prices.keys())
+        lengths = np.array([prices[name].close.shape[0] for name in self.instruments])
+        self.starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        self.lengths = lengths
+        concatenated = Prices(
+            *[
+                np.concatenate([getattr(prices[name], field) for name in self.instruments])
+                for field in Prices._fields
+            ]
+        )
+        self.open = concatenated.open
+        self.close = concatenated.close
+        self.bar_windows = bar_windows(concatenated, bars_count, volumes)
+
+        self.instrument = np.zeros(n_envs, dtype=np.int64)
+        self.offset = np.zeros(n_envs, dtype=np.int64)
+        self.have_position = np.zeros(n_envs, dtype=bool)
+        self.open_price = np.zeros(n_envs, dtype=np.float32)
+        self.rng = np.random.default_rng(seed)
+
+    def reset(self):
+        self.reset_envs(np.arange(self.n_envs))
+        return self.encode()
+
+    def reset_envs(self, env_ids):
+        # make selection of the instrument and it's offset for every episode
+        instrument = self.rng.integers(len(self.instruments), size=len(env_ids))
+        bars = self.bars_count
+        if self.random_ofs_on_reset:
+            offset = self.rng.integers(self.lengths[instrument] - bars * 10) + bars
+        else:
+            offset = np.full(len(env_ids), bars)
+        self.instrument[env_ids] = instrument
+        self.offset[env_ids] = self.starts[instrument] + offset
+        self.have_position[env_ids] = False
+        self.open_price[env_ids] = 0.0
+
+    def encode(self):
+        res = np.empty((self.n_envs,) + self._state.shape, dtype=np.float32)
+        res[:, :-2] = self.bar_windows[self.offset - self.bars_count + 1]
+        res[:, -2] = self.have_position
+        rel_profit = (self.cur_close() - self.open_price) / np.where(
+            self.have_position, self.open_price, 1.0
+        )
+        res[:, -1] = np.where(self.have_position, rel_profit, 0.0)
+        return res
+
+    def cur_close(self):
+        return self.open[self.offset] * (1.0 + self.close[self.offset])
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        rewards = np.zeros(self.n_envs)
+        dones = np.zeros(self.n_envs, dtype=bool)
+        close = self.cur_close()
+
+        buy = (actions == Actions.Buy.value) & ~self.have_position
+        self.have_position |= buy
+        self.open_price = np.where(buy, close, self.open_price)
+        rewards -= buy * self.commission_perc
+
+        sell = (actions == Actions.Close.value) & self.have_position
+        rewards -= sell * self.commission_perc
+        dones |= sell & self.reset_on_close
+        if self.reward_on_close:
+            profit = 100.0 * (close - self.open_price) / np.where(sell, self.open_price, 1.0)
+            rewards += np.where(sell, profit, 0.0)
+        self.have_position &= ~sell
+        self.open_price = np.where(sell, 0.0, self.open_price).astype(np.float32)
+
+        self.offset += 1
+        prev_close = close
+        close = self.cur_close()
+        end = self.starts[self.instrument] + self.lengths[self.instrument] - 1
+        dones |= self.offset >= end
+
+        if not self.reward_on_close:
+            rewards += np.where(self.have_position, 100.0 * (close - prev_close) / prev_close, 0.0)
+
+        obs = self.encode()
+        info = {}
+        if dones.any():
+            info["terminal_observation"] = obs.copy()
+            done_ids = np.flatnonzero(dones)
+            self.reset_envs(done_ids)
+            obs = self.encode()
+        return obs, rewards, dones, info
+
+
 class Actions(enum.Enum):
     Skip = 0
     Buy = 1
@@ -107,6 +236,7 @@ class State:
         self.reset_on_close = reset_on_close
         self.reward_on_close = reward_on_close
         self.volumes = volumes
+        self._windows = {}
 
     def reset(self, prices, offset):
         assert isinstance(prices, Prices)
@@ -115,6 +245,13 @@ class State:
         self.open_price = 0.0
         self._prices = prices
         self._offset = offset
+        # The windows are computed once per prices, keeping a reference so the id stays valid
+        if id(prices) not in self._windows:
+            self._windows[id(prices)] = (
+                prices,
+                bar_windows(prices, self.bars_count, self.volumes),
+            )
+        self._bar_windows = self._windows[id(prices)][1]
 
     @property
     def shape(self):
@@ -129,17 +266,8 @@ class State:
         Convert current state into numpy array.
         """
         res = np.ndarray(shape=self.shape, dtype=np.float32)
-        shift = 0
-        for bar_idx in range(-self.bars_count + 1, 1):
-            res[shift] = self._prices.high[self._offset + bar_idx]
-            shift += 1
-            res[shift] = self._prices.low[self._offset + bar_idx]
-            shift += 1
-            res[shift] = self._prices.close[self._offset + bar_idx]
-            shift += 1
-            if self.volumes:
-                res[shift] = self._prices.volume[self._offset + bar_idx]
-                shift += 1
+        shift = self.shape[0] - 2
+        res[:shift] = self._bar_windows[self._offset - self.bars_count + 1]
         res[shift] = float(self.have_position)
         shift += 1
         if not self.have_position:
@@ -1,4 +1,13 @@
-import itertools
+import time
+
+import numpy as np
+
+# Largest tour, restaurant included, solved exactly by tsp_dp_opt_sol
+MAX_EXACT_STOPS = 18
+# Bound on the memory of the Held-Karp tables
+HELD_KARP_MAX_TABLE_BYTES = 1 << 30
+# Seconds given to the 2-opt/Or-opt search on larger tours
+HEURISTIC_TIME_LIMIT = 1.0
 
 
 def tsp_action_go_from_a_to_b(a, b):
@@ -29,9 +38,6 @@ def tsp_action_go_from_a_to_b(a, b):
     return action
 
 
-import numpy as np
-
-
 def create_dist_matrix(all_xy, num_stops):
     # D[i,j] is the cost of going from i to j
     D = {i: {} for i in range(num_stops)}  # index 0 is the restaurant
@@ -97,32 +103,207 @@ def manhattan_dist(x1, y1, x2, y2):
     return np.abs(x1 - x2) + np.abs(y1 - y2)
 
 
-def tsp_dp_opt_sol(res_xy, orders_xy):
-    all_xy = [res_xy] + orders_xy
-    num_stops = len(all_xy)
-    D = create_dist_matrix(all_xy, num_stops)
-    C = {}  # Subtour cost dictionary, (set of nodes in the subtour, last node)
-    P = {}  # Subtour path dictionary, (set of nodes in the subtour, last node)
-
-    # Initialize C
-    for o in range(1, num_stops):
-        C[frozenset({o}), o] = D[0][o]
-        P[frozenset({o}), o] = [0, o]
-
-    for s in range(2, num_stops):
-        for S in itertools.combinations(range(1, num_stops), s):
-            for o in S:
-                search_keys = [(frozenset(S) - {o}, m) for m in S if m != o]
-                search_list = [C[S_o, m] + D[m][o] for S_o, m in search_keys]
-                min_val = min(search_list)
-                opt_key = search_keys[search_list.index(min_val)]
-                C[frozenset(S), o] = min_val
-                P[frozenset(S), o] = P[opt_key] + [o]
-
-    final_set = frozenset(range(1, num_stops))
-    search_list = [C[final_set, o] + D[o][0] for o in final_set]
-    best_cost = min(search_list)
-    opt_final_order = search_list.index(best_cost) + 1
-    best_route = P[final_set, opt_final_order] + [0]
+def create_dist_array(all_xy):
+    # D[i,j] is the manhattan distance from stop i to stop j, index 0 is the restaurant
+    xy = np.asarray(all_xy)
+    return np.abs(xy[:, None, :] - xy[None, :, :]).sum(axis=2)
+
+
+def route_cost(D, route):
+    route = np.asarray(route)
+    return D[route[:-1], route[1:]].sum()
+
+
+def held_karp_table_bytes(num_stops):
+    # Cost (float64) and parent (int8) tables, one row per subset of orders
+    num_orders = num_stops - 1
+    return (1 << num_orders) * num_orders * (8 + 1)
+
+
+def held_karp(D, max_table_bytes=HELD_KARP_MAX_TABLE_BYTES):
+    """
+    Exact Held-Karp solution of the tour starting and finishing at stop 0.
+
+    Subsets of orders are encoded as integer bitmasks (bit j is order j + 1) indexing dense
+    tables: C[mask, j] is the cost of the best path from stop 0 through the orders in mask,
+    finishing at order j, and P[mask, j] is the order visited before j on that path.
+    Subsets of the same size only depend on smaller ones, so they are relaxed together
+    with array operations.
+    """
+    num_stops = len(D)
+    num_orders = num_stops - 1
+    if num_orders == 0:
+        return route_cost(D, [0, 0]), [0, 0]
+    if held_karp_table_bytes(num_stops) > max_table_bytes:
+        raise ValueError(
+            "Held-Karp tables for {} stops need {} bytes, more than {}".format(
+                num_stops, held_karp_table_bytes(num_stops), max_table_bytes
+            )
+        )
+
+    to_orders = D[1:, 1:].astype(np.float64)
+    num_subsets = 1 << num_orders
+    C = np.full((num_subsets, num_orders), np.inf)
+    P = np.full((num_subsets, num_orders), -1, dtype=np.int8)
+
+    masks = np.arange(num_subsets)
+    subset_sizes = np.zeros(num_subsets, dtype=np.int8)
+    for o in range(num_orders):
+        subset_sizes += (masks >> o) & 1
+
+    # Initialize C with the paths visiting a single order
+    for o in range(num_orders):
+        C[1 << o, o] = D[0, o + 1]
+
+    for s in range(2, num_orders + 1):
+        masks_s = masks[subset_sizes == s]
+        for o in range(num_orders):
+            with_o = masks_s[(masks_s >> o) & 1 == 1]
+            # C of orders not in the previous subset is inf, so they are never the minimum
+            search_list = C[with_o ^ (1 << o)] + to_orders[:, o]
+            best_prev = search_list.argmin(axis=1)
+            C[with_o, o] = search_list[np.arange(len(with_o)), best_prev]
+            P[with_o, o] = best_prev
+
+    full_set = num_subsets - 1
+    o = int(np.argmin(C[full_set] + D[1:, 0]))
+    mask = full_set
+    reversed_route = []
+    while o >= 0:
+        reversed_route.append(o + 1)
+        mask, o = mask ^ (1 << o), int(P[mask, o])
+    best_route = [0] + reversed_route[::-1] + [0]
+
+    return route_cost(D, best_route), best_route
+
+
+def nearest_neighbor_route(D):
+    route = [0]
+    unvisited = set(range(1, len(D)))
+    while unvisited:
+        o = min(unvisited, key=lambda stop: D[route[-1], stop])
+        route.append(o)
+        unvisited.remove(o)
+    return route + [0]
+
+
+def best_two_opt_move(D, route):
+    # Replacing edges (a_i, b_i) and (a_j, b_j) by (a_i, a_j) and (b_i, b_j)
+    # reverses route[i + 1 : j + 1]
+    a, b = route[:-1], route[1:]
+    delta = D[a[:, None], a] + D[b[:, None], b] - D[a, b][:, None] - D[a, b][None, :]
+    delta = np.triu(delta, k=2)
+    i, j = np.unravel_index(np.argmin(delta), delta.shape)
+    return delta[i, j], (i, j)
+
+
+def best_or_opt_move(D, route, max_segment_length=3):
+    # Moving route[s : s + length] between a_k and b_k, possibly reversed
+    a, b = route[:-1], route[1:]
+    num_edges = len(a)
+    best = (0, None)
+    for length in range(1, min(max_segment_length, num_edges - 2) + 1):
+        starts = np.arange(1, num_edges - length + 1)
+        first, last = route[starts], route[starts + length - 1]
+        before, after = route[starts - 1], route[starts + length]
+        removal = D[before, first] + D[last, after] - D[before, after]
+        forward = D[a[None, :], first[:, None]] + D[last[:, None], b[None, :]]
+        backward = D[a[None, :], last[:, None]] + D[first[:, None], b[None, :]]
+        delta = np.minimum(forward, backward) - D[a, b][None, :] - removal[:, None]
+        # The segment can not be inserted at the edges touching it
+        edges = np.arange(num_edges)
+        touching = (edges[None, :] >= starts[:, None] - 1) & (
+            edges[None, :] <= starts[:, None] + length - 1
+        )
+        delta = np.where(touching, np.inf, delta)
+        s, k = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[s, k] < best[0]:
+            reverse = backward[s, k] < forward[s, k]
+            best = (delta[s, k], (starts[s], length, k, reverse))
+    return best
+
+
+def apply_or_opt_move(route, move):
+    start, length, k, reverse = move
+    segment = route[start : start + length]
+    if reverse:
+        segment = segment[::-1]
+    # Insert after a_k, which is route[k] before the segment is removed
+    if k < start:
+        return np.concatenate(
+            [route[: k + 1], segment, route[k + 1 : start], route[start + length :]]
+        )
+    return np.concatenate([route[:start], route[start + length : k + 1], segment, route[k + 1 :]])
+
+
+def local_search_route(D, route, time_limit=HEURISTIC_TIME_LIMIT):
+    """
+    Improve a route with 2-opt and Or-opt moves, applying the best improving move until
+    none is left or time_limit seconds have passed. D is assumed to be symmetric.
+    """
+    deadline = time.perf_counter() + time_limit
+    route = np.asarray(route)
+    while time.perf_counter() < deadline:
+        two_opt_delta, (i, j) = best_two_opt_move(D, route)
+        or_opt_delta, or_opt_move = best_or_opt_move(D, route)
+        if min(two_opt_delta, or_opt_delta) >= 0:
+            break
+        if two_opt_delta <= or_opt_delta:
+            route = np.concatenate([route[: i + 1], route[i + 1 : j + 1][::-1], route[j + 1 :]])
+        else:
+            route = apply_or_opt_move(route, or_opt_move)
+    return route.tolist()
+
+
+def one_tree_lower_bound(D):
+    """
+    Lower bound of the tour cost: minimum spanning tree of the orders (Prim's algorithm)
+    plus the two shortest edges from the restaurant.
+    """
+    num_orders = len(D) - 1
+    if num_orders < 2:
+        return 2 * D[0, 1:].sum()
+    to_orders = D[1:, 1:]
+    in_tree = np.zeros(num_orders, dtype=bool)
+    in_tree[0] = True
+    dist_to_tree = to_orders[0].astype(np.float64)
+    tree_cost = 0
+    for _ in range(num_orders - 1):
+        o = int(np.argmin(np.where(in_tree, np.inf, dist_to_tree)))
+        tree_cost += dist_to_tree[o]
+        in_tree[o] = True
+        np.minimum(dist_to_tree, to_orders[o], out=dist_to_tree)
+    return tree_cost + np.sort(D[0, 1:])[:2].sum()
+
+
+def tsp_heuristic_sol(D, time_limit=HEURISTIC_TIME_LIMIT):
+    """
+    Nearest neighbor route improved by 2-opt and Or-opt within time_limit seconds.
+    The returned gap is relative to the 1-tree lower bound, so it bounds the optimality gap.
+    """
+    route = local_search_route(D, nearest_neighbor_route(D), time_limit)
+    cost = route_cost(D, route)
+    lower_bound = one_tree_lower_bound(D)
+    gap = (cost - lower_bound) / lower_bound if lower_bound > 0 else 0.0
+    return cost, route, float(gap)
+
+
+def tsp_opt_sol(
+    res_xy, orders_xy, max_exact_stops=MAX_EXACT_STOPS, time_limit=HEURISTIC_TIME_LIMIT
+):
+    """
+    Returns (cost, route, gap). Tours of up to max_exact_stops stops, restaurant included,
+    are solved exactly with Held-Karp (gap 0), larger ones with tsp_heuristic_sol.
+    """
+    D = create_dist_array([res_xy] + orders_xy)
+    if len(D) <= max_exact_stops:
+        best_cost, best_route = held_karp(D)
+        return best_cost, best_route, 0.0
+    return tsp_heuristic_sol(D, time_limit)
+
 
+def tsp_dp_opt_sol(
+    res_xy, orders_xy, max_exact_stops=MAX_EXACT_STOPS, time_limit=HEURISTIC_TIME_LIMIT
+):
+    best_cost, best_route, _ = tsp_opt_sol(res_xy, orders_xy, max_exact_stops, time_limit)
     return best_cost, best_route
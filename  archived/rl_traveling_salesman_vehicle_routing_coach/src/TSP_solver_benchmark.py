@@ -0,0 +1,113 @@
+"""
+Checks that the bitset Held-Karp solver finds the same tour costs as the previous
+frozenset implementation, then compares their solve times against the number of orders
+and reports the 2-opt/Or-opt fallback's optimality gap on larger tours.
+
+    python TSP_solver_benchmark.py --exact-orders 6 8 10 12 14 16 --heuristic-orders 30 60
+"""
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+from TSP_baseline_utils import (
+    create_dist_array,
+    create_dist_matrix,
+    held_karp,
+    tsp_heuristic_sol,
+)
+
+
+def frozenset_held_karp(res_xy, orders_xy):
+    """The previous tsp_dp_opt_sol, with subtours keyed by (frozenset, last node)."""
+    all_xy = [res_xy] + orders_xy
+    num_stops = len(all_xy)
+    D = create_dist_matrix(all_xy, num_stops)
+    C = {}
+    P = {}
+
+    for o in range(1, num_stops):
+        C[frozenset({o}), o] = D[0][o]
+        P[frozenset({o}), o] = [0, o]
+
+    for s in range(2, num_stops):
+        for S in itertools.combinations(range(1, num_stops), s):
+            for o in S:
+                search_keys = [(frozenset(S) - {o}, m) for m in S if m != o]
+                search_list = [C[S_o, m] + D[m][o] for S_o, m in search_keys]
+                min_val = min(search_list)
+                opt_key = search_keys[search_list.index(min_val)]
+                C[frozenset(S), o] = min_val
+                P[frozenset(S), o] = P[opt_key] + [o]
+
+    final_set = frozenset(range(1, num_stops))
+    search_list = [C[final_set, o] + D[o][0] for o in final_set]
+    best_cost = min(search_list)
+    opt_final_order = search_list.index(best_cost) + 1
+    best_route = P[final_set, opt_final_order] + [0]
+
+    return best_cost, best_route
+
+
+def random_orders(rng, num_orders, map_quad):
+    xy = rng.randint(-map_quad, map_quad + 1, size=(num_orders, 2))
+    return [tuple(o) for o in xy.tolist()]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def check_exact(rng, max_orders=9, instances=20, map_quad=10):
+    for num_orders in range(1, max_orders + 1):
+        for _ in range(instances):
+            orders_xy = random_orders(rng, num_orders, map_quad)
+            D = create_dist_array([(0, 0)] + orders_xy)
+            cost, route = held_karp(D)
+            assert sorted(route[1:-1]) == list(range(1, num_orders + 1)), route
+            assert cost == frozenset_held_karp((0, 0), orders_xy)[0], orders_xy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exact-orders", type=int, nargs="+", default=[6, 8, 10, 12, 14, 16])
+    parser.add_argument("--frozenset-max-orders", type=int, default=12)
+    parser.add_argument("--heuristic-orders", type=int, nargs="+", default=[30, 60, 120])
+    parser.add_argument("--time-limit", type=float, default=1.0)
+    parser.add_argument("--map-quad", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    check_exact(rng)
+    print("bitset Held-Karp matches the frozenset implementation")
+
+    print("{:>7} {:>14} {:>14} {:>10}".format("orders", "frozenset s", "bitset s", "2-opt gap"))
+    for num_orders in args.exact_orders:
+        orders_xy = random_orders(rng, num_orders, args.map_quad)
+        D = create_dist_array([(0, 0)] + orders_xy)
+        (cost, _), bitset_time = timed(held_karp, D)
+        if num_orders <= args.frozenset_max_orders:
+            _, frozenset_time = timed(frozenset_held_karp, (0, 0), orders_xy)
+            frozenset_time = "{:.3f}".format(frozenset_time)
+        else:
+            frozenset_time = "-"
+        heuristic_cost, _, _ = tsp_heuristic_sol(D, args.time_limit)
+        print(
+            "{:>7} {:>14} {:>14.3f} {:>9.1%}".format(
+                num_orders, frozenset_time, bitset_time, (heuristic_cost - cost) / cost
+            )
+        )
+
+    print("{:>7} {:>14} {:>14}".format("orders", "heuristic s", "gap bound"))
+    for num_orders in args.heuristic_orders:
+        orders_xy = random_orders(rng, num_orders, 5 * args.map_quad)
+        D = create_dist_array([(0, 0)] + orders_xy)
+        (_, _, gap), heuristic_time = timed(tsp_heuristic_sol, D, args.time_limit)
+        print("{:>7} {:>14.3f} {:>13.1%}".format(num_orders, heuristic_time, gap))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import gym
 import numpy as np
 from gym import spaces
-from rl_operations_research_baselines.VRP.VRP_view_2D import VRPView2D
+from VRP_view_2D import VRPView2D
 
 """ 
 
@@ -29,10 +29,61 @@ Easy:
 Order Promise: Infinite( = Episode length)
 Order Timeout: Infinite( = Episode length)
 Driver Capacity: Infinite( =  # Orders)
+
+RANDOMNESS:
+All random draws of an episode come from the env's random generator in a fixed order:
+one draw placing the restaurants and the driver, then blocks of RANDOM_TAPE_LENGTH steps
+of order draws (creation coin flip, order cell among the non-restaurant cells, restaurant)
+for every order slot. VRP_vector_env.VRPVectorEnv makes the same draws per instance, so a
+seeded instance follows the same transitions as a seeded VRPEasyEnv.
 """
 
+# Number of steps of order draws taken from the random generator at once.
+RANDOM_TAPE_LENGTH = 128
+
+
+def map_shape(map_quad):
+    """Width and height of the grid spanned by map_quad."""
+    return 2 * map_quad[0] + 1, 2 * map_quad[1] + 1
+
+
+def place_restaurants_and_driver(rng, n_cells, n_restaurants):
+    """Distinct restaurant cells and the driver cell, from a single draw."""
+    draws = rng.random_sample(n_restaurants + 1)
+    # Partial Fisher-Yates shuffle: restaurant j takes one of the cells not taken yet.
+    # Only the swapped cells are tracked, in a dict.
+    swapped = {}
+    res_cells = []
+    for j in range(n_restaurants):
+        k = j + int(draws[j] * (n_cells - j))
+        res_cells.append(swapped.get(k, k))
+        swapped[k] = swapped.get(j, j)
+    return np.array(res_cells), int(draws[-1] * n_cells)
+
+
+def draw_order_tape(rng, n_steps, n_orders):
+    """Uniform order draws for n_steps steps, see split_order_draws."""
+    return rng.random_sample((n_steps, n_orders, 3))
+
+
+def split_order_draws(draws, n_free_cells, n_restaurants):
+    """Creation coin flips, free cell indices and restaurants from uniform order draws."""
+    coins = draws[..., 0]
+    cells = (draws[..., 1] * n_free_cells).astype(np.int64)
+    restaurants = (draws[..., 2] * n_restaurants).astype(np.int64)
+    return coins, cells, restaurants
+
 
 class VRPEasyEnv(gym.Env):
+    """
+    With seed, the env draws from its own np.random.RandomState, otherwise from the global
+    np.random. Either way the draws follow the order described under RANDOMNESS: one draw
+    per reset, and the order draws of RANDOM_TAPE_LENGTH steps at once. This changed the
+    random stream. For the same seed, episodes differ from the ones of the versions that
+    drew every placement with np.random.choice. An unseeded env also consumes np.random in
+    blocks, ahead of the steps that use the draws.
+    """
+
     def render(self, mode="human", close=False):
 
         if self.vrp_view is None:
@@ -63,6 +114,7 @@ class VRPEasyEnv(gym.Env):
         order_promise=100,
         order_timeout=100,
         episode_length=100,
+        seed=None,
     ):
 
         self.vrp_view = None
@@ -99,6 +151,8 @@ class VRPEasyEnv(gym.Env):
         self.map_max_y = +map_quad[1]
         self.map_range_x = range(-self.map_max_x, self.map_max_x + 1)
         self.map_range_y = range(-self.map_max_y, self.map_max_y + 1)
+        self.map_width, self.map_height = map_shape(map_quad)
+        self.seed(seed)
 
         # restaurant x position limits
         res_x_min = [self.map_min_x] * n_restaurants
@@ -174,11 +228,16 @@ class VRPEasyEnv(gym.Env):
         # Action space: no action, up, down, left, right, accept order i
         self.action_space = spaces.Discrete(5 + n_orders)
 
+    def seed(self, seed=None):
+        # Without a seed, draw from the global numpy generator as before.
+        self.rng = np.random if seed is None else np.random.RandomState(seed)
+        return [seed]
+
     def reset(self):
         self.clock = 0
 
-        self.__place_restaurants()
-        self.__place_driver()
+        self.__place_restaurants_and_driver()
+        self.__draw_order_tape()
         self.dr_used_capacity = 0
         self.o_x = [0] * self.n_orders
         self.o_y = [0] * self.n_orders
@@ -254,6 +313,20 @@ class VRPEasyEnv(gym.Env):
                 self.o_x[o] = 0
                 self.o_y[o] = 0
 
+    def __cell_to_xy(self, cell):
+        return (
+            int(self.map_min_x + cell % self.map_width),
+            int(self.map_min_y + cell // self.map_width),
+        )
+
+    def __draw_order_tape(self):
+        self.o_tape = split_order_draws(
+            draw_order_tape(self.rng, RANDOM_TAPE_LENGTH, self.n_orders),
+            len(self.free_cells),
+            self.n_restaurants,
+        )
+        self.o_tape_step = 0
+
     def __update_environment_parameters(self):
         # Update the waiting times
         for o in range(self.n_orders):
@@ -275,53 +348,33 @@ class VRPEasyEnv(gym.Env):
                 self.o_x[o] = 0
                 self.o_y[o] = 0
         # Create new orders
+        if self.o_tape_step == RANDOM_TAPE_LENGTH:
+            self.__draw_order_tape()
+        coins, cells, restaurants = (draws[self.o_tape_step] for draws in self.o_tape)
+        self.o_tape_step += 1
         for o in range(self.n_orders):
             if self.o_status[o] == 0:
                 # Flip a coin to create an order
-                if np.random.random(1)[0] < self.order_prob:
-                    o_x, o_y, r = self.__receive_order()
+                if coins[o] < self.order_prob:
+                    o_x, o_y, r = self.__receive_order(cells[o], restaurants[o])
                     self.o_x[o] = o_x
                     self.o_y[o] = o_y
                     self.o_res_map[o] = r
                     self.o_status[o] = 1
 
-    def __place_restaurants(self):
-        self.res_coordinates = []
-        self.res_x = []
-        self.res_y = []
-        i = 0
-        while len(self.res_coordinates) < self.n_restaurants:
-            res_x = np.random.choice([i for i in self.map_range_x], 1)[0]
-            res_y = np.random.choice([i for i in self.map_range_y], 1)[0]
-            res_loc = (res_x, res_y)
-            if res_loc not in self.res_coordinates:
-                self.res_coordinates.append(res_loc)
-                self.res_x.append(res_x)
-                self.res_y.append(res_y)
-            elif i > 1000:
-                print("Something is wrong with the restaurant placement.")
-                break
-
-    def __place_driver(self):
-        self.dr_x = np.random.choice([i for i in self.map_range_x], 1)[0]
-        self.dr_y = np.random.choice([i for i in self.map_range_y], 1)[0]
-
-    def __receive_order(self):
-        i = 0  # prevent infinite loop
-        while True:
-            order_x = np.random.choice([i for i in self.map_range_x], 1)[0]
-            order_y = np.random.choice([i for i in self.map_range_y], 1)[0]
-            # Make sure the order does not overlap with any restaurants
-            if (order_x, order_y) not in self.res_coordinates:
-                break
-            elif i > 1000:
-                print("Something is wrong with the restaurant/order locations.")
-                break
-            else:
-                i += 1
-        # Determine the restaurant to assign the order
-        from_res = np.random.choice([i for i in range(self.n_restaurants)], 1)[0]
-        return order_x, order_y, from_res
+    def __place_restaurants_and_driver(self):
+        n_cells = self.map_width * self.map_height
+        res_cells, dr_cell = place_restaurants_and_driver(self.rng, n_cells, self.n_restaurants)
+        self.res_coordinates = [self.__cell_to_xy(cell) for cell in res_cells]
+        self.res_x = [res_x for res_x, _ in self.res_coordinates]
+        self.res_y = [res_y for _, res_y in self.res_coordinates]
+        self.dr_x, self.dr_y = self.__cell_to_xy(dr_cell)
+        # Orders are placed uniformly on the cells without a restaurant
+        self.free_cells = np.setdiff1d(np.arange(n_cells), res_cells)
+
+    def __receive_order(self, free_cell_index, from_res):
+        order_x, order_y = self.__cell_to_xy(self.free_cells[free_cell_index])
+        return order_x, order_y, int(from_res)
 
     def __create_state(self):
         return (
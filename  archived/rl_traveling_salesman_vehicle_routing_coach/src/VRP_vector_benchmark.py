@@ -0,0 +1,85 @@
+"""
+Compares the steps per second of VRPVectorEnv and VRPEasyEnv. test_VRP_vector_env.py
+checks that they follow the same transitions.
+
+    python VRP_vector_benchmark.py --n-envs 64 256 1024
+"""
+
+import argparse
+import time
+
+import numpy as np
+from VRP_env import VRPEasyEnv
+from VRP_vector_env import VRPVectorEnv
+
+# Parameters of VRPEasyEnv, VRPMediumEnv and VRPHardEnv
+ENV_CONFIGS = {
+    "easy": {},
+    "medium": dict(
+        n_restaurants=1,
+        n_orders=10,
+        order_prob=0.9,
+        driver_capacity=4,
+        map_quad=(8, 8),
+        order_promise=200,
+        order_timeout=400,
+        episode_length=2000,
+    ),
+    "hard": dict(
+        n_restaurants=2,
+        n_orders=3,
+        order_prob=0.9,
+        driver_capacity=4,
+        map_quad=(10, 10),
+        order_promise=60,
+        order_timeout=120,
+        episode_length=5000,
+    ),
+}
+
+
+def steps_per_second(step_fn, n_steps, steps_per_call):
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        step_fn()
+    return n_steps * steps_per_call / (time.perf_counter() - start)
+
+
+def benchmark(env_kwargs, n_envs_list, n_steps):
+    env = VRPEasyEnv(seed=0, **env_kwargs)
+    env.reset()
+    action_rng = np.random.RandomState(0)
+    n_actions = env.action_space.n
+
+    def single_step():
+        if env.step(action_rng.randint(0, n_actions))[2]:
+            env.reset()
+
+    baseline = steps_per_second(single_step, n_steps, 1)
+    print("{:<22} {:>12.0f} steps/sec".format("VRPEasyEnv", baseline))
+
+    for n_envs in n_envs_list:
+        vector_env = VRPVectorEnv(n_envs, seeds=range(n_envs), **env_kwargs)
+        vector_env.reset()
+        actions = action_rng.randint(0, n_actions, size=(n_steps, n_envs))
+        step_iter = iter(actions)
+        rate = steps_per_second(lambda: vector_env.step(next(step_iter)), n_steps, n_envs)
+        print(
+            "{:<22} {:>12.0f} steps/sec  {:>6.1f}x".format(
+                f"VRPVectorEnv n={n_envs}", rate, rate / baseline
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", choices=sorted(ENV_CONFIGS), default="easy")
+    parser.add_argument("--n-envs", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--steps", type=int, default=2000)
+    args = parser.parse_args()
+
+    benchmark(ENV_CONFIGS[args.config], args.n_envs, args.steps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import numpy as np
+from VRP_env import (
+    RANDOM_TAPE_LENGTH,
+    VRPEasyEnv,
+    draw_order_tape,
+    map_shape,
+    place_restaurants_and_driver,
+    split_order_draws,
+)
+
+"""
+Batched version of VRPEasyEnv.
+
+VRPVectorEnv simulates n_envs independent VRPEasyEnv instances at once. The state of
+all instances is kept in (n_envs, ...) arrays and every step updates them with array
+operations instead of looping over orders and restaurants in Python.
+
+Instance i draws its random numbers from its own generator, in the same order as
+VRPEasyEnv, so with seeds[i] it follows exactly the transitions of VRPEasyEnv(seed=seeds[i]).
+Finished instances are reset automatically, like gym vector environments.
+"""
+
+
+class VRPVectorEnv:
+    def __init__(self, n_envs, seeds=None, **env_kwargs):
+        # The single env holds the parameters and the spaces of one instance.
+        env = VRPEasyEnv(**env_kwargs)
+        self.n_envs = n_envs
+        self.single_observation_space = env.observation_space
+        self.single_action_space = env.action_space
+
+        self.n_restaurants = env.n_restaurants
+        self.n_orders = env.n_orders
+        self.driver_capacity = env.driver_capacity
+        self.order_prob = env.order_prob
+        self.order_promise = env.order_promise
+        self.order_timeout = env.order_timeout
+        self.episode_length = env.episode_length
+        self.map_min_x = env.map_min_x
+        self.map_max_x = env.map_max_x
+        self.map_min_y = env.map_min_y
+        self.map_max_y = env.map_max_y
+        self.map_width, self.map_height = map_shape(env.map_quad)
+        self.n_cells = self.map_width * self.map_height
+
+        if seeds is None:
+            seeds = [None] * n_envs
+        self.rngs = [np.random.RandomState(seed) for seed in seeds]
+
+        n, r, o = n_envs, self.n_restaurants, self.n_orders
+        self.rows = np.arange(n)
+        self.res_x = np.zeros((n, r), dtype=np.int32)
+        self.res_y = np.zeros((n, r), dtype=np.int32)
+        self.free_cells = np.zeros((n, self.n_cells - r), dtype=np.int32)
+        # restaurant index at every cell of the map, -2 for cells without a restaurant
+        self.cell_res = np.full((n, self.n_cells), -2, dtype=np.int32)
+        self.dr_x = np.zeros(n, dtype=np.int32)
+        self.dr_y = np.zeros(n, dtype=np.int32)
+        self.dr_used_capacity = np.zeros(n, dtype=np.int32)
+        self.o_x = np.zeros((n, o), dtype=np.int32)
+        self.o_y = np.zeros((n, o), dtype=np.int32)
+        self.o_cell = np.full((n, o), -1, dtype=np.int32)
+        self.o_status = np.zeros((n, o), dtype=np.int32)
+        self.o_res_map = np.full((n, o), -1, dtype=np.int32)
+        self.o_time = np.zeros((n, o), dtype=np.int32)
+        self.clock = np.zeros(n, dtype=np.int32)
+
+        # driver moves of every action: no action, up, down, left, right, accept order i
+        self.move_x = np.array([0, 0, 0, -1, 1] + [0] * o)
+        self.move_y = np.array([0, 1, -1, 0, 0] + [0] * o)
+
+        self.o_tape = np.zeros((n, RANDOM_TAPE_LENGTH, o, 3))
+        self.o_tape_step = np.zeros(n, dtype=np.int32)
+
+        # Observation columns, in the order of VRPEasyEnv's state
+        self.obs = np.zeros((n, 2 * r + 4 + 5 * o + 2), dtype=np.int32)
+        self.obs[:, 2 * r + 3] = self.driver_capacity
+        self.obs[:, -2] = self.order_promise
+        self.obs[:, -1] = self.order_timeout
+
+    def reset(self):
+        self.reset_envs(self.rows)
+        return self.create_state()
+
+    def reset_envs(self, env_ids):
+        # Random draws are made instance by instance, everything else for all of them at once
+        res_cells = np.zeros((len(env_ids), self.n_restaurants), dtype=np.int32)
+        dr_cells = np.zeros(len(env_ids), dtype=np.int32)
+        for j, i in enumerate(env_ids):
+            res_cells[j], dr_cells[j] = place_restaurants_and_driver(
+                self.rngs[i], self.n_cells, self.n_restaurants
+            )
+            self.draw_order_tape(i)
+
+        self.res_x[env_ids] = self.map_min_x + res_cells % self.map_width
+        self.res_y[env_ids] = self.map_min_y + res_cells // self.map_width
+        self.dr_x[env_ids] = self.map_min_x + dr_cells % self.map_width
+        self.dr_y[env_ids] = self.map_min_y + dr_cells // self.map_width
+        free = np.ones((len(env_ids), self.n_cells), dtype=bool)
+        free[np.arange(len(env_ids))[:, None], res_cells] = False
+        self.free_cells[env_ids] = np.nonzero(free)[1].reshape(len(env_ids), -1)
+        self.cell_res[env_ids] = -2
+        self.cell_res[np.asarray(env_ids)[:, None], res_cells] = np.arange(self.n_restaurants)
+
+        self.dr_used_capacity[env_ids] = 0
+        self.o_x[env_ids] = 0
+        self.o_y[env_ids] = 0
+        self.o_cell[env_ids] = -1
+        self.o_status[env_ids] = 0
+        self.o_res_map[env_ids] = -1
+        self.o_time[env_ids] = 0
+        self.clock[env_ids] = 0
+
+    def draw_order_tape(self, i):
+        self.o_tape[i] = draw_order_tape(self.rngs[i], RANDOM_TAPE_LENGTH, self.n_orders)
+        self.o_tape_step[i] = 0
+
+    def step(self, actions):
+        """
+        Step every instance with its action.
+
+        Returns observations, rewards and dones of shape (n_envs, ...). Instances that
+        finished their episode are reset, their final observation is returned in
+        info["terminal_observation"].
+        """
+        actions = np.asarray(actions)
+        rewards = np.zeros(self.n_envs)
+        self.update_driver_parameters(actions, rewards)
+        self.update_environment_parameters(rewards)
+        state = self.create_state()
+
+        # Update the clock
+        self.clock += 1
+        dones = self.clock >= self.episode_length
+
+        info = {}
+        if dones.any():
+            info["terminal_observation"] = state.copy()
+            done_ids = np.flatnonzero(dones)
+            self.reset_envs(done_ids)
+            state = self.create_state()
+        return state, rewards, dones, info
+
+    def update_driver_parameters(self, actions, rewards):
+        self.dr_x = np.minimum(
+            self.map_max_x, np.maximum(self.map_min_x, self.dr_x + self.move_x[actions])
+        )
+        self.dr_y = np.minimum(
+            self.map_max_y, np.maximum(self.map_min_y, self.dr_y + self.move_y[actions])
+        )
+        dr_cell = (self.dr_y - self.map_min_y) * self.map_width + (self.dr_x - self.map_min_x)
+
+        # accept order i if it is open and the driver has capacity
+        accepting = actions > 4
+        order = np.where(accepting, actions - 5, 0)
+        accepted = (
+            accepting
+            & (self.o_status[self.rows, order] == 1)
+            & (self.dr_used_capacity < self.driver_capacity)
+        )
+        self.o_status[self.rows[accepted], order[accepted]] = 2
+        self.dr_used_capacity += accepted
+
+        # Pick up the accepted orders of the restaurant the driver is at, if any
+        dr_res = self.cell_res[self.rows, dr_cell]
+        picked_up = (self.o_status == 2) & (self.o_res_map == dr_res[:, None])
+        np.copyto(self.o_status, 3, where=picked_up)
+        pick_up_rewards = (self.order_timeout - self.o_time) * 0.1
+
+        # Deliver the picked up orders at the driver's location
+        delivered = (self.o_status == 3) & (self.o_cell == dr_cell[:, None])
+        delivery_rewards = (
+            np.maximum(0.0, (self.order_promise - self.o_time) * 0.5)
+            + (self.order_timeout - self.o_time) * 0.15
+        )
+
+        # Rewards are added order by order, in the same sequence as VRPEasyEnv
+        for o in range(self.n_orders):
+            rewards += picked_up[:, o] * pick_up_rewards[:, o]
+        for o in range(self.n_orders):
+            rewards += delivered[:, o] * delivery_rewards[:, o]
+
+        self.dr_used_capacity -= delivered.sum(axis=1)
+        self.clear_orders(delivered)
+
+    def update_environment_parameters(self, rewards):
+        # Update the waiting times of active orders
+        self.o_time += self.o_status > 1
+
+        # Expire orders, charging the driver who had accepted them
+        expired = self.o_time >= self.order_timeout
+        if expired.any():
+            charged = expired & (self.o_status >= 2)
+            for o in range(self.n_orders):
+                rewards -= charged[:, o] * (self.order_timeout * 0.5)
+            self.dr_used_capacity -= charged.sum(axis=1)
+            self.clear_orders(expired)
+
+        # Create new orders from the next step of every instance's order draws
+        for i in np.flatnonzero(self.o_tape_step == RANDOM_TAPE_LENGTH):
+            self.draw_order_tape(i)
+        coins, free_cell_indices, restaurants = split_order_draws(
+            self.o_tape[self.rows, self.o_tape_step],
+            self.n_cells - self.n_restaurants,
+            self.n_restaurants,
+        )
+        self.o_tape_step += 1
+
+        created = (self.o_status == 0) & (coins < self.order_prob)
+        cells = self.free_cells[self.rows[:, None], free_cell_indices]
+        np.copyto(self.o_cell, cells, where=created)
+        np.copyto(self.o_x, self.map_min_x + cells % self.map_width, where=created)
+        np.copyto(self.o_y, self.map_min_y + cells // self.map_width, where=created)
+        np.copyto(self.o_res_map, restaurants, where=created)
+        np.copyto(self.o_status, 1, where=created)
+
+    def clear_orders(self, mask):
+        np.copyto(self.o_status, 0, where=mask)
+        np.copyto(self.o_time, 0, where=mask)
+        np.copyto(self.o_res_map, -1, where=mask)
+        np.copyto(self.o_x, 0, where=mask)
+        np.copyto(self.o_y, 0, where=mask)
+        np.copyto(self.o_cell, -1, where=mask)
+
+    def create_state(self):
+        r, o = self.n_restaurants, self.n_orders
+        obs = self.obs
+        obs[:, :r] = self.res_x
+        obs[:, r : 2 * r] = self.res_y
+        obs[:, 2 * r] = self.dr_x
+        obs[:, 2 * r + 1] = self.dr_y
+        obs[:, 2 * r + 2] = self.dr_used_capacity
+        start = 2 * r + 4
+        for column in [self.o_x, self.o_y, self.o_status, self.o_res_map, self.o_time]:
+            obs[:, start : start + o] = column
+            start += o
+        return obs.copy()
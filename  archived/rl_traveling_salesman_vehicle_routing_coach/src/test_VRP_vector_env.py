@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from VRP_env import VRPEasyEnv
+from VRP_vector_benchmark import ENV_CONFIGS
+from VRP_vector_env import VRPVectorEnv
+
+
+@pytest.mark.parametrize("config", sorted(ENV_CONFIGS))
+def test_vector_env_matches_seeded_envs(config):
+    """Step seeded VRPEasyEnvs and a VRPVectorEnv with the same actions and compare them."""
+    n_envs, n_steps, seed = 8, 6000, 0
+    env_kwargs = ENV_CONFIGS[config]
+    seeds = [seed + i for i in range(n_envs)]
+    envs = [VRPEasyEnv(seed=env_seed, **env_kwargs) for env_seed in seeds]
+    vector_env = VRPVectorEnv(n_envs, seeds=seeds, **env_kwargs)
+    action_rng = np.random.RandomState(seed)
+    n_actions = vector_env.single_action_space.n
+
+    states = np.array([env.reset() for env in envs])
+    vector_states = vector_env.reset()
+    assert np.array_equal(states, vector_states), "reset states differ"
+
+    for step in range(n_steps):
+        actions = action_rng.randint(0, n_actions, size=n_envs)
+        vector_states, vector_rewards, vector_dones, info = vector_env.step(actions)
+        for i, env in enumerate(envs):
+            state, reward, done, _ = env.step(actions[i])
+            assert reward == vector_rewards[i], f"step {step} env {i}: rewards differ"
+            assert done == vector_dones[i], f"step {step} env {i}: dones differ"
+            if done:
+                assert np.array_equal(state, info["terminal_observation"][i])
+                state = env.reset()
+            assert np.array_equal(state, vector_states[i]), f"step {step} env {i}: states differ"
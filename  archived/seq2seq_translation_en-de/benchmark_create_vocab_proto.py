@@ -0,0 +1,228 @@
+"""
+Checks and benchmarks create_vocab_proto.py on a synthetic parallel corpus.
+
+The corpus has Zipf distributed tokens and some empty lines. The script checks that the
+vocabularies and the encoded records are the same as with the previous single Counter and
+single writer pipeline, then compares the lines/sec of both for several numbers of workers.
+
+    python benchmark_create_vocab_proto.py --lines 500000 --num-workers 1 2 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter
+from contextlib import ExitStack
+from itertools import chain
+
+import numpy as np
+from create_vocab_proto import (
+    UNK_SYMBOL,
+    VOCAB_SYMBOLS,
+    build_from_paths,
+    chunked,
+    list_to_record_bytes,
+    prune_vocab,
+    read_next,
+    run_workers,
+    smart_open,
+    write_recordio,
+    write_to_file,
+)
+from record_pb2 import Record
+
+
+def write_synthetic_corpus(source_file, target_file, lines, vocab_size, seed=0):
+    rng = np.random.RandomState(seed)
+    for path, offset in [(source_file, 0), (target_file, vocab_size)]:
+        words = np.array(["w{}".format(offset + i) for i in range(vocab_size)])
+        lengths = rng.randint(0, 40, size=lines)
+        tokens = words[np.minimum(rng.zipf(1.3, size=lengths.sum()), vocab_size) - 1]
+        ends = np.cumsum(lengths)
+        with open(path, "w", encoding="utf-8") as f:
+            for start, end in zip(ends - lengths, ends):
+                f.write(" ".join(tokens[start:end]) + "\n")
+
+
+def get_tokens(line):
+    """The tokenizer of the previous pipeline."""
+    for token in line.rstrip().split():
+        if len(token) > 0:
+            yield token
+
+
+def build_vocab_single_counter(data_source, data_target, num_words=50000):
+    """The previous build_vocab, without single_vocab."""
+    vocab_symbols_set = set(VOCAB_SYMBOLS)
+    vocabs = []
+    for data in [data_source, data_target]:
+        raw_vocab = Counter(
+            token for line in data for token in get_tokens(line) if token not in vocab_symbols_set
+        )
+        vocabs.append(prune_vocab(raw_vocab, num_words, 1))
+    return vocabs
+
+
+def read_worker(q_in, q_out):
+    while True:
+        deq = q_in.get()
+        if deq is None:
+            break
+        int_source, int_target = deq
+        record = list_to_record_bytes(int_source, int_target)
+        q_out.put(record)
+
+
+def write_worker(q_out, output_file):
+    with open(output_file, "wb") as f:
+        while True:
+            deq = q_out.get()
+            if deq is None:
+                break
+            write_recordio(f, deq)
+
+
+def write_to_file_single_writer(
+    input_source, input_target, output_file, vocab_source, vocab_target
+):
+    """The previous write_to_file: unbounded queues to the encoders and a single writer."""
+    num_read_workers = max(multiprocessing.cpu_count() - 1, 1)
+    q_in = [multiprocessing.Queue() for i in range(num_read_workers)]
+    q_out = multiprocessing.Queue()
+    read_process = [
+        multiprocessing.Process(target=read_worker, args=(q_in[i], q_out))
+        for i in range(num_read_workers)
+    ]
+    for p in read_process:
+        p.start()
+    write_process = multiprocessing.Process(target=write_worker, args=(q_out, output_file))
+    write_process.start()
+
+    lines_processed = 0
+    with ExitStack() as stack:
+        files = (stack.enter_context(smart_open(path)) for path in [input_source, input_target])
+        for line_source, line_target in zip(*files):
+            if line_source.strip() == "" or line_target.strip() == "":
+                continue
+            int_source = [
+                vocab_source.get(token, vocab_source[UNK_SYMBOL])
+                for token in get_tokens(line_source)
+            ]
+            int_target = [
+                vocab_target.get(token, vocab_target[UNK_SYMBOL])
+                for token in get_tokens(line_target)
+            ]
+            q_in[lines_processed % len(q_in)].put((int_source, int_target))
+            lines_processed += 1
+
+    for q in q_in:
+        q.put(None)
+    for p in read_process:
+        p.join()
+    q_out.put(None)
+    write_process.join()
+
+
+def exit_worker(q_in, q_out):
+    """A worker that dies before it puts its result."""
+    while q_in.get() is not None:
+        pass
+    os._exit(1)
+
+
+def read_records(paths):
+    records = []
+    for path in paths:
+        with open(path, "rb") as f:
+            for data in iter(lambda: read_next(f), None):
+                record = Record()
+                record.ParseFromString(data)
+                records.append(
+                    (
+                        tuple(record.features["source"].int32_tensor.values),
+                        tuple(record.features["target"].int32_tensor.values),
+                    )
+                )
+    return sorted(records)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--vocab-size", type=int, default=100000)
+    parser.add_argument("--num-workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    logging.getLogger("create_vocab_proto").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "corpus.en")
+        target = os.path.join(tmp_dir, "corpus.de")
+        write_synthetic_corpus(source, target, args.lines, args.vocab_size)
+
+        with smart_open(source) as data_source, smart_open(target) as data_target:
+            vocabs, vocab_time = timed(build_vocab_single_counter, data_source, data_target)
+        baseline_file = os.path.join(tmp_dir, "baseline.rec")
+        _, encode_time = timed(write_to_file_single_writer, source, target, baseline_file, *vocabs)
+        baseline_records = read_records([baseline_file])
+        print("{:<26} {:>14} {:>14}".format("", "vocab lines/s", "encode lines/s"))
+        print(
+            "{:<26} {:>14.0f} {:>14.0f}".format(
+                "single Counter and writer", args.lines / vocab_time, args.lines / encode_time
+            )
+        )
+
+        for num_workers in args.num_workers:
+            new_vocabs, vocab_time = timed(
+                build_from_paths, source, target, num_workers=num_workers
+            )
+            assert list(new_vocabs) == vocabs, "vocabularies differ"
+            output_file = os.path.join(tmp_dir, "train.rec")
+            output_files, encode_time = timed(
+                write_to_file,
+                source,
+                target,
+                output_file,
+                *new_vocabs,
+                num_workers=num_workers,
+                merge_shards=False,
+            )
+            assert read_records(output_files) == baseline_records, "records differ"
+            print(
+                "{:<26} {:>14.0f} {:>14.0f}".format(
+                    "num_workers={}".format(num_workers),
+                    args.lines / vocab_time,
+                    args.lines / encode_time,
+                )
+            )
+            for path in output_files:
+                os.remove(path)
+
+        merged = write_to_file(source, target, output_file, *vocabs, num_workers=2)
+        assert merged == [output_file] and read_records(merged) == baseline_records
+        print("vocabularies and records match the previous pipeline")
+
+        try:
+            run_workers(exit_worker, [()] * 2, chunked(["a b"] * 10, size=2))
+        except RuntimeError:
+            print("a worker that dies fails the run instead of hanging it")
+        else:
+            raise AssertionError("the death of a worker was not detected")
+
+        # The single vocabulary counts both sides together
+        with smart_open(source) as data_source, smart_open(target) as data_target:
+            single = Counter(chain(*(line.split() for line in chain(data_source, data_target))))
+        single_vocab, _ = build_from_paths(source, target, single_vocab=True, num_workers=2)
+        assert single_vocab == prune_vocab(single, 50000, 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,8 @@ import logging
 import multiprocessing
 import os
 import pickle
+import queue
+import shutil
 import struct
 from collections import Counter
 from contextlib import ExitStack
@@ -37,20 +39,19 @@ PAD_ID = 0
 TOKEN_SEPARATOR = " "
 VOCAB_SYMBOLS = [PAD_SYMBOL, UNK_SYMBOL, BOS_SYMBOL, EOS_SYMBOL]
 VOCAB_ENCODING = "utf-8"
+RECORDIO_MAGIC = struct.pack("I", 0xCED7230A)
+# Lines sent to a worker at a time, and chunks queued per worker before the reader blocks
+CHUNK_LINES = 10000
+QUEUE_CHUNKS_PER_WORKER = 4
 
 
 # RecordIO and Protobuf related utilities
 
 
 def write_recordio(f, data):
-    kmagic = 0xCED7230A
     length = len(data)
-    f.write(struct.pack("I", kmagic))
-    f.write(struct.pack("I", length))
     upper_align = ((length + 3) >> 2) << 2
-    padding = bytes([0x00 for _ in range(upper_align - length)])
-    f.write(data)
-    f.write(padding)
+    f.write(RECORDIO_MAGIC + struct.pack("I", length) + data + bytes(upper_align - length))
 
 
 def list_to_record_bytes(source: List[int] = None, target: List[int] = None):
@@ -115,18 +116,6 @@ def smart_open(filename: str, mode: str = "rt", ftype: str = "auto", errors: str
         return open(filename, mode=mode, encoding="utf-8", errors=errors)
 
 
-def get_tokens(line: str) -> Generator[str, None, None]:
-    """
-    Yields tokens from input string.
-
-    :param line: Input string.
-    :return: Iterator over tokens.
-    """
-    for token in line.rstrip().split():
-        if len(token) > 0:
-            yield token
-
-
 def add_optional_args(model_params):
     model_params.add_argument(
         "-vs", "--val-source", required=False, type=str, help="Validation source file."
@@ -202,6 +191,20 @@ def add_optional_args(model_params):
         help="Minimum frequency of words to be included in target vocabulary. "
         "Default: %(default)s",
     )
+    model_params.add_argument(
+        "--num-workers",
+        required=False,
+        type=int,
+        default=default_num_workers(),
+        help="Number of processes counting and encoding tokens. Default: %(default)s",
+    )
+    model_params.add_argument(
+        "--keep-shards",
+        action="store_true",
+        default=False,
+        help="Keep the RecordIO file written by every worker instead of merging them into the "
+        "output file.",
+    )
 
 
 def add_vocab_args(required, optional):
@@ -222,6 +225,7 @@ def build_from_paths(
     num_words_target: int = 50000,
     min_count_source: int = 1,
     min_count_target: int = 1,
+    num_workers: int = None,
 ) -> (Dict[str, int], Dict[str, int]):
     """
     Creates vocabulary from paths to a file in sentence-per-line format. A sentence is just a whitespace delimited
@@ -234,6 +238,7 @@ def build_from_paths(
     :param min_count_source: Minimum frequency to include a word in source vocabulary.
     :param min_count_target: Minimum frequency to include a word in target vocabulary.
     :param input_source: Input original sour file path.
+    :param num_workers: Number of token counting processes. Default: one less than the number of CPUs.
     :return: Word-to-id mapping.
     """
     with ExitStack() as stack:
@@ -245,27 +250,162 @@ def build_from_paths(
             num_words_source=num_words_source,
             num_words_target=num_words_target,
             min_count_source=min_count_source,
-            min_count_target=min_count_target
+            min_count_target=min_count_target,
+            num_workers=num_workers or default_num_workers(),
         )
 
 
-def read_worker(q_in, q_out):
+def default_num_workers() -> int:
+    return max(multiprocessing.cpu_count() - 1, 1)
+
+
+def chunked(iterable: Iterable, size: int = CHUNK_LINES) -> Generator[List, None, None]:
+    """
+    Yields lists of up to size consecutive items of iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def put_checked(q, item, processes):
+    """
+    Puts item on the bounded queue q, failing instead of blocking forever if a worker died.
+    """
+    while True:
+        try:
+            q.put(item, timeout=1)
+            return
+        except queue.Full:
+            if not all(p.is_alive() for p in processes):
+                raise RuntimeError("A worker process exited unexpectedly")
+
+
+def get_checked(q, processes):
+    """
+    Gets an item from q, failing instead of blocking forever if a worker died.
+    """
+    while True:
+        try:
+            return q.get(timeout=1)
+        except queue.Empty:
+            if any(p.exitcode not in (None, 0) for p in processes):
+                raise RuntimeError("A worker process exited unexpectedly")
+
+
+def run_workers(target, worker_args, items):
+    """
+    Feeds items to one process per entry of worker_args through a bounded queue and returns
+    the result every worker puts on the output queue once it received all items.
+    target is called as target(q_in, q_out, *args).
+    """
+    q_in = multiprocessing.Queue(maxsize=QUEUE_CHUNKS_PER_WORKER * len(worker_args))
+    q_out = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=target, args=(q_in, q_out) + tuple(args))
+        for args in worker_args
+    ]
+    for p in processes:
+        p.start()
+    try:
+        for item in items:
+            put_checked(q_in, item, processes)
+        for _ in processes:
+            put_checked(q_in, None, processes)
+        # Results are read before joining, a process does not exit before its queue is flushed
+        results = [get_checked(q_out, processes) for _ in processes]
+    except BaseException:
+        for p in processes:
+            p.terminate()
+        raise
+    for p in processes:
+        p.join()
+    return results
+
+
+def count_lines(lines: Iterable[str]) -> Counter:
+    counts = Counter()
+    for line in lines:
+        counts.update(line.split())
+    return counts
+
+
+def count_worker(q_in, q_out):
+    counts = Counter()
     while True:
-        deq = q_in.get()
-        if deq is None:
+        lines = q_in.get()
+        if lines is None:
             break
-        int_source, int_target = deq
-        record = list_to_record_bytes(int_source, int_target)
-        q_out.put(record)
+        counts.update(count_lines(lines))
+    q_out.put(counts)
+
+
+def count_tokens(lines: Iterable[str], num_workers: int = 1) -> Counter:
+    """
+    Counts the whitespace delimited tokens of lines, except the special symbols.
+    With more than one worker, chunks of lines are counted by worker processes in their own
+    Counter and the Counters are merged at the end.
+    :param lines: Sequence of sentences.
+    :param num_workers: Number of counting processes.
+    :return: Token counts.
+    """
+    if num_workers <= 1:
+        counts = count_lines(lines)
+    else:
+        counts = Counter()
+        for worker_counts in run_workers(count_worker, [()] * num_workers, chunked(lines)):
+            counts.update(worker_counts)
+    for symbol in VOCAB_SYMBOLS:
+        counts.pop(symbol, None)
+    return counts
 
 
-def write_worker(q_out, output_file):
-    with open(output_file, "wb") as f:
+def encode_lines(f, line_pairs, vocab_source, vocab_target):
+    """
+    Encodes pairs of source and target lines with the vocabularies and writes them to f as
+    RecordIO protobuf records. Pairs where either line is empty are skipped.
+    :return: Number of lines written and ignored.
+    """
+    unk_source = vocab_source[UNK_SYMBOL]
+    unk_target = vocab_target[UNK_SYMBOL]
+    lines_processed = 0
+    lines_ignored = 0
+    for line_source, line_target in line_pairs:
+        tokens_source = line_source.split()
+        tokens_target = line_target.split()
+        if not tokens_source or not tokens_target:
+            lines_ignored += 1
+            continue
+        int_source = [vocab_source.get(token, unk_source) for token in tokens_source]
+        int_target = [vocab_target.get(token, unk_target) for token in tokens_target]
+        write_recordio(f, list_to_record_bytes(int_source, int_target))
+        lines_processed += 1
+    return lines_processed, lines_ignored
+
+
+def encode_worker(q_in, q_out, shard_file, vocab_source, vocab_target):
+    lines_processed = 0
+    lines_ignored = 0
+    with open(shard_file, "wb") as f:
         while True:
-            deq = q_out.get()
-            if deq is None:
+            line_pairs = q_in.get()
+            if line_pairs is None:
                 break
-            write_recordio(f, deq)
+            processed, ignored = encode_lines(f, line_pairs, vocab_source, vocab_target)
+            lines_processed += processed
+            lines_ignored += ignored
+    q_out.put((lines_processed, lines_ignored))
+
+
+def shard_path(output_file: str, index: int) -> str:
+    """
+    Path of the index-th shard of output_file, "train.rec" -> "train.00001.rec".
+    """
+    root, ext = os.path.splitext(output_file)
+    return "{}.{:05d}{}".format(root, index, ext)
 
 
 def write_to_file(
@@ -275,70 +415,58 @@ def write_to_file(
     vocab_source: Dict[str, int],
     vocab_target: Dict[str, int],
     file_type: str = "train",
-):
+    num_workers: int = None,
+    merge_shards: bool = True,
+) -> List[str]:
     """
     Converts the input strings to integers. Processes all the input files and writes into a single file each
     line if which is a list of integers.
+    With more than one worker, chunks of lines are encoded by worker processes which read the vocabularies
+    they were started with and write their own RecordIO shard. The reader blocks when the workers fall behind.
     :param input_source: input original source file path (parallel corpus).
     :param input_target: input original target file path (parallel corpus).
     :param output_file: Path of output file to which the processed input file will be written
     :param vocab_source: String to Integer mapping of source vocabulary
     :param vocab_target: String to Integer mapping of target vocabulary
+    :param num_workers: Number of encoding processes. Default: one less than the number of CPUs.
+    :param merge_shards: Concatenate the shards into output_file. Otherwise they are kept as
+        written, see shard_path. Records are not in the order of the input lines either way.
+    :return: Paths of the written files.
     """
-    num_read_workers = max(multiprocessing.cpu_count() - 1, 1)
-    logger.info(
-        "Spawning %s encoding worker(s) for encoding %s datasets!", str(num_read_workers), file_type
-    )
-    q_in = [multiprocessing.Queue() for i in range(num_read_workers)]
-    q_out = multiprocessing.Queue()
-    read_process = [
-        multiprocessing.Process(target=read_worker, args=(q_in[i], q_out))
-        for i in range(num_read_workers)
-    ]
-    for p in read_process:
-        p.start()
-    write_process = multiprocessing.Process(target=write_worker, args=(q_out, output_file))
-    write_process.start()
-
-    lines_ignored = 0
-    lines_processed = 0
+    num_workers = num_workers or default_num_workers()
+    logger.info("Encoding %s datasets with %d worker(s)!", file_type, num_workers)
 
     with ExitStack() as stack:
-        files = (stack.enter_context(smart_open(path)) for path in [input_source, input_target])
-        for line_source, line_target in zip(*files):
-            if line_source.strip() == "" or line_target.strip() == "":
-                lines_ignored += 1
-                continue
-            int_source = [
-                vocab_source.get(token, vocab_source[UNK_SYMBOL])
-                for token in get_tokens(line_source)
-            ]
-            int_target = [
-                vocab_target.get(token, vocab_target[UNK_SYMBOL])
-                for token in get_tokens(line_target)
-            ]
-            item = (int_source, int_target)
-            q_in[lines_processed % len(q_in)].put(item)
-            lines_processed += 1
+        files = [stack.enter_context(smart_open(path)) for path in [input_source, input_target]]
+        if num_workers == 1:
+            with open(output_file, "wb") as f:
+                results = [encode_lines(f, zip(*files), vocab_source, vocab_target)]
+            output_files = [output_file]
+        else:
+            output_files = [shard_path(output_file, i) for i in range(num_workers)]
+            worker_args = [(shard, vocab_source, vocab_target) for shard in output_files]
+            results = run_workers(encode_worker, worker_args, chunked(zip(*files)))
 
     logger.info(
         """Processed %s lines for encoding to protobuf. %s lines were ignored as they didn't have
                 any content in either the source or the target file!""",
-        lines_processed,
-        lines_ignored,
+        sum(processed for processed, _ in results),
+        sum(ignored for _, ignored in results),
     )
 
-    logger.info("Completed writing the encoding queue!")
-    for q in q_in:
-        q.put(None)
-    for p in read_process:
-        p.join()
-
-    logger.info('Encoding finished! Writing records to "%s"', output_file)
-    q_out.put(None)
-    write_process.join()
+    if merge_shards and output_files != [output_file]:
+        logger.info(
+            'Encoding finished! Merging %d shards into "%s"', len(output_files), output_file
+        )
+        with open(output_file, "wb") as f:
+            for shard in output_files:
+                with open(shard, "rb") as shard_f:
+                    shutil.copyfileobj(shard_f, f, 1 << 20)
+                os.remove(shard)
+        output_files = [output_file]
 
-    logger.info('Processed input and saved to "%s"', output_file)
+    logger.info("Processed input and saved to %s", ", ".join(output_files))
+    return output_files
 
 
 def prune_vocab(raw_vocab, num_words, min_count):
@@ -370,6 +498,7 @@ def build_vocab(
     num_words_target: int = 50000,
     min_count_source: int = 1,
     min_count_target: int = 1,
+    num_workers: int = 1,
 ) -> (Dict[str, int], Dict[str, int]):
     """
     Creates a vocabulary mapping from words to ids. Increasing integer ids are assigned by word frequency,
@@ -382,30 +511,16 @@ def build_vocab(
     :param num_words_target: Maximum number of words in the vocabulary for target side.
     :param min_count_source: Minimum frequency to include a word in source vocabulary.
     :param min_count_target: Minimum frequency to include a word in target vocabulary.
+    :param num_workers: Number of token counting processes.
     :return: Word-to-id mapping.
     """
-    vocab_symbols_set = set(VOCAB_SYMBOLS)
-
     if single_vocab:
-        data = chain(data_source, data_target)
-        raw_vocab = Counter(
-            token for line in data for token in get_tokens(line) if token not in vocab_symbols_set
-        )
+        raw_vocab = count_tokens(chain(data_source, data_target), num_workers)
         logger.info("Initial vocabulary: %d types" % len(raw_vocab))
         return prune_vocab(raw_vocab, num_words_source, min_count_source), None
     else:
-        raw_vocab_source = Counter(
-            token
-            for line in data_source
-            for token in get_tokens(line)
-            if token not in vocab_symbols_set
-        )
-        raw_vocab_target = Counter(
-            token
-            for line in data_target
-            for token in get_tokens(line)
-            if token not in vocab_symbols_set
-        )
+        raw_vocab_source = count_tokens(data_source, num_workers)
+        raw_vocab_target = count_tokens(data_target, num_workers)
 
         return (
             prune_vocab(raw_vocab_source, num_words_source, min_count_source),
@@ -498,6 +613,7 @@ def main():
             num_words_target=args.num_words_target,
             min_count_source=args.word_min_count_source,
             min_count_target=args.word_min_count_target,
+            num_workers=args.num_workers,
         )
         logger.info("Source vocabulary size: %d ", len(vocab_source))
         vocab_to_json(vocab_source, "vocab.src" + JSON_SUFFIX)
@@ -512,7 +628,13 @@ def main():
 
     vocab_target = vocab_target or vocab_source
     write_to_file(
-        args.train_source, args.train_target, args.train_output, vocab_source, vocab_target
+        args.train_source,
+        args.train_target,
+        args.train_output,
+        vocab_source,
+        vocab_target,
+        num_workers=args.num_workers,
+        merge_shards=not args.keep_shards,
     )
 
     if args.val_source and args.val_target:
@@ -523,6 +645,8 @@ def main():
             vocab_source,
             vocab_target,
             "validation",
+            num_workers=args.num_workers,
+            merge_shards=not args.keep_shards,
         )
 
 